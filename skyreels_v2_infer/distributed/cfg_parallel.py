@@ -0,0 +1,111 @@
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import torch
+import torch.distributed as dist
+
+
+class CFGParallelGroups:
+    """
+    Process groups that split the world into one half per classifier-free guidance branch.
+
+    The first `world_size / 2` ranks compute the conditional prediction and the others the unconditional one. Each
+    half may run sequence parallelism over its own consecutive ranks (see `init_sequence_parallel`), and rank `g` of
+    the first half pairs with rank `g + world_size / 2` of the second, the rank holding the same sequence chunk.
+    """
+
+    degree = 2
+
+    def __init__(self):
+        world_size = dist.get_world_size()
+        if world_size % self.degree != 0:
+            raise ValueError(f"CFG parallelism needs an even number of ranks, got {world_size}")
+        self.branch_size = world_size // self.degree
+        global_rank = dist.get_rank()
+        self.rank = global_rank // self.branch_size
+
+        # every rank has to create every group, in the same order
+        for position in range(self.branch_size):
+            ranks = list(range(position, world_size, self.branch_size))
+            group = dist.new_group(ranks)
+            if global_rank in ranks:
+                self.group, self.ranks = group, ranks
+
+
+_GROUPS: Optional[CFGParallelGroups] = None
+
+
+def init_cfg_parallel() -> CFGParallelGroups:
+    """Creates the CFG groups from the default process group, which must already be initialized."""
+    global _GROUPS
+    _GROUPS = CFGParallelGroups()
+    return _GROUPS
+
+
+def destroy_cfg_parallel():
+    global _GROUPS
+    _GROUPS = None
+
+
+def is_initialized() -> bool:
+    return _GROUPS is not None
+
+
+def get_groups() -> CFGParallelGroups:
+    if _GROUPS is None:
+        raise RuntimeError("CFG parallelism is not initialized, call `init_cfg_parallel` first")
+    return _GROUPS
+
+
+def get_cfg_parallel_rank() -> int:
+    return get_groups().rank
+
+
+def cfg_parallel_predict(
+    transformer,
+    latent_model_input,
+    cond_kwargs: Dict[str, Any],
+    uncond_kwargs: Dict[str, Any],
+    guidance_scale: float,
+    use_uncond: bool = True,
+    **kwargs,
+) -> torch.Tensor:
+    """
+    Guided noise prediction with the conditional and unconditional forwards on different ranks.
+
+    Each rank runs `transformer(latent_model_input, **kwargs, **branch_kwargs)` for its own branch and the pair of
+    ranks exchanges the predictions with one all-gather, after which both combine them exactly like the serial
+    pipelines. Steps without guidance (`use_uncond=False`) only run the conditional forward, which is broadcast to the
+    unconditional rank. The step cache of each rank is advanced past the branch it does not compute.
+
+    Returns the float32 noise prediction, identical on every rank of the pair.
+    """
+    groups = get_groups()
+
+    def predict(branch_kwargs):
+        return transformer(latent_model_input, **kwargs, **branch_kwargs)[0].float().contiguous()
+
+    if not use_uncond:
+        if groups.rank == 0:
+            noise_pred = predict(cond_kwargs)
+        else:
+            transformer.skip_teacache_uncond()
+            noise_pred = torch.empty(
+                latent_model_input.shape[1:], dtype=torch.float32, device=latent_model_input.device
+            )
+        transformer.skip_teacache_uncond()
+        dist.broadcast(noise_pred, src=groups.ranks[0], group=groups.group)
+        return noise_pred
+
+    if groups.rank == 0:
+        local = predict(cond_kwargs)
+        transformer.skip_teacache_uncond()
+    else:
+        transformer.skip_teacache_uncond()
+        local = predict(uncond_kwargs)
+    predictions: List[torch.Tensor] = [torch.empty_like(local) for _ in range(groups.degree)]
+    dist.all_gather(predictions, local, group=groups.group)
+    noise_pred_cond, noise_pred_uncond = predictions
+    return noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
@@ -0,0 +1,226 @@
+import math
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import torch
+import torch.distributed as dist
+
+
+class SequenceParallelGroups:
+    """
+    Process groups of a hybrid Ulysses x Ring layout.
+
+    Consecutive blocks of `ulysses_degree x ring_degree` ranks form independent sequence parallel groups, one for the
+    whole world or e.g. one per CFG branch. Inside a block, the rank at position `p` holds the `p`-th chunk of the
+    sequence and sits at position `p % ulysses_degree` of its Ulysses group and `p // ulysses_degree` of its ring
+    group, so the Ulysses groups are made of consecutive ranks (one node, when the degree does not exceed the GPUs per
+    node) and the ring groups stride across them.
+    """
+
+    def __init__(self, ulysses_degree: int, ring_degree: int):
+        world_size = dist.get_world_size()
+        sp_size = ulysses_degree * ring_degree
+        if world_size % sp_size != 0:
+            raise ValueError(
+                f"ulysses_degree ({ulysses_degree}) x ring_degree ({ring_degree}) must divide the world size "
+                f"({world_size})"
+            )
+        self.ulysses_degree = ulysses_degree
+        self.ring_degree = ring_degree
+        self.world_size = sp_size
+        global_rank = dist.get_rank()
+
+        # every rank has to create every group, in the same order
+        for start in range(0, world_size, sp_size):
+            ranks = list(range(start, start + sp_size))
+            group = dist.new_group(ranks)
+            if global_rank in ranks:
+                self.group, self.ranks = group, ranks
+            for ring_rank in range(ring_degree):
+                ulysses_ranks = ranks[ring_rank * ulysses_degree : (ring_rank + 1) * ulysses_degree]
+                group = dist.new_group(ulysses_ranks)
+                if global_rank in ulysses_ranks:
+                    self.ulysses_group, self.ulysses_ranks = group, ulysses_ranks
+            for ulysses_rank in range(ulysses_degree):
+                ring_ranks = ranks[ulysses_rank::ulysses_degree]
+                group = dist.new_group(ring_ranks)
+                if global_rank in ring_ranks:
+                    self.ring_group, self.ring_ranks = group, ring_ranks
+        self.rank = self.ranks.index(global_rank)
+
+
+_GROUPS: Optional[SequenceParallelGroups] = None
+
+
+def resolve_parallel_degrees(
+    world_size: int,
+    num_heads: int,
+    ulysses_degree: Optional[int] = None,
+    ring_degree: Optional[int] = None,
+    max_ulysses_degree: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    Splits `world_size` sequence parallel ranks into `(ulysses_degree, ring_degree)`.
+
+    Ulysses scatters the attention heads over its ranks with two all-to-alls per layer, so its degree must divide the
+    head count and it wants fast links between its ranks. Ring attention passes key/value blocks to the next rank and
+    overlaps that with compute, so it tolerates slow links and has no head constraint. Given degrees are validated;
+    a missing one is derived from the other. With neither, the largest Ulysses degree that divides both the head count
+    and the world size and does not exceed `max_ulysses_degree` (e.g. the GPUs of one node) is used and ring
+    attention covers the rest.
+    """
+    if world_size < 1:
+        raise ValueError(f"`world_size` must be positive, got {world_size}")
+    if ulysses_degree is None and ring_degree is None:
+        limit = min(world_size, max_ulysses_degree or world_size)
+        ulysses_degree = max(d for d in range(1, limit + 1) if world_size % d == 0 and num_heads % d == 0)
+    elif ulysses_degree is None:
+        if ring_degree < 1 or world_size % ring_degree != 0:
+            raise ValueError(f"ring_degree ({ring_degree}) must divide the world size ({world_size})")
+        ulysses_degree = world_size // ring_degree
+    elif ulysses_degree < 1 or world_size % ulysses_degree != 0:
+        raise ValueError(f"ulysses_degree ({ulysses_degree}) must divide the world size ({world_size})")
+    if ring_degree is None:
+        ring_degree = world_size // ulysses_degree
+    if ulysses_degree * ring_degree != world_size:
+        raise ValueError(
+            f"ulysses_degree ({ulysses_degree}) x ring_degree ({ring_degree}) must equal the world size ({world_size})"
+        )
+    if num_heads % ulysses_degree != 0:
+        raise ValueError(
+            f"ulysses_degree ({ulysses_degree}) must divide the number of attention heads ({num_heads}), "
+            "use a larger ring_degree instead"
+        )
+    return ulysses_degree, ring_degree
+
+
+def init_sequence_parallel(ulysses_degree: int, ring_degree: int) -> SequenceParallelGroups:
+    """Creates the Ulysses and ring groups from the default process group, which must already be initialized."""
+    global _GROUPS
+    _GROUPS = SequenceParallelGroups(ulysses_degree, ring_degree)
+    return _GROUPS
+
+
+def destroy_sequence_parallel():
+    global _GROUPS
+    _GROUPS = None
+
+
+def is_initialized() -> bool:
+    return _GROUPS is not None
+
+
+def get_groups() -> SequenceParallelGroups:
+    if _GROUPS is None:
+        raise RuntimeError("sequence parallelism is not initialized, call `init_sequence_parallel` first")
+    return _GROUPS
+
+
+def get_sequence_parallel_world_size() -> int:
+    return get_groups().world_size
+
+
+def get_sequence_parallel_rank() -> int:
+    return get_groups().rank
+
+
+def all_gather(x: torch.Tensor, dim: int = 1) -> torch.Tensor:
+    """Concatenates the sequence chunks of the sequence parallel group along `dim`, in rank order."""
+    groups = get_groups()
+    chunks = [torch.empty_like(x) for _ in range(groups.world_size)]
+    dist.all_gather(chunks, x.contiguous(), group=groups.group)
+    return torch.cat(chunks, dim=dim)
+
+
+def broadcast(x: torch.Tensor) -> torch.Tensor:
+    """Broadcasts `x` in place from the first rank of the sequence parallel group."""
+    groups = get_groups()
+    dist.broadcast(x, src=groups.ranks[0], group=groups.group)
+    return x
+
+
+def all_to_all(x: torch.Tensor, scatter_dim: int, gather_dim: int, group, ranks: List[int]) -> torch.Tensor:
+    """
+    Splits `x` into `len(ranks)` chunks along `scatter_dim`, sends chunk `i` to `ranks[i]` and concatenates the chunks
+    received from every rank along `gather_dim`. Backends without a native all-to-all, e.g. gloo, exchange the chunks
+    with point-to-point sends.
+    """
+    world_size = len(ranks)
+    if world_size == 1:
+        return x
+    inputs = [chunk.contiguous() for chunk in torch.chunk(x, world_size, dim=scatter_dim)]
+    outputs = [torch.empty_like(chunk) for chunk in inputs]
+    if dist.get_backend(group) == "nccl":
+        dist.all_to_all(outputs, inputs, group=group)
+    else:
+        index = ranks.index(dist.get_rank())
+        requests = []
+        for i, peer in enumerate(ranks):
+            if i == index:
+                outputs[i].copy_(inputs[i])
+            else:
+                requests.append(dist.isend(inputs[i], dst=peer, group=group))
+                requests.append(dist.irecv(outputs[i], src=peer, group=group))
+        for request in requests:
+            request.wait()
+    return torch.cat(outputs, dim=gather_dim)
+
+
+def _attention_block(q, k, v, scale):
+    # [B, N, Lq, D] x [B, N, Lk, D], returns the block output and its log-sum-exp to merge blocks exactly
+    scores = torch.matmul(q, k.transpose(-2, -1)) * scale
+    lse = torch.logsumexp(scores, dim=-1, keepdim=True)
+    return torch.matmul(torch.exp(scores - lse), v), lse
+
+
+def ring_attention(q, k, v, group, ranks: List[int], softmax_scale: Optional[float] = None) -> torch.Tensor:
+    """
+    Attention of the local queries over the keys and values of all `ranks`, all [B, L, N, D]. The key/value block is
+    passed to the next rank while the current one is attended, and the partial outputs are merged through their
+    log-sum-exp, so the result equals full attention up to float32 rounding.
+    """
+    scale = softmax_scale or 1.0 / math.sqrt(q.size(-1))
+    out_dtype = q.dtype
+    q = q.transpose(1, 2).float()
+    kv = torch.stack([k, v]).transpose(2, 3).float().contiguous()
+
+    world_size = len(ranks)
+    index = ranks.index(dist.get_rank()) if world_size > 1 else 0
+    out, lse = None, None
+    for step in range(world_size):
+        if step + 1 < world_size:
+            incoming = torch.empty_like(kv)
+            requests = [
+                dist.isend(kv, dst=ranks[(index + 1) % world_size], group=group),
+                dist.irecv(incoming, src=ranks[(index - 1) % world_size], group=group),
+            ]
+        block_out, block_lse = _attention_block(q, kv[0], kv[1], scale)
+        if out is None:
+            out, lse = block_out, block_lse
+        else:
+            merged_lse = torch.logaddexp(lse, block_lse)
+            out = out * torch.exp(lse - merged_lse) + block_out * torch.exp(block_lse - merged_lse)
+            lse = merged_lse
+        if step + 1 < world_size:
+            for request in requests:
+                request.wait()
+            kv = incoming
+    return out.transpose(1, 2).to(out_dtype)
+
+
+def long_context_attention(q, k, v, softmax_scale: Optional[float] = None) -> torch.Tensor:
+    """
+    Hybrid Ulysses x Ring attention of the local sequence chunk, q, k and v of shape [B, L / P, N, D].
+
+    An all-to-all inside the Ulysses group trades the sequence split for a head split, ring attention then covers the
+    sequence chunks of the other Ulysses groups and a second all-to-all restores the sequence split. A degree of 1
+    reduces it to pure ring or pure Ulysses attention.
+    """
+    groups = get_groups()
+    if groups.ulysses_degree > 1:
+        q, k, v = (all_to_all(x, 2, 1, groups.ulysses_group, groups.ulysses_ranks) for x in (q, k, v))
+    x = ring_attention(q, k, v, groups.ring_group, groups.ring_ranks, softmax_scale)
+    if groups.ulysses_degree > 1:
+        x = all_to_all(x, 1, 2, groups.ulysses_group, groups.ulysses_ranks)
+    return x
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import time
+from contextlib import contextmanager
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+
+import torch
+import torch.distributed as dist
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+if hasattr(torch, "float8_e4m3fn"):
+    _SAFETENSORS_DTYPES.update(F8_E4M3=torch.float8_e4m3fn, F8_E5M2=torch.float8_e5m2)
+
+_STAGE_DIR: Optional[str] = None
+
+
+def set_stage_dir(stage_dir: Optional[str]):
+    """
+    Makes `shared_checkpoint` copy checkpoints into `stage_dir` (e.g. /dev/shm) once per node before mapping them,
+    for network filesystems whose page cache is not shared between processes. None maps them from where they are.
+    """
+    global _STAGE_DIR
+    _STAGE_DIR = stage_dir
+
+
+def is_node_leader() -> bool:
+    """Whether this process is the first of its node (`LOCAL_RANK` 0 under torchrun), or the only one."""
+    if not dist.is_initialized():
+        return True
+    return int(os.environ.get("LOCAL_RANK", dist.get_rank())) == 0
+
+
+def _read_through(path: str, chunk_size: int = 64 << 20):
+    # sequential reads fill the page cache that the other ranks then map
+    with open(path, "rb", buffering=0) as f:
+        buffer = bytearray(chunk_size)
+        while f.readinto(buffer):
+            pass
+
+
+def _staged_path(path: str, stage_dir: str) -> str:
+    path = os.path.abspath(path)
+    run_id = os.environ.get("TORCHELASTIC_RUN_ID", os.environ.get("MASTER_PORT", ""))
+    digest = hashlib.sha1(f"{run_id}:{path}".encode()).hexdigest()[:12]
+    return os.path.join(stage_dir, f"skyreels-{digest}-{os.path.basename(path)}")
+
+
+@contextmanager
+def shared_checkpoint(path: str) -> Iterator[str]:
+    """
+    Yields the path the ranks should map `path` from, so that each node reads the checkpoint from disk once.
+
+    Without distribution this is `path` itself. Otherwise the node leader reads the file first, warming the page
+    cache, or copies it into the stage directory (see `set_stage_dir`), while the other ranks wait. Every rank then
+    maps the same pages with `map_safetensors` or `torch.load(..., mmap=True)`, instead of holding a private copy.
+    Staged copies are unlinked once every rank has left the block; pages still mapped stay valid until released.
+    Collective: all ranks must load the same checkpoints in the same order.
+    """
+    if not dist.is_initialized():
+        yield path
+        return
+
+    staged = path if _STAGE_DIR is None else _staged_path(path, _STAGE_DIR)
+    if is_node_leader():
+        if staged == path:
+            _read_through(path)
+        else:
+            shutil.copyfile(path, staged + ".tmp")
+            os.replace(staged + ".tmp", staged)
+    dist.barrier()
+    try:
+        yield staged
+    finally:
+        dist.barrier()
+        if staged != path and is_node_leader():
+            os.remove(staged)
+
+
+def map_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Loads a safetensors file without copying it: the tensors are views into a private memory mapping, so processes
+    mapping the same file share its pages and writes to a tensor never reach the file. Tensors whose offset is not
+    a multiple of their element size, e.g. after an unpadded header, are copied out of the mapping instead.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    (header_size,) = struct.unpack("<Q", buffer[:8])
+    header = json.loads(buffer[8 : 8 + header_size])
+    header.pop("__metadata__", None)
+
+    tensors = {}
+    for key, info in header.items():
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        count = (end - start) // dtype.itemsize
+        offset = 8 + header_size + start
+        if count == 0:
+            tensor = torch.empty(0, dtype=dtype)
+        elif offset % dtype.itemsize:
+            # kernels assume aligned data, copy the bytes into a fresh (aligned) allocation
+            tensor = torch.frombuffer(buffer, dtype=torch.uint8, count=end - start, offset=offset).clone().view(dtype)
+        else:
+            tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        tensors[key] = tensor.view(info["shape"])
+    return tensors
+
+
+def memory_usage() -> Dict[str, int]:
+    """
+    Memory of this process in bytes, from /proc on Linux: `peak_rss` (VmHWM), `rss_anon`, the private memory, and
+    `pss`, the resident memory with pages shared by `n` processes counted `1 / n` times.
+    """
+    usage = {"peak_rss": 0, "rss_anon": 0, "pss": 0}
+    fields = {"VmHWM:": "peak_rss", "RssAnon:": "rss_anon", "Pss:": "pss"}
+    for proc_file in ("/proc/self/status", "/proc/self/smaps_rollup"):
+        try:
+            with open(proc_file) as f:
+                for line in f:
+                    name, *values = line.split()
+                    if name in fields:
+                        usage[fields[name]] = int(values[0]) * 1024
+        except OSError:
+            pass
+    return usage
+
+
+def report_cold_start(start_time: float) -> str:
+    """
+    Summarizes the start-up since `start_time` (a `time.perf_counter()` value): the wall time of the slowest rank,
+    the largest peak RSS of a rank, and per node the sum of the ranks' peak RSS, which over-counts shared checkpoint
+    pages, and of their current PSS, which counts them once. Collective when distributed.
+    """
+    elapsed = time.perf_counter() - start_time
+    usage = memory_usage()
+    stats = [(0, elapsed, usage)]
+    if dist.is_initialized():
+        local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", dist.get_world_size()))
+        node = dist.get_rank() // local_world_size
+        stats = [None] * dist.get_world_size()
+        dist.all_gather_object(stats, (node, elapsed, usage))
+
+    gib = float(1 << 30)
+    nodes = {}
+    for rank_node, _, rank_usage in stats:
+        peak, pss = nodes.get(rank_node, (0, 0))
+        nodes[rank_node] = (peak + rank_usage["peak_rss"], pss + rank_usage["pss"])
+    return (
+        f"cold start {max(s[1] for s in stats):.1f}s, "
+        f"peak RSS per rank {max(s[2]['peak_rss'] for s in stats) / gib:.2f} GiB, "
+        f"node peak RSS (sum over ranks) {max(peak for peak, _ in nodes.values()) / gib:.2f} GiB, "
+        f"node PSS {max(pss for _, pss in nodes.values()) / gib:.2f} GiB"
+    )
@@ -0,0 +1,255 @@
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+
+import torch
+import torch.distributed as dist
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class TensorParallelGroups:
+    """
+    Process groups for Megatron-style tensor parallelism.
+
+    Consecutive blocks of `tp_size` ranks each hold one copy of the model, with the attention heads and the
+    feed-forward features split over the ranks of the block. Every rank of a block sees the full sequence, and the
+    partial outputs are summed with one all-reduce after each attention and feed-forward layer. With CFG parallelism
+    each guidance branch takes one block (see `init_cfg_parallel`).
+    """
+
+    def __init__(self, tp_size: int):
+        world_size = dist.get_world_size()
+        if tp_size < 1 or world_size % tp_size != 0:
+            raise ValueError(f"tp_size ({tp_size}) must divide the world size ({world_size})")
+        self.world_size = tp_size
+        global_rank = dist.get_rank()
+
+        # every rank has to create every group, in the same order
+        for start in range(0, world_size, tp_size):
+            ranks = list(range(start, start + tp_size))
+            group = dist.new_group(ranks)
+            if global_rank in ranks:
+                self.group, self.ranks = group, ranks
+        self.rank = self.ranks.index(global_rank)
+
+
+_GROUPS: Optional[TensorParallelGroups] = None
+
+
+def init_tensor_parallel(tp_size: Optional[int] = None) -> TensorParallelGroups:
+    """Creates the tensor parallel groups, over the whole world by default, from the initialized default group."""
+    global _GROUPS
+    _GROUPS = TensorParallelGroups(tp_size or dist.get_world_size())
+    return _GROUPS
+
+
+def destroy_tensor_parallel():
+    global _GROUPS
+    _GROUPS = None
+
+
+def is_initialized() -> bool:
+    return _GROUPS is not None
+
+
+def get_groups() -> TensorParallelGroups:
+    if _GROUPS is None:
+        raise RuntimeError("tensor parallelism is not initialized, call `init_tensor_parallel` first")
+    return _GROUPS
+
+
+def local_shard(size: int, group=None) -> Tuple[int, slice]:
+    """The number of features out of `size` held by this rank of `group`, and their slice."""
+    world_size = dist.get_world_size(group)
+    if size % world_size != 0:
+        raise ValueError(f"{size} features can't be split evenly over {world_size} tensor parallel ranks")
+    local_size = size // world_size
+    start = dist.get_rank(group) * local_size
+    return local_size, slice(start, start + local_size)
+
+
+class ColumnParallelLinear(nn.Module):
+    """
+    `nn.Linear` keeping the rank's slice of the output features, e.g. its attention heads. The output stays split, to
+    be consumed by per-head or elementwise ops and then a `RowParallelLinear`.
+    """
+
+    # dimension of each parameter that is split over the ranks, read by `load_sharded_state_dict`
+    tp_shard_dims = {"weight": 0, "bias": 0}
+
+    def __init__(self, linear: nn.Linear, group=None):
+        super().__init__()
+        self.group = group
+        self.in_features = linear.in_features
+        self.out_features, self.shard = local_shard(linear.out_features, group)
+        self.weight = nn.Parameter(linear.weight[self.shard].clone(), requires_grad=False)
+        if linear.bias is not None:
+            self.bias = nn.Parameter(linear.bias[self.shard].clone(), requires_grad=False)
+        else:
+            self.register_parameter("bias", None)
+
+    def forward(self, x):
+        return F.linear(x, self.weight, self.bias)
+
+
+class RowParallelLinear(nn.Module):
+    """
+    `nn.Linear` keeping the rank's slice of the input features, applied to the split output of a column parallel
+    layer. The partial products are summed over the group, so every rank gets the full output.
+    """
+
+    tp_shard_dims = {"weight": 1}
+
+    def __init__(self, linear: nn.Linear, group=None):
+        super().__init__()
+        self.group = group
+        self.out_features = linear.out_features
+        self.in_features, self.shard = local_shard(linear.in_features, group)
+        self.weight = nn.Parameter(linear.weight[:, self.shard].clone(), requires_grad=False)
+        if linear.bias is not None:
+            # added once, after the reduction
+            self.bias = nn.Parameter(linear.bias.clone(), requires_grad=False)
+        else:
+            self.register_parameter("bias", None)
+
+    def forward(self, x):
+        x = F.linear(x, self.weight)
+        dist.all_reduce(x, group=self.group)
+        return x if self.bias is None else x + self.bias
+
+
+class ParallelRMSNorm(nn.Module):
+    """
+    `WanRMSNorm` over features split like a column parallel layer: the mean square spans every head, so the sums of
+    squares are all-reduced before normalizing the local features.
+    """
+
+    tp_shard_dims = {"weight": 0}
+
+    def __init__(self, norm: nn.Module, group=None):
+        super().__init__()
+        self.group = group
+        self.dim = norm.dim
+        self.eps = norm.eps
+        _, self.shard = local_shard(norm.dim, group)
+        self.weight = nn.Parameter(norm.weight[self.shard].clone(), requires_grad=False)
+
+    def forward(self, x):
+        x = x.float()
+        sum_sq = x.pow(2).sum(dim=-1, keepdim=True)
+        dist.all_reduce(sum_sq, group=self.group)
+        return x * torch.rsqrt(sum_sq / self.dim + self.eps) * self.weight
+
+
+def _shard_heads(embedding: nn.Embedding, group=None):
+    """Keeps the rank's heads of a T5 relative position embedding, whose [num_buckets, num_heads] weight is per head."""
+    embedding.embedding_dim, embedding.shard = local_shard(embedding.embedding_dim, group)
+    embedding.weight = nn.Parameter(embedding.weight[:, embedding.shard].clone(), requires_grad=False)
+    embedding.tp_shard_dims = {"weight": 1}
+
+
+def _shard_wan_attention(attn, group=None):
+    from ..modules.transformer import WanI2VCrossAttention
+    from ..modules.transformer import WanRMSNorm
+
+    if attn.fused_qkv:
+        raise ValueError("shard the model before fusing its q/k/v projections")
+    attn.num_heads, _ = local_shard(attn.num_heads, group)
+    names = ["q", "k", "v"] + (["k_img", "v_img"] if isinstance(attn, WanI2VCrossAttention) else [])
+    for name in names:
+        setattr(attn, name, ColumnParallelLinear(getattr(attn, name), group))
+    attn.o = RowParallelLinear(attn.o, group)
+    for name in ("norm_q", "norm_k", "norm_k_img"):
+        if isinstance(getattr(attn, name, None), WanRMSNorm):
+            setattr(attn, name, ParallelRMSNorm(getattr(attn, name), group))
+
+
+def _shard_t5_attention(attn, group=None):
+    attn.num_heads, _ = local_shard(attn.num_heads, group)
+    attn.dim_attn = attn.num_heads * attn.head_dim
+    for name in ("q", "k", "v"):
+        setattr(attn, name, ColumnParallelLinear(getattr(attn, name), group))
+    attn.o = RowParallelLinear(attn.o, group)
+
+
+def shard_model(model: nn.Module, sync_module_states: bool = False, group=None) -> nn.Module:
+    """
+    Tensor parallel `shard_fn` for `T5EncoderModel`, `get_text_encoder` and `get_transformer`.
+
+    Splits the attention heads and the feed-forward features of the T5 encoder and of `WanModel` over the ranks of
+    `group`, the tensor parallel group by default. The q/k/v and first feed-forward projections become column
+    parallel, the output and second feed-forward projections row parallel, so each rank holds `1 / tp_size` of the
+    linear weights and each layer costs one all-reduce. Embeddings, modulations, norms over the hidden size and the
+    output head are small and stay replicated.
+
+    The model may live on the meta device, in which case `load_sharded_state_dict` fills in the rank's slices of the
+    checkpoint afterwards; that's how the loaders keep the full weights out of each rank's memory. Every rank loads
+    the same checkpoint, so `sync_module_states` has nothing to do and is accepted for compatibility with FSDP-style
+    shard functions.
+    """
+    from ..modules.t5 import T5Attention
+    from ..modules.t5 import T5FeedForward
+    from ..modules.t5 import T5RelativeEmbedding
+    from ..modules.transformer import WanAttentionBlock
+
+    if group is None and is_initialized():
+        group = get_groups().group
+    for module in list(model.modules()):
+        if isinstance(module, WanAttentionBlock):
+            _shard_wan_attention(module.self_attn, group)
+            _shard_wan_attention(module.cross_attn, group)
+            module.ffn[0] = ColumnParallelLinear(module.ffn[0], group)
+            module.ffn[2] = RowParallelLinear(module.ffn[2], group)
+        elif isinstance(module, T5Attention):
+            _shard_t5_attention(module, group)
+        elif isinstance(module, T5FeedForward):
+            module.gate[0] = ColumnParallelLinear(module.gate[0], group)
+            module.fc1 = ColumnParallelLinear(module.fc1, group)
+            module.fc2 = RowParallelLinear(module.fc2, group)
+        elif isinstance(module, T5RelativeEmbedding):
+            module.num_heads, _ = local_shard(module.num_heads, group)
+            _shard_heads(module.embedding, group)
+    return model
+
+
+def load_sharded_state_dict(
+    model: nn.Module, state_dict: Mapping, device="cpu", dtype: Optional[torch.dtype] = None
+) -> List[str]:
+    """
+    Assigns checkpoint tensors to the parameters of `model`, typically built on the meta device and sharded by
+    `shard_model`, reading only the rank's slice of the sharded parameters.
+
+    `state_dict` maps checkpoint keys to tensors, typically memory-mapped with `map_safetensors` or
+    `torch.load(..., mmap=True)` so that only the pages of the rank's slices are read. Keys missing from `state_dict`
+    are skipped, so checkpoints split into several files can be loaded one file at a time. Parameters are cast to
+    `dtype`, except those a module lists in `keep_dtypes`, e.g. quantized weights.
+
+    Returns the names of the loaded parameters.
+    """
+    loaded = []
+    for prefix, module in model.named_modules():
+        shard_dims = getattr(module, "tp_shard_dims", {})
+        keep_dtypes = getattr(module, "keep_dtypes", ())
+        for name, param in list(module._parameters.items()):
+            key = f"{prefix}.{name}" if prefix else name
+            if param is None or key not in state_dict:
+                continue
+            dim = shard_dims.get(name)
+            if dim is None:
+                tensor = state_dict[key][:]
+            elif dim == 0:
+                tensor = state_dict[key][module.shard]
+            else:
+                tensor = state_dict[key][:, module.shard]
+            # tensors already on `device` with `dtype`, e.g. memory-mapped ones, are used without a copy
+            tensor = tensor.to(device=device, dtype=param.dtype if name in keep_dtypes else dtype).contiguous()
+            module._parameters[name] = nn.Parameter(tensor, requires_grad=param.requires_grad)
+            loaded.append(key)
+    return loaded
+
+
+def unloaded_parameters(model: nn.Module) -> List[str]:
+    """Names of the parameters still on the meta device, i.e. missing from every checkpoint file."""
+    return [name for name, param in model.named_parameters() if param.is_meta]
@@ -0,0 +1,67 @@
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import torch
+import torch.distributed as dist
+
+
+def split_latent_frames(num_latent_frames: int, world_size: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    Contiguous `(start, end)` latent frame ranges, one per rank. Every rank but the first also decodes up to `overlap`
+    warm-up frames, so the first rank takes correspondingly more frames of its own to even out the work.
+    """
+    work = num_latent_frames + overlap * (world_size - 1)
+    ranges = []
+    start = 0
+    for rank in range(world_size):
+        share = work // world_size + (1 if rank < work % world_size else 0)
+        warmup = min(overlap, start)
+        end = num_latent_frames if rank == world_size - 1 else min(num_latent_frames, start + max(share - warmup, 1))
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def num_video_frames(start: int, end: int, temporal_stride: int = 4) -> int:
+    """Video frames decoded from latent frames `start` to `end`: one for latent frame 0, `temporal_stride` after."""
+    return sum(1 if i == 0 else temporal_stride for i in range(start, end))
+
+
+def parallel_decode(vae, z: torch.Tensor, overlap: int = 4, group=None, dst: Optional[int] = None) -> torch.Tensor:
+    """
+    Decodes `z` ([B, C, T, H, W] or [C, T, H, W]) with a `WanVAE` split over the ranks of `group`.
+
+    Every rank holds the same latents, e.g. after sequence parallel denoising. Each decodes the temporal chunk given by
+    `split_latent_frames`, warming its causal caches up on the `overlap` latent frames before the chunk, and the
+    frames are gathered on rank `dst` of the group, or on every rank when `dst` is None. The first chunk is exact, the
+    others match the single-rank decode closely and exactly when `overlap` reaches back to the first latent frame.
+
+    Returns the full video clamped to [-1, 1] like `WanVAE.decode`, or the rank's own frames on ranks other than
+    `dst`.
+    """
+    if z.dim() == 4:
+        z = z.unsqueeze(0)
+    world_size = dist.get_world_size(group)
+    rank = dist.get_rank(group)
+    ranges = split_latent_frames(z.shape[2], world_size, overlap)
+    counts = [num_video_frames(start, end, vae.vae_stride[0]) for start, end in ranges]
+
+    start, end = ranges[rank]
+    b, _, _, h, w = z.shape
+    shape = (b, 3, max(counts), h * vae.vae_stride[1], w * vae.vae_stride[2])
+    local = torch.zeros(shape, dtype=torch.float32, device=z.device)
+    if end > start:
+        local[:, :, : counts[rank]] = vae.vae.decode_range(z, vae.scale, start, end, overlap).float().clamp_(-1, 1)
+
+    # chunks are padded to the longest one since the collectives need equal shapes
+    if dst is None:
+        chunks = [torch.empty_like(local) for _ in range(world_size)]
+        dist.all_gather(chunks, local, group=group)
+    else:
+        chunks = [torch.empty_like(local) for _ in range(world_size)] if rank == dst else None
+        global_dst = dst if group is None else dist.get_process_group_ranks(group)[dst]
+        dist.gather(local, chunks, dst=global_dst, group=group)
+        if rank != dst:
+            return local[:, :, : counts[rank]]
+    return torch.cat([chunk[:, :, :count] for chunk, count in zip(chunks, counts)], dim=2)
@@ -1,13 +1,51 @@
-import numpy as np
 import torch
-import torch.amp as amp
 from torch.backends.cuda import sdp_kernel
-from xfuser.core.distributed import get_sequence_parallel_rank
-from xfuser.core.distributed import get_sequence_parallel_world_size
-from xfuser.core.distributed import get_sp_group
-from xfuser.core.long_ctx_attention import xFuserLongContextAttention
 
+try:
+    import xfuser.core.distributed as xfuser_distributed
+    from xfuser.core.long_ctx_attention import xFuserLongContextAttention
+
+    XFUSER_AVAILABLE = True
+except ImportError:
+    XFUSER_AVAILABLE = False
+
+from ..modules.device import float32_autocast
+from ..modules.device import no_autocast
 from ..modules.transformer import sinusoidal_embedding_1d
+from . import sequence_parallel
+
+
+# The native `sequence_parallel` groups take precedence once initialized, otherwise the xDiT ones are used.
+def get_sequence_parallel_world_size():
+    if sequence_parallel.is_initialized():
+        return sequence_parallel.get_sequence_parallel_world_size()
+    return xfuser_distributed.get_sequence_parallel_world_size()
+
+
+def get_sequence_parallel_rank():
+    if sequence_parallel.is_initialized():
+        return sequence_parallel.get_sequence_parallel_rank()
+    return xfuser_distributed.get_sequence_parallel_rank()
+
+
+def sp_all_gather(x, dim):
+    if sequence_parallel.is_initialized():
+        return sequence_parallel.all_gather(x, dim=dim)
+    return xfuser_distributed.get_sp_group().all_gather(x, dim=dim)
+
+
+def sp_broadcast(x):
+    if sequence_parallel.is_initialized():
+        return sequence_parallel.broadcast(x)
+    return xfuser_distributed.get_sp_group().broadcast(x, src=0)
+
+
+def long_context_attention(q, k, v, window_size=(-1, -1)):
+    if sequence_parallel.is_initialized():
+        assert tuple(window_size) == (-1, -1), "the native sequence parallel attention does not support windows"
+        return sequence_parallel.long_context_attention(q, k, v)
+    # xDiT reads the Ulysses and ring degrees from `initialize_model_parallel`
+    return xFuserLongContextAttention()(None, query=q, key=k, value=v, window_size=window_size)
 
 
 def pad_freqs(original_tensor, target_len):
@@ -18,7 +56,7 @@ def pad_freqs(original_tensor, target_len):
     return padded_tensor
 
 
-@amp.autocast("cuda", enabled=False)
+@no_autocast
 def rope_apply(x, grid_sizes, freqs):
     """
     x:          [B, L, N, C].
@@ -52,7 +90,7 @@ def rope_apply(x, grid_sizes, freqs):
         freqs_i = pad_freqs(freqs_i, s * sp_size)
         s_per_rank = s
         freqs_i_rank = freqs_i[(sp_rank * s_per_rank) : ((sp_rank + 1) * s_per_rank), :, :]
-        x_i = torch.view_as_real(x_i * freqs_i_rank.cuda()).flatten(2)
+        x_i = torch.view_as_real(x_i * freqs_i_rank.to(x_i.device)).flatten(2)
         x_i = torch.cat([x_i, x[i, s:]])
 
         # append to collection
@@ -60,15 +98,14 @@ def rope_apply(x, grid_sizes, freqs):
     return torch.stack(output).float()
 
 
-def broadcast_should_calc(should_calc: bool) -> bool:
+def broadcast_should_calc(should_calc: torch.Tensor) -> torch.Tensor:
     import torch.distributed as dist
 
-    device = torch.cuda.current_device()
-    int_should_calc = 1 if should_calc else 0
-    tensor = torch.tensor([int_should_calc], device=device, dtype=torch.int8)
-    dist.broadcast(tensor, src=0)
-    should_calc = tensor.item() == 1
-    return should_calc
+    device = torch.cuda.current_device() if dist.get_backend() == "nccl" else "cpu"
+    tensor = should_calc.reshape(1).to(device=device, dtype=torch.int8)
+    # ranks of one sequence parallel group have to agree, other groups (e.g. the other CFG branch) decide alone
+    tensor = sp_broadcast(tensor)
+    return tensor[0] == 1
 
 
 def usp_dit_forward(self, x, t, context, clip_fea=None, y=None, fps=None):
@@ -106,7 +143,7 @@ def usp_dit_forward(self, x, t, context, clip_fea=None, y=None, fps=None):
         self.block_mask = casual_mask.unsqueeze(0).unsqueeze(0)
 
     # time embeddings
-    with amp.autocast("cuda", dtype=torch.float32):
+    with float32_autocast(device):
         if t.dim() == 2:
             b, f = t.shape
             _flag_df = True
@@ -125,15 +162,15 @@ def usp_dit_forward(self, x, t, context, clip_fea=None, y=None, fps=None):
                 e0 = e0 + self.fps_projection(fps_emb).unflatten(1, (6, self.dim)).repeat(t.shape[1], 1, 1)
             else:
                 e0 = e0 + self.fps_projection(fps_emb).unflatten(1, (6, self.dim))
+        # CPU autocast returns the embeddings in its low precision dtype, see `WanModel.forward`
+        e, e0 = e.float(), e0.float()
 
         if _flag_df:
-            e = e.view(b, f, 1, 1, self.dim)
-            e0 = e0.view(b, f, 1, 1, 6, self.dim)
-            e = e.repeat(1, 1, grid_sizes[1], grid_sizes[2], 1).flatten(1, 3)
-            e0 = e0.repeat(1, 1, grid_sizes[1], grid_sizes[2], 1, 1).flatten(1, 3)
-            e0 = e0.transpose(1, 2).contiguous()
-
-        assert e.dtype == torch.float32 and e0.dtype == torch.float32
+            # per-token modulation in a single copy, see `WanModel.forward`
+            tokens_per_frame = grid_sizes[1] * grid_sizes[2]
+            e = e.view(b, f, 1, self.dim).expand(b, f, tokens_per_frame, self.dim).flatten(1, 2)
+            e0 = e0.view(b, f, 1, 6, self.dim).permute(0, 3, 1, 2, 4)
+            e0 = e0.expand(b, 6, f, tokens_per_frame, self.dim).flatten(2, 3)
 
     # context
     context = self.text_embedding(context)
@@ -147,73 +184,10 @@ def usp_dit_forward(self, x, t, context, clip_fea=None, y=None, fps=None):
         e0 = torch.chunk(e0, get_sequence_parallel_world_size(), dim=2)[get_sequence_parallel_rank()]
     kwargs = dict(e=e0, grid_sizes=grid_sizes, freqs=self.freqs, context=context, block_mask=self.block_mask)
 
-    if self.enable_teacache:
-        modulated_inp = e0 if self.use_ref_steps else e
-        # teacache
-        if self.cnt % 2 == 0:  # even -> conditon
-            self.is_even = True
-            if self.cnt < self.ret_steps or self.cnt >= self.cutoff_steps:
-                should_calc_even = True
-                self.accumulated_rel_l1_distance_even = 0
-            else:
-                rescale_func = np.poly1d(self.coefficients)
-                self.accumulated_rel_l1_distance_even += rescale_func(
-                    ((modulated_inp - self.previous_e0_even).abs().mean() / self.previous_e0_even.abs().mean())
-                    .cpu()
-                    .item()
-                )
-                if self.accumulated_rel_l1_distance_even < self.teacache_thresh:
-                    should_calc_even = False
-                else:
-                    should_calc_even = True
-                    self.accumulated_rel_l1_distance_even = 0
-            self.previous_e0_even = modulated_inp.clone()
-        else:  # odd -> unconditon
-            self.is_even = False
-            if self.cnt < self.ret_steps or self.cnt >= self.cutoff_steps:
-                should_calc_odd = True
-                self.accumulated_rel_l1_distance_odd = 0
-            else:
-                rescale_func = np.poly1d(self.coefficients)
-                self.accumulated_rel_l1_distance_odd += rescale_func(
-                    ((modulated_inp - self.previous_e0_odd).abs().mean() / self.previous_e0_odd.abs().mean())
-                    .cpu()
-                    .item()
-                )
-                if self.accumulated_rel_l1_distance_odd < self.teacache_thresh:
-                    should_calc_odd = False
-                else:
-                    should_calc_odd = True
-                    self.accumulated_rel_l1_distance_odd = 0
-            self.previous_e0_odd = modulated_inp.clone()
-
     x = torch.chunk(x, get_sequence_parallel_world_size(), dim=1)[get_sequence_parallel_rank()]
-    if self.enable_teacache:
-        if self.is_even:
-            should_calc_even = broadcast_should_calc(should_calc_even)
-            if not should_calc_even:
-                x += self.previous_residual_even
-            else:
-                ori_x = x.clone()
-                for block in self.blocks:
-                    x = block(x, **kwargs)
-                ori_x.mul_(-1)
-                ori_x.add_(x)
-                self.previous_residual_even = ori_x
-        else:
-            should_calc_odd = broadcast_should_calc(should_calc_odd)
-            if not should_calc_odd:
-                x += self.previous_residual_odd
-            else:
-                ori_x = x.clone()
-                for block in self.blocks:
-                    x = block(x, **kwargs)
-                ori_x.mul_(-1)
-                ori_x.add_(x)
-                self.previous_residual_odd = ori_x
-        self.cnt += 1
-        if self.cnt >= self.num_steps:
-            self.cnt = 0
+    if self.step_cache is not None:
+        self.step_cache.sync_decision = broadcast_should_calc
+        x = self.step_cache(self.blocks, x, kwargs, e=e, e0=e0)
     else:
         # Context Parallel
         for block in self.blocks:
@@ -224,36 +198,31 @@ def usp_dit_forward(self, x, t, context, clip_fea=None, y=None, fps=None):
         e = torch.chunk(e, get_sequence_parallel_world_size(), dim=1)[get_sequence_parallel_rank()]
     x = self.head(x, e)
     # Context Parallel
-    x = get_sp_group().all_gather(x, dim=1)
+    x = sp_all_gather(x, dim=1)
     # unpatchify
     x = self.unpatchify(x, grid_sizes)
     return x.float()
 
 
-def usp_attn_forward(self, x, grid_sizes, freqs, block_mask):
+def usp_attn_forward(self, x, grid_sizes, freqs, block_mask, seq_lens=None):
 
     r"""
     Args:
         x(Tensor): Shape [B, L, num_heads, C / num_heads]
-        seq_lens(Tensor): Shape [B]
         grid_sizes(Tensor): Shape [B, 3], the second dimension contains (F, H, W)
         freqs(Tensor): Rope freqs, shape [1024, C / num_heads / 2]
+        seq_lens(Tensor): Packed sample lengths, not supported with sequence parallelism
     """
+    assert seq_lens is None, "packed sequences are not supported with xDiT USP"
     b, s, n, d = *x.shape[:2], self.num_heads, self.head_dim
     half_dtypes = (torch.float16, torch.bfloat16)
 
     def half(x):
         return x if x.dtype in half_dtypes else x.to(torch.bfloat16)
 
-    # query, key, value function
-    def qkv_fn(x):
-        q = self.norm_q(self.q(x)).view(b, s, n, d)
-        k = self.norm_k(self.k(x)).view(b, s, n, d)
-        v = self.v(x).view(b, s, n, d)
-        return q, k, v
-
-    x = x.to(self.q.weight.dtype)
-    q, k, v = qkv_fn(x)
+    # the bias keeps the compute dtype when the weight is quantized
+    x = x.to(self.o.bias.dtype)
+    q, k, v = self.qkv_fn(x)
 
     if not self._flag_ar_attention:
         q = rope_apply(q, grid_sizes, freqs)
@@ -278,7 +247,7 @@ def usp_attn_forward(self, x, grid_sizes, freqs, block_mask):
                 .transpose(1, 2)
                 .contiguous()
             )
-    x = xFuserLongContextAttention()(None, query=half(q), key=half(k), value=half(v), window_size=self.window_size)
+    x = long_context_attention(half(q), half(k), half(v), window_size=self.window_size)
 
     # output
     x = x.flatten(2)
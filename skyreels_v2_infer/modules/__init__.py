@@ -2,9 +2,14 @@ import gc
 import os
 
 import torch
-from safetensors.torch import load_file
 
+from ..distributed.shared_loading import map_safetensors
+from ..distributed.shared_loading import shared_checkpoint
+from ..distributed.tensor_parallel import load_sharded_state_dict
+from ..distributed.tensor_parallel import unloaded_parameters
 from .clip import CLIPModel
+from .quantization import quantize_model
+from .quantization import read_quantization_config
 from .t5 import T5EncoderModel
 from .transformer import WanModel
 from .vae import WanVAE
@@ -27,18 +32,44 @@ def get_vae(model_path, device="cuda", weight_dtype=torch.float32) -> WanVAE:
     return vae
 
 
-def get_transformer(model_path, device="cuda", weight_dtype=torch.bfloat16) -> WanModel:
+def get_transformer(
+    model_path, device="cuda", weight_dtype=torch.bfloat16, shard_fn=None, quantization=None
+) -> WanModel:
     config_path = os.path.join(model_path, "config.json")
-    transformer = WanModel.from_config(config_path).to(weight_dtype).to(device)
+    saved_quantization = read_quantization_config(model_path)
+    if saved_quantization is not None:
+        if quantization not in (None, saved_quantization["format"]):
+            raise ValueError(f"{model_path} holds {saved_quantization['format']} weights, not {quantization}")
+        quantization = saved_quantization["format"]
+    if shard_fn is not None and quantization is not None:
+        raise ValueError("tensor parallel sharding does not support quantized weights")
 
-    for file in os.listdir(model_path):
+    # built on the meta device and filled with the mapped checkpoint tensors, or with this rank's slices of them when
+    # a `shard_fn` splits the model, so no full-size copy of the weights is ever allocated on the host
+    with torch.device("meta"):
+        transformer = WanModel.from_config(config_path)
+    if shard_fn is not None:
+        transformer = shard_fn(transformer, sync_module_states=False)
+    load_device = device
+    if saved_quantization is not None:
+        # the layout of the quantized checkpoint, loaded as is
+        quantize_model(transformer, quantization)
+    elif quantization is not None:
+        # quantized while loading: the full precision weights stay mapped on the host and only the quantized ones
+        # reach the device
+        load_device = "cpu"
+
+    for file in sorted(os.listdir(model_path)):
         if file.endswith(".safetensors"):
-            file_path = os.path.join(model_path, file)
-            state_dict = load_file(file_path)
-            transformer.load_state_dict(state_dict, strict=False)
-            del state_dict
+            with shared_checkpoint(os.path.join(model_path, file)) as file_path:
+                load_sharded_state_dict(transformer, map_safetensors(file_path), load_device, weight_dtype)
             gc.collect()
-            torch.cuda.empty_cache()
+    missing = unloaded_parameters(transformer)
+    if missing:
+        raise RuntimeError(f"{model_path} is missing parameters: {missing}")
+    if saved_quantization is None and quantization is not None:
+        quantize_model(transformer, quantization)
+        transformer.to(device)
 
     transformer.requires_grad_(False)
     transformer.eval()
@@ -47,10 +78,11 @@ def get_transformer(model_path, device="cuda", weight_dtype=torch.bfloat16) -> W
     return transformer
 
 
-def get_text_encoder(model_path, device="cuda", weight_dtype=torch.bfloat16) -> T5EncoderModel:
+def get_text_encoder(model_path, device="cuda", weight_dtype=torch.bfloat16, shard_fn=None) -> T5EncoderModel:
     t5_model = os.path.join(model_path, "models_t5_umt5-xxl-enc-bf16.pth")
     tokenizer_path = os.path.join(model_path, "google", "umt5-xxl")
-    text_encoder = T5EncoderModel(checkpoint_path=t5_model, tokenizer_path=tokenizer_path).to(device).to(weight_dtype)
+    text_encoder = T5EncoderModel(checkpoint_path=t5_model, tokenizer_path=tokenizer_path, shard_fn=shard_fn)
+    text_encoder = text_encoder.to(device).to(weight_dtype)
     text_encoder.requires_grad_(False)
     text_encoder.eval()
     gc.collect()
@@ -19,10 +19,82 @@ import warnings
 
 __all__ = [
     "flash_attention",
+    "sdpa_attention",
     "attention",
 ]
 
 
+def _sdpa(q, k, v, softmax_scale=None, causal=False, window_size=(-1, -1), dropout_p=0.0):
+    """Attention of one sample (or a batch of equal-length samples) in the [B, L, N, C] layout of flash-attn."""
+    lq, lk = q.size(1), k.size(1)
+    if k.size(2) != q.size(2):
+        # grouped query attention: every key/value head serves `Nq / Nk` query heads
+        k = k.repeat_interleave(q.size(2) // k.size(2), dim=2)
+        v = v.repeat_interleave(q.size(2) // v.size(2), dim=2)
+
+    attn_mask = None
+    if causal or tuple(window_size) != (-1, -1):
+        # positions are aligned at the end of the sequences, like the flash-attn kernels do when lq != lk
+        diff = torch.arange(lk, device=q.device)[None, :] - torch.arange(lq, device=q.device)[:, None] - (lk - lq)
+        attn_mask = torch.ones(lq, lk, dtype=torch.bool, device=q.device)
+        left, right = window_size
+        if left >= 0:
+            attn_mask &= diff >= -left
+        if causal:
+            attn_mask &= diff <= 0
+        elif right >= 0:
+            attn_mask &= diff <= right
+
+    out = torch.nn.functional.scaled_dot_product_attention(
+        q.transpose(1, 2),
+        k.transpose(1, 2),
+        v.transpose(1, 2),
+        attn_mask=attn_mask,
+        dropout_p=dropout_p,
+        scale=softmax_scale,
+    )
+    return out.transpose(1, 2)
+
+
+def sdpa_attention(
+    q,
+    k,
+    v,
+    q_lens=None,
+    k_lens=None,
+    dropout_p=0.0,
+    softmax_scale=None,
+    q_scale=None,
+    causal=False,
+    window_size=(-1, -1),
+):
+    """
+    `flash_attention` on top of `scaled_dot_product_attention`, for CPUs and for GPUs without flash-attn. Inputs keep
+    their dtype, float32 included. Packed samples are attended one at a time rather than through a block-diagonal
+    mask, so memory stays that of the longest sample; query positions past the packed samples are zero.
+    """
+    b, lq, lk = q.size(0), q.size(1), k.size(1)
+    q = q.to(v.dtype)
+    k = k.to(v.dtype)
+    if q_scale is not None:
+        q = q * q_scale
+    if q_lens is None and k_lens is None:
+        return _sdpa(q, k, v, softmax_scale, causal, window_size, dropout_p)
+
+    assert b == 1, "packed sequences must be passed with a batch size of 1"
+    q_lens = [lq] if q_lens is None else q_lens.tolist()
+    k_lens = [lk] if k_lens is None else k_lens.tolist()
+    out = v.new_zeros(b, lq, q.size(2), v.size(3))
+    q_start = k_start = 0
+    for q_len, k_len in zip(q_lens, k_lens):
+        q_end, k_end = q_start + q_len, k_start + k_len
+        out[:, q_start:q_end] = _sdpa(
+            q[:, q_start:q_end], k[:, k_start:k_end], v[:, k_start:k_end], softmax_scale, causal, window_size, dropout_p
+        )
+        q_start, k_start = q_end, k_end
+    return out
+
+
 def flash_attention(
     q,
     k,
@@ -42,18 +114,34 @@ def flash_attention(
     q:              [B, Lq, Nq, C1].
     k:              [B, Lk, Nk, C1].
     v:              [B, Lk, Nk, C2]. Nq must be divisible by Nk.
-    q_lens:         [B].
-    k_lens:         [B].
+    q_lens:         [N]. Lengths of the samples packed along Lq (B must be 1), defaults to B samples of Lq.
+    k_lens:         [N]. Lengths of the samples packed along Lk (B must be 1), defaults to B samples of Lk.
     dropout_p:      float. Dropout probability.
     softmax_scale:  float. The scaling of QK^T before applying softmax.
     causal:         bool. Whether to apply causal attention mask.
     window_size:    (left right). If not (-1, -1), apply sliding window local attention.
     deterministic:  bool. If True, slightly slower and uses more memory.
     dtype:          torch.dtype. Apply when dtype of q/k/v is not float16/bfloat16.
+
+    Runs `sdpa_attention` instead off CUDA devices or without flash-attn.
     """
+    if q.device.type != "cuda" or not (FLASH_ATTN_2_AVAILABLE or FLASH_ATTN_3_AVAILABLE):
+        return sdpa_attention(
+            q,
+            k,
+            v,
+            q_lens=q_lens,
+            k_lens=k_lens,
+            dropout_p=dropout_p,
+            softmax_scale=softmax_scale,
+            q_scale=q_scale,
+            causal=causal,
+            window_size=window_size,
+        )
+
     half_dtypes = (torch.float16, torch.bfloat16)
     assert dtype in half_dtypes
-    assert q.device.type == "cuda" and q.size(-1) <= 256
+    assert q.size(-1) <= 256
 
     # params
     b, lq, lk, out_dtype = q.size(0), q.size(1), k.size(1), q.dtype
@@ -64,13 +152,25 @@ def flash_attention(
     # preprocess query
 
     q = half(q.flatten(0, 1))
-    q_lens = torch.tensor([lq] * b, dtype=torch.int32).to(device=q.device, non_blocking=True)
+    if q_lens is None:
+        q_lens = torch.tensor([lq] * b, dtype=torch.int32).to(device=q.device, non_blocking=True)
+        max_seqlen_q = lq
+    else:
+        assert b == 1, "packed sequences must be passed with a batch size of 1"
+        max_seqlen_q = int(q_lens.max())
+        q_lens = q_lens.to(device=q.device, dtype=torch.int32, non_blocking=True)
 
     # preprocess key, value
 
     k = half(k.flatten(0, 1))
     v = half(v.flatten(0, 1))
-    k_lens = torch.tensor([lk] * b, dtype=torch.int32).to(device=k.device, non_blocking=True)
+    if k_lens is None:
+        k_lens = torch.tensor([lk] * b, dtype=torch.int32).to(device=k.device, non_blocking=True)
+        max_seqlen_k = lk
+    else:
+        assert b == 1, "packed sequences must be passed with a batch size of 1"
+        max_seqlen_k = int(k_lens.max())
+        k_lens = k_lens.to(device=k.device, dtype=torch.int32, non_blocking=True)
 
     q = q.to(v.dtype)
     k = k.to(v.dtype)
@@ -97,8 +197,8 @@ def flash_attention(
             .to(q.device, non_blocking=True),
             seqused_q=None,
             seqused_k=None,
-            max_seqlen_q=lq,
-            max_seqlen_k=lk,
+            max_seqlen_q=max_seqlen_q,
+            max_seqlen_k=max_seqlen_k,
             softmax_scale=softmax_scale,
             causal=causal,
             deterministic=deterministic,
@@ -115,8 +215,8 @@ def flash_attention(
             cu_seqlens_k=torch.cat([k_lens.new_zeros([1]), k_lens])
             .cumsum(0, dtype=torch.int32)
             .to(q.device, non_blocking=True),
-            max_seqlen_q=lq,
-            max_seqlen_k=lk,
+            max_seqlen_q=max_seqlen_q,
+            max_seqlen_k=max_seqlen_k,
             dropout_p=dropout_p,
             softmax_scale=softmax_scale,
             causal=causal,
@@ -9,6 +9,7 @@ import torch.nn.functional as F
 import torchvision.transforms as T
 from diffusers.models import ModelMixin
 
+from ..distributed.shared_loading import shared_checkpoint
 from .attention import flash_attention
 from .tokenizers import HuggingfaceTokenizer
 from .xlm_roberta import XLMRoberta
@@ -497,7 +498,8 @@ class CLIPModel(ModelMixin):
         )
         self.model = self.model.eval().requires_grad_(False)
         logging.info(f"loading {checkpoint_path}")
-        self.model.load_state_dict(torch.load(checkpoint_path, map_location="cpu"))
+        with shared_checkpoint(checkpoint_path) as path:
+            self.model.load_state_dict(torch.load(path, map_location="cpu", mmap=True))
 
         # init tokenizer
         self.tokenizer = HuggingfaceTokenizer(
@@ -0,0 +1,80 @@
+import contextlib
+import os
+from typing import List
+from typing import Optional
+
+import torch
+
+
+def autocast(device, dtype: torch.dtype):
+    """
+    Mixed precision context of the pipelines on any device: autocast to the model's `dtype` on CUDA and CPU alike.
+    Float32 models run without autocast, which CPUs don't support for float32.
+    """
+    return torch.autocast(device_type=torch.device(device).type, dtype=dtype, enabled=dtype != torch.float32)
+
+
+def float32_autocast(device):
+    """
+    Float32 region inside `autocast`, e.g. the time embedding, modulation and residuals of the DiT, on the device of
+    its inputs. CUDA autocasts the region's matmuls to float32. CPU autocast has no float32 dtype and would switch off,
+    leaving float32 inputs against low precision weights, so there the enclosing autocast stays: matmuls return its
+    dtype, the caller upcasts what must stay float32, and elementwise ops follow their float32 inputs.
+    """
+    if torch.device(device).type == "cuda":
+        return torch.autocast(device_type="cuda", dtype=torch.float32)
+    return contextlib.nullcontext()
+
+
+def no_autocast(fn):
+    """Runs `fn` with autocast disabled on CUDA and CPU alike, e.g. the complex rope math."""
+    return torch.autocast("cuda", enabled=False)(torch.autocast("cpu", enabled=False)(fn))
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    """CPU ids of a Linux cpu list such as "0-31,64-95"."""
+    cpus = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def numa_node_cpus(node: int) -> List[int]:
+    """CPU ids of NUMA node `node`, from sysfs."""
+    path = f"/sys/devices/system/node/node{node}/cpulist"
+    if not os.path.exists(path):
+        raise ValueError(f"NUMA node {node} does not exist")
+    with open(path) as f:
+        return parse_cpu_list(f.read())
+
+
+def configure_cpu(num_threads: Optional[int] = None, cpus: Optional[str] = None, numa_node: Optional[int] = None):
+    """
+    Sets up this process for CPU inference: pins it to the `cpus` list or to the cores of `numa_node`, and sizes the
+    intra-op thread pool to `num_threads`, one thread per pinned core by default. Memory allocated after pinning, e.g.
+    weights cast or quantized while loading, lands on the pinned cores' node; run under `numactl --membind` to bind
+    the mapped checkpoint pages as well.
+
+    Returns:
+        int: Number of intra-op threads.
+    """
+    if cpus is not None and numa_node is not None:
+        raise ValueError("pin to a cpu list or to a NUMA node, not both")
+    pinned = None
+    if cpus is not None:
+        pinned = parse_cpu_list(cpus)
+    elif numa_node is not None:
+        pinned = numa_node_cpus(numa_node)
+    if pinned is not None:
+        os.sched_setaffinity(0, pinned)
+    if num_threads is None:
+        num_threads = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    torch.set_num_threads(num_threads)
+    return num_threads
@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+from typing import Optional
+from typing import Sequence
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+__all__ = [
+    "LatentPreviewer",
+    "fit_latent_previewer",
+    "load_latent_previewer",
+    "LATENT_PREVIEW_CONFIG_NAME",
+]
+
+LATENT_PREVIEW_CONFIG_NAME = "latent_preview.json"
+
+# Approximate [C, RGB] projection of the normalized Wan 2.1 VAE latents and its RGB bias. Checkpoints with a
+# calibrated `latent_preview.json` (see `src/utils/calibrate_latent_preview.py`) get sharper and truer colors.
+WAN_LATENT_RGB_FACTORS = [
+    [-0.1299, -0.1692, 0.2932],
+    [0.0671, 0.0406, 0.0442],
+    [0.3568, 0.2548, 0.1747],
+    [0.0372, 0.2344, 0.1420],
+    [0.0313, 0.0189, -0.0328],
+    [0.0296, -0.0956, -0.0665],
+    [-0.3477, -0.4059, -0.2925],
+    [0.0166, 0.1902, 0.1975],
+    [-0.0412, 0.0267, -0.1364],
+    [-0.1293, 0.0740, 0.1636],
+    [0.0680, 0.3019, 0.1128],
+    [0.0032, 0.0581, 0.0639],
+    [-0.1251, 0.0927, 0.1699],
+    [0.0060, -0.0633, 0.0005],
+    [0.3477, 0.2275, 0.2950],
+    [0.1984, 0.0913, 0.1861],
+]
+WAN_LATENT_RGB_BIAS = [-0.1835, -0.0868, -0.3360]
+
+
+class LatentPreviewer:
+    """
+    Cheap latent-to-RGB decoder for progress previews.
+
+    Every latent position is mapped linearly to an `upscale` x `upscale` patch of RGB pixels in [-1, 1], i.e. a
+    1x1 convolution followed by a pixel shuffle, so a preview of a whole clip costs a single small matmul instead of
+    a `WanVAE.decode`. With `upscale=1` this is the classic per-channel RGB projection. One preview frame is produced
+    per latent frame.
+
+    Args:
+        weight (`Sequence`): Projection of shape [3 * upscale**2, C].
+        bias (`Sequence`): Bias of shape [3 * upscale**2].
+        upscale (`int`, defaults to 1): Output pixels per latent position along each spatial axis.
+    """
+
+    def __init__(self, weight: Sequence, bias: Sequence, upscale: int = 1):
+        self.weight = torch.as_tensor(weight, dtype=torch.float32)
+        self.bias = torch.as_tensor(bias, dtype=torch.float32)
+        self.upscale = upscale
+        if self.weight.shape[0] != 3 * upscale**2 or self.bias.shape != (3 * upscale**2,):
+            raise ValueError(
+                f"expected a [{3 * upscale ** 2}, C] projection for upscale={upscale}, got {tuple(self.weight.shape)}"
+            )
+
+    @classmethod
+    def default(cls) -> "LatentPreviewer":
+        return cls(torch.tensor(WAN_LATENT_RGB_FACTORS).t(), WAN_LATENT_RGB_BIAS)
+
+    def to(self, device) -> "LatentPreviewer":
+        self.weight = self.weight.to(device)
+        self.bias = self.bias.to(device)
+        return self
+
+    def decode(self, latents: torch.Tensor) -> torch.Tensor:
+        """
+        Projects latents of shape [C, F, H, W] to RGB frames of shape [3, F, H * upscale, W * upscale] in [-1, 1].
+        """
+        weight = self.weight.to(latents.device)
+        bias = self.bias.to(latents.device)
+        rgb = torch.einsum("oc,cfhw->fohw", weight, latents.float()) + bias.view(1, -1, 1, 1)
+        if self.upscale > 1:
+            rgb = F.pixel_shuffle(rgb, self.upscale)
+        return rgb.clamp(-1, 1).permute(1, 0, 2, 3)
+
+    def __call__(self, latents: torch.Tensor) -> np.ndarray:
+        """
+        Returns uint8 preview frames of shape [F, H * upscale, W * upscale, 3] for latents of shape [C, F, H, W].
+        """
+        rgb = self.decode(latents)
+        return ((rgb + 1) * 127.5).round().to(torch.uint8).permute(1, 2, 3, 0).cpu().numpy()
+
+    def save(self, path: str):
+        config = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                config = json.load(f)
+        config.update({"weight": self.weight.tolist(), "bias": self.bias.tolist(), "upscale": self.upscale})
+        with open(path, "w") as f:
+            json.dump(config, f, indent=2)
+
+
+def latent_frame_targets(videos: torch.Tensor, num_latent_frames: int, temporal_stride: int = 4) -> torch.Tensor:
+    """Averages the video frames of shape [3, T, H, W] that each causal latent frame encodes."""
+    targets = [videos[:, :1].mean(dim=1)]
+    for i in range(1, num_latent_frames):
+        start = 1 + (i - 1) * temporal_stride
+        targets.append(videos[:, start : start + temporal_stride].mean(dim=1))
+    return torch.stack(targets, dim=1)
+
+
+def fit_latent_previewer(
+    latents: Sequence[torch.Tensor], videos: Sequence[torch.Tensor], upscale: int = 1, ridge: float = 1e-4
+) -> LatentPreviewer:
+    """
+    Least-squares fit of a `LatentPreviewer` on pairs of VAE latents [C, F, h, w] and the videos [3, T, H, W] in
+    [-1, 1] they were encoded from.
+    """
+    inputs, outputs = [], []
+    for z, video in zip(latents, videos):
+        z = z.float()
+        target = latent_frame_targets(video.float().to(z.device), z.shape[1])
+        target = F.interpolate(target.transpose(0, 1), size=(z.shape[2] * upscale, z.shape[3] * upscale), mode="area")
+        if upscale > 1:
+            target = F.pixel_unshuffle(target, upscale)
+        inputs.append(z.permute(1, 2, 3, 0).reshape(-1, z.shape[0]))
+        outputs.append(target.permute(0, 2, 3, 1).reshape(-1, target.shape[1]))
+    x = torch.cat(inputs).double()
+    y = torch.cat(outputs).double()
+    x = torch.cat([x, torch.ones_like(x[:, :1])], dim=1)
+    # ridge-regularized normal equations, well conditioned for the 17 x 17 system
+    gram = x.t() @ x + ridge * torch.eye(x.shape[1], dtype=x.dtype, device=x.device)
+    solution = torch.linalg.solve(gram, x.t() @ y)
+    return LatentPreviewer(solution[:-1].t().float().cpu(), solution[-1].float().cpu(), upscale=upscale)
+
+
+def load_latent_previewer(ckpt_dir: Optional[str] = None) -> LatentPreviewer:
+    """
+    Returns the calibrated previewer from `latent_preview.json` beside the weights, or the built-in projection.
+    """
+    config_path = os.path.join(ckpt_dir, LATENT_PREVIEW_CONFIG_NAME) if ckpt_dir else None
+    if config_path and os.path.exists(config_path):
+        with open(config_path) as f:
+            config = json.load(f)
+        if "weight" in config:
+            logging.info(f"using calibrated latent preview from {config_path}")
+            return LatentPreviewer(config["weight"], config["bias"], upscale=config.get("upscale", 1))
+    return LatentPreviewer.default()
@@ -0,0 +1,282 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from ..distributed.shared_loading import map_safetensors
+
+# key suffixes of the peft/diffusers and kohya LoRA layouts
+_LORA_SUFFIXES = {
+    ".lora_A.weight": "down",
+    ".lora_down.weight": "down",
+    ".lora_B.weight": "up",
+    ".lora_up.weight": "up",
+    ".alpha": "alpha",
+}
+# prefixes trainers put before the `WanModel` module names
+_LORA_PREFIXES = ("diffusion_model.", "base_model.model.", "transformer.", "model.")
+
+
+def read_lora(path: str, device="cpu", dtype: Optional[torch.dtype] = None) -> Dict[str, Tuple]:
+    """
+    Reads a LoRA safetensors file targeting `WanModel` module names, e.g. `blocks.0.self_attn.q`.
+
+    Returns:
+        Dict[str, Tuple]: `(down, up, scale)` per target module, with down [rank, in_features], up [out_features,
+        rank] and scale `alpha / rank`, 1 when the file has no alpha.
+    """
+    weights = {}
+    for key, tensor in map_safetensors(path).items():
+        suffix = next((suffix for suffix in _LORA_SUFFIXES if key.endswith(suffix)), None)
+        if suffix is None:
+            raise ValueError(f"{path}: unsupported LoRA key {key}")
+        name = key[: -len(suffix)]
+        prefix = next((prefix for prefix in _LORA_PREFIXES if name.startswith(prefix)), "")
+        weights.setdefault(name[len(prefix) :], {})[_LORA_SUFFIXES[suffix]] = tensor
+
+    layers = {}
+    for name, parts in weights.items():
+        if "down" not in parts or "up" not in parts:
+            raise ValueError(f"{path}: {name} lacks its down or up projection")
+        rank = parts["down"].size(0)
+        scale = parts["alpha"].item() / rank if "alpha" in parts else 1.0
+        down = parts["down"].to(device=device, dtype=dtype)
+        up = parts["up"].to(device=device, dtype=dtype)
+        layers[name] = (down, up, scale)
+    return layers
+
+
+class LoRAAdapter:
+    """A resident adapter. Its weights live in the `LoRALinear` layers it targets, which move them with the model."""
+
+    def __init__(self, name: str, path: str, layers: Dict[str, Tuple]):
+        self.name = name
+        self.path = path
+        self.layers = sorted(layers)
+        self.rank = max(down.size(0) for down, _, _ in layers.values())
+        self.nbytes = sum(t.numel() * t.element_size() for down, up, _ in layers.values() for t in (down, up))
+
+
+class LoRALinear(nn.Module):
+    """
+    Linear layer (plain or `QuantizedLinear`) with any number of resident LoRA adapters, applied unmerged as
+    `base(x) + scale * up(down(x))`. Switching adapters never touches the base weight, and each sample of a batch can
+    use a different adapter.
+    """
+
+    def __init__(self, base: nn.Module):
+        super().__init__()
+        self.base = base
+        self.in_features = base.in_features
+        self.out_features = base.out_features
+        self.adapters: Dict[str, Tuple] = {}
+        # adapter name (or None) of every sample along the batch dimension, or one for the whole batch
+        self.active: Optional[List[Optional[str]]] = None
+
+    @property
+    def bias(self) -> Optional[torch.Tensor]:
+        # the attention reads its compute dtype from `o.bias`, which adapters may wrap
+        return self.base.bias
+
+    def _apply(self, fn, *args, **kwargs):
+        # the adapters are not registered tensors, move and cast them with the base layer, e.g. when offloading
+        super()._apply(fn, *args, **kwargs)
+        self.adapters = {name: (fn(down), fn(up), scale) for name, (down, up, scale) in self.adapters.items()}
+        return self
+
+    def _delta(self, x, name):
+        down, up, scale = self.adapters[name]
+        return F.linear(F.linear(x, down.to(x.dtype)), up.to(x.dtype)) * scale
+
+    def forward(self, x):
+        y = self.base(x)
+        names = set(self.active or ()) & self.adapters.keys()
+        if not names:
+            return y
+        if len(set(self.active)) == 1:
+            return y + self._delta(x, self.active[0]).to(y.dtype)
+        if x.size(0) % len(self.active):
+            raise ValueError(f"{len(self.active)} adapter selections for a batch of {x.size(0)}")
+        # inputs flattened sample-major, e.g. the per-frame timesteps of diffusion forcing, repeat each selection
+        repeats = x.size(0) // len(self.active)
+        for name in names:
+            rows = [i * repeats + j for i, n in enumerate(self.active) if n == name for j in range(repeats)]
+            rows = torch.tensor(rows, device=x.device)
+            y = y.index_add(0, rows, self._delta(x.index_select(0, rows), name).to(y.dtype))
+        return y
+
+
+class LoRAManager:
+    """
+    Serves LoRA adapters on one resident `WanModel`.
+
+    Adapters are read from `lora_dir` (or from any path) on first use and kept in an LRU cache of up to
+    `max_adapters` entries, so a hot swap only changes which adapters the wrapped layers apply. Resident adapters
+    follow the model when it moves between devices, e.g. with `--offload`. `use` selects one adapter for the whole
+    batch or one per sample, which lets the requests of a `ContinuousBatchScheduler` batch use different adapters in
+    the same forward. The targeted layers are wrapped in `LoRALinear` on first use; fused q/k/v projections are split
+    back first, since adapters target q, k and v separately.
+
+    The adapter selection is state of the model, so `use` blocks are serialized across threads.
+    """
+
+    def __init__(self, model: nn.Module, lora_dir: Optional[str] = None, max_adapters: int = 8):
+        if max_adapters < 1:
+            raise ValueError(f"`max_adapters` must be positive, got {max_adapters}")
+        self.model = model
+        self.lora_dir = lora_dir
+        self.max_adapters = max_adapters
+        self.adapters: "OrderedDict[str, LoRAAdapter]" = OrderedDict()
+        self._in_use: Dict[str, int] = {}
+        self._cache_lock = threading.Lock()
+        self._active_lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_times: List[float] = []
+        self.swap_times: List[float] = []
+        if hasattr(model, "unfuse_qkv"):
+            model.unfuse_qkv()
+
+    @property
+    def device(self) -> torch.device:
+        # read at every load, the model may have moved since, e.g. with `--offload`
+        return next(self.model.parameters()).device
+
+    @property
+    def dtype(self) -> torch.dtype:
+        return getattr(self.model, "dtype", next(self.model.parameters()).dtype)
+
+    def available(self) -> List[str]:
+        """Names of the adapters in `lora_dir`."""
+        if self.lora_dir is None or not os.path.isdir(self.lora_dir):
+            return []
+        return sorted(f[: -len(".safetensors")] for f in os.listdir(self.lora_dir) if f.endswith(".safetensors"))
+
+    def _path(self, name: str) -> str:
+        if os.path.isfile(name):
+            return name
+        if self.lora_dir is not None:
+            path = os.path.join(self.lora_dir, f"{name}.safetensors")
+            if os.path.isfile(path):
+                return path
+        raise FileNotFoundError(f"no LoRA adapter {name!r} in {self.lora_dir}")
+
+    def _layer(self, name: str) -> LoRALinear:
+        parent_name, _, attr = name.rpartition(".")
+        parent = self.model.get_submodule(parent_name) if parent_name else self.model
+        layer = getattr(parent, attr, None)
+        if isinstance(layer, LoRALinear):
+            return layer
+        if not hasattr(layer, "in_features"):
+            raise ValueError(f"LoRA target {name} is not a linear layer of the model")
+        wrapped = LoRALinear(layer)
+        setattr(parent, attr, wrapped)
+        return wrapped
+
+    def _drop(self, name: str):
+        for layer in self.model.modules():
+            if isinstance(layer, LoRALinear):
+                layer.adapters.pop(name, None)
+        del self.adapters[name]
+
+    def _evict(self):
+        # least recently used first, never the adapter just loaded or one a forward is using
+        for name in list(self.adapters)[:-1]:
+            if len(self.adapters) <= self.max_adapters:
+                break
+            if not self._in_use.get(name):
+                self._drop(name)
+                self.evictions += 1
+
+    def load(self, name: str) -> LoRAAdapter:
+        """Makes adapter `name` (a name in `lora_dir` or a path) resident, reading it on a cache miss."""
+        with self._cache_lock:
+            if name in self.adapters:
+                self.hits += 1
+                self.adapters.move_to_end(name)
+                return self.adapters[name]
+
+            self.misses += 1
+            start = time.perf_counter()
+            path = self._path(name)
+            layers = read_lora(path, self.device, self.dtype)
+            targets = {target: self._layer(target) for target in layers}
+            for target, weights in layers.items():
+                targets[target].adapters[name] = weights
+            adapter = LoRAAdapter(name, path, layers)
+            self.adapters[name] = adapter
+            self._evict()
+            self.load_times.append(time.perf_counter() - start)
+            return adapter
+
+    def unload(self, name: str):
+        """Frees the device memory of adapter `name`."""
+        with self._cache_lock:
+            if self._in_use.get(name):
+                raise RuntimeError(f"LoRA adapter {name} is in use")
+            self._drop(name)
+
+    def _set_active(self, names: Optional[List[Optional[str]]]):
+        for layer in self.model.modules():
+            if isinstance(layer, LoRALinear):
+                layer.active = names
+
+    @contextmanager
+    def use(self, names: Union[None, str, Sequence[Optional[str]]]) -> Iterator[None]:
+        """
+        Applies adapter `names` in the forwards run inside the block: one name (or None for the base model) for the
+        whole batch, or one per sample along the batch dimension. Missing adapters are loaded first.
+        """
+        names = [names] if names is None or isinstance(names, str) else list(names)
+        wanted = {name for name in names if name is not None}
+        with self._active_lock:
+            for name in wanted:
+                self.load(name)
+                self._in_use[name] = self._in_use.get(name, 0) + 1
+            try:
+                start = time.perf_counter()
+                self._set_active(names)
+                self.swap_times.append(time.perf_counter() - start)
+                yield
+            finally:
+                self._set_active(None)
+                for name in wanted:
+                    self._in_use[name] -= 1
+
+    def stats(self) -> dict:
+        """Resident adapters with their memory, and the cache hit rate and load and swap latencies."""
+
+        def mean_ms(times):
+            return 1000 * sum(times) / len(times) if times else 0.0
+
+        return {
+            "adapters": [
+                {
+                    "name": adapter.name,
+                    "path": adapter.path,
+                    "rank": adapter.rank,
+                    "layers": len(adapter.layers),
+                    "memory_mb": adapter.nbytes / 2**20,
+                }
+                for adapter in self.adapters.values()
+            ],
+            "memory_mb": sum(adapter.nbytes for adapter in self.adapters.values()) / 2**20,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "mean_load_ms": mean_ms(self.load_times),
+            "mean_swap_ms": mean_ms(self.swap_times),
+        }
@@ -0,0 +1,237 @@
+import json
+import os
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+QUANTIZATION_CONFIG_NAME = "quantization_config.json"
+
+QUANT_DTYPES = {"int8": torch.int8}
+if hasattr(torch, "float8_e4m3fn"):
+    QUANT_DTYPES["fp8"] = torch.float8_e4m3fn
+
+QUANT_FORMATS = ("int8", "fp8")
+
+
+def _quant_dtype(fmt: str) -> torch.dtype:
+    if fmt not in QUANT_FORMATS:
+        raise ValueError(f"unknown quantization format {fmt!r}, expected one of {QUANT_FORMATS}")
+    if fmt not in QUANT_DTYPES:
+        raise ValueError(f"{fmt} quantization needs a torch build with float8_e4m3fn")
+    return QUANT_DTYPES[fmt]
+
+
+def quantize_weight(weight: torch.Tensor, fmt: str = "int8") -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Per output channel symmetric quantization of a [out_features, in_features] weight.
+
+    Each row is scaled so that its largest magnitude maps to the largest value of the format (127 for int8, 448 for
+    FP8 e4m3), then rounded. Returns the quantized weight and the float32 [out_features, 1] scales.
+    """
+    dtype = _quant_dtype(fmt)
+    weight = weight.float()
+    max_value = 127.0 if dtype == torch.int8 else torch.finfo(dtype).max
+    scale = weight.abs().amax(dim=1, keepdim=True).clamp(min=1e-12) / max_value
+    scaled = weight / scale
+    if dtype == torch.int8:
+        scaled = scaled.round().clamp(-127, 127)
+    return scaled.to(dtype), scale
+
+
+class QuantizedLinear(nn.Module):
+    """
+    `nn.Linear` with a weight-only quantized weight: int8 or FP8 values per output channel times a float32 scale,
+    dequantized to the input dtype at every forward. Inputs, outputs and the bias keep their dtype, so the layer runs
+    on any device, CPU included, and stores the weight in half the bytes of bf16.
+    """
+
+    # parameters loaded with their own dtype rather than the model's, see `load_sharded_state_dict`
+    keep_dtypes = ("weight", "weight_scale")
+
+    def __init__(
+        self, in_features: int, out_features: int, bias: bool = True, fmt: str = "int8", device=None, dtype=None
+    ):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.fmt = fmt
+        weight = torch.empty(out_features, in_features, dtype=_quant_dtype(fmt), device=device)
+        self.weight = nn.Parameter(weight, requires_grad=False)
+        scale = torch.empty(out_features, 1, dtype=torch.float32, device=device)
+        self.weight_scale = nn.Parameter(scale, requires_grad=False)
+        if bias:
+            self.bias = nn.Parameter(torch.empty(out_features, device=device, dtype=dtype), requires_grad=False)
+        else:
+            self.register_parameter("bias", None)
+        # int8 weight prepacked for the quantized CPU GEMM, see `pack_int8_for_cpu`
+        self._packed = None
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, fmt: str = "int8") -> "QuantizedLinear":
+        weight = linear.weight
+        layer = cls(
+            linear.in_features, linear.out_features, linear.bias is not None, fmt, weight.device, weight.dtype
+        )
+        with torch.no_grad():
+            layer.weight.data, layer.weight_scale.data = quantize_weight(weight.detach(), fmt)
+            if linear.bias is not None:
+                layer.bias.data = linear.bias.detach()
+        return layer
+
+    def dequantize(self, dtype: Optional[torch.dtype] = None) -> torch.Tensor:
+        dtype = dtype or torch.float32
+        # int8 and e4m3 values are exact in bf16, the scales are rounded like the bf16 weights would be
+        return self.weight.to(dtype) * self.weight_scale.to(dtype)
+
+    def pack_for_cpu(self):
+        """Prepacks the int8 weight and its scales, as they are, for `torch.ops.quantized.linear_dynamic`."""
+        if self.fmt != "int8":
+            raise ValueError(f"only int8 weights have a quantized CPU GEMM, not {self.fmt}")
+        scale = self.weight_scale.detach().flatten().double().cpu()
+        qweight = torch._make_per_channel_quantized_tensor(
+            self.weight.detach().cpu(), scale, torch.zeros(scale.shape, dtype=torch.long), 0
+        )
+        bias = None if self.bias is None else self.bias.detach().float().cpu()
+        self._packed = torch.ops.quantized.linear_prepack(qweight, bias)
+
+    def forward(self, x):
+        if self._packed is not None and x.device.type == "cpu":
+            # activations are quantized on the fly per tensor, the accumulation is int32; 7-bit activations as in
+            # `torch.ao.nn.quantized.dynamic.Linear` keep fbgemm's int16 intermediate sums from saturating
+            y = torch.ops.quantized.linear_dynamic(
+                x.float().reshape(-1, self.in_features), self._packed, reduce_range=True
+            )
+            return y.view(*x.shape[:-1], self.out_features).to(x.dtype)
+        bias = None if self.bias is None else self.bias.to(x.dtype)
+        return F.linear(x, self.dequantize(x.dtype), bias)
+
+    def extra_repr(self):
+        return f"in_features={self.in_features}, out_features={self.out_features}, fmt={self.fmt}"
+
+
+def _quantizable_linears(model: nn.Module) -> Dict[str, Tuple[nn.Module, str]]:
+    """The attention and feed-forward projections of every `WanAttentionBlock`, by name, with their parent."""
+    from .transformer import WanAttentionBlock
+
+    layers = {}
+    for block_name, block in model.named_modules():
+        if not isinstance(block, WanAttentionBlock):
+            continue
+        for attn_name in ("self_attn", "cross_attn"):
+            attn = getattr(block, attn_name)
+            for name in ("q", "k", "v", "qkv", "o", "k_img", "v_img"):
+                # LoRA wrapped and tensor parallel layers are not plain `nn.Linear` and stay as they are
+                if type(getattr(attn, name, None)) is nn.Linear:
+                    layers[f"{block_name}.{attn_name}.{name}"] = (attn, name)
+        for index in ("0", "2"):
+            if type(block.ffn[int(index)]) is nn.Linear:
+                layers[f"{block_name}.ffn.{index}"] = (block.ffn, index)
+    return layers
+
+
+def quantize_model(model: nn.Module, fmt: str = "int8") -> int:
+    """
+    Replaces the attention and feed-forward linears of every `WanAttentionBlock` of `model` by `QuantizedLinear`s, in
+    place. Embeddings, modulations and the output head are small and precision sensitive, and stay as they are.
+    Works on the meta device too, to build the skeleton that a quantized checkpoint is loaded into.
+
+    Returns:
+        int: Number of quantized layers.
+    """
+    layers = _quantizable_linears(model)
+    for parent, name in layers.values():
+        setattr(parent, name, QuantizedLinear.from_linear(getattr(parent, name), fmt))
+    return len(layers)
+
+
+def pack_int8_for_cpu(model: nn.Module) -> int:
+    """
+    Makes the int8 `QuantizedLinear`s of `model` run CPU inputs through the int8 GEMM of the quantized CPU backend
+    (x86/fbgemm or oneDNN) instead of dequantizing their weights to the activation dtype at every forward. Faster on
+    CPUs with VNNI or AMX, at the cost of quantizing the activations too and of a packed copy of the int8 weights.
+
+    Returns:
+        int: Number of packed layers, 0 when torch has no quantized CPU backend.
+    """
+    engines = torch.backends.quantized.supported_engines
+    engine = next((name for name in ("x86", "fbgemm", "onednn") if name in engines), None)
+    if engine is None:
+        return 0
+    torch.backends.quantized.engine = engine
+    layers = [m for m in model.modules() if isinstance(m, QuantizedLinear) and m.fmt == "int8"]
+    for layer in layers:
+        layer.pack_for_cpu()
+    return len(layers)
+
+
+def read_quantization_config(model_path: str) -> Optional[dict]:
+    """The quantization config saved with a quantized checkpoint by `save_quantized`, or None."""
+    config_path = os.path.join(model_path, QUANTIZATION_CONFIG_NAME)
+    if not os.path.exists(config_path):
+        return None
+    with open(config_path) as f:
+        return json.load(f)
+
+
+def save_quantized(model: nn.Module, output_dir: str, fmt: str):
+    """Saves a model quantized by `quantize_model` so that `get_transformer` loads it without re-quantizing."""
+    from safetensors.torch import save_file
+
+    os.makedirs(output_dir, exist_ok=True)
+    model.save_config(output_dir)
+    state_dict = {key: value.contiguous() for key, value in model.state_dict().items()}
+    save_file(state_dict, os.path.join(output_dir, "diffusion_pytorch_model.safetensors"))
+    with open(os.path.join(output_dir, QUANTIZATION_CONFIG_NAME), "w") as f:
+        json.dump({"format": fmt}, f, indent=2)
+
+
+def _relative_error(output: torch.Tensor, reference: torch.Tensor) -> float:
+    return ((output.float() - reference).norm() / reference.norm().clamp(min=1e-12)).item()
+
+
+@torch.no_grad()
+def quantization_report(model: nn.Module, fmt: str = "int8", num_tokens: int = 64, seed: int = 0) -> List[dict]:
+    """
+    Numerics of quantizing the layers `quantize_model` would replace, without modifying `model`.
+
+    For every layer, random activations go through the float32 weight as the reference, through the bf16 weight and
+    through the dequantized weight. Returns one row per layer with the relative errors of the quantized weight
+    (`weight_error`), of its output (`output_error`) and of the bf16 output (`bf16_output_error`) for comparison.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    rows = []
+    for name, (parent, attr) in _quantizable_linears(model).items():
+        linear = getattr(parent, attr)
+        weight = linear.weight.detach().float().cpu()
+        x = torch.randn(num_tokens, linear.in_features, generator=generator)
+        reference = x @ weight.T
+        qweight, scale = quantize_weight(weight, fmt)
+        dequantized = qweight.float() * scale
+        bf16_output = x.bfloat16() @ weight.bfloat16().T
+        rows.append(
+            dict(
+                name=name,
+                weight_error=_relative_error(dequantized, weight),
+                output_error=_relative_error(x.bfloat16() @ dequantized.bfloat16().T, reference),
+                bf16_output_error=_relative_error(bf16_output, reference),
+            )
+        )
+    return rows
+
+
+def format_quantization_report(rows: List[dict], fmt: str) -> str:
+    """Summary of `quantization_report` rows: mean and worst layer errors against the float32 weights."""
+    if not rows:
+        return f"{fmt}: no quantizable layers"
+    lines = [f"{fmt} weight-only quantization of {len(rows)} layers, relative errors vs float32:"]
+    labels = {"weight_error": "weights", "output_error": f"{fmt} outputs", "bf16_output_error": "bf16 outputs"}
+    for key, label in labels.items():
+        mean = sum(row[key] for row in rows) / len(rows)
+        worst = max(rows, key=lambda row: row[key])
+        lines.append(f"  {label}: mean {mean:.2e}, max {worst[key]:.2e} ({worst['name']})")
+    return "\n".join(lines)
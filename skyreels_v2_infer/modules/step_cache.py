@@ -0,0 +1,325 @@
+import json
+import logging
+import os
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+import numpy as np
+import torch
+
+__all__ = [
+    "StepCache",
+    "TeaCache",
+    "FirstBlockCache",
+    "BlockResidualCache",
+    "StepCacheCalibrator",
+    "build_step_cache",
+    "load_teacache_coefficients",
+    "STEP_CACHE_CONFIG_NAME",
+    "STEP_CACHE_METHODS",
+]
+
+STEP_CACHE_CONFIG_NAME = "step_cache.json"
+
+# Coefficients fitted for the released SkyReels-V2 checkpoints, keyed by (model_type, size, resolution).
+# `None` resolution entries apply to every resolution. Fine-tuned checkpoints should be calibrated with
+# `src/utils/calibrate_step_cache.py`, which writes `step_cache.json` beside the weights.
+TEACACHE_COEFFICIENTS = {
+    ("i2v", "14B", "540P"): {
+        "coefficients": [-3.02331670e02, 2.23948934e02, -5.25463970e01, 5.87348440e00, -2.01973289e-01],
+        "ret_steps_coefficients": [2.57151496e05, -3.54229917e04, 1.40286849e03, -1.35890334e01, 1.32517977e-01],
+    },
+    ("i2v", "14B", "720P"): {
+        "coefficients": [-114.36346466, 65.26524496, -18.82220707, 4.91518089, -0.23412683],
+        "ret_steps_coefficients": [8.10705460e03, 2.13393892e03, -3.72934672e02, 1.66203073e01, -4.17769401e-02],
+    },
+    ("t2v", "1.3B", None): {
+        "coefficients": [2.39676752e03, -1.31110545e03, 2.01331979e02, -8.29855975e00, 1.37887774e-01],
+        "ret_steps_coefficients": [-5.21862437e04, 9.23041404e03, -5.28275948e02, 1.36987616e01, -4.99875664e-02],
+    },
+    ("t2v", "14B", None): {
+        "coefficients": [-5784.54975374, 5449.50911966, -1811.16591783, 256.27178429, -13.02252404],
+        "ret_steps_coefficients": [-3.03318725e05, 4.90537029e04, -2.65530556e03, 5.87365115e01, -3.15583525e-01],
+    },
+}
+# the I2V 1.3B checkpoint is only released at 540P and, as in the original implementation, uses the 14B fit
+TEACACHE_COEFFICIENTS[("i2v", "1.3B", None)] = TEACACHE_COEFFICIENTS[("i2v", "14B", "540P")]
+
+MODEL_SIZES = {1536: "1.3B", 5120: "14B"}
+
+
+def load_teacache_coefficients(ckpt_dir: str, model_type: str, dim: int, use_ret_steps: bool) -> List[float]:
+    """
+    Resolves TeaCache rescale coefficients for a checkpoint.
+
+    A calibrated `step_cache.json` beside the weights always wins. Otherwise the built-in table is used for the
+    released checkpoints, matched on the model config rather than on the directory name alone.
+    """
+    key = "ret_steps_coefficients" if use_ret_steps else "coefficients"
+    config_path = os.path.join(ckpt_dir, STEP_CACHE_CONFIG_NAME) if ckpt_dir else None
+    if config_path and os.path.exists(config_path):
+        with open(config_path) as f:
+            calibrated = json.load(f).get("teacache", {})
+        if key in calibrated:
+            logging.info(f"using calibrated teacache coefficients from {config_path}")
+            return calibrated[key]
+
+    size = MODEL_SIZES.get(dim)
+    resolution = next((r for r in ("540P", "720P") if r in (ckpt_dir or "")), None)
+    entry = TEACACHE_COEFFICIENTS.get((model_type, size, resolution)) or TEACACHE_COEFFICIENTS.get(
+        (model_type, size, None)
+    )
+    if entry is None:
+        raise ValueError(
+            f"No teacache coefficients for {ckpt_dir} ({model_type}, dim={dim}). "
+            "Run src/utils/calibrate_step_cache.py to fit them for this checkpoint."
+        )
+    logging.warning(
+        f"using built-in teacache coefficients for the released {model_type} {size} checkpoints; "
+        "calibrate fine-tuned or LoRA-merged weights for best results"
+    )
+    return entry[key]
+
+
+def polyval(coefficients: torch.Tensor, x: torch.Tensor) -> torch.Tensor:
+    """Horner evaluation with highest-degree coefficient first, matching `np.poly1d`."""
+    out = torch.zeros_like(x)
+    for c in coefficients:
+        out = out * x + c
+    return out
+
+
+def rel_l1(x: torch.Tensor, ref: torch.Tensor) -> torch.Tensor:
+    return (x - ref).abs().mean() / ref.abs().mean()
+
+
+class StepCache:
+    """
+    Base class for step-level caching of the transformer blocks.
+
+    The model calls the cache once per forward with the block stack, the hidden states and the timestep embeddings.
+    Calls alternate between the conditional (even) and unconditional (odd) branch, and each branch keeps its own
+    state. Strategies keep their metrics and decisions as device tensors; the host only reads the final boolean
+    when it has to choose between running and skipping the blocks.
+
+    Args:
+        num_steps (`int`): Number of forward calls after which the call counter wraps around.
+        ret_steps (`int`): Calls at the start of the trajectory that are always computed.
+        cutoff_steps (`int`): Calls from which on every forward is computed again.
+    """
+
+    def __init__(self, num_steps: int, ret_steps: int = 2, cutoff_steps: Optional[int] = None):
+        self.num_steps = num_steps
+        self.ret_steps = ret_steps
+        self.cutoff_steps = cutoff_steps if cutoff_steps is not None else num_steps * 2 - 2
+        self.sync_decision: Optional[Callable[[torch.Tensor], torch.Tensor]] = None
+        self.reset()
+
+    def init_state(self) -> Dict:
+        return {}
+
+    def reset(self):
+        self.cnt = 0
+        self.state = [self.init_state(), self.init_state()]
+
+    @property
+    def branch(self) -> int:
+        return self.cnt % 2
+
+    def force_calc(self) -> bool:
+        return self.cnt < self.ret_steps or self.cnt >= self.cutoff_steps
+
+    def should_calc(self, decision: torch.Tensor) -> bool:
+        # the one host sync of a cached call: running or skipping the blocks decides which kernels are launched, so
+        # the choice cannot stay on the device. Forced calls never get here and the metrics themselves stay on it.
+        if self.sync_decision is not None:
+            decision = self.sync_decision(decision)
+        return bool(decision)
+
+    def advance(self):
+        self.cnt += 1
+        if self.cnt >= self.num_steps:
+            self.cnt = 0
+
+    def skip_branch(self):
+        """Called instead of a forward when the pipeline skips the current branch (e.g. no uncond pass)."""
+        self.state[self.branch] = self.init_state()
+        self.advance()
+
+    def invalidate(self):
+        """Drops the cached activations of both branches (e.g. after a resolution change) and keeps the counter."""
+        self.state = [self.init_state(), self.init_state()]
+
+    @staticmethod
+    def run_blocks(blocks, x, block_kwargs):
+        for block in blocks:
+            x = block(x, **block_kwargs)
+        return x
+
+    def forward(self, state, blocks, x, block_kwargs, e, e0) -> torch.Tensor:
+        raise NotImplementedError
+
+    def __call__(self, blocks, x, block_kwargs, e, e0) -> torch.Tensor:
+        x = self.forward(self.state[self.branch], blocks, x, block_kwargs, e, e0)
+        self.advance()
+        return x
+
+
+class TeaCache(StepCache):
+    """
+    Timestep-embedding aware cache: the relative change of the modulated input is rescaled with a fitted polynomial
+    and accumulated, and the whole block stack is replaced by the cached residual while the estimate stays below
+    `thresh`.
+    """
+
+    def __init__(self, coefficients: Sequence[float], thresh: float, num_steps: int, use_ret_steps: bool = False):
+        if use_ret_steps:
+            ret_steps, cutoff_steps = 5 * 2, num_steps * 2
+        else:
+            ret_steps, cutoff_steps = 1 * 2, num_steps * 2 - 2
+        self.coefficients = list(coefficients)
+        self.thresh = thresh
+        self.use_ret_steps = use_ret_steps
+        self._coefficients = None
+        super().__init__(num_steps, ret_steps, cutoff_steps)
+
+    def init_state(self):
+        return {"accumulated": None, "previous_inp": None, "previous_residual": None}
+
+    def forward(self, state, blocks, x, block_kwargs, e, e0):
+        modulated_inp = e0 if self.use_ret_steps else e
+        if self.force_calc() or state["previous_inp"] is None:
+            calc = True
+        else:
+            if self._coefficients is None or self._coefficients.device != modulated_inp.device:
+                self._coefficients = torch.tensor(self.coefficients, dtype=torch.float64, device=modulated_inp.device)
+            distance = rel_l1(modulated_inp, state["previous_inp"]).double()
+            accumulated = polyval(self._coefficients, distance)
+            if state["accumulated"] is not None:
+                accumulated = accumulated + state["accumulated"]
+            calc = self.should_calc(accumulated >= self.thresh)
+            state["accumulated"] = accumulated
+        if calc:
+            state["accumulated"] = None
+        state["previous_inp"] = modulated_inp.clone()
+
+        if not calc:
+            return x + state["previous_residual"]
+        ori_x = x.clone()
+        x = self.run_blocks(blocks, x, block_kwargs)
+        state["previous_residual"] = x - ori_x
+        return x
+
+
+class FirstBlockCache(StepCache):
+    """
+    First-block cache: the first block always runs and the relative change of its residual decides whether the
+    remaining blocks are replaced by their cached residual. Needs no fitted coefficients.
+    """
+
+    def __init__(self, thresh: float, num_steps: int, ret_steps: int = 2, cutoff_steps: Optional[int] = None):
+        self.thresh = thresh
+        super().__init__(num_steps, ret_steps, cutoff_steps)
+
+    def init_state(self):
+        return {"first_residual": None, "remaining_residual": None}
+
+    def forward(self, state, blocks, x, block_kwargs, e, e0):
+        first_x = blocks[0](x, **block_kwargs)
+        first_residual = first_x - x
+        if self.force_calc() or state["first_residual"] is None:
+            calc = True
+        else:
+            calc = self.should_calc(rel_l1(first_residual, state["first_residual"]) >= self.thresh)
+
+        if not calc:
+            return first_x + state["remaining_residual"]
+        x = self.run_blocks(blocks[1:], first_x, block_kwargs)
+        state["first_residual"] = first_residual
+        state["remaining_residual"] = x - first_x
+        return x
+
+
+class BlockResidualCache(StepCache):
+    """
+    Per-block residual reuse: the blocks in `cache_blocks` are fully computed every `interval` calls of a branch
+    and replaced by their cached residual in between. Decisions are static, so no device sync is involved.
+    """
+
+    def __init__(
+        self,
+        cache_blocks: Sequence[int],
+        interval: int,
+        num_steps: int,
+        ret_steps: int = 2,
+        cutoff_steps: Optional[int] = None,
+    ):
+        self.cache_blocks = set(cache_blocks)
+        self.interval = interval
+        super().__init__(num_steps, ret_steps, cutoff_steps)
+
+    def init_state(self):
+        return {"residuals": {}, "calls": 0}
+
+    def forward(self, state, blocks, x, block_kwargs, e, e0):
+        calc = self.force_calc() or state["calls"] % self.interval == 0
+        residuals = state["residuals"]
+        for i, block in enumerate(blocks):
+            if i not in self.cache_blocks:
+                x = block(x, **block_kwargs)
+            elif calc or i not in residuals:
+                out = block(x, **block_kwargs)
+                residuals[i] = out - x
+                x = out
+            else:
+                x = x + residuals[i]
+        state["calls"] += 1
+        return x
+
+
+class StepCacheCalibrator(StepCache):
+    """
+    Computes every step and records, per branch, the relative change of both modulated inputs (`e` and `e0`) and of
+    the block stack output. `fit` turns the records into TeaCache coefficients.
+    """
+
+    def __init__(self, num_steps: int):
+        super().__init__(num_steps, ret_steps=num_steps, cutoff_steps=num_steps)
+        self.records = {"e": [], "e0": [], "output": []}
+
+    def init_state(self):
+        return {"e": None, "e0": None, "output": None}
+
+    def forward(self, state, blocks, x, block_kwargs, e, e0):
+        ori_x = x.clone()
+        x = self.run_blocks(blocks, x, block_kwargs)
+        residual = x - ori_x
+        if state["output"] is not None:
+            self.records["e"].append(rel_l1(e, state["e"]).item())
+            self.records["e0"].append(rel_l1(e0, state["e0"]).item())
+            self.records["output"].append(rel_l1(residual, state["output"]).item())
+        state["e"], state["e0"], state["output"] = e.clone(), e0.clone(), residual
+        return x
+
+    def fit(self, degree: int = 4) -> Dict[str, List[float]]:
+        output = np.asarray(self.records["output"])
+        return {
+            "coefficients": np.polyfit(np.asarray(self.records["e"]), output, degree).tolist(),
+            "ret_steps_coefficients": np.polyfit(np.asarray(self.records["e0"]), output, degree).tolist(),
+        }
+
+
+STEP_CACHE_METHODS = ["teacache", "fbcache", "block_cache"]
+
+
+def build_step_cache(method: str, num_steps: int, **kwargs) -> StepCache:
+    if method == "teacache":
+        return TeaCache(num_steps=num_steps, **kwargs)
+    if method == "fbcache":
+        return FirstBlockCache(num_steps=num_steps, **kwargs)
+    if method == "block_cache":
+        return BlockResidualCache(num_steps=num_steps, **kwargs)
+    raise ValueError(f"`method` must be one of {STEP_CACHE_METHODS}, got {method}")
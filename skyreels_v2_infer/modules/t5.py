@@ -8,6 +8,9 @@ import torch.nn as nn
 import torch.nn.functional as F
 from diffusers.models import ModelMixin
 
+from ..distributed.shared_loading import shared_checkpoint
+from ..distributed.tensor_parallel import load_sharded_state_dict
+from ..distributed.tensor_parallel import unloaded_parameters
 from .tokenizers import HuggingfaceTokenizer
 
 __all__ = [
@@ -432,14 +435,19 @@ class T5EncoderModel(ModelMixin):
 
         super().__init__()
         # init model
-        model = umt5_xxl(encoder_only=True, return_tokenizer=False)
         logging.info(f"loading {checkpoint_path}")
-        model.load_state_dict(torch.load(checkpoint_path, map_location="cpu"))
-        self.model = model
+        # built on the meta device and filled with the memory-mapped checkpoint tensors, which ranks of one node
+        # share, or with this rank's slices of them when a `shard_fn` splits the model
+        model = umt5_xxl(encoder_only=True, return_tokenizer=False, device="meta")
         if shard_fn is not None:
-            self.model = shard_fn(self.model, sync_module_states=False)
-        else:
-            self.model.eval().requires_grad_(False)
+            model = shard_fn(model, sync_module_states=False)
+        with shared_checkpoint(checkpoint_path) as path:
+            load_sharded_state_dict(model, torch.load(path, map_location="cpu", mmap=True))
+        missing = unloaded_parameters(model)
+        if missing:
+            raise RuntimeError(f"{checkpoint_path} is missing parameters: {missing}")
+        self.model = model
+        self.model.eval().requires_grad_(False)
         # init tokenizer
         self.tokenizer = HuggingfaceTokenizer(name=tokenizer_path, seq_len=text_len, clean="whitespace")
 
@@ -449,6 +457,6 @@ class T5EncoderModel(ModelMixin):
         mask = mask.to(self.device)
         # seq_lens = mask.gt(0).sum(dim=1).long()
         context = self.model(ids, mask)
-        context = context * mask.unsqueeze(-1).cuda()
+        context = context * mask.unsqueeze(-1).to(context.device)
 
         return context
@@ -1,8 +1,9 @@
 # Copyright 2024-2025 The Alibaba Wan Team Authors. All rights reserved.
+import contextlib
 import math
-import numpy as np
+import os
+
 import torch
-import torch.amp as amp
 import torch.nn as nn
 from diffusers.configuration_utils import ConfigMixin
 from diffusers.configuration_utils import register_to_config
@@ -14,11 +15,16 @@ from torch.nn.attention.flex_attention import create_block_mask
 from torch.nn.attention.flex_attention import flex_attention
 
 from .attention import flash_attention
+from .device import float32_autocast
+from .device import no_autocast
+from .step_cache import build_step_cache
+from .step_cache import load_teacache_coefficients
 
 
 flex_attention = torch.compile(flex_attention, dynamic=False, mode="max-autotune")
 
-DISABLE_COMPILE = False  # get os env
+# e.g. on CPU nodes without the C++ toolchain that torch.compile needs there
+DISABLE_COMPILE = os.environ.get("SKYREELS_DISABLE_COMPILE", "0") == "1"
 
 __all__ = ["WanModel"]
 
@@ -35,7 +41,7 @@ def sinusoidal_embedding_1d(dim, position):
     return x
 
 
-@amp.autocast("cuda", enabled=False)
+@no_autocast
 def rope_params(max_seq_len, dim, theta=10000):
     assert dim % 2 == 0
     freqs = torch.outer(
@@ -45,7 +51,18 @@ def rope_params(max_seq_len, dim, theta=10000):
     return freqs
 
 
-@amp.autocast("cuda", enabled=False)
+def rope_grid_freqs(freqs, f, h, w):
+    return torch.cat(
+        [
+            freqs[0][:f].view(f, 1, 1, -1).expand(f, h, w, -1),
+            freqs[1][:h].view(1, h, 1, -1).expand(f, h, w, -1),
+            freqs[2][:w].view(1, 1, w, -1).expand(f, h, w, -1),
+        ],
+        dim=-1,
+    ).reshape(f * h * w, 1, -1)
+
+
+@no_autocast
 def rope_apply(x, grid_sizes, freqs):
     n, c = x.size(2), x.size(3) // 2
     bs = x.size(0)
@@ -53,23 +70,17 @@ def rope_apply(x, grid_sizes, freqs):
     # split freqs
     freqs = freqs.split([c - 2 * (c // 3), c // 3, c // 3], dim=1)
 
-    # loop over samples
-    f, h, w = grid_sizes.tolist()
-    seq_len = f * h * w
-
-    # precompute multipliers
-
-    x = torch.view_as_complex(x.to(torch.float32).reshape(bs, seq_len, n, -1, 2))
-    freqs_i = torch.cat(
-        [
-            freqs[0][:f].view(f, 1, 1, -1).expand(f, h, w, -1),
-            freqs[1][:h].view(1, h, 1, -1).expand(f, h, w, -1),
-            freqs[2][:w].view(1, 1, w, -1).expand(f, h, w, -1),
-        ],
-        dim=-1,
-    ).reshape(seq_len, 1, -1)
+    if grid_sizes.dim() == 2:
+        # packed samples: one (f, h, w) grid per sample, concatenated along the sequence
+        freqs_i = torch.cat([rope_grid_freqs(freqs, f, h, w) for f, h, w in grid_sizes.tolist()])
+        seq_len = freqs_i.size(0)
+    else:
+        f, h, w = grid_sizes.tolist()
+        seq_len = f * h * w
+        freqs_i = rope_grid_freqs(freqs, f, h, w)
 
     # apply rotary embedding
+    x = torch.view_as_complex(x.to(torch.float32).reshape(bs, seq_len, n, -1, 2))
     x = torch.view_as_real(x * freqs_i).flatten(3)
 
     return x
@@ -133,42 +144,129 @@ class WanSelfAttention(nn.Module):
         self.norm_k = WanRMSNorm(dim, eps=eps) if qk_norm else nn.Identity()
 
         self._flag_ar_attention = False
+        self.fused_qkv = False
+        self._register_state_dict_hook(self._split_fused_qkv_state_dict)
 
     def set_ar_attention(self):
         self._flag_ar_attention = True
 
-    def forward(self, x, grid_sizes, freqs, block_mask):
+    def fuse_qkv(self):
+        r"""
+        Replace the q/k/v projections by one [3 * dim, dim] projection, so every forward runs a single GEMM and a
+        single RMSNorm over q and k. Checkpoints keep the q/k/v layout: loading q/k/v weights writes into the fused
+        projection and `state_dict` splits it back. Layers already wrapped by a LoRA adapter are left unfused.
+
+        Returns:
+            bool: Whether the projections are fused.
+        """
+        if self.fused_qkv:
+            return True
+        if not all(type(layer) is nn.Linear for layer in (self.q, self.k, self.v)):
+            return False
+        qkv = nn.Linear(self.dim, 3 * self.dim, device=self.q.weight.device, dtype=self.q.weight.dtype)
+        with torch.no_grad():
+            qkv.weight.copy_(torch.cat([self.q.weight, self.k.weight, self.v.weight]))
+            qkv.bias.copy_(torch.cat([self.q.bias, self.k.bias, self.v.bias]))
+        del self.q, self.k, self.v
+        self.qkv = qkv
+        self.fused_qkv = True
+        return True
+
+    def unfuse_qkv(self):
+        r"""
+        Restore separate q/k/v projections, e.g. before loading LoRA adapters that target them.
+        """
+        if not self.fused_qkv:
+            return
+        weights, biases = self.qkv.weight.chunk(3), self.qkv.bias.chunk(3)
+        for name, weight, bias in zip(("q", "k", "v"), weights, biases):
+            layer = nn.Linear(self.dim, self.dim, device=weight.device, dtype=weight.dtype)
+            with torch.no_grad():
+                layer.weight.copy_(weight)
+                layer.bias.copy_(bias)
+            setattr(self, name, layer)
+        del self.qkv
+        self.fused_qkv = False
+
+    @staticmethod
+    def _split_fused_qkv_state_dict(module, state_dict, prefix, local_metadata):
+        if module.fused_qkv:
+            # keep the checkpoint layout of separate projections
+            for param in ("weight", "bias"):
+                fused = state_dict.pop(f"{prefix}qkv.{param}")
+                for name, part in zip(("q", "k", "v"), fused.chunk(3)):
+                    state_dict[f"{prefix}{name}.{param}"] = part.clone()
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs):
+        if self.fused_qkv:
+            # q/k/v weights may arrive in different checkpoint shards, so missing slices keep their current values
+            for param in ("weight", "bias"):
+                keys = [f"{prefix}{name}.{param}" for name in ("q", "k", "v")]
+                if not any(key in state_dict for key in keys):
+                    continue
+                fused = list(getattr(self.qkv, param).detach().chunk(3))
+                for i, key in enumerate(keys):
+                    if key in state_dict:
+                        fused[i] = state_dict.pop(key)
+                state_dict[f"{prefix}qkv.{param}"] = torch.cat(fused)
+        super()._load_from_state_dict(
+            state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs
+        )
+
+    def qkv_fn(self, x):
         r"""
         Args:
-            x(Tensor): Shape [B, L, num_heads, C / num_heads]
-            seq_lens(Tensor): Shape [B]
-            grid_sizes(Tensor): Shape [B, 3], the second dimension contains (F, H, W)
-            freqs(Tensor): Rope freqs, shape [1024, C / num_heads / 2]
+            x(Tensor): Shape [B, L, C]
+
+        Returns:
+            q, k, v, each of shape [B, L, num_heads, C / num_heads]
         """
         b, s, n, d = *x.shape[:2], self.num_heads, self.head_dim
-
-        # query, key, value function
-        def qkv_fn(x):
+        if not self.fused_qkv:
             q = self.norm_q(self.q(x)).view(b, s, n, d)
             k = self.norm_k(self.k(x)).view(b, s, n, d)
             v = self.v(x).view(b, s, n, d)
             return q, k, v
 
-        x = x.to(self.q.weight.dtype)
-        q, k, v = qkv_fn(x)
+        qk, v = self.qkv(x).split([2 * self.dim, self.dim], dim=-1)
+        qk = qk.view(b, s, 2, self.dim)
+        if self.qk_norm:
+            # RMSNorm is per row, so q and k share one normalization call with their stacked weights
+            weight = torch.stack([self.norm_q.weight, self.norm_k.weight])
+            qk = fast_rms_norm(qk, weight, self.eps)
+        q, k = qk.unbind(2)
+        return q.reshape(b, s, n, d), k.reshape(b, s, n, d), v.reshape(b, s, n, d)
+
+    def forward(self, x, grid_sizes, freqs, block_mask, seq_lens=None):
+        r"""
+        Args:
+            x(Tensor): Shape [B, L, num_heads, C / num_heads]
+            grid_sizes(Tensor): Shape [3] with (F, H, W), or [N, 3] for N samples packed into L with B = 1
+            freqs(Tensor): Rope freqs, shape [1024, C / num_heads / 2]
+            seq_lens(Tensor, *optional*): Shape [N], length of each packed sample
+        """
+        # the bias keeps the compute dtype when the weight is quantized
+        x = x.to(self.o.bias.dtype)
+        q, k, v = self.qkv_fn(x)
 
         if not self._flag_ar_attention:
             q = rope_apply(q, grid_sizes, freqs)
             k = rope_apply(k, grid_sizes, freqs)
-            x = flash_attention(q=q, k=k, v=v, window_size=self.window_size)
+            x = flash_attention(q=q, k=k, v=v, q_lens=seq_lens, k_lens=seq_lens, window_size=self.window_size)
         else:
+            assert seq_lens is None, "packed sequences are not supported with autoregressive attention"
             q = rope_apply(q, grid_sizes, freqs)
             k = rope_apply(k, grid_sizes, freqs)
             q = q.to(torch.bfloat16)
             k = k.to(torch.bfloat16)
             v = v.to(torch.bfloat16)
 
-            with sdp_kernel(enable_flash=True, enable_math=False, enable_mem_efficient=False):
+            # the flash kernel is CUDA only, other devices pick their own
+            if q.device.type == "cuda":
+                kernels = sdp_kernel(enable_flash=True, enable_math=False, enable_mem_efficient=False)
+            else:
+                kernels = contextlib.nullcontext()
+            with kernels:
                 x = (
                     torch.nn.functional.scaled_dot_product_attention(
                         q.transpose(1, 2), k.transpose(1, 2), v.transpose(1, 2), attn_mask=block_mask
@@ -183,15 +281,23 @@ class WanSelfAttention(nn.Module):
         return x
 
 
+def packed_context_lens(context, seq_lens):
+    """Packed queries attend to their own sample's context: [N, L2, C] contexts are flattened into one sequence."""
+    if seq_lens is None:
+        return None
+    return torch.full((context.size(0),), context.size(1), dtype=torch.int32)
+
+
 class WanT2VCrossAttention(WanSelfAttention):
-    def forward(self, x, context):
+    def forward(self, x, context, seq_lens=None):
         r"""
         Args:
             x(Tensor): Shape [B, L1, C]
-            context(Tensor): Shape [B, L2, C]
-            context_lens(Tensor): Shape [B]
+            context(Tensor): Shape [B, L2, C], or [N, L2, C] when N samples are packed into L1
+            seq_lens(Tensor, *optional*): Shape [N], length of each packed sample
         """
         b, n, d = x.size(0), self.num_heads, self.head_dim
+        context_lens = packed_context_lens(context, seq_lens)
 
         # compute query, key, value
         q = self.norm_q(self.q(x)).view(b, -1, n, d)
@@ -199,7 +305,7 @@ class WanT2VCrossAttention(WanSelfAttention):
         v = self.v(context).view(b, -1, n, d)
 
         # compute attention
-        x = flash_attention(q, k, v)
+        x = flash_attention(q, k, v, q_lens=seq_lens, k_lens=context_lens)
 
         # output
         x = x.flatten(2)
@@ -216,15 +322,17 @@ class WanI2VCrossAttention(WanSelfAttention):
         # self.alpha = nn.Parameter(torch.zeros((1, )))
         self.norm_k_img = WanRMSNorm(dim, eps=eps) if qk_norm else nn.Identity()
 
-    def forward(self, x, context):
+    def forward(self, x, context, seq_lens=None):
         r"""
         Args:
             x(Tensor): Shape [B, L1, C]
-            context(Tensor): Shape [B, L2, C]
-            context_lens(Tensor): Shape [B]
+            context(Tensor): Shape [B, L2, C], or [N, L2, C] when N samples are packed into L1
+            seq_lens(Tensor, *optional*): Shape [N], length of each packed sample
         """
         context_img = context[:, :257]
         context = context[:, 257:]
+        context_img_lens = packed_context_lens(context_img, seq_lens)
+        context_lens = packed_context_lens(context, seq_lens)
         b, n, d = x.size(0), self.num_heads, self.head_dim
 
         # compute query, key, value
@@ -233,9 +341,9 @@ class WanI2VCrossAttention(WanSelfAttention):
         v = self.v(context).view(b, -1, n, d)
         k_img = self.norm_k_img(self.k_img(context_img)).view(b, -1, n, d)
         v_img = self.v_img(context_img).view(b, -1, n, d)
-        img_x = flash_attention(q, k_img, v_img)
+        img_x = flash_attention(q, k_img, v_img, q_lens=seq_lens, k_lens=context_img_lens)
         # compute attention
-        x = flash_attention(q, k, v)
+        x = flash_attention(q, k, v, q_lens=seq_lens, k_lens=context_lens)
 
         # output
         x = x.flatten(2)
@@ -295,9 +403,50 @@ class WanAttentionBlock(nn.Module):
         # modulation
         self.modulation = nn.Parameter(torch.randn(1, 6, dim) / dim**0.5)
 
+        self.ffn_chunk_size = None
+
     def set_ar_attention(self):
         self.self_attn.set_ar_attention()
 
+    def set_ffn_chunk_size(self, chunk_size):
+        self.ffn_chunk_size = chunk_size
+
+    def ffn_forward(self, x, e, dtype):
+        r"""
+        Modulated feed-forward with its residual, optionally over chunks of `ffn_chunk_size` tokens.
+
+        Every op here is per-token, so chunking gives the same result as the full pass while the float32 modulation
+        and the [L, ffn_dim] intermediate only ever exist for one chunk. The result is written back into `x`. The
+        modulation is exact per chunk; the FFN GEMMs over fewer rows may pick other kernels and round differently in
+        the last bits, hence the 1e-6 tolerance of the tests rather than bitwise equality.
+
+        Per-token modulation ([B, L, C] chunks, diffusion forcing) stays expanded to every token rather than per frame:
+        the sequence parallel split and the packed samples cut the tokens at arbitrary frame boundaries, and a token
+        slice of `e` serves them all. Chunking slices it along with the tokens.
+
+        Args:
+            x(Tensor): Shape [B, L, C], float32
+            e(List[Tensor]): Modulation chunks, each of shape [B, 1, C] or [B, L, C]
+        """
+        seq_len = x.size(1)
+        chunk_size = self.ffn_chunk_size
+        if chunk_size is None or chunk_size >= seq_len:
+            y = self.ffn(mul_add_add_compile(self.norm2(x), e[4], e[3]).to(dtype))
+            with float32_autocast(x.device):
+                return mul_add_compile(x, y, e[5])
+
+        def token_slice(ei, start, end):
+            return ei[:, start:end] if ei.size(1) == seq_len else ei
+
+        for start in range(0, seq_len, chunk_size):
+            end = min(start + chunk_size, seq_len)
+            x_chunk = x[:, start:end]
+            e3, e4, e5 = (token_slice(e[i], start, end) for i in (3, 4, 5))
+            y = self.ffn(mul_add_add_compile(self.norm2(x_chunk), e4, e3).to(dtype))
+            with float32_autocast(x.device):
+                x[:, start:end] = mul_add_compile(x_chunk, y, e5)
+        return x
+
     def forward(
         self,
         x,
@@ -306,39 +455,37 @@ class WanAttentionBlock(nn.Module):
         freqs,
         context,
         block_mask,
+        seq_lens=None,
     ):
         r"""
         Args:
             x(Tensor): Shape [B, L, C]
-            e(Tensor): Shape [B, 6, C]
-            seq_lens(Tensor): Shape [B], length of each sequence in batch
-            grid_sizes(Tensor): Shape [B, 3], the second dimension contains (F, H, W)
+            e(Tensor): Shape [B, 6, C], or [B, 6, L, C] for per-token modulation
+            grid_sizes(Tensor): Shape [3] with (F, H, W), or [N, 3] for N samples packed into L with B = 1
             freqs(Tensor): Rope freqs, shape [1024, C / num_heads / 2]
+            seq_lens(Tensor, *optional*): Shape [N], length of each packed sample
         """
         if e.dim() == 3:
             modulation = self.modulation  # 1, 6, dim
-            with amp.autocast("cuda", dtype=torch.float32):
+            with float32_autocast(e.device):
                 e = (modulation + e).chunk(6, dim=1)
         elif e.dim() == 4:
             modulation = self.modulation.unsqueeze(2)  # 1, 6, 1, dim
-            with amp.autocast("cuda", dtype=torch.float32):
+            with float32_autocast(e.device):
                 e = (modulation + e).chunk(6, dim=1)
             e = [ei.squeeze(1) for ei in e]
 
         # self-attention
         out = mul_add_add_compile(self.norm1(x), e[1], e[0])
-        y = self.self_attn(out, grid_sizes, freqs, block_mask)
-        with amp.autocast("cuda", dtype=torch.float32):
+        y = self.self_attn(out, grid_sizes, freqs, block_mask, seq_lens=seq_lens)
+        with float32_autocast(x.device):
             x = mul_add_compile(x, y, e[2])
 
         # cross-attention & ffn function
         def cross_attn_ffn(x, context, e):
             dtype = context.dtype
-            x = x + self.cross_attn(self.norm3(x.to(dtype)), context)
-            y = self.ffn(mul_add_add_compile(self.norm2(x), e[4], e[3]).to(dtype))
-            with amp.autocast("cuda", dtype=torch.float32):
-                x = mul_add_compile(x, y, e[5])
-            return x
+            x = x + self.cross_attn(self.norm3(x.to(dtype)), context, seq_lens)
+            return self.ffn_forward(x, e, dtype)
 
         x = cross_attn_ffn(x, context, e)
         return x.to(torch.bfloat16)
@@ -366,7 +513,7 @@ class Head(nn.Module):
             x(Tensor): Shape [B, L1, C]
             e(Tensor): Shape [B, C]
         """
-        with amp.autocast("cuda", dtype=torch.float32):
+        with float32_autocast(x.device):
             if e.dim() == 2:
                 modulation = self.modulation  # 1, 2, dim
                 e = (modulation + e.unsqueeze(1)).chunk(2, dim=1)
@@ -484,7 +631,7 @@ class WanModel(ModelMixin, ConfigMixin, PeftAdapterMixin):
         self.num_frame_per_block = 1
         self.flag_causal_attention = False
         self.block_mask = None
-        self.enable_teacache = False
+        self.step_cache = None
 
         # embeddings
         self.patch_embedding = nn.Conv3d(in_dim, dim, kernel_size=patch_size, stride=patch_size)
@@ -512,10 +659,12 @@ class WanModel(ModelMixin, ConfigMixin, PeftAdapterMixin):
         # buffers (don't use register_buffer otherwise dtype will be changed in to())
         assert (dim % num_heads) == 0 and (dim // num_heads) % 2 == 0
         d = dim // num_heads
-        self.freqs = torch.cat(
-            [rope_params(1024, d - 4 * (d // 6)), rope_params(1024, 2 * (d // 6)), rope_params(1024, 2 * (d // 6))],
-            dim=1,
-        )
+        with torch.device("cpu"):
+            # real values even when the model is built on the meta device to load sharded weights
+            self.freqs = torch.cat(
+                [rope_params(1024, d - 4 * (d // 6)), rope_params(1024, 2 * (d // 6)), rope_params(1024, 2 * (d // 6))],
+                dim=1,
+            )
 
         if model_type == "i2v":
             self.img_emb = MLPProj(1280, dim)
@@ -575,57 +724,77 @@ class WanModel(ModelMixin, ConfigMixin, PeftAdapterMixin):
 
         return block_mask
 
-    def initialize_teacache(self, enable_teacache=True, num_steps=25, teacache_thresh=0.15, use_ret_steps=False, ckpt_dir=''):
-        self.enable_teacache = enable_teacache
-        print('using teacache')
-        self.cnt = 0
-        self.num_steps = num_steps
-        self.teacache_thresh = teacache_thresh
-        self.accumulated_rel_l1_distance_even = 0
-        self.accumulated_rel_l1_distance_odd = 0
-        self.previous_e0_even = None
-        self.previous_e0_odd = None
-        self.previous_residual_even = None
-        self.previous_residual_odd = None
-        self.use_ref_steps = use_ret_steps
-        if "I2V" in ckpt_dir:
-            if use_ret_steps:
-                if '540P' in ckpt_dir:
-                    self.coefficients = [ 2.57151496e+05, -3.54229917e+04,  1.40286849e+03, -1.35890334e+01, 1.32517977e-01]
-                if '720P' in ckpt_dir:
-                    self.coefficients = [ 8.10705460e+03,  2.13393892e+03, -3.72934672e+02,  1.66203073e+01, -4.17769401e-02]
-                self.ret_steps = 5*2
-                self.cutoff_steps = num_steps*2
-            else:
-                if '540P' in ckpt_dir:
-                    self.coefficients = [-3.02331670e+02,  2.23948934e+02, -5.25463970e+01,  5.87348440e+00, -2.01973289e-01]
-                if '720P' in ckpt_dir:
-                    self.coefficients = [-114.36346466,   65.26524496,  -18.82220707,    4.91518089,   -0.23412683]
-                self.ret_steps = 1*2
-                self.cutoff_steps = num_steps*2 - 2
-        else:
-            if use_ret_steps:
-                if '1.3B' in ckpt_dir:
-                    self.coefficients = [-5.21862437e+04, 9.23041404e+03, -5.28275948e+02, 1.36987616e+01, -4.99875664e-02]
-                if '14B' in ckpt_dir:
-                    self.coefficients = [-3.03318725e+05, 4.90537029e+04, -2.65530556e+03, 5.87365115e+01, -3.15583525e-01]
-                self.ret_steps = 5*2
-                self.cutoff_steps = num_steps*2
-            else:
-                if '1.3B' in ckpt_dir:
-                    self.coefficients = [2.39676752e+03, -1.31110545e+03,  2.01331979e+02, -8.29855975e+00, 1.37887774e-01]
-                if '14B' in ckpt_dir:
-                    self.coefficients = [-5784.54975374,  5449.50911966, -1811.16591783,   256.27178429, -13.02252404]
-                self.ret_steps = 1*2
-                self.cutoff_steps = num_steps*2 - 2
+    @property
+    def enable_teacache(self):
+        return self.step_cache is not None
+
+    @property
+    def num_steps(self):
+        return self.step_cache.num_steps
+
+    @num_steps.setter
+    def num_steps(self, num_steps):
+        self.step_cache.num_steps = num_steps
+
+    def initialize_step_cache(self, method="teacache", num_steps=25, ckpt_dir="", **kwargs):
+        r"""
+        Enable step-level caching of the transformer blocks.
+
+        Args:
+            method (`str`, *optional*, defaults to 'teacache'):
+                One of 'teacache', 'fbcache' (first-block cache) or 'block_cache' (per-block residual reuse)
+            num_steps (`int`, *optional*, defaults to 25):
+                Number of forward calls after which the cache call counter wraps around
+            ckpt_dir (`str`, *optional*):
+                Checkpoint directory used to resolve calibrated teacache coefficients
+            kwargs:
+                Strategy options, e.g. `thresh`, `use_ret_steps` or `coefficients` for teacache
+        """
+        if method == "teacache" and kwargs.get("coefficients") is None:
+            kwargs["coefficients"] = load_teacache_coefficients(
+                ckpt_dir, self.model_type, self.dim, kwargs.get("use_ret_steps", False)
+            )
+        print(f"using {method}")
+        self.step_cache = build_step_cache(method, num_steps, **kwargs)
+
+    def initialize_teacache(self, enable_teacache=True, num_steps=25, teacache_thresh=0.15, use_ret_steps=False, ckpt_dir='', coefficients=None):
+        if not enable_teacache:
+            self.step_cache = None
+            return
+        self.initialize_step_cache(
+            "teacache",
+            num_steps=num_steps,
+            ckpt_dir=ckpt_dir,
+            thresh=teacache_thresh,
+            use_ret_steps=use_ret_steps,
+            coefficients=coefficients,
+        )
+
+    def skip_teacache_uncond(self):
+        """
+        Keeps the step cache's cond/uncond alternation in sync when a pipeline skips the unconditional forward of a
+        step (guidance scale of 1 or outside the guidance interval). The stale uncond state is dropped so the branch
+        is fully recomputed when guidance resumes.
+        """
+        if self.step_cache is not None:
+            self.step_cache.skip_branch()
+
+    def invalidate_step_cache(self):
+        """
+        Drops cached residuals whose token layout no longer matches the latents, e.g. when progressive sampling
+        moves to the full-resolution grid. The next forward of each branch is fully computed.
+        """
+        if self.step_cache is not None:
+            self.step_cache.invalidate()
 
     def forward(self, x, t, context, clip_fea=None, y=None, fps=None):
         r"""
         Forward pass through the diffusion model
 
         Args:
-            x (List[Tensor]):
-                List of input video tensors, each with shape [C_in, F, H, W]
+            x (Tensor or List[Tensor]):
+                Input video tensor of shape [B, C_in, F, H, W], or a list of [C_in, F, H, W] tensors of different
+                shapes, which are packed into one sequence (see `forward_packed`)
             t (Tensor):
                 Diffusion timesteps tensor of shape [B]
             context (List[Tensor]):
@@ -643,6 +812,8 @@ class WanModel(ModelMixin, ConfigMixin, PeftAdapterMixin):
         """
         if self.model_type == "i2v":
             assert clip_fea is not None and y is not None
+        if isinstance(x, (list, tuple)):
+            return self.forward_packed(x, t, context, clip_fea=clip_fea, y=y, fps=fps)
         # params
         device = self.patch_embedding.weight.device
         if self.freqs.device != device:
@@ -670,7 +841,7 @@ class WanModel(ModelMixin, ConfigMixin, PeftAdapterMixin):
             self.block_mask = casual_mask.unsqueeze(0).unsqueeze(0)
 
         # time embeddings
-        with amp.autocast("cuda", dtype=torch.float32):
+        with float32_autocast(device):
             if t.dim() == 2:
                 b, f = t.shape
                 _flag_df = True
@@ -690,15 +861,15 @@ class WanModel(ModelMixin, ConfigMixin, PeftAdapterMixin):
                     e0 = e0 + self.fps_projection(fps_emb).unflatten(1, (6, self.dim)).repeat(t.shape[1], 1, 1)
                 else:
                     e0 = e0 + self.fps_projection(fps_emb).unflatten(1, (6, self.dim))
+            # CPU autocast returns the embeddings in its low precision dtype, the modulation stays float32
+            e, e0 = e.float(), e0.float()
 
             if _flag_df:
-                e = e.view(b, f, 1, 1, self.dim)
-                e0 = e0.view(b, f, 1, 1, 6, self.dim)
-                e = e.repeat(1, 1, grid_sizes[1], grid_sizes[2], 1).flatten(1, 3)
-                e0 = e0.repeat(1, 1, grid_sizes[1], grid_sizes[2], 1, 1).flatten(1, 3)
-                e0 = e0.transpose(1, 2).contiguous()
-
-            assert e.dtype == torch.float32 and e0.dtype == torch.float32
+                # per-token modulation in a single copy, frames are contiguous runs of h * w tokens
+                tokens_per_frame = grid_sizes[1] * grid_sizes[2]
+                e = e.view(b, f, 1, self.dim).expand(b, f, tokens_per_frame, self.dim).flatten(1, 2)
+                e0 = e0.view(b, f, 1, 6, self.dim).permute(0, 3, 1, 2, 4)
+                e0 = e0.expand(b, 6, f, tokens_per_frame, self.dim).flatten(2, 3)
 
         # context
         context = self.text_embedding(context)
@@ -709,60 +880,8 @@ class WanModel(ModelMixin, ConfigMixin, PeftAdapterMixin):
 
         # arguments
         kwargs = dict(e=e0, grid_sizes=grid_sizes, freqs=self.freqs, context=context, block_mask=self.block_mask)
-        if self.enable_teacache:
-            modulated_inp = e0 if self.use_ref_steps else e
-            # teacache
-            if self.cnt%2==0: # even -> conditon
-                self.is_even = True
-                if self.cnt < self.ret_steps or self.cnt >= self.cutoff_steps:
-                    should_calc_even = True
-                    self.accumulated_rel_l1_distance_even = 0
-                else:
-                    rescale_func = np.poly1d(self.coefficients)
-                    self.accumulated_rel_l1_distance_even += rescale_func(((modulated_inp-self.previous_e0_even).abs().mean() / self.previous_e0_even.abs().mean()).cpu().item())
-                    if self.accumulated_rel_l1_distance_even < self.teacache_thresh:
-                        should_calc_even = False
-                    else:
-                        should_calc_even = True
-                        self.accumulated_rel_l1_distance_even = 0
-                self.previous_e0_even = modulated_inp.clone()
-
-            else: # odd -> unconditon
-                self.is_even = False
-                if self.cnt < self.ret_steps or self.cnt >= self.cutoff_steps:
-                    should_calc_odd = True
-                    self.accumulated_rel_l1_distance_odd = 0
-                else: 
-                    rescale_func = np.poly1d(self.coefficients)
-                    self.accumulated_rel_l1_distance_odd += rescale_func(((modulated_inp-self.previous_e0_odd).abs().mean() / self.previous_e0_odd.abs().mean()).cpu().item())
-                    if self.accumulated_rel_l1_distance_odd < self.teacache_thresh:
-                        should_calc_odd = False
-                    else:
-                        should_calc_odd = True
-                        self.accumulated_rel_l1_distance_odd = 0
-                self.previous_e0_odd = modulated_inp.clone()
-
-        if self.enable_teacache: 
-            if self.is_even:
-                if not should_calc_even:
-                    x += self.previous_residual_even
-                else:
-                    ori_x = x.clone()
-                    for block in self.blocks:
-                        x = block(x, **kwargs)
-                    self.previous_residual_even = x - ori_x
-            else:
-                if not should_calc_odd:
-                    x += self.previous_residual_odd
-                else:
-                    ori_x = x.clone()
-                    for block in self.blocks:
-                        x = block(x, **kwargs)
-                    self.previous_residual_odd = x - ori_x
-
-            self.cnt += 1
-            if self.cnt >= self.num_steps:
-                self.cnt = 0
+        if self.step_cache is not None:
+            x = self.step_cache(self.blocks, x, kwargs, e=e, e0=e0)
         else:
             for block in self.blocks:
                 x = block(x, **kwargs)
@@ -774,6 +893,89 @@ class WanModel(ModelMixin, ConfigMixin, PeftAdapterMixin):
 
         return x.float()
 
+    def forward_packed(self, x, t, context, clip_fea=None, y=None, fps=None):
+        r"""
+        Forward pass over samples of different frame counts and resolutions in one batch.
+
+        The patch tokens of all samples are concatenated along the sequence, and every sample keeps its own grid for
+        RoPE, its own timestep modulation and its own attention boundaries through varlen flash attention, so e.g.
+        16:9, 9:16 and 1:1 requests run in a single forward without padding.
+
+        Args:
+            x (List[Tensor]):
+                List of N input video tensors, each with shape [C_in, F, H, W]
+            t (Tensor):
+                Diffusion timesteps tensor of shape [N]
+            context (Tensor):
+                Text embeddings of shape [N, L, C]
+            clip_fea (Tensor, *optional*):
+                CLIP image features of shape [N, 257, C] for image-to-video mode
+            y (List[Tensor], *optional*):
+                Conditional video inputs for image-to-video mode, same shapes as x
+            fps (List[int], *optional*):
+                Per-sample fps for models with sample info injection
+
+        Returns:
+            List[Tensor]:
+                List of denoised video tensors with the input shapes [C_out, F, H, W]
+        """
+        assert not self.flag_causal_attention, "packed sequences are not supported with causal attention"
+        assert t.dim() == 1 and t.size(0) == len(x) == context.size(0)
+        device = self.patch_embedding.weight.device
+        if self.freqs.device != device:
+            self.freqs = self.freqs.to(device)
+
+        if y is not None:
+            x = [torch.cat([u, v], dim=0) for u, v in zip(x, y)]
+
+        # embeddings
+        x = [self.patch_embedding(u.unsqueeze(0)) for u in x]
+        grid_sizes = torch.tensor([u.shape[2:] for u in x], dtype=torch.long)
+        x = [u.flatten(2).transpose(1, 2) for u in x]
+        seq_lens = torch.tensor([u.size(1) for u in x], dtype=torch.int32)
+        x = torch.cat(x, dim=1)
+
+        # time embeddings, expanded to per-token modulation of each sample
+        with float32_autocast(device):
+            e = self.time_embedding(
+                sinusoidal_embedding_1d(self.freq_dim, t).to(self.patch_embedding.weight.dtype)
+            )  # n, dim
+            e0 = self.time_projection(e).unflatten(1, (6, self.dim))  # n, 6, dim
+            if self.inject_sample_info:
+                fps = torch.tensor(fps, dtype=torch.long, device=device)
+                e0 = e0 + self.fps_projection(self.fps_embedding(fps).float()).unflatten(1, (6, self.dim))
+            # CPU autocast returns the embeddings in its low precision dtype, the modulation stays float32
+            e, e0 = e.float(), e0.float()
+
+            repeats = seq_lens.to(device=device, dtype=torch.long)
+            e = torch.repeat_interleave(e, repeats, dim=0).unsqueeze(0)  # 1, L, dim
+            e0 = torch.repeat_interleave(e0, repeats, dim=0).transpose(0, 1).unsqueeze(0)  # 1, 6, L, dim
+
+        # context
+        context = self.text_embedding(context)
+
+        if clip_fea is not None:
+            context_clip = self.img_emb(clip_fea)  # n x 257 x dim
+            context = torch.concat([context_clip, context], dim=1)
+
+        # arguments
+        kwargs = dict(
+            e=e0, grid_sizes=grid_sizes, freqs=self.freqs, context=context, block_mask=None, seq_lens=seq_lens
+        )
+        if self.step_cache is not None:
+            x = self.step_cache(self.blocks, x, kwargs, e=e, e0=e0)
+        else:
+            for block in self.blocks:
+                x = block(x, **kwargs)
+
+        x = self.head(x, e)
+
+        # unpatchify
+        return [
+            self.unpatchify(u.unsqueeze(0), grid)[0].float()
+            for u, grid in zip(x[0].split(seq_lens.tolist()), grid_sizes.tolist())
+        ]
+
     def unpatchify(self, x, grid_sizes):
         r"""
         Reconstruct video tensors from patch embeddings.
@@ -804,6 +1006,27 @@ class WanModel(ModelMixin, ConfigMixin, PeftAdapterMixin):
         for block in self.blocks:
             block.set_ar_attention()
 
+    def fuse_qkv(self):
+        r"""
+        Fuse the q/k/v projections of every self-attention layer (see `WanSelfAttention.fuse_qkv`).
+
+        Returns:
+            int: Number of fused layers. Layers wrapped by LoRA adapters stay unfused.
+        """
+        return sum(block.self_attn.fuse_qkv() for block in self.blocks)
+
+    def unfuse_qkv(self):
+        for block in self.blocks:
+            block.self_attn.unfuse_qkv()
+
+    def set_ffn_chunk_size(self, chunk_size=None):
+        r"""
+        Run the feed-forward of every block over chunks of `chunk_size` tokens to cap activation memory on long
+        sequences, e.g. large diffusion forcing windows. `None` disables chunking.
+        """
+        for block in self.blocks:
+            block.set_ffn_chunk_size(chunk_size)
+
     def init_weights(self):
         r"""
         Initialize model parameters using Xavier initialization.
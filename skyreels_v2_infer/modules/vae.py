@@ -6,6 +6,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 from einops import rearrange
 
+from ..distributed.shared_loading import shared_checkpoint
 
 __all__ = [
     "WanVAE",
@@ -476,48 +477,86 @@ class WanVAE_(nn.Module):
         return x_recon, mu, log_var
 
     def encode(self, x, scale):
+        return self.encode_from_chunks(self.encode_chunks(x), scale)
+
+    def encode_chunks(self, x):
+        """
+        Runs the causal encoder over `x` split in time into 1, 4, 4, ... frames and returns the encoder output of
+        every chunk. Each output only depends on its own and earlier frames.
+        """
         self.clear_cache()
         ## cache
         t = x.shape[2]
         iter_ = 1 + (t - 1) // 4
         ## 对encode输入的x，按时间拆分为1、4、4、4....
+        out = []
         for i in range(iter_):
             self._enc_conv_idx = [0]
             if i == 0:
-                out = self.encoder(x[:, :, :1, :, :], feat_cache=self._enc_feat_map, feat_idx=self._enc_conv_idx)
+                out.append(self.encoder(x[:, :, :1, :, :], feat_cache=self._enc_feat_map, feat_idx=self._enc_conv_idx))
             else:
-                out_ = self.encoder(
-                    x[:, :, 1 + 4 * (i - 1) : 1 + 4 * i, :, :],
-                    feat_cache=self._enc_feat_map,
-                    feat_idx=self._enc_conv_idx,
+                out.append(
+                    self.encoder(
+                        x[:, :, 1 + 4 * (i - 1) : 1 + 4 * i, :, :],
+                        feat_cache=self._enc_feat_map,
+                        feat_idx=self._enc_conv_idx,
+                    )
                 )
-                out = torch.cat([out, out_], 2)
-        mu, log_var = self.conv1(out).chunk(2, dim=1)
+        self.clear_cache()
+        return out
+
+    def encoder_reach(self):
+        """
+        Upper bound on the number of earlier `encode_chunks` chunks the output of a chunk depends on through the causal
+        caches. A temporal convolution looks back `kernel - 1` frames, which span `ceil((kernel - 1) / n)` chunks of
+        `n` frames at its temporal resolution, and a temporal downsample looks back one frame.
+        """
+        frames, reach = 4, 0
+        for module in self.encoder.modules():
+            if isinstance(module, Resample) and module.mode == "downsample3d":
+                reach += 1
+                frames = max(1, frames // 2)
+            elif isinstance(module, CausalConv3d) and module._padding[4] > 0:
+                reach += -(-module._padding[4] // frames)
+        return reach
+
+    def encode_from_chunks(self, chunks, scale):
+        mu, log_var = self.conv1(torch.cat(chunks, 2)).chunk(2, dim=1)
         if isinstance(scale[0], torch.Tensor):
             mu = (mu - scale[0].view(1, self.z_dim, 1, 1, 1)) * scale[1].view(1, self.z_dim, 1, 1, 1)
         else:
             mu = (mu - scale[0]) * scale[1]
-        self.clear_cache()
         return mu
 
     def decode(self, z, scale):
+        return self.decode_range(z, scale)
+
+    def decode_range(self, z, scale, start=0, end=None, overlap=0):
+        """
+        Decodes latent frames `start` to `end` of `z` ([B, C, T, H, W]) into the video frames they produce: one for
+        latent frame 0, four for each later one. The causal caches are first warmed up on up to `overlap` latent
+        frames before `start`, whose output is dropped. The result matches the corresponding frames of a full decode
+        exactly when the warm-up reaches back to frame 0 and closely once it covers the decoder's effective temporal
+        receptive field.
+        """
+        end = z.shape[2] if end is None else end
+        first = max(0, start - overlap)
         self.clear_cache()
         # z: [b,c,t,h,w]
+        z = z[:, :, first:end]
         if isinstance(scale[0], torch.Tensor):
             z = z / scale[1].view(1, self.z_dim, 1, 1, 1) + scale[0].view(1, self.z_dim, 1, 1, 1)
         else:
             z = z / scale[1] + scale[0]
-        iter_ = z.shape[2]
         x = self.conv2(z)
-        for i in range(iter_):
+        out = []
+        for i in range(x.shape[2]):
             self._conv_idx = [0]
-            if i == 0:
-                out = self.decoder(x[:, :, i : i + 1, :, :], feat_cache=self._feat_map, feat_idx=self._conv_idx)
-            else:
-                out_ = self.decoder(x[:, :, i : i + 1, :, :], feat_cache=self._feat_map, feat_idx=self._conv_idx)
-                out = torch.cat([out, out_], 2)
+            out_ = self.decoder(x[:, :, i : i + 1, :, :], feat_cache=self._feat_map, feat_idx=self._conv_idx)
+            if first + i >= start:
+                out.append(out_)
         self.clear_cache()
-        return out
+        return torch.cat(out, 2)
 
     def reparameterize(self, mu, log_var):
         std = torch.exp(0.5 * log_var)
@@ -563,12 +602,15 @@ def _video_vae(pretrained_path=None, z_dim=None, device="cpu", **kwargs):
 
     # load checkpoint
     logging.info(f"loading {pretrained_path}")
-    model.load_state_dict(torch.load(pretrained_path, map_location=device), assign=True)
+    with shared_checkpoint(pretrained_path) as path:
+        model.load_state_dict(torch.load(path, map_location=device, mmap=True), assign=True)
 
     return model
 
 
 class WanVAE:
+    parallel_decode = None
+
     def __init__(self, vae_pth="cache/vae_step_411000.pth", z_dim=16):
 
         mean = [
@@ -611,6 +653,7 @@ class WanVAE:
         self.mean = torch.tensor(mean)
         self.std = torch.tensor(std)
         self.scale = [self.mean, 1.0 / self.std]
+        self._zero_padding_cache = {}
 
         # init model
         self.vae = (
@@ -628,6 +671,29 @@ class WanVAE:
         """
         return self.vae.encode(video, self.scale).float()
 
+    def encode_zero_padded(self, image, num_frames):
+        """
+        Encodes `image` ([B, C, 1, H, W]) followed by `num_frames - 1` black frames, as used for image-to-video
+        conditioning, without re-encoding the padding on every call.
+
+        The encoder is causal and its caches only reach `encoder_reach` chunks back, so every chunk past that only
+        sees black frames and equals the chunk of an all-black clip. Those are encoded once per (B, F, H, W) and
+        reused; each call only encodes the image and the chunks it still reaches. The released VAE reaches 33 chunks
+        back, so clips of up to 133 frames are encoded in full.
+        """
+        b, c, _, h, w = image.shape
+        num_chunks = 1 + (num_frames - 1) // 4
+        num_dependent = min(num_chunks, self.vae.encoder_reach() + 1)
+        padding = torch.zeros(b, c, 4 * (num_dependent - 1), h, w, dtype=image.dtype, device=image.device)
+        chunks = self.vae.encode_chunks(torch.cat([image, padding], dim=2))
+        if num_dependent < num_chunks:
+            key = (b, num_frames, h, w, image.dtype, image.device)
+            if key not in self._zero_padding_cache:
+                zeros = torch.zeros(b, c, num_frames, h, w, dtype=image.dtype, device=image.device)
+                self._zero_padding_cache[key] = self.vae.encode_chunks(zeros)[num_dependent:]
+            chunks = chunks + list(self._zero_padding_cache[key])
+        return self.vae.encode_from_chunks(chunks, self.scale).float()
+
     def to(self, *args, **kwargs):
         self.mean = self.mean.to(*args, **kwargs)
         self.std = self.std.to(*args, **kwargs)
@@ -635,5 +701,20 @@ class WanVAE:
         self.vae = self.vae.to(*args, **kwargs)
         return self
 
+    def enable_parallel_decode(self, overlap=4, group=None, dst=None):
+        """
+        Splits `decode` over the ranks of `group` (the default process group if None), each decoding a temporal chunk
+        of the latents after warming its causal caches up on `overlap` latent frames, see
+        `skyreels_v2_infer.distributed.vae_parallel.parallel_decode`. With `dst` only that rank receives the full
+        video and the others return their own chunk.
+        """
+        if overlap < 1:
+            raise ValueError(f"`overlap` must be at least 1 latent frame, got {overlap}")
+        self.parallel_decode = dict(overlap=overlap, group=group, dst=dst)
+
     def decode(self, z):
+        if self.parallel_decode is not None:
+            from ..distributed.vae_parallel import parallel_decode
+
+            return parallel_decode(self, z, **self.parallel_decode)
         return self.vae.decode(z, self.scale).float().clamp_(-1, 1)
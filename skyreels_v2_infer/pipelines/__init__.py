@@ -1,6 +1,42 @@
 """
 SkyReels-V2 Inference Pipelines
 """
+from .cancellation import CancellationToken
+from .cancellation import DenoiseCheckpoint
+from .cancellation import GenerationCancelled
+from .cancellation import GenerationPreempted
+from .continuous_batching import ContinuousBatchScheduler
+from .continuous_batching import DenoiseRequest
+from .diffusion_forcing_pipeline import DiffusionForcingPipeline
+from .guidance import GuidanceSchedule
+from .image2video_pipeline import Image2VideoPipeline
+from .image2video_pipeline import resizecrop
+from .progressive import ProgressiveSchedule
 from .prompt_enhancer import PromptEnhancer
+from .staged_executor import Stage
+from .staged_executor import StagedExecutor
+from .text2video_pipeline import Text2VideoPipeline
+from .video_io import VideoSink
+from .video_io import VideoSource
+from .video_io import write_video
 
-__all__ = ['PromptEnhancer']
+__all__ = [
+    'CancellationToken',
+    'ContinuousBatchScheduler',
+    'DenoiseCheckpoint',
+    'DenoiseRequest',
+    'DiffusionForcingPipeline',
+    'GenerationCancelled',
+    'GenerationPreempted',
+    'GuidanceSchedule',
+    'Image2VideoPipeline',
+    'ProgressiveSchedule',
+    'PromptEnhancer',
+    'Stage',
+    'StagedExecutor',
+    'Text2VideoPipeline',
+    'VideoSink',
+    'VideoSource',
+    'resizecrop',
+    'write_video',
+]
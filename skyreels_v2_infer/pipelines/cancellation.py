@@ -0,0 +1,170 @@
+import copy
+import threading
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Union
+
+import torch
+
+
+class GenerationCancelled(Exception):
+    """Raised at a step boundary when the job's `CancellationToken` was cancelled."""
+
+
+class GenerationPreempted(Exception):
+    """
+    Raised at a step boundary when the job was asked to yield the GPU. `checkpoint` resumes the job bit-exactly when
+    passed back to the pipeline as `resume_from` with the same arguments.
+    """
+
+    def __init__(self, checkpoint: "DenoiseCheckpoint"):
+        super().__init__(f"generation preempted at step {checkpoint.step_index}")
+        self.checkpoint = checkpoint
+
+
+class CancellationToken:
+    """
+    Cooperative stop signal checked by the pipelines between denoising steps.
+
+    Another thread (e.g. the API server) calls `cancel` to abandon the job or `preempt` to pause it. The pipeline
+    notices at its next step boundary: a cancelled job raises `GenerationCancelled`, a preempted one raises
+    `GenerationPreempted` carrying a `DenoiseCheckpoint` of its latents, scheduler and RNG state.
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._preempt = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def preempt(self):
+        self._preempt.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def preempt_requested(self) -> bool:
+        return self._preempt.is_set()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise GenerationCancelled("generation cancelled")
+
+    def check(self, capture) -> None:
+        """
+        Called by the pipelines at every step boundary. `capture` builds the `DenoiseCheckpoint` of the current step
+        and is only invoked when a preemption is pending, so the check is free otherwise.
+        """
+        self.raise_if_cancelled()
+        if self.preempt_requested:
+            self._preempt.clear()
+            raise GenerationPreempted(capture())
+
+
+def _generator_states(generator) -> Optional[List[torch.Tensor]]:
+    if generator is None:
+        return None
+    generators = generator if isinstance(generator, list) else [generator]
+    return [g.get_state() for g in generators]
+
+
+def _set_generator_states(generator, states):
+    if generator is None or states is None:
+        return
+    generators = generator if isinstance(generator, list) else [generator]
+    for g, state in zip(generators, states):
+        g.set_state(state)
+
+
+class DenoiseCheckpoint:
+    """
+    State of a denoising loop at a step boundary: everything the remaining steps read, so resuming from it replays
+    exactly the computation the uninterrupted run would have done.
+
+    Args:
+        step_index (`int`): Index of the next step to run.
+        latents (`torch.Tensor`): Current latents.
+        schedulers (`List`): Copies of the sampling scheduler(s), with their multistep history and step index.
+        generator_states (`List[torch.Tensor]`, *optional*): States of the pipeline's generator(s).
+        cpu_rng_state (`torch.Tensor`): Global CPU RNG state.
+        cuda_rng_state (`torch.Tensor`, *optional*): Global RNG state of the current CUDA device.
+        step_cache (*optional*): Copy of the transformer's step cache, whose skip decisions depend on past steps.
+        extra (`Dict[str, Any]`, *optional*): Pipeline-specific loop state.
+    """
+
+    def __init__(
+        self,
+        step_index: int,
+        latents: torch.Tensor,
+        schedulers: List,
+        generator_states: Optional[List[torch.Tensor]] = None,
+        cpu_rng_state: Optional[torch.Tensor] = None,
+        cuda_rng_state: Optional[torch.Tensor] = None,
+        step_cache=None,
+        extra: Optional[Dict[str, Any]] = None,
+    ):
+        self.step_index = step_index
+        self.latents = latents
+        self.schedulers = schedulers
+        self.generator_states = generator_states
+        self.cpu_rng_state = cpu_rng_state
+        self.cuda_rng_state = cuda_rng_state
+        self.step_cache = step_cache
+        self.extra = extra or {}
+
+    @classmethod
+    def capture(
+        cls,
+        step_index: int,
+        latents: torch.Tensor,
+        schedulers: Union[List, Any],
+        generator=None,
+        transformer=None,
+        **extra,
+    ) -> "DenoiseCheckpoint":
+        schedulers = schedulers if isinstance(schedulers, list) else [schedulers]
+        step_cache = getattr(transformer, "step_cache", None)
+        return cls(
+            step_index,
+            latents.detach().clone(),
+            copy.deepcopy(schedulers),
+            generator_states=_generator_states(generator),
+            cpu_rng_state=torch.get_rng_state(),
+            cuda_rng_state=torch.cuda.get_rng_state() if torch.cuda.is_available() else None,
+            step_cache=copy.deepcopy(step_cache),
+            extra=copy.deepcopy(extra),
+        )
+
+    def restore(self, generator=None, transformer=None) -> List:
+        """
+        Restores the RNG and step cache state and returns fresh copies of the schedulers, leaving the checkpoint
+        reusable.
+        """
+        _set_generator_states(generator, self.generator_states)
+        if self.cpu_rng_state is not None:
+            torch.set_rng_state(self.cpu_rng_state)
+        if self.cuda_rng_state is not None and torch.cuda.is_available():
+            torch.cuda.set_rng_state(self.cuda_rng_state)
+        if transformer is not None:
+            transformer.step_cache = copy.deepcopy(self.step_cache)
+        return copy.deepcopy(self.schedulers)
+
+    def to(self, device) -> "DenoiseCheckpoint":
+        """Moves the latents, e.g. to CPU memory while the job is paused."""
+        self.latents = self.latents.to(device)
+        return self
+
+    def save(self, path: str):
+        torch.save(self.__dict__, path)
+
+    @classmethod
+    def load(cls, path: str) -> "DenoiseCheckpoint":
+        state = torch.load(path, map_location="cpu", weights_only=False)
+        checkpoint = cls.__new__(cls)
+        checkpoint.__dict__.update(state)
+        return checkpoint
@@ -0,0 +1,273 @@
+import contextlib
+import time
+from collections import deque
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import torch
+
+from ..modules.device import autocast
+from ..scheduler.fm_solvers import build_sampler
+from .guidance import GuidanceSchedule
+
+
+class DenoiseRequest:
+    """
+    One text-to-video denoising job for the `ContinuousBatchScheduler`.
+
+    The request carries everything the transformer needs per step (initial noise and prompt embeddings) and owns a
+    private sampler, so requests at different points of their trajectory can share one batched forward.
+
+    Args:
+        request_id (`str`): Identifier reported back on completion.
+        latents (`torch.Tensor`): Initial noise of shape [C, F, H, W].
+        context (`torch.Tensor`): Prompt embeddings of shape [1, L, C].
+        context_null (`torch.Tensor`, *optional*): Negative prompt embeddings, needed when guidance is applied.
+        num_inference_steps (`int`, defaults to 50): Number of denoising steps.
+        shift (`float`, defaults to 5.0): Flow shift of the sampling schedule.
+        guidance_schedule (`GuidanceSchedule`, *optional*): Per-step guidance, defaults to a constant scale of 5.0.
+        generator (`torch.Generator`, *optional*): Generator forwarded to the scheduler step.
+        on_finish (`Callable[[DenoiseRequest], None]`, *optional*): Called with the request once it retires.
+        adapter (`str`, *optional*): LoRA adapter to denoise with, a name known to the scheduler's `LoRAManager`.
+        sampler (`str`, defaults to "unipc"): Sampler of the request, one of `SAMPLERS`.
+    """
+
+    def __init__(
+        self,
+        request_id: str,
+        latents: torch.Tensor,
+        context: torch.Tensor,
+        context_null: Optional[torch.Tensor] = None,
+        num_inference_steps: int = 50,
+        shift: float = 5.0,
+        guidance_schedule: Optional[GuidanceSchedule] = None,
+        generator: Optional[torch.Generator] = None,
+        on_finish: Optional[Callable[["DenoiseRequest"], None]] = None,
+        adapter: Optional[str] = None,
+        sampler: str = "unipc",
+    ):
+        self.request_id = request_id
+        self.latents = latents
+        self.context = context
+        self.context_null = context_null
+        self.num_inference_steps = num_inference_steps
+        self.shift = shift
+        self.guidance_schedule = guidance_schedule if guidance_schedule is not None else GuidanceSchedule()
+        if self.guidance_schedule.requires_uncond() and context_null is None:
+            raise ValueError(f"request {request_id} applies guidance but has no `context_null`")
+        self.generator = generator
+        self.on_finish = on_finish
+        self.adapter = adapter
+        self.sampler = sampler
+
+        self.scheduler = None
+        self.timesteps = None
+        self.step_index = 0
+        self.submit_time = None
+        self.admit_time = None
+        self.finish_time = None
+
+    @property
+    def batch_key(self):
+        """Requests with equal keys can be stacked into one transformer forward."""
+        return tuple(self.latents.shape), tuple(self.context.shape[1:]), self.latents.dtype
+
+    @property
+    def packed_batch_key(self):
+        """Requests with equal keys can be packed into one transformer forward, whatever their resolution."""
+        # packed samples share the batch row the adapters are selected by
+        return self.latents.size(0), tuple(self.context.shape[1:]), self.latents.dtype, self.adapter
+
+    @property
+    def finished(self) -> bool:
+        return self.timesteps is not None and self.step_index >= len(self.timesteps)
+
+    def start(self, device):
+        self.scheduler = build_sampler(self.sampler)
+        self.scheduler.set_timesteps(self.num_inference_steps, device=device, shift=self.shift)
+        self.scheduler.set_begin_index(0)
+        self.timesteps = self.scheduler.timesteps
+
+    @property
+    def guidance_scale(self) -> float:
+        return self.guidance_schedule.scale_at(self.step_index, len(self.timesteps))
+
+
+class ContinuousBatchScheduler:
+    """
+    Iteration-level batching of denoising steps across concurrent requests.
+
+    Instead of running every request's full denoising loop on its own, the scheduler advances all in-flight requests
+    one step at a time. Each call to `step` picks the group of compatible requests (same latent and context shape)
+    that waited longest, runs a single batched transformer forward with per-sample timesteps, with the conditional
+    and unconditional branches of guided samples folded into the same batch, and steps each sample's own scheduler.
+    New requests are admitted and finished requests retired between steps.
+
+    `max_batch_size` bounds the samples per forward (the uncond pass counts as a sample) and trades per-step latency
+    for throughput. `max_active` bounds the requests in flight; groups beyond what fits one forward are time-sliced,
+    so a larger value raises throughput under load while every request's completion time grows.
+
+    With `pack=True` requests of different frame counts and resolutions share a forward as well: their latents are
+    passed as a list and `WanModel.forward_packed` concatenates them along the sequence with per-sample RoPE grids
+    and varlen attention boundaries. `max_batch_tokens` then bounds the packed sequence length of a forward.
+
+    With a `lora_manager` every request can name its own LoRA adapter. Stacked batches mix requests with different
+    adapters, each sample selecting its own; packed batches group requests by adapter.
+
+    Step caches keep per-branch state for a single trajectory and are not supported here.
+
+    Args:
+        transformer: `WanModel` or any module with the same `(x, t, context)` forward.
+        max_batch_size (`int`, defaults to 4): Maximum samples per transformer forward.
+        max_active (`int`, *optional*): Maximum requests in flight, defaults to `max_batch_size`.
+        device (`str`, defaults to "cuda"): Device the latents and scheduler state live on.
+        pack (`bool`, defaults to False): Pack requests of different shapes into one forward.
+        max_batch_tokens (`int`, *optional*): Maximum latent positions (F * H * W) per packed forward.
+        lora_manager (`LoRAManager`, *optional*): Serves the adapters requests name, on the same `transformer`.
+    """
+
+    def __init__(
+        self,
+        transformer,
+        max_batch_size: int = 4,
+        max_active: Optional[int] = None,
+        device="cuda",
+        pack: bool = False,
+        max_batch_tokens: Optional[int] = None,
+        lora_manager=None,
+    ):
+        if getattr(transformer, "step_cache", None) is not None:
+            raise ValueError("continuous batching does not support step caches, disable teacache first")
+        if max_batch_size < 1:
+            raise ValueError(f"`max_batch_size` must be positive, got {max_batch_size}")
+        self.transformer = transformer
+        self.max_batch_size = max_batch_size
+        self.max_active = max_active if max_active is not None else max_batch_size
+        self.device = torch.device(device)
+        self.pack = pack
+        self.max_batch_tokens = max_batch_tokens
+        self.lora_manager = lora_manager
+        self.waiting = deque()
+        self.active: List[DenoiseRequest] = []
+        self.finished: Dict[str, DenoiseRequest] = {}
+        self.num_forwards = 0
+        self._last_run: Dict[tuple, int] = {}
+
+    def submit(self, request: DenoiseRequest):
+        if request.adapter is not None and self.lora_manager is None:
+            raise ValueError(f"request {request.request_id} names an adapter but the scheduler has no `lora_manager`")
+        request.submit_time = time.perf_counter()
+        self.waiting.append(request)
+
+    def has_work(self) -> bool:
+        return bool(self.waiting or self.active)
+
+    def _admit(self):
+        while self.waiting and len(self.active) < self.max_active:
+            request = self.waiting.popleft()
+            request.start(self.device)
+            request.latents = request.latents.to(self.device)
+            request.admit_time = time.perf_counter()
+            self.active.append(request)
+
+    def _retire(self):
+        still_active = []
+        for request in self.active:
+            if request.finished:
+                request.finish_time = time.perf_counter()
+                self.finished[request.request_id] = request
+                if request.on_finish is not None:
+                    request.on_finish(request)
+            else:
+                still_active.append(request)
+        self.active = still_active
+
+    def _select_batch(self) -> List[DenoiseRequest]:
+        groups: Dict[tuple, List[DenoiseRequest]] = {}
+        for request in self.active:
+            key = request.packed_batch_key if self.pack else request.batch_key
+            groups.setdefault(key, []).append(request)
+        # the group that ran least recently goes first so no shape starves
+        key = min(groups, key=lambda k: self._last_run.get(k, -1))
+        self._last_run[key] = self.num_forwards
+
+        batch, num_samples, num_tokens = [], 0, 0
+        for request in groups[key]:
+            cost = 2 if request.guidance_schedule.needs_uncond(request.guidance_scale) else 1
+            tokens = cost * request.latents[0].numel()
+            if batch and num_samples + cost > self.max_batch_size:
+                break
+            if batch and self.max_batch_tokens is not None and num_tokens + tokens > self.max_batch_tokens:
+                break
+            batch.append(request)
+            num_samples += cost
+            num_tokens += tokens
+        return batch
+
+    def _forward(self, batch: List[DenoiseRequest]):
+        latents, timesteps, contexts, uncond = [], [], [], []
+        for i, request in enumerate(batch):
+            t = request.timesteps[request.step_index]
+            latents.append(request.latents)
+            timesteps.append(t)
+            contexts.append(request.context)
+            if request.guidance_schedule.needs_uncond(request.guidance_scale):
+                uncond.append(i)
+        for i in uncond:
+            latents.append(batch[i].latents)
+            timesteps.append(timesteps[i])
+            contexts.append(batch[i].context_null)
+
+        adapters = contextlib.nullcontext()
+        if self.lora_manager is not None:
+            if self.pack:
+                adapters = self.lora_manager.use(batch[0].adapter)
+            else:
+                names = [request.adapter for request in batch] + [batch[i].adapter for i in uncond]
+                adapters = self.lora_manager.use(names)
+
+        dtype = getattr(self.transformer, "dtype", torch.float32)
+        with adapters, autocast(self.device, dtype):
+            noise_pred = self.transformer(
+                latents if self.pack else torch.stack(latents),
+                t=torch.stack(timesteps),
+                context=torch.cat(contexts).to(self.device),
+            )
+        self.num_forwards += 1
+
+        noise_pred_cond = [noise_pred[i] for i in range(len(batch))]
+        for j, i in enumerate(uncond):
+            scale = batch[i].guidance_scale
+            noise_pred_uncond = noise_pred[len(batch) + j]
+            noise_pred_cond[i] = noise_pred_uncond + scale * (noise_pred_cond[i] - noise_pred_uncond)
+        return noise_pred_cond
+
+    @torch.no_grad()
+    def step(self) -> List[DenoiseRequest]:
+        """
+        Admits waiting requests, runs one batched denoising step and retires finished requests.
+
+        Returns:
+            The requests that finished during this step.
+        """
+        self._admit()
+        if not self.active:
+            return []
+        batch = self._select_batch()
+        noise_pred = self._forward(batch)
+        for request, pred in zip(batch, noise_pred):
+            t = request.timesteps[request.step_index]
+            request.latents = request.scheduler.step(
+                pred.unsqueeze(0), t, request.latents.unsqueeze(0), return_dict=False, generator=request.generator
+            )[0].squeeze(0)
+            request.step_index += 1
+        done = [request for request in batch if request.finished]
+        self._retire()
+        return done
+
+    def run_until_complete(self) -> Dict[str, DenoiseRequest]:
+        while self.has_work():
+            self.step()
+        return self.finished
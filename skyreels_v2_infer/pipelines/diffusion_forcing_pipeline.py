@@ -1,5 +1,6 @@
 import math
 import os
+from typing import Callable
 from typing import List
 from typing import Optional
 from typing import Tuple
@@ -11,17 +12,20 @@ from diffusers.image_processor import PipelineImageInput
 from diffusers.utils.torch_utils import randn_tensor
 from diffusers.video_processor import VideoProcessor
 from tqdm import tqdm
-try:
-    import decord
-    from decord import VideoReader
-    DECORD_AVAILABLE = True
-except ImportError:
-    DECORD_AVAILABLE = False
 
+from ..distributed import cfg_parallel
+from ..distributed import tensor_parallel
 from ..modules import get_text_encoder
 from ..modules import get_transformer
 from ..modules import get_vae
-from ..scheduler.fm_solvers_unipc import FlowUniPCMultistepScheduler
+from ..scheduler.fm_solvers import build_sampler
+from .cancellation import CancellationToken
+from .cancellation import DenoiseCheckpoint
+from .guidance import GuidanceSchedule
+from .progressive import ProgressiveSchedule
+from .video_io import VideoSource
+from .video_io import frames_to_numpy
+from .video_io import video_to_uint8
 
 
 
@@ -49,6 +53,9 @@ class DiffusionForcingPipeline:
         weight_dtype=torch.bfloat16,
         use_usp=False,
         offload=False,
+        quantization=None,
+        sampler: str = "unipc",
+        parallel_vae_decode: bool = False,
     ):
         """
         Initialize the diffusion forcing pipeline class
@@ -58,18 +65,28 @@ class DiffusionForcingPipeline:
             dit_path (str): Path to the DIT model, containing model configuration file (config.json) and weight file (*.safetensor)
             device (str): Device to run on, defaults to 'cuda'
             weight_dtype: Weight data type, defaults to torch.bfloat16
+            quantization (str): Weight-only quantization of the DiT linears, 'int8' or 'fp8'; checkpoints saved
+                quantized are detected
+            sampler (str): Sampler of every frame, one of `SAMPLERS` except 'adaptive', whose per-step schedule
+                changes cannot follow the precomputed timestep matrix; defaults to 'unipc'
+            parallel_vae_decode (bool): Splits the VAE decode over the ranks of a multi-GPU run in temporal chunks,
+                which approximate the single-rank decode after the first chunk; defaults to False
         """
         load_device = "cpu" if offload else device
-        self.transformer = get_transformer(dit_path, load_device, weight_dtype)
+        # with tensor parallelism each rank only loads its slice of the DiT and text encoder weights
+        shard_fn = tensor_parallel.shard_model if tensor_parallel.is_initialized() else None
+        self.transformer = get_transformer(
+            dit_path, load_device, weight_dtype, shard_fn=shard_fn, quantization=quantization
+        )
         vae_model_path = os.path.join(model_path, "Wan2.1_VAE.pth")
         self.vae = get_vae(vae_model_path, device, weight_dtype=torch.float32)
-        self.text_encoder = get_text_encoder(model_path, load_device, weight_dtype)
+        self.text_encoder = get_text_encoder(model_path, load_device, weight_dtype, shard_fn=shard_fn)
         self.video_processor = VideoProcessor(vae_scale_factor=16)
         self.device = device
         self.offload = offload
 
         if use_usp:
-            from xfuser.core.distributed import get_sequence_parallel_world_size
+            from ..distributed.xdit_context_parallel import get_sequence_parallel_world_size
             from ..distributed.xdit_context_parallel import usp_attn_forward, usp_dit_forward
             import types
 
@@ -77,12 +94,72 @@ class DiffusionForcingPipeline:
                 block.self_attn.forward = types.MethodType(usp_attn_forward, block.self_attn)
                 self.transformer.forward = types.MethodType(usp_dit_forward, self.transformer)
                 self.sp_size = get_sequence_parallel_world_size()
+        distributed = use_usp or cfg_parallel.is_initialized() or tensor_parallel.is_initialized()
+        if parallel_vae_decode and distributed:
+            # every rank ends up with the same latents, so each decodes a temporal chunk; all ranks receive the
+            # frames since long videos and extensions condition the next window on the decoded, approximate tail
+            self.vae.enable_parallel_decode()
 
-        self.scheduler = FlowUniPCMultistepScheduler()
+        if sampler == "adaptive":
+            raise ValueError("diffusion forcing steps every frame on a fixed timestep matrix, use a fixed-step sampler")
+        self.sampler = sampler
+        self.scheduler = build_sampler(sampler)
 
     @property
     def do_classifier_free_guidance(self) -> bool:
-        return self._guidance_scale > 1
+        return self._guidance_schedule.requires_uncond()
+
+    def _predict_noise(
+        self, latent_model_input, timestep, prompt_embeds, negative_prompt_embeds, fps_embeds, guidance_scale, **kwargs
+    ) -> torch.Tensor:
+        if cfg_parallel.is_initialized():
+            return cfg_parallel.cfg_parallel_predict(
+                self.transformer,
+                latent_model_input,
+                dict(context=prompt_embeds),
+                dict(context=negative_prompt_embeds),
+                guidance_scale,
+                self.do_classifier_free_guidance and self._guidance_schedule.needs_uncond(guidance_scale),
+                t=timestep,
+                fps=fps_embeds,
+                **kwargs,
+            )
+        noise_pred = self.transformer(latent_model_input, t=timestep, context=prompt_embeds, fps=fps_embeds, **kwargs)[0]
+        if not (self.do_classifier_free_guidance and self._guidance_schedule.needs_uncond(guidance_scale)):
+            self.transformer.skip_teacache_uncond()
+            return noise_pred
+        noise_pred_uncond = self.transformer(
+            latent_model_input, t=timestep, context=negative_prompt_embeds, fps=fps_embeds, **kwargs
+        )[0]
+        return noise_pred_uncond + guidance_scale * (noise_pred - noise_pred_uncond)
+
+    def _progressive_latents(self, latents, condition_frames, progressive, generator) -> torch.Tensor:
+        """Samples the noise of a window on the low-resolution grid and downsamples its conditioning frames."""
+        low_res = progressive.sample_noise(latents.shape, dtype=latents.dtype, device=latents.device, generator=generator)
+        for start, end in condition_frames:
+            if end > start:
+                low_res[:, start:end] = progressive.downsample(latents[:, start:end])
+        return low_res
+
+    def _progressive_refine(
+        self, latents, full_res_latents, sample_schedulers, condition_frames, progressive, generator
+    ) -> torch.Tensor:
+        """Moves every frame of a window to full resolution at the noise level of its own scheduler."""
+        refined = torch.empty_like(full_res_latents)
+        for idx, sample_scheduler in enumerate(sample_schedulers):
+            refined[:, idx] = progressive.refine(sample_scheduler, latents[:, idx], full_res_latents.shape[-2:], generator)
+        for start, end in condition_frames:
+            refined[:, start:end] = full_res_latents[:, start:end]
+        return refined
+
+    @staticmethod
+    def _x0_estimate(latents, sample_schedulers) -> torch.Tensor:
+        """Clean-latent estimate of a window: each frame's latest x0 prediction, or the frame before its first step."""
+        x0 = latents.clone()
+        for idx, sample_scheduler in enumerate(sample_schedulers):
+            if sample_scheduler.model_outputs[-1] is not None:
+                x0[:, idx] = sample_scheduler.model_outputs[-1].to(x0.dtype)
+        return x0
 
     def encode_image(
         self, image: PipelineImageInput, height: int, width: int, num_frames: int
@@ -188,29 +265,18 @@ class DiffusionForcingPipeline:
 
         return step_matrix, step_index, step_update_mask, valid_interval
 
-    def get_video_as_tensor(self, video_path, width, height):
+    def get_video_as_tensor(self, video_path, width, height, num_frames=None):
         """
         Loads a video from the given path and returns it as a tensor with proper channel ordering.
         Args:
             video_path (str): Path to the video file
+            num_frames (int, optional): Only decode the last `num_frames` frames
         Returns:
-            torch.Tensor: Video tensor in [C, T, H, W] format (channels first)
+            torch.Tensor: Video tensor in [T, C, H, W] format
         """
-        
-        # Set Decord to use CPU for video decoding
-        decord.bridge.set_bridge('torch')
-        
-        # Load video
-        vr = VideoReader(video_path, width=width, height=height)
-        total_frames = len(vr)
-        
-        # Read all frames
-        video_frames = vr.get_batch(list(range(total_frames)))
-        
-        # Convert from [T, H, W, C] to [C, T, H, W] format
-        video_tensor = video_frames.permute(0, 3, 1, 2).float()
-        
-        return video_tensor
+        source = VideoSource(video_path, width=width, height=height)
+        video_frames = source.read_tail(num_frames) if num_frames is not None else source.read()
+        return torch.from_numpy(video_frames).permute(0, 3, 1, 2).float()
 
     @torch.no_grad()
     def extend_video(
@@ -231,12 +297,20 @@ class DiffusionForcingPipeline:
         ar_step: int = 5,
         causal_block_size: int = None,
         fps: int = 24,
+        guidance_schedule: Optional[GuidanceSchedule] = None,
+        include_prefix: bool = True,
     ):
+        """
+        Continues the video at `prefix_video_path`. Only its last `overlap_history` frames are decoded to condition
+        the generation, plus the whole clip if `include_prefix` prepends it to the output; without it only the new
+        frames are returned and the caller can stream the source into the output with a `VideoSource`.
+        """
         latent_height = height // 8
         latent_width = width // 8
         latent_length = (num_frames - 1) // 4 + 1
 
         self._guidance_scale = guidance_scale
+        self._guidance_schedule = guidance_schedule or GuidanceSchedule(guidance_scale)
 
         i2v_extra_kwrags = {}
         prefix_video = None
@@ -244,6 +318,7 @@ class DiffusionForcingPipeline:
 
         self.text_encoder.to(self.device)
         prompt_embeds = self.text_encoder.encode(prompt).to(self.transformer.dtype)
+        negative_prompt_embeds = None
         if self.do_classifier_free_guidance:
             negative_prompt_embeds = self.text_encoder.encode(negative_prompt).to(self.transformer.dtype)
         if self.offload:
@@ -259,8 +334,8 @@ class DiffusionForcingPipeline:
         transformer_dtype = self.transformer.dtype
         # with torch.cuda.amp.autocast(dtype=self.transformer.dtype), torch.no_grad():
 
-        prefix_video = self.get_video_as_tensor(prefix_video_path, width, height)
-        prefix_frame = torch.tensor(prefix_video, device=self.device)
+        prefix_video = self.get_video_as_tensor(prefix_video_path, width, height, num_frames=overlap_history)
+        prefix_frame = prefix_video.to(self.device)
         start_video = (prefix_frame.float() / (255.0 / 2.0)) - 1.0
         start_video = start_video.transpose(0, 1)
 
@@ -269,9 +344,12 @@ class DiffusionForcingPipeline:
         overlap_history_frames = (overlap_history - 1) // 4 + 1
         n_iter = 1 + (latent_length - base_num_frames - 1) // (base_num_frames - overlap_history_frames) + 1
         print(f"n_iter:{n_iter}")
-        output_video = start_video.cpu()
+        history = start_video[:, -overlap_history:]
+        output_frames = []
+        if include_prefix:
+            output_frames.append(VideoSource(prefix_video_path, width=width, height=height).read())
         for i in range(n_iter):
-            prefix_video = output_video[:, -overlap_history:].to(prompt_embeds.device)
+            prefix_video = history.to(prompt_embeds.device)
             prefix_video = [self.vae.encode(prefix_video.unsqueeze(0))[0]]  # [(c, f, h, w)]
             if prefix_video[0].shape[1] % causal_block_size != 0:
                 truncate_len = prefix_video[0].shape[1] % causal_block_size
@@ -302,10 +380,9 @@ class DiffusionForcingPipeline:
             )
             sample_schedulers = []
             for _ in range(base_num_frames_iter):
-                sample_scheduler = FlowUniPCMultistepScheduler(
-                    num_train_timesteps=1000, shift=1, use_dynamic_shifting=False
-                )
+                sample_scheduler = build_sampler(self.sampler)
                 sample_scheduler.set_timesteps(num_inference_steps, device=prompt_embeds.device, shift=shift)
+                sample_scheduler.set_begin_index(0)
                 sample_schedulers.append(sample_scheduler)
             sample_schedulers_counter = [0] * base_num_frames_iter
             self.transformer.to(self.device)
@@ -327,30 +404,15 @@ class DiffusionForcingPipeline:
                         * noise_factor
                     )
                     timestep[:, valid_interval_start:predix_video_latent_length] = timestep_for_noised_condition
-                if not self.do_classifier_free_guidance:
-                    noise_pred = self.transformer(
-                        torch.stack([latent_model_input[0]]),
-                        t=timestep,
-                        context=prompt_embeds,
-                        fps=fps_embeds,
-                        **i2v_extra_kwrags,
-                    )[0]
-                else:
-                    noise_pred_cond = self.transformer(
-                        torch.stack([latent_model_input[0]]),
-                        t=timestep,
-                        context=prompt_embeds,
-                        fps=fps_embeds,
-                        **i2v_extra_kwrags,
-                    )[0]
-                    noise_pred_uncond = self.transformer(
-                        torch.stack([latent_model_input[0]]),
-                        t=timestep,
-                        context=negative_prompt_embeds,
-                        fps=fps_embeds,
-                        **i2v_extra_kwrags,
-                    )[0]
-                    noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
+                noise_pred = self._predict_noise(
+                    torch.stack([latent_model_input[0]]),
+                    timestep,
+                    prompt_embeds,
+                    negative_prompt_embeds,
+                    fps_embeds,
+                    guidance_scale=self._guidance_schedule.scale_at(i, len(step_matrix)),
+                    **i2v_extra_kwrags,
+                )
                 for idx in range(valid_interval_start, valid_interval_end):
                     if update_mask_i[idx].item():
                         latents[0][:, idx] = sample_schedulers[idx].step(
@@ -366,18 +428,12 @@ class DiffusionForcingPipeline:
                 torch.cuda.empty_cache()
             x0 = latents[0].unsqueeze(0)
             videos = [self.vae.decode(x0)[0]]
-            if output_video is None:
-                output_video = videos[0].clamp(-1, 1).cpu()  # c, f, h, w
-            else:
-                output_video = torch.cat(
-                    [output_video, videos[0][:, overlap_history:].clamp(-1, 1).cpu()], 1
-                )  # c, f, h, w
-        output_video = [(output_video / 2 + 0.5).clamp(0, 1)]
-        output_video = [video for video in output_video]
-        output_video = [video.permute(1, 2, 3, 0) * 255 for video in output_video]
-        output_video = [video.cpu().numpy().astype(np.uint8) for video in output_video]
-    
-        return output_video
+            segment = videos[0][:, overlap_history:].clamp(-1, 1)  # c, f, h, w
+            # only the last frames condition the next window, the rest go to the host as uint8
+            history = torch.cat([history, segment], 1)[:, -overlap_history:]
+            output_frames.append(frames_to_numpy(video_to_uint8(segment)))
+
+        return [np.concatenate(output_frames)]
     
 
     @torch.no_grad()
@@ -400,12 +456,32 @@ class DiffusionForcingPipeline:
         ar_step: int = 5,
         causal_block_size: int = None,
         fps: int = 24,
+        guidance_schedule: Optional[GuidanceSchedule] = None,
+        progressive: Optional[ProgressiveSchedule] = None,
+        preview_callback: Optional[Callable[[int, torch.Tensor], None]] = None,
+        preview_interval: int = 1,
+        cancellation_token: Optional[CancellationToken] = None,
+        resume_from: Optional[DenoiseCheckpoint] = None,
+        output_type: str = "np",
     ):
         latent_height = height // 8
         latent_width = width // 8
         latent_length = (num_frames - 1) // 4 + 1
 
         self._guidance_scale = guidance_scale
+        self._guidance_schedule = guidance_schedule or GuidanceSchedule(guidance_scale)
+        if preview_callback is not None and preview_interval < 1:
+            raise ValueError(f"`preview_interval` must be at least 1, got {preview_interval}")
+        if progressive is not None and progressive.low_res_steps >= num_inference_steps:
+            raise ValueError(
+                f"progressive sampling needs full-resolution steps, got {progressive.low_res_steps} low-resolution "
+                f"steps out of {num_inference_steps}"
+            )
+        if progressive is not None and progressive.low_res_steps == 0:
+            progressive = None
+        long_video = overlap_history is not None and base_num_frames is not None and num_frames > base_num_frames
+        if resume_from is not None and long_video:
+            raise ValueError("resuming from a checkpoint is only supported for single-window generation")
 
         i2v_extra_kwrags = {}
         prefix_video = None
@@ -421,6 +497,7 @@ class DiffusionForcingPipeline:
 
         self.text_encoder.to(self.device)
         prompt_embeds = self.text_encoder.encode(prompt).to(self.transformer.dtype)
+        negative_prompt_embeds = None
         if self.do_classifier_free_guidance:
             negative_prompt_embeds = self.text_encoder.encode(negative_prompt).to(self.transformer.dtype)
         if self.offload:
@@ -464,14 +541,44 @@ class DiffusionForcingPipeline:
 
             sample_schedulers = []
             for _ in range(latent_length):
-                sample_scheduler = FlowUniPCMultistepScheduler(
-                    num_train_timesteps=1000, shift=1, use_dynamic_shifting=False
-                )
+                sample_scheduler = build_sampler(self.sampler)
                 sample_scheduler.set_timesteps(num_inference_steps, device=prompt_embeds.device, shift=shift)
+                sample_scheduler.set_begin_index(0)
                 sample_schedulers.append(sample_scheduler)
             sample_schedulers_counter = [0] * latent_length
+            condition_frames = [(0, predix_video_latent_length), (latent_shape[1], latents[0].shape[1])]
+            full_res_latents = None
+            if progressive is not None:
+                full_res_latents = latents[0]
+                latents = [self._progressive_latents(full_res_latents, condition_frames, progressive, generator)]
+            start_step = 0
+            if resume_from is not None:
+                sample_schedulers = resume_from.restore(generator, self.transformer)
+                latents = [resume_from.latents.to(latents[0].device)]
+                sample_schedulers_counter = list(resume_from.extra["sample_schedulers_counter"])
+                full_res_latents = resume_from.extra["full_res_latents"]
+                start_step = resume_from.step_index
             self.transformer.to(self.device)
-            for i, timestep_i in enumerate(tqdm(step_matrix)):
+            for i, timestep_i in enumerate(tqdm(step_matrix[start_step:]), start_step):
+                if cancellation_token is not None:
+                    cancellation_token.check(
+                        lambda: DenoiseCheckpoint.capture(
+                            i,
+                            latents[0],
+                            sample_schedulers,
+                            generator,
+                            self.transformer,
+                            sample_schedulers_counter=sample_schedulers_counter,
+                            full_res_latents=full_res_latents,
+                        )
+                    )
+                if progressive is not None and progressive.is_switch_step(i):
+                    latents = [
+                        self._progressive_refine(
+                            latents[0], full_res_latents, sample_schedulers, condition_frames, progressive, generator
+                        )
+                    ]
+                    self.transformer.invalidate_step_cache()
                 update_mask_i = step_update_mask[i]
                 valid_interval_i = valid_interval[i]
                 valid_interval_start, valid_interval_end = valid_interval_i
@@ -486,30 +593,15 @@ class DiffusionForcingPipeline:
                         * noise_factor
                     )
                     timestep[:, valid_interval_start:predix_video_latent_length] = timestep_for_noised_condition
-                if not self.do_classifier_free_guidance:
-                    noise_pred = self.transformer(
-                        torch.stack([latent_model_input[0]]),
-                        t=timestep,
-                        context=prompt_embeds,
-                        fps=fps_embeds,
-                        **i2v_extra_kwrags,
-                    )[0]
-                else:
-                    noise_pred_cond = self.transformer(
-                        torch.stack([latent_model_input[0]]),
-                        t=timestep,
-                        context=prompt_embeds,
-                        fps=fps_embeds,
-                        **i2v_extra_kwrags,
-                    )[0]
-                    noise_pred_uncond = self.transformer(
-                        torch.stack([latent_model_input[0]]),
-                        t=timestep,
-                        context=negative_prompt_embeds,
-                        fps=fps_embeds,
-                        **i2v_extra_kwrags,
-                    )[0]
-                    noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
+                noise_pred = self._predict_noise(
+                    torch.stack([latent_model_input[0]]),
+                    timestep,
+                    prompt_embeds,
+                    negative_prompt_embeds,
+                    fps_embeds,
+                    guidance_scale=self._guidance_schedule.scale_at(i, len(step_matrix)),
+                    **i2v_extra_kwrags,
+                )
                 for idx in range(valid_interval_start, valid_interval_end):
                     if update_mask_i[idx].item():
                         latents[0][:, idx] = sample_schedulers[idx].step(
@@ -520,6 +612,8 @@ class DiffusionForcingPipeline:
                             generator=generator,
                         )[0]
                         sample_schedulers_counter[idx] += 1
+                if preview_callback is not None and (i + 1) % preview_interval == 0:
+                    preview_callback(i, self._x0_estimate(latents[0], sample_schedulers))
             if self.offload:
                 self.transformer.cpu()
                 torch.cuda.empty_cache()
@@ -527,22 +621,21 @@ class DiffusionForcingPipeline:
             if end_video is not None:
                 x0 = latents[0][:, :-end_video_latent_length].unsqueeze(0)
             
-            videos = self.vae.decode(x0)
-            videos = (videos / 2 + 0.5).clamp(0, 1)
-            videos = [video for video in videos]
-            videos = [video.permute(1, 2, 3, 0) * 255 for video in videos]
-            videos = [video.cpu().numpy().astype(np.uint8) for video in videos]
-            return videos
+            videos = video_to_uint8(self.vae.decode(x0))
+            if output_type == "pt":
+                return list(videos)
+            return [frames_to_numpy(video) for video in videos]
         else:
             # long video generation
             base_num_frames = (base_num_frames - 1) // 4 + 1 if base_num_frames is not None else latent_length
             overlap_history_frames = (overlap_history - 1) // 4 + 1
             n_iter = 1 + (latent_length - base_num_frames - 1) // (base_num_frames - overlap_history_frames) + 1
             print(f"n_iter:{n_iter}")
-            output_video = None
+            history = None
+            output_frames = []
             for i in range(n_iter):
-                if output_video is not None:  # i !=0
-                    prefix_video = output_video[:, -overlap_history:].to(prompt_embeds.device)
+                if history is not None:  # i !=0
+                    prefix_video = history.to(prompt_embeds.device)
                     prefix_video = [self.vae.encode(prefix_video.unsqueeze(0))[0]]  # [(c, f, h, w)]
                     if prefix_video[0].shape[1] % causal_block_size != 0:
                         truncate_len = prefix_video[0].shape[1] % causal_block_size
@@ -583,14 +676,26 @@ class DiffusionForcingPipeline:
 
                 sample_schedulers = []
                 for _ in range(base_num_frames_iter):
-                    sample_scheduler = FlowUniPCMultistepScheduler(
-                        num_train_timesteps=1000, shift=1, use_dynamic_shifting=False
-                    )
+                    sample_scheduler = build_sampler(self.sampler)
                     sample_scheduler.set_timesteps(num_inference_steps, device=prompt_embeds.device, shift=shift)
+                    sample_scheduler.set_begin_index(0)
                     sample_schedulers.append(sample_scheduler)
                 sample_schedulers_counter = [0] * base_num_frames_iter
+                condition_frames = [(0, predix_video_latent_length), (latent_shape[1], latents[0].shape[1])]
+                if progressive is not None:
+                    full_res_latents = latents[0]
+                    latents = [self._progressive_latents(full_res_latents, condition_frames, progressive, generator)]
                 self.transformer.to(self.device)
                 for i, timestep_i in enumerate(tqdm(step_matrix)):
+                    if cancellation_token is not None:
+                        cancellation_token.raise_if_cancelled()
+                    if progressive is not None and progressive.is_switch_step(i):
+                        latents = [
+                            self._progressive_refine(
+                                latents[0], full_res_latents, sample_schedulers, condition_frames, progressive, generator
+                            )
+                        ]
+                        self.transformer.invalidate_step_cache()
                     update_mask_i = step_update_mask[i]
                     valid_interval_i = valid_interval[i]
                     valid_interval_start, valid_interval_end = valid_interval_i
@@ -608,30 +713,15 @@ class DiffusionForcingPipeline:
                             * noise_factor
                         )
                         timestep[:, valid_interval_start:predix_video_latent_length] = timestep_for_noised_condition
-                    if not self.do_classifier_free_guidance:
-                        noise_pred = self.transformer(
-                            torch.stack([latent_model_input[0]]),
-                            t=timestep,
-                            context=prompt_embeds,
-                            fps=fps_embeds,
-                            **i2v_extra_kwrags,
-                        )[0]
-                    else:
-                        noise_pred_cond = self.transformer(
-                            torch.stack([latent_model_input[0]]),
-                            t=timestep,
-                            context=prompt_embeds,
-                            fps=fps_embeds,
-                            **i2v_extra_kwrags,
-                        )[0]
-                        noise_pred_uncond = self.transformer(
-                            torch.stack([latent_model_input[0]]),
-                            t=timestep,
-                            context=negative_prompt_embeds,
-                            fps=fps_embeds,
-                            **i2v_extra_kwrags,
-                        )[0]
-                        noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
+                    noise_pred = self._predict_noise(
+                        torch.stack([latent_model_input[0]]),
+                        timestep,
+                        prompt_embeds,
+                        negative_prompt_embeds,
+                        fps_embeds,
+                        guidance_scale=self._guidance_schedule.scale_at(i, len(step_matrix)),
+                        **i2v_extra_kwrags,
+                    )
                     for idx in range(valid_interval_start, valid_interval_end):
                         if update_mask_i[idx].item():
                             latents[0][:, idx] = sample_schedulers[idx].step(
@@ -642,6 +732,8 @@ class DiffusionForcingPipeline:
                                 generator=generator,
                             )[0]
                             sample_schedulers_counter[idx] += 1
+                    if preview_callback is not None and (i + 1) % preview_interval == 0:
+                        preview_callback(i, self._x0_estimate(latents[0], sample_schedulers))
                 if self.offload:
                     self.transformer.cpu()
                     torch.cuda.empty_cache()
@@ -650,14 +742,15 @@ class DiffusionForcingPipeline:
                     x0 = latents[0][:, :-end_video_latent_length].unsqueeze(0)  
 
                 videos = [self.vae.decode(x0)[0]]
-                if output_video is None:
-                    output_video = videos[0].clamp(-1, 1).cpu()  # c, f, h, w
+                if history is None:
+                    segment = videos[0].clamp(-1, 1)  # c, f, h, w
+                    history = segment[:, -overlap_history:]
                 else:
-                    output_video = torch.cat(
-                        [output_video, videos[0][:, overlap_history:].clamp(-1, 1).cpu()], 1
-                    )  # c, f, h, w
-            output_video = [(output_video / 2 + 0.5).clamp(0, 1)]
-            output_video = [video for video in output_video]
-            output_video = [video.permute(1, 2, 3, 0) * 255 for video in output_video]
-            output_video = [video.cpu().numpy().astype(np.uint8) for video in output_video]
-            return output_video
+                    segment = videos[0][:, overlap_history:].clamp(-1, 1)  # c, f, h, w
+                    history = torch.cat([history, segment], 1)[:, -overlap_history:]
+                # only the last frames condition the next window, the rest leave the device as uint8
+                segment = video_to_uint8(segment)
+                output_frames.append(segment if output_type == "pt" else frames_to_numpy(segment))
+            if output_type == "pt":
+                return [torch.cat(output_frames)]
+            return [np.concatenate(output_frames)]
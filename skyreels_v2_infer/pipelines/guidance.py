@@ -0,0 +1,91 @@
+import math
+from typing import Callable
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+
+GUIDANCE_CURVES = ["constant", "linear", "cosine"]
+
+
+class GuidanceSchedule:
+    """
+    Per-step classifier-free guidance schedule shared by the T2V, I2V and diffusion forcing pipelines.
+
+    The schedule decides, for every denoising step, which guidance scale to apply and whether the unconditional
+    transformer pass is needed at all. Steps outside `interval` or whose scale is 1.0 only run the conditional
+    branch, which removes half of the transformer FLOPs for those steps.
+
+    Args:
+        guidance_scale (`float`): Peak guidance scale.
+        interval (`Tuple[float, float]`, defaults to (0.0, 1.0)):
+            Fraction of the sampling trajectory, as (start, end) in [0, 1], where guidance is applied.
+        curve (`str`, `Sequence[float]` or `Callable[[float], float]`, defaults to "constant"):
+            How the scale evolves inside the interval. "constant" keeps `guidance_scale`, "linear" and "cosine"
+            decay from `guidance_scale` to `end_scale`. A sequence gives one explicit scale per step and a callable
+            maps the step progress in [0, 1] to a scale.
+        end_scale (`float`, defaults to 1.0): Scale reached at the end of the interval for decaying curves.
+    """
+
+    def __init__(
+        self,
+        guidance_scale: float = 5.0,
+        interval: Tuple[float, float] = (0.0, 1.0),
+        curve: Union[str, Sequence[float], Callable[[float], float]] = "constant",
+        end_scale: float = 1.0,
+    ):
+        start, end = interval
+        if not 0.0 <= start <= end <= 1.0:
+            raise ValueError(f"`interval` must satisfy 0 <= start <= end <= 1, got {interval}")
+        if isinstance(curve, str) and curve not in GUIDANCE_CURVES:
+            raise ValueError(f"`curve` must be one of {GUIDANCE_CURVES}, got {curve}")
+        self.guidance_scale = guidance_scale
+        self.interval = (start, end)
+        self.curve = curve
+        self.end_scale = end_scale
+
+    @staticmethod
+    def progress(step_index: int, num_steps: int) -> float:
+        return step_index / (num_steps - 1) if num_steps > 1 else 0.0
+
+    def scale_at(self, step_index: int, num_steps: int) -> float:
+        """
+        Returns the guidance scale for `step_index` out of `num_steps` denoising steps.
+        """
+        p = self.progress(step_index, num_steps)
+        start, end = self.interval
+        if p < start or p > end:
+            return 1.0
+
+        if callable(self.curve):
+            return float(self.curve(p))
+        if not isinstance(self.curve, str):
+            if len(self.curve) != num_steps:
+                raise ValueError(f"explicit guidance curve has {len(self.curve)} entries for {num_steps} steps")
+            return float(self.curve[step_index])
+        if self.curve == "constant":
+            return self.guidance_scale
+
+        # decaying curves are parameterized over the guidance interval
+        local = (p - start) / (end - start) if end > start else 0.0
+        if self.curve == "linear":
+            weight = 1.0 - local
+        else:
+            weight = 0.5 * (1.0 + math.cos(math.pi * local))
+        return self.end_scale + (self.guidance_scale - self.end_scale) * weight
+
+    @staticmethod
+    def needs_uncond(scale: float) -> bool:
+        return scale != 1.0
+
+    def requires_uncond(self) -> bool:
+        """
+        Whether any step may run the unconditional branch, i.e. whether negative prompt embeddings are needed.
+        """
+        if callable(self.curve):
+            return True
+        if not isinstance(self.curve, str):
+            return any(self.needs_uncond(float(s)) for s in self.curve)
+        if self.curve == "constant":
+            return self.needs_uncond(self.guidance_scale)
+        return self.needs_uncond(self.guidance_scale) or self.needs_uncond(self.end_scale)
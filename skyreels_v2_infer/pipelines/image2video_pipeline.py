@@ -1,4 +1,7 @@
+import hashlib
 import os
+from collections import OrderedDict
+from typing import Callable
 from typing import List
 from typing import Optional
 from typing import Union
@@ -10,11 +13,19 @@ from diffusers.video_processor import VideoProcessor
 from PIL import Image
 from tqdm import tqdm
 
+from ..distributed import cfg_parallel
+from ..distributed import tensor_parallel
 from ..modules import get_image_encoder
 from ..modules import get_text_encoder
 from ..modules import get_transformer
 from ..modules import get_vae
-from ..scheduler.fm_solvers_unipc import FlowUniPCMultistepScheduler
+from ..modules.device import autocast
+from ..scheduler.fm_solvers import build_sampler
+from .cancellation import CancellationToken
+from .cancellation import DenoiseCheckpoint
+from .guidance import GuidanceSchedule
+from .video_io import frames_to_numpy
+from .video_io import video_to_uint8
 
 
 def resizecrop(image: Image.Image, th, tw):
@@ -37,20 +48,34 @@ def resizecrop(image: Image.Image, th, tw):
 
 class Image2VideoPipeline:
     def __init__(
-        self, model_path, dit_path, device: str = "cuda", weight_dtype=torch.bfloat16, use_usp=False, offload=False
+        self,
+        model_path,
+        dit_path,
+        device: str = "cuda",
+        weight_dtype=torch.bfloat16,
+        use_usp=False,
+        offload=False,
+        image_cache_size: int = 8,
+        quantization=None,
+        sampler: str = "unipc",
+        parallel_vae_decode: bool = False,
     ):
         load_device = "cpu" if offload else device
-        self.transformer = get_transformer(dit_path, load_device, weight_dtype)
+        # with tensor parallelism each rank only loads its slice of the DiT and text encoder weights
+        shard_fn = tensor_parallel.shard_model if tensor_parallel.is_initialized() else None
+        self.transformer = get_transformer(
+            dit_path, load_device, weight_dtype, shard_fn=shard_fn, quantization=quantization
+        )
         vae_model_path = os.path.join(model_path, "Wan2.1_VAE.pth")
         self.vae = get_vae(vae_model_path, device, weight_dtype=torch.float32)
-        self.text_encoder = get_text_encoder(model_path, load_device, weight_dtype)
+        self.text_encoder = get_text_encoder(model_path, load_device, weight_dtype, shard_fn=shard_fn)
         self.clip = get_image_encoder(model_path, load_device, weight_dtype)
         self.sp_size = 1
         self.device = device
         self.offload = offload
         self.video_processor = VideoProcessor(vae_scale_factor=16)
         if use_usp:
-            from xfuser.core.distributed import get_sequence_parallel_world_size
+            from ..distributed.xdit_context_parallel import get_sequence_parallel_world_size
             from ..distributed.xdit_context_parallel import usp_attn_forward, usp_dit_forward
             import types
 
@@ -58,10 +83,47 @@ class Image2VideoPipeline:
                 block.self_attn.forward = types.MethodType(usp_attn_forward, block.self_attn)
                 self.transformer.forward = types.MethodType(usp_dit_forward, self.transformer)
                 self.sp_size = get_sequence_parallel_world_size()
+        distributed = use_usp or cfg_parallel.is_initialized() or tensor_parallel.is_initialized()
+        if parallel_vae_decode and distributed:
+            # every rank ends up with the same latents, so each decodes a temporal chunk and rank 0 gets the video;
+            # opt-in since the chunks after the first approximate the single-rank decode
+            self.vae.enable_parallel_decode(dst=0)
 
-        self.scheduler = FlowUniPCMultistepScheduler()
+        self.scheduler = build_sampler(sampler)
         self.vae_stride = (4, 8, 8)
         self.patch_size = (1, 2, 2)
+        # conditioning of recently used images, keyed by image content and target shape
+        self.image_cache_size = image_cache_size
+        self._image_cache = OrderedDict()
+
+    def encode_image(self, img: torch.Tensor, num_frames: int):
+        """
+        Returns the VAE conditioning `y` and the CLIP features for a preprocessed image of shape [B, C, H, W].
+
+        Both only depend on the image content and the target shape, so they are cached by a hash of the image and
+        repeated requests for the same image skip both encoders.
+        """
+        key = (hashlib.sha256(img.float().cpu().numpy().tobytes()).hexdigest(), tuple(img.shape), num_frames)
+        if key in self._image_cache:
+            self._image_cache.move_to_end(key)
+            return self._image_cache[key]
+
+        img = img.to(device=self.device, dtype=self.transformer.dtype).unsqueeze(2)
+        img_cond = self.vae.encode_zero_padded(img.float(), num_frames)
+        mask = torch.ones_like(img_cond)
+        mask[:, :, 1:] = 0
+        y = torch.cat([mask[:, :4], img_cond], dim=1)
+        self.clip.to(self.device)
+        clip_context = self.clip.encode_video(img)
+        if self.offload:
+            self.clip.cpu()
+            torch.cuda.empty_cache()
+
+        if self.image_cache_size > 0:
+            self._image_cache[key] = (y, clip_context)
+            if len(self._image_cache) > self.image_cache_size:
+                self._image_cache.popitem(last=False)
+        return y, clip_context
 
     @torch.no_grad()
     def __call__(
@@ -76,7 +138,17 @@ class Image2VideoPipeline:
         guidance_scale: float = 5.0,
         shift: float = 5.0,
         generator: Optional[torch.Generator] = None,
+        guidance_schedule: Optional[GuidanceSchedule] = None,
+        preview_callback: Optional[Callable[[int, torch.Tensor], None]] = None,
+        preview_interval: int = 1,
+        cancellation_token: Optional[CancellationToken] = None,
+        resume_from: Optional[DenoiseCheckpoint] = None,
+        output_type: str = "np",
     ):
+        if guidance_schedule is None:
+            guidance_schedule = GuidanceSchedule(guidance_scale)
+        if preview_callback is not None and preview_interval < 1:
+            raise ValueError(f"`preview_interval` must be at least 1, got {preview_interval}")
         F = num_frames
 
         latent_height = height // 8 // 2 * 2
@@ -87,27 +159,14 @@ class Image2VideoPipeline:
         w = latent_width * 8
 
         img = self.video_processor.preprocess(image, height=h, width=w)
-
-        img = img.to(device=self.device, dtype=self.transformer.dtype)
-
-        padding_video = torch.zeros(img.shape[0], 3, F - 1, h, w, device=self.device)
-
-        img = img.unsqueeze(2)
-        img_cond = torch.concat([img, padding_video], dim=2)
-        img_cond = self.vae.encode(img_cond)
-        mask = torch.ones_like(img_cond)
-        mask[:, :, 1:] = 0
-        y = torch.cat([mask[:, :4], img_cond], dim=1)
-        self.clip.to(self.device)
-        clip_context = self.clip.encode_video(img)
-        if self.offload:
-            self.clip.cpu()
-            torch.cuda.empty_cache()
+        y, clip_context = self.encode_image(img, F)
 
         # preprocess
         self.text_encoder.to(self.device)
         context = self.text_encoder.encode(prompt).to(self.device)
-        context_null = self.text_encoder.encode(negative_prompt).to(self.device)
+        context_null = None
+        if guidance_schedule.requires_uncond():
+            context_null = self.text_encoder.encode(negative_prompt).to(self.device)
         if self.offload:
             self.text_encoder.cpu()
             torch.cuda.empty_cache()
@@ -117,8 +176,15 @@ class Image2VideoPipeline:
         )
 
         self.transformer.to(self.device)
-        with torch.cuda.amp.autocast(dtype=self.transformer.dtype), torch.no_grad():
+        with autocast(self.device, self.transformer.dtype), torch.no_grad():
             self.scheduler.set_timesteps(num_inference_steps, device=self.device, shift=shift)
+            # stepping from the first timestep by counter, without looking it up on the device
+            self.scheduler.set_begin_index(0)
+            start_step = 0
+            if resume_from is not None:
+                (self.scheduler,) = resume_from.restore(generator, self.transformer)
+                latent = resume_from.latents.to(self.device)
+                start_step = resume_from.step_index
             timesteps = self.scheduler.timesteps
 
             arg_c = {
@@ -134,23 +200,46 @@ class Image2VideoPipeline:
             }
 
             self.transformer.to(self.device)
-            for _, t in enumerate(tqdm(timesteps)):
+            for i, t in enumerate(tqdm(timesteps[start_step:]), start_step):
+                if cancellation_token is not None:
+                    cancellation_token.check(
+                        lambda: DenoiseCheckpoint.capture(i, latent, self.scheduler, generator, self.transformer)
+                    )
                 latent_model_input = torch.stack([latent]).to(self.device)
                 timestep = torch.stack([t]).to(self.device)
-                noise_pred_cond = self.transformer(latent_model_input, t=timestep, **arg_c)[0].to(self.device)
-                noise_pred_uncond = self.transformer(latent_model_input, t=timestep, **arg_null)[0].to(self.device)
-                noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
+                step_guidance_scale = guidance_schedule.scale_at(i, len(timesteps))
+                if cfg_parallel.is_initialized():
+                    noise_pred = cfg_parallel.cfg_parallel_predict(
+                        self.transformer,
+                        latent_model_input,
+                        arg_c,
+                        arg_null,
+                        step_guidance_scale,
+                        guidance_schedule.needs_uncond(step_guidance_scale),
+                        t=timestep,
+                    ).to(self.device)
+                else:
+                    noise_pred_cond = self.transformer(latent_model_input, t=timestep, **arg_c)[0].to(self.device)
+                    if guidance_schedule.needs_uncond(step_guidance_scale):
+                        noise_pred_uncond = self.transformer(latent_model_input, t=timestep, **arg_null)[0].to(
+                            self.device
+                        )
+                        noise_pred = noise_pred_uncond + step_guidance_scale * (noise_pred_cond - noise_pred_uncond)
+                    else:
+                        self.transformer.skip_teacache_uncond()
+                        noise_pred = noise_pred_cond
 
                 temp_x0 = self.scheduler.step(
                     noise_pred.unsqueeze(0), t, latent.unsqueeze(0), return_dict=False, generator=generator
                 )[0]
                 latent = temp_x0.squeeze(0)
+                if preview_callback is not None and (i + 1) % preview_interval == 0:
+                    preview_callback(i, self.scheduler.model_outputs[-1].squeeze(0))
             if self.offload:
                 self.transformer.cpu()
                 torch.cuda.empty_cache()
-            videos = self.vae.decode(latent)
-            videos = (videos / 2 + 0.5).clamp(0, 1)
-            videos = [video for video in videos]
-            videos = [video.permute(1, 2, 3, 0) * 255 for video in videos]
-            videos = [video.cpu().numpy().astype(np.uint8) for video in videos]
+            videos = video_to_uint8(self.vae.decode(latent))
+            if output_type == "pt":
+                return list(videos)
+            videos = [frames_to_numpy(video) for video in videos]
         return videos
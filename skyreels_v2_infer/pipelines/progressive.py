@@ -0,0 +1,90 @@
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import torch
+import torch.nn.functional as F
+
+
+class ProgressiveSchedule:
+    """
+    Low-resolution-then-refine sampling shared by the T2V and diffusion forcing pipelines.
+
+    The first `low_res_steps` denoising steps run on a latent grid whose height and width are scaled by `scale`, which
+    cuts the token count of those transformer forwards by roughly `scale ** 2` (and attention by its square). At the
+    switch the clean-latent estimate of the last low-resolution step is upsampled and noised again to the sigma of the
+    next step of the flow-matching schedule, x = (1 - sigma) * x0 + sigma * noise, and sampling finishes at full
+    resolution on the remaining steps of the same schedule. The multistep solver history is restarted at the switch
+    because its stored predictions live on the low-resolution grid.
+
+    Args:
+        low_res_steps (`int`): Denoising steps (rows of the step matrix for diffusion forcing) run at low resolution.
+        scale (`float`, defaults to 0.5): Factor applied to the latent height and width during the first stage.
+        mode (`str`, defaults to "bicubic"): Interpolation mode used to upsample the clean-latent estimate.
+        patch_size (`Tuple[int, int]`, defaults to (2, 2)): Spatial patch size the low-resolution grid must divide.
+    """
+
+    def __init__(
+        self,
+        low_res_steps: int,
+        scale: float = 0.5,
+        mode: str = "bicubic",
+        patch_size: Tuple[int, int] = (2, 2),
+    ):
+        if low_res_steps < 0:
+            raise ValueError(f"`low_res_steps` must be non-negative, got {low_res_steps}")
+        if not 0.0 < scale <= 1.0:
+            raise ValueError(f"`scale` must be in (0, 1], got {scale}")
+        self.low_res_steps = low_res_steps
+        self.scale = scale
+        self.mode = mode
+        self.patch_size = patch_size
+
+    def is_switch_step(self, step_index: int) -> bool:
+        return self.low_res_steps > 0 and step_index == self.low_res_steps
+
+    def low_res_size(self, size: Sequence[int]) -> Tuple[int, int]:
+        """Returns the low-resolution (H, W) of a latent grid, rounded to whole patches."""
+        return tuple(max(p, round(s * self.scale / p) * p) for s, p in zip(size, self.patch_size))
+
+    def _resize(self, x: torch.Tensor, size: Sequence[int], mode: str) -> torch.Tensor:
+        # interpolate every leading (channel, frame) slice of [..., H, W] as an image
+        lead = x.shape[:-2]
+        x = x.reshape(1, -1, *x.shape[-2:]).float()
+        kwargs = {} if mode in ("nearest", "area") else {"align_corners": False}
+        x = F.interpolate(x, size=tuple(size), mode=mode, **kwargs)
+        return x.reshape(*lead, *size)
+
+    def downsample(self, x: torch.Tensor) -> torch.Tensor:
+        """Downsamples clean latents (e.g. conditioning frames) of shape [..., H, W] to the low-resolution grid."""
+        return self._resize(x, self.low_res_size(x.shape[-2:]), "area").to(x.dtype)
+
+    def sample_noise(
+        self, shape: Sequence[int], dtype=torch.float32, device=None, generator: Optional[torch.Generator] = None
+    ) -> torch.Tensor:
+        """Samples initial noise of shape [..., H, W] on the low-resolution grid."""
+        shape = (*shape[:-2], *self.low_res_size(shape[-2:]))
+        return torch.randn(shape, dtype=dtype, device=device, generator=generator)
+
+    def refine(
+        self, scheduler, latent: torch.Tensor, size: Sequence[int], generator: Optional[torch.Generator] = None
+    ) -> torch.Tensor:
+        """
+        Moves the low-resolution `latent` driven by `scheduler` to the full-resolution grid `size` (H, W).
+
+        The clean-latent estimate stored by the scheduler's last step is upsampled and noised to the sigma of the
+        scheduler's next step, and the scheduler's multistep history is restarted. A latent whose scheduler has not
+        stepped yet is still pure noise and is resampled, a fully denoised one is upsampled as is.
+        """
+        shape = (*latent.shape[:-2], *size)
+        if scheduler.step_index is None:
+            return torch.randn(shape, dtype=latent.dtype, device=latent.device, generator=generator)
+
+        sigma = scheduler.sigmas[scheduler.step_index].item() if scheduler.step_index < len(scheduler.sigmas) else 0.0
+        x0 = scheduler.model_outputs[-1].reshape(latent.shape) if sigma > 0 else latent
+        x = self._resize(x0, size, self.mode)
+        if sigma > 0:
+            noise = torch.randn(shape, dtype=x.dtype, device=x.device, generator=generator)
+            x = (1.0 - sigma) * x + sigma * noise
+        scheduler.reset_multistep_history()
+        return x.to(latent.dtype)
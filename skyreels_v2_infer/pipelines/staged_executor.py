@@ -0,0 +1,202 @@
+import queue
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import torch
+
+_STOP = object()
+
+
+class Stage:
+    """
+    One step of a `StagedExecutor`, e.g. text encoding, denoising, VAE decoding or video encoding.
+
+    Args:
+        name (`str`): Name reported in the stage statistics.
+        fn (`Callable[[Any], Any]`): Maps the payload handed over by the previous stage to the payload of the next.
+        queue_size (`int`, defaults to 1): Jobs that may wait in front of the stage. A full queue blocks the upstream
+            stage, which bounds the memory held by jobs in flight.
+        device (*optional*): CUDA device the stage computes on. The stage then issues its work on a stream of its
+            own so it can overlap with the other stages on the same GPU.
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], queue_size: int = 1, device=None):
+        if queue_size < 1:
+            raise ValueError(f"`queue_size` must be positive, got {queue_size}")
+        self.name = name
+        self.fn = fn
+        self.queue_size = queue_size
+        self.device = torch.device(device) if device is not None else None
+
+
+class StageJob:
+    """
+    Handle of a job submitted to a `StagedExecutor`.
+
+    `result` blocks until the last stage is done with the job and returns its output, or raises the exception of the
+    stage that failed. Later stages skip a failed job.
+    """
+
+    def __init__(self, job_id: str, payload: Any):
+        self.job_id = job_id
+        self.payload = payload
+        self.error: Optional[BaseException] = None
+        self.failed_stage: Optional[str] = None
+        self.stage_times: Dict[str, float] = {}
+        self.submit_time = time.perf_counter()
+        self.finish_time = None
+        self._done = threading.Event()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"job {self.job_id} did not finish within {timeout}s")
+        if self.error is not None:
+            raise self.error
+        return self.payload
+
+
+class _StageWorker:
+    def __init__(self, stage: Stage, inbox: queue.Queue, outbox: Optional[queue.Queue]):
+        self.stage = stage
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stream = None
+        if stage.device is not None and stage.device.type == "cuda":
+            self.stream = torch.cuda.Stream(device=stage.device)
+        self.num_jobs = 0
+        self.busy_time = 0.0
+        self.blocked_time = 0.0
+        self.thread = threading.Thread(target=self.run, name=f"stage-{stage.name}", daemon=True)
+
+    def _process(self, job: StageJob):
+        start = time.perf_counter()
+        try:
+            if self.stream is None:
+                job.payload = self.stage.fn(job.payload)
+            else:
+                with torch.cuda.stream(self.stream):
+                    job.payload = self.stage.fn(job.payload)
+                # the next stage reads the outputs from another stream
+                self.stream.synchronize()
+        except Exception as e:
+            job.error = e
+            job.failed_stage = self.stage.name
+        elapsed = time.perf_counter() - start
+        job.stage_times[self.stage.name] = elapsed
+        self.busy_time += elapsed
+        self.num_jobs += 1
+
+    @torch.no_grad()
+    def run(self):
+        while True:
+            job = self.inbox.get()
+            if job is _STOP:
+                if self.outbox is not None:
+                    self.outbox.put(_STOP)
+                return
+            if job.error is None:
+                self._process(job)
+            if self.outbox is None:
+                job.finish_time = time.perf_counter()
+                job._done.set()
+            else:
+                start = time.perf_counter()
+                self.outbox.put(job)
+                self.blocked_time += time.perf_counter() - start
+
+
+class StagedExecutor:
+    """
+    Runs jobs through a chain of stages, one worker thread per stage, so consecutive jobs overlap.
+
+    Running text encoding, denoising, VAE decoding and video encoding of one job back to back leaves the transformer
+    idle while the other models work. Here each stage hands its output to the next through a bounded queue, so while
+    job N is being denoised, job N+1 is already text-encoded and job N-1 is decoded and written to disk. The steady
+    state throughput is then set by the slowest stage instead of the sum of all stages.
+
+    Stages keep their models resident, so the models of all stages must fit on the device at once. Jobs leave the
+    executor in submission order.
+
+    Args:
+        stages (`List[Stage]`): Stages in execution order.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        if not stages:
+            raise ValueError("a staged executor needs at least one stage")
+        self.stages = stages
+        inboxes = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        self.workers = [
+            _StageWorker(stage, inbox, inboxes[i + 1] if i + 1 < len(stages) else None)
+            for i, (stage, inbox) in enumerate(zip(stages, inboxes))
+        ]
+        self.start_time = None
+        self.stop_time = None
+        self._closed = False
+
+    def start(self) -> "StagedExecutor":
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+            for worker in self.workers:
+                worker.thread.start()
+        return self
+
+    def submit(self, job_id: str, payload: Any) -> StageJob:
+        """Queues a job for the first stage, blocking while that stage's queue is full."""
+        if self._closed:
+            raise RuntimeError("cannot submit to a staged executor that was shut down")
+        self.start()
+        job = StageJob(job_id, payload)
+        self.workers[0].inbox.put(job)
+        return job
+
+    def map(self, payloads: Dict[str, Any]) -> Dict[str, Any]:
+        """Runs every job to completion and returns their outputs by job id."""
+        jobs = [self.submit(job_id, payload) for job_id, payload in payloads.items()]
+        return {job.job_id: job.result() for job in jobs}
+
+    def shutdown(self, wait: bool = True):
+        """Stops the workers once the jobs already submitted are done."""
+        if not self._closed:
+            self._closed = True
+            self.start()
+            self.workers[0].inbox.put(_STOP)
+        if wait:
+            for worker in self.workers:
+                worker.thread.join()
+            if self.stop_time is None:
+                self.stop_time = time.perf_counter()
+
+    def __enter__(self) -> "StagedExecutor":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Per-stage job counts, busy and blocked time and utilisation, the fraction of the executor's wall time the
+        stage spent computing. The bottleneck stage is the one closest to full utilisation.
+        """
+        if self.start_time is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.stop_time or time.perf_counter()) - self.start_time
+        stages = {}
+        for worker in self.workers:
+            stages[worker.stage.name] = {
+                "jobs": worker.num_jobs,
+                "busy_s": worker.busy_time,
+                "blocked_s": worker.blocked_time,
+                "queued": worker.inbox.qsize(),
+                "utilisation": worker.busy_time / elapsed if elapsed > 0 else 0.0,
+            }
+        return {"elapsed_s": elapsed, "stages": stages}
@@ -1,4 +1,5 @@
 import os
+from typing import Callable
 from typing import List
 from typing import Optional
 from typing import Union
@@ -8,27 +9,51 @@ import torch
 from diffusers.video_processor import VideoProcessor
 from tqdm import tqdm
 
+from ..distributed import cfg_parallel
+from ..distributed import tensor_parallel
 from ..modules import get_text_encoder
 from ..modules import get_transformer
 from ..modules import get_vae
-from ..scheduler.fm_solvers_unipc import FlowUniPCMultistepScheduler
+from ..modules.device import autocast
+from ..scheduler.fm_solvers import build_sampler
+from .cancellation import CancellationToken
+from .cancellation import DenoiseCheckpoint
+from .continuous_batching import DenoiseRequest
+from .guidance import GuidanceSchedule
+from .progressive import ProgressiveSchedule
+from .staged_executor import Stage
+from .video_io import frames_to_numpy
+from .video_io import video_to_uint8
 
 
 class Text2VideoPipeline:
     def __init__(
-        self, model_path, dit_path, device: str = "cuda", weight_dtype=torch.bfloat16, use_usp=False, offload=False
+        self,
+        model_path,
+        dit_path,
+        device: str = "cuda",
+        weight_dtype=torch.bfloat16,
+        use_usp=False,
+        offload=False,
+        quantization=None,
+        sampler: str = "unipc",
+        parallel_vae_decode: bool = False,
     ):
         load_device = "cpu" if offload else device
-        self.transformer = get_transformer(dit_path, load_device, weight_dtype)
+        # with tensor parallelism each rank only loads its slice of the DiT and text encoder weights
+        shard_fn = tensor_parallel.shard_model if tensor_parallel.is_initialized() else None
+        self.transformer = get_transformer(
+            dit_path, load_device, weight_dtype, shard_fn=shard_fn, quantization=quantization
+        )
         vae_model_path = os.path.join(model_path, "Wan2.1_VAE.pth")
         self.vae = get_vae(vae_model_path, device, weight_dtype=torch.float32)
-        self.text_encoder = get_text_encoder(model_path, load_device, weight_dtype)
+        self.text_encoder = get_text_encoder(model_path, load_device, weight_dtype, shard_fn=shard_fn)
         self.video_processor = VideoProcessor(vae_scale_factor=16)
         self.sp_size = 1
         self.device = device
         self.offload = offload
         if use_usp:
-            from xfuser.core.distributed import get_sequence_parallel_world_size
+            from ..distributed.xdit_context_parallel import get_sequence_parallel_world_size
             from ..distributed.xdit_context_parallel import usp_attn_forward, usp_dit_forward
             import types
 
@@ -36,8 +61,14 @@ class Text2VideoPipeline:
                 block.self_attn.forward = types.MethodType(usp_attn_forward, block.self_attn)
                 self.transformer.forward = types.MethodType(usp_dit_forward, self.transformer)
                 self.sp_size = get_sequence_parallel_world_size()
+        distributed = use_usp or cfg_parallel.is_initialized() or tensor_parallel.is_initialized()
+        if parallel_vae_decode and distributed:
+            # every rank ends up with the same latents, so each decodes a temporal chunk and rank 0 gets the video;
+            # opt-in since the chunks after the first approximate the single-rank decode
+            self.vae.enable_parallel_decode(dst=0)
 
-        self.scheduler = FlowUniPCMultistepScheduler()
+        self.sampler = sampler
+        self.scheduler = build_sampler(sampler)
         self.vae_stride = (4, 8, 8)
         self.patch_size = (1, 2, 2)
 
@@ -53,7 +84,25 @@ class Text2VideoPipeline:
         guidance_scale: float = 5.0,
         shift: float = 5.0,
         generator: Optional[torch.Generator] = None,
+        guidance_schedule: Optional[GuidanceSchedule] = None,
+        progressive: Optional[ProgressiveSchedule] = None,
+        preview_callback: Optional[Callable[[int, torch.Tensor], None]] = None,
+        preview_interval: int = 1,
+        cancellation_token: Optional[CancellationToken] = None,
+        resume_from: Optional[DenoiseCheckpoint] = None,
+        prompt_embeds: Optional[torch.Tensor] = None,
+        negative_prompt_embeds: Optional[torch.Tensor] = None,
+        output_type: str = "np",
     ):
+        if guidance_schedule is None:
+            guidance_schedule = GuidanceSchedule(guidance_scale)
+        if preview_callback is not None and preview_interval < 1:
+            raise ValueError(f"`preview_interval` must be at least 1, got {preview_interval}")
+        if progressive is not None and progressive.low_res_steps >= num_inference_steps:
+            raise ValueError(
+                f"progressive sampling needs full-resolution steps, got {progressive.low_res_steps} low-resolution "
+                f"steps out of {num_inference_steps}"
+            )
         # preprocess
         F = num_frames
         target_shape = (
@@ -62,49 +111,207 @@ class Text2VideoPipeline:
             height // self.vae_stride[1],
             width // self.vae_stride[2],
         )
-        self.text_encoder.to(self.device)
-        context = self.text_encoder.encode(prompt).to(self.device)
-        context_null = self.text_encoder.encode(negative_prompt).to(self.device)
-        if self.offload:
-            self.text_encoder.cpu()
-            torch.cuda.empty_cache()
+        if prompt_embeds is None:
+            context, context_null = self.encode_prompt(prompt, negative_prompt, guidance_schedule)
+        else:
+            if guidance_schedule.requires_uncond() and negative_prompt_embeds is None:
+                raise ValueError("`negative_prompt_embeds` are required when guidance is applied")
+            context, context_null = prompt_embeds.to(self.device), negative_prompt_embeds
+            if context_null is not None:
+                context_null = context_null.to(self.device)
 
-        latents = [
-            torch.randn(
-                target_shape[0],
-                target_shape[1],
-                target_shape[2],
-                target_shape[3],
-                dtype=torch.float32,
-                device=self.device,
-                generator=generator,
-            )
-        ]
+        if progressive is not None and progressive.low_res_steps > 0:
+            latents = [progressive.sample_noise(target_shape, device=self.device, generator=generator)]
+        else:
+            latents = [
+                torch.randn(
+                    target_shape[0],
+                    target_shape[1],
+                    target_shape[2],
+                    target_shape[3],
+                    dtype=torch.float32,
+                    device=self.device,
+                    generator=generator,
+                )
+            ]
 
         # evaluation mode
         self.transformer.to(self.device)
-        with torch.cuda.amp.autocast(dtype=self.transformer.dtype), torch.no_grad():
+        with autocast(self.device, self.transformer.dtype), torch.no_grad():
             self.scheduler.set_timesteps(num_inference_steps, device=self.device, shift=shift)
+            # stepping from the first timestep by counter, without looking it up on the device
+            self.scheduler.set_begin_index(0)
+            start_step = 0
+            if resume_from is not None:
+                (self.scheduler,) = resume_from.restore(generator, self.transformer)
+                latents = [resume_from.latents.to(self.device)]
+                start_step = resume_from.step_index
             timesteps = self.scheduler.timesteps
 
-            for _, t in enumerate(tqdm(timesteps)):
+            for i, t in enumerate(tqdm(timesteps[start_step:]), start_step):
+                if cancellation_token is not None:
+                    cancellation_token.check(
+                        lambda: DenoiseCheckpoint.capture(i, latents[0], self.scheduler, generator, self.transformer)
+                    )
+                if progressive is not None and progressive.is_switch_step(i):
+                    latents = [progressive.refine(self.scheduler, latents[0], target_shape[2:], generator)]
+                    self.transformer.invalidate_step_cache()
                 latent_model_input = torch.stack(latents)
                 timestep = torch.stack([t])
-                noise_pred_cond = self.transformer(latent_model_input, t=timestep, context=context)[0]
-                noise_pred_uncond = self.transformer(latent_model_input, t=timestep, context=context_null)[0]
-
-                noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
+                step_guidance_scale = guidance_schedule.scale_at(i, len(timesteps))
+                if cfg_parallel.is_initialized():
+                    noise_pred = cfg_parallel.cfg_parallel_predict(
+                        self.transformer,
+                        latent_model_input,
+                        dict(context=context),
+                        dict(context=context_null),
+                        step_guidance_scale,
+                        guidance_schedule.needs_uncond(step_guidance_scale),
+                        t=timestep,
+                    )
+                else:
+                    noise_pred_cond = self.transformer(latent_model_input, t=timestep, context=context)[0]
+                    if guidance_schedule.needs_uncond(step_guidance_scale):
+                        noise_pred_uncond = self.transformer(latent_model_input, t=timestep, context=context_null)[0]
+                        noise_pred = noise_pred_uncond + step_guidance_scale * (noise_pred_cond - noise_pred_uncond)
+                    else:
+                        self.transformer.skip_teacache_uncond()
+                        noise_pred = noise_pred_cond
 
                 temp_x0 = self.scheduler.step(
                     noise_pred.unsqueeze(0), t, latents[0].unsqueeze(0), return_dict=False, generator=generator
                 )[0]
                 latents = [temp_x0.squeeze(0)]
+                if preview_callback is not None and (i + 1) % preview_interval == 0:
+                    # the solver keeps the clean-latent estimate of the step, ready for a latent preview
+                    preview_callback(i, self.scheduler.model_outputs[-1].squeeze(0))
             if self.offload:
                 self.transformer.cpu()
                 torch.cuda.empty_cache()
-            videos = self.vae.decode(latents[0])
-            videos = (videos / 2 + 0.5).clamp(0, 1)
-            videos = [video for video in videos]
-            videos = [video.permute(1, 2, 3, 0) * 255 for video in videos]
-            videos = [video.cpu().numpy().astype(np.uint8) for video in videos]
+            if output_type == "latent":
+                return latents[0]
+            videos = self.decode_latents(latents[0], output_type)
         return videos
+
+    @torch.no_grad()
+    def encode_prompt(
+        self,
+        prompt: Union[str, List[str]],
+        negative_prompt: Union[str, List[str]] = None,
+        guidance_schedule: Optional[GuidanceSchedule] = None,
+    ):
+        """
+        Returns the prompt embeddings and, unless `guidance_schedule` never applies guidance, the negative prompt
+        embeddings.
+        """
+        self.text_encoder.to(self.device)
+        context = self.text_encoder.encode(prompt).to(self.device)
+        context_null = None
+        if guidance_schedule is None or guidance_schedule.requires_uncond():
+            context_null = self.text_encoder.encode(negative_prompt).to(self.device)
+        if self.offload:
+            self.text_encoder.cpu()
+            torch.cuda.empty_cache()
+        return context, context_null
+
+    def decode_latents(self, latents: torch.Tensor, output_type: str = "np") -> List[Union[np.ndarray, torch.Tensor]]:
+        """
+        Decodes latents to uint8 frames of shape [T, H, W, C], on the device with `output_type="pt"` and as host
+        arrays otherwise.
+        """
+        videos = video_to_uint8(self.vae.decode(latents))
+        if output_type == "pt":
+            return list(videos)
+        return [frames_to_numpy(video) for video in videos]
+
+    @torch.no_grad()
+    def prepare_request(
+        self,
+        request_id: str,
+        prompt: str,
+        negative_prompt: str = "",
+        width: int = 544,
+        height: int = 960,
+        num_frames: int = 97,
+        num_inference_steps: int = 50,
+        guidance_scale: float = 5.0,
+        shift: float = 5.0,
+        generator: Optional[torch.Generator] = None,
+        guidance_schedule: Optional[GuidanceSchedule] = None,
+        on_finish=None,
+        adapter: Optional[str] = None,
+    ) -> DenoiseRequest:
+        """
+        Encodes the prompts and samples the initial noise of a request for the `ContinuousBatchScheduler`, which then
+        shares `self.transformer` across requests. Decode finished requests with `decode_latents`.
+        """
+        if guidance_schedule is None:
+            guidance_schedule = GuidanceSchedule(guidance_scale)
+        target_shape = (
+            self.vae.vae.z_dim,
+            (num_frames - 1) // self.vae_stride[0] + 1,
+            height // self.vae_stride[1],
+            width // self.vae_stride[2],
+        )
+        context, context_null = self.encode_prompt(prompt, negative_prompt, guidance_schedule)
+        latents = torch.randn(*target_shape, dtype=torch.float32, device=self.device, generator=generator)
+        return DenoiseRequest(
+            request_id,
+            latents,
+            context,
+            context_null,
+            num_inference_steps=num_inference_steps,
+            shift=shift,
+            guidance_schedule=guidance_schedule,
+            generator=generator,
+            on_finish=on_finish,
+            adapter=adapter,
+            sampler=self.sampler,
+        )
+
+    def stages(
+        self, save_video: Optional[Callable[[torch.Tensor, str], None]] = None, queue_size: int = 1
+    ) -> List[Stage]:
+        """
+        Splits generation into text encoding, denoising, VAE decoding and, with `save_video`, video encoding stages
+        for a `StagedExecutor`, so the transformer denoises one job while its neighbours are encoded and decoded.
+
+        A job's payload is a dict of `__call__` keyword arguments plus the `output_path` handed to `save_video`. The
+        job's result is its `output_path` once written, or the decoded frames without `save_video`.
+        """
+        if self.offload:
+            raise ValueError("staged execution keeps every model resident, disable offload first")
+
+        def encode(kwargs):
+            kwargs = dict(kwargs)
+            if kwargs.get("guidance_schedule") is None:
+                kwargs["guidance_schedule"] = GuidanceSchedule(kwargs.get("guidance_scale", 5.0))
+            kwargs["prompt_embeds"], kwargs["negative_prompt_embeds"] = self.encode_prompt(
+                kwargs.pop("prompt"), kwargs.pop("negative_prompt", None), kwargs["guidance_schedule"]
+            )
+            return kwargs
+
+        def denoise(kwargs):
+            output_path = kwargs.pop("output_path", None)
+            return self(**kwargs, output_type="latent"), output_path
+
+        def decode(job):
+            latents, output_path = job
+            if save_video is None:
+                return self.decode_latents(latents)[0]
+            # the frames stay on the device, `write_video` overlaps their transfer with the encode
+            return self.decode_latents(latents, output_type="pt")[0], output_path
+
+        def export(job):
+            frames, output_path = job
+            save_video(frames, output_path)
+            return output_path
+
+        stages = [
+            Stage("text_encoder", encode, queue_size, self.device),
+            Stage("transformer", denoise, queue_size, self.device),
+            Stage("vae", decode, queue_size, self.device),
+        ]
+        if save_video is not None:
+            stages.append(Stage("video_encoder", export, queue_size))
+        return stages
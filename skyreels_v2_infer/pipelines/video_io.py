@@ -0,0 +1,391 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from fractions import Fraction
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import torch
+
+try:
+    from decord import VideoReader
+
+    DECORD_AVAILABLE = True
+except ImportError:
+    DECORD_AVAILABLE = False
+try:
+    import av
+
+    AV_AVAILABLE = True
+except ImportError:
+    AV_AVAILABLE = False
+
+ENCODER_PRESETS = (
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+)
+
+
+def get_ffmpeg_exe() -> str:
+    """Returns the ffmpeg bundled with imageio-ffmpeg, or the one on the `PATH`."""
+    try:
+        import imageio_ffmpeg
+
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg not found, install imageio-ffmpeg or put ffmpeg on the PATH")
+        return ffmpeg
+
+
+def video_to_uint8(videos: torch.Tensor) -> torch.Tensor:
+    """
+    Maps decoded videos of shape [..., C, T, H, W] in [-1, 1] to contiguous uint8 frames of shape [..., T, H, W, C]
+    on the same device, so only a quarter of the bytes of the float video cross to the host.
+    """
+    frames = (videos / 2 + 0.5).clamp_(0, 1).mul_(255).to(torch.uint8)
+    return frames.movedim(-4, -1).contiguous()
+
+
+def iter_host_frames(frames: torch.Tensor, chunk_size: int = 8) -> Iterator[np.ndarray]:
+    """
+    Yields the uint8 frames of shape [T, H, W, C] on the host, `chunk_size` frames at a time.
+
+    CUDA frames are copied through two pinned staging buffers on a side stream: the copy of the next chunk is in
+    flight while the caller consumes the current one, e.g. feeds it to a `VideoSink`. A yielded array is only valid
+    until the next chunk is requested.
+    """
+    if frames.device.type != "cuda":
+        for start in range(0, frames.shape[0], chunk_size):
+            yield frames[start : start + chunk_size].numpy()
+        return
+
+    chunk_size = min(chunk_size, frames.shape[0])
+    buffers = [torch.empty((chunk_size, *frames.shape[1:]), dtype=frames.dtype, pin_memory=True) for _ in range(2)]
+    events = [torch.cuda.Event(), torch.cuda.Event()]
+    stream = torch.cuda.Stream(device=frames.device)
+    stream.wait_stream(torch.cuda.current_stream(frames.device))
+    # keeps the allocator from reusing the frames while the side stream still reads them
+    frames.record_stream(stream)
+    starts = list(range(0, frames.shape[0], chunk_size))
+
+    def copy(i):
+        chunk = frames[starts[i] : starts[i] + chunk_size]
+        with torch.cuda.stream(stream):
+            buffers[i % 2][: chunk.shape[0]].copy_(chunk, non_blocking=True)
+            events[i % 2].record(stream)
+
+    copy(0)
+    for i, start in enumerate(starts):
+        if i + 1 < len(starts):
+            # the buffer of chunk i + 1 held chunk i - 1, which the caller is done with
+            copy(i + 1)
+        events[i % 2].synchronize()
+        yield buffers[i % 2][: min(chunk_size, frames.shape[0] - start)].numpy()
+
+
+def frames_to_numpy(frames: torch.Tensor, chunk_size: int = 8) -> np.ndarray:
+    """Gathers uint8 frames of shape [T, H, W, C] into a host array with chunked, pinned transfers."""
+    output = np.empty(tuple(frames.shape), dtype=np.uint8)
+    start = 0
+    for chunk in iter_host_frames(frames, chunk_size):
+        output[start : start + len(chunk)] = chunk
+        start += len(chunk)
+    return output
+
+
+class VideoSink:
+    """
+    Streams RGB frames into an MP4 through an ffmpeg subprocess as they are produced.
+
+    Frames are piped to ffmpeg's stdin chunk by chunk, so the encoder starts while the clip is still being decoded
+    and the whole clip never has to sit in host memory. The video is written next to `path` and renamed into place
+    by `close`, so `path` never holds a partial file and no copy to the final location is needed. Leaving a `with`
+    block on an exception discards the partial video.
+
+    Args:
+        path (`str`): Final location of the video.
+        fps (`int`, defaults to 24): Frame rate.
+        crf (`int`, defaults to 18): Constant rate factor, lower is higher quality and larger files.
+        preset (`str`, defaults to "medium"): x264 speed preset, faster presets make larger files at the same quality.
+        codec (`str`, defaults to "libx264"): ffmpeg video encoder.
+        pix_fmt (`str`, defaults to "yuv420p"): Pixel format of the video, the one every player supports.
+        extra_args (`List[str]`, *optional*): Further ffmpeg output options.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fps: int = 24,
+        crf: int = 18,
+        preset: str = "medium",
+        codec: str = "libx264",
+        pix_fmt: str = "yuv420p",
+        extra_args: Optional[List[str]] = None,
+    ):
+        if preset not in ENCODER_PRESETS:
+            raise ValueError(f"unknown encoder preset {preset}, choose from {ENCODER_PRESETS}")
+        self.path = str(path)
+        self.fps = fps
+        self.crf = crf
+        self.preset = preset
+        self.codec = codec
+        self.pix_fmt = pix_fmt
+        self.extra_args = extra_args or []
+        self.frames_written = 0
+        self.frame_size = None
+        root, ext = os.path.splitext(self.path)
+        self._partial_path = f"{root}.part{ext}"
+        self._process = None
+        self._stderr = None
+
+    def _open(self, height: int, width: int):
+        self.frame_size = (height, width)
+        self._stderr = tempfile.TemporaryFile()
+        # yuv420p needs even dimensions, pad odd ones by a pixel
+        command = [
+            get_ffmpeg_exe(),
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgb24",
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            str(self.fps),
+            "-i",
+            "-",
+            "-an",
+            "-vf",
+            "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-c:v",
+            self.codec,
+            "-preset",
+            self.preset,
+            "-crf",
+            str(self.crf),
+            "-pix_fmt",
+            self.pix_fmt,
+            "-movflags",
+            "+faststart",
+            *self.extra_args,
+            self._partial_path,
+        ]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+
+    def _ffmpeg_error(self) -> str:
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors="replace").strip()
+
+    def write(self, frames):
+        """
+        Appends frames of shape [H, W, 3] or [T, H, W, 3], either uint8 or floats in [0, 1]. Tensors are moved to
+        the host here, so pass frame chunks rather than the whole clip.
+        """
+        if hasattr(frames, "cpu"):
+            frames = frames.cpu().numpy()
+        frames = np.asarray(frames)
+        if frames.ndim == 3:
+            frames = frames[None]
+        if frames.ndim != 4 or frames.shape[-1] != 3:
+            raise ValueError(f"expected RGB frames of shape [T, H, W, 3], got {frames.shape}")
+        if frames.dtype != np.uint8:
+            frames = (np.clip(frames, 0, 1) * 255).round().astype(np.uint8)
+        if self._process is None:
+            self._open(frames.shape[1], frames.shape[2])
+        elif frames.shape[1:3] != self.frame_size:
+            raise ValueError(f"frame size changed from {self.frame_size} to {frames.shape[1:3]}")
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frames).tobytes())
+        except BrokenPipeError:
+            self._process.wait()
+            raise RuntimeError(f"ffmpeg exited while encoding {self.path}: {self._ffmpeg_error()}")
+        self.frames_written += frames.shape[0]
+
+    def close(self) -> str:
+        """Finishes the encode and moves the video to `path`."""
+        if self._process is None:
+            raise RuntimeError(f"no frames were written to {self.path}")
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            error = self._ffmpeg_error()
+            self.abort()
+            raise RuntimeError(f"ffmpeg failed to encode {self.path}: {error}")
+        self._stderr.close()
+        os.replace(self._partial_path, self.path)
+        return self.path
+
+    def abort(self):
+        """Stops the encoder and deletes the partial video."""
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+                self._process.wait()
+            self._stderr.close()
+        if os.path.exists(self._partial_path):
+            os.remove(self._partial_path)
+
+    def __enter__(self) -> "VideoSink":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_video(path: str, frames, fps: int = 24, chunk_size: int = 16, **kwargs) -> str:
+    """
+    Encodes a clip of shape [T, H, W, 3] with a `VideoSink`, `chunk_size` frames at a time. uint8 tensors, e.g. from
+    `video_to_uint8`, are transferred with `iter_host_frames` so the transfer overlaps the encode. `kwargs` are
+    forwarded to the sink.
+    """
+    if isinstance(frames, torch.Tensor) and frames.dtype == torch.uint8:
+        chunks = iter_host_frames(frames, chunk_size)
+    else:
+        chunks = (frames[start : start + chunk_size] for start in range(0, len(frames), chunk_size))
+    with VideoSink(path, fps=fps, **kwargs) as sink:
+        for chunk in chunks:
+            sink.write(chunk)
+    return str(path)
+
+
+class VideoSource:
+    """
+    Random access to the frames of a video file that decodes only what is asked for.
+
+    The frame count, size and frame rate come from the container, and `read` seeks to the keyframe before the first
+    requested frame, so reading the tail of a long clip costs time and memory proportional to the tail. Frames are
+    resized to `width` x `height` while decoding. decord is used when installed, then PyAV, then an ffmpeg
+    subprocess.
+
+    Args:
+        path (`str`): Video file.
+        width (`int`, *optional*): Output width, the video's own by default.
+        height (`int`, *optional*): Output height, the video's own by default.
+        backend (`str`, *optional*): One of "decord", "av" or "ffmpeg", the first available by default.
+    """
+
+    def __init__(self, path: str, width: Optional[int] = None, height: Optional[int] = None, backend=None):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        if backend is None:
+            backend = "decord" if DECORD_AVAILABLE else "av" if AV_AVAILABLE else "ffmpeg"
+        if backend not in ("decord", "av", "ffmpeg"):
+            raise ValueError(f"unknown video backend {backend}")
+        self.path = str(path)
+        self.backend = backend
+        self._reader = None
+        if backend == "decord":
+            self._reader = VideoReader(self.path)
+            source_height, source_width = self._reader[0].shape[:2]
+            self.num_frames = len(self._reader)
+            self.fps = float(self._reader.get_avg_fps())
+            if width is not None or height is not None:
+                self._reader = VideoReader(
+                    self.path, width=width or source_width, height=height or source_height
+                )
+        elif backend == "av":
+            with av.open(self.path) as container:
+                stream = container.streams.video[0]
+                source_width, source_height = stream.codec_context.width, stream.codec_context.height
+                self.fps = float(stream.average_rate)
+                self.num_frames = stream.frames or sum(1 for packet in container.demux(stream) if packet.size)
+        else:
+            source_width, source_height, self.fps, self.num_frames = self._ffmpeg_probe()
+        self.source_size = (source_width, source_height)
+        self.width = width or source_width
+        self.height = height or source_height
+
+    def _ffmpeg_probe(self) -> Tuple[int, int, float, int]:
+        # remuxing to framecrc lists one line per packet without decoding any of them
+        command = [get_ffmpeg_exe(), "-hide_banner", "-i", self.path, "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"]
+        result = subprocess.run(command, capture_output=True, text=True)
+        size = re.search(r"^#dimensions 0: (\d+)x(\d+)", result.stdout, re.MULTILINE)
+        fps = re.search(r"Video: .*?([\d.]+) (?:fps|tbr)", result.stderr)
+        if result.returncode != 0 or size is None or fps is None:
+            raise RuntimeError(f"ffmpeg could not read {self.path}: {result.stderr.strip().splitlines()[-1:]}")
+        num_frames = sum(1 for line in result.stdout.splitlines() if line and not line.startswith("#"))
+        return int(size.group(1)), int(size.group(2)), float(fps.group(1)), num_frames
+
+    def read(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Returns frames `start` to `end` (exclusive) as uint8 RGB of shape [T, H, W, 3]."""
+        end = self.num_frames if end is None else min(end, self.num_frames)
+        start = max(0, start)
+        if start >= end:
+            return np.empty((0, self.height, self.width, 3), dtype=np.uint8)
+        if self.backend == "decord":
+            batch = self._reader.get_batch(list(range(start, end)))
+            return batch.asnumpy() if hasattr(batch, "asnumpy") else batch.numpy()
+        if self.backend == "av":
+            return self._read_av(start, end)
+        return self._read_ffmpeg(start, end)
+
+    def _read_av(self, start: int, end: int) -> np.ndarray:
+        frames = []
+        with av.open(self.path) as container:
+            stream = container.streams.video[0]
+            rate = Fraction(stream.average_rate)
+            offset = stream.start_time or 0
+            if start > 0:
+                container.seek(offset + int(start / rate / stream.time_base), stream=stream, backward=True)
+            for frame in container.decode(stream):
+                index = round((frame.pts - offset) * stream.time_base * rate)
+                if index < start:
+                    continue
+                if index >= end:
+                    break
+                frames.append(frame.reformat(width=self.width, height=self.height, format="rgb24").to_ndarray())
+        return np.stack(frames)
+
+    def _read_ffmpeg(self, start: int, end: int) -> np.ndarray:
+        # -ss before -i seeks to the previous keyframe and decodes forward to the exact timestamp
+        command = [
+            get_ffmpeg_exe(),
+            "-loglevel",
+            "error",
+            "-ss",
+            f"{start / self.fps:.6f}",
+            "-i",
+            self.path,
+            "-frames:v",
+            str(end - start),
+            "-vf",
+            f"scale={self.width}:{self.height}",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgb24",
+            "-",
+        ]
+        result = subprocess.run(command, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {self.path}: {result.stderr.decode(errors='replace')}")
+        return np.frombuffer(result.stdout, dtype=np.uint8).reshape(-1, self.height, self.width, 3)
+
+    def iter_chunks(self, chunk_size: int = 16, start: int = 0, end: Optional[int] = None) -> Iterator[np.ndarray]:
+        """Yields the frames from `start` to `end` `chunk_size` at a time, e.g. to stream them into a `VideoSink`."""
+        end = self.num_frames if end is None else min(end, self.num_frames)
+        for chunk_start in range(start, end, chunk_size):
+            yield self.read(chunk_start, min(chunk_start + chunk_size, end))
+
+    def read_tail(self, num_frames: int) -> np.ndarray:
+        """Returns the last `num_frames` frames."""
+        return self.read(self.num_frames - num_frames)
@@ -0,0 +1,341 @@
+# Flow-matching Euler, Heun, DPM-Solver++ and adaptive samplers sharing the interface of
+# `FlowUniPCMultistepScheduler`, so any of them can drive the pipelines.
+import math
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+import torch
+from diffusers.configuration_utils import ConfigMixin
+from diffusers.configuration_utils import register_to_config
+from diffusers.schedulers.scheduling_utils import SchedulerMixin
+from diffusers.schedulers.scheduling_utils import SchedulerOutput
+
+from .fm_solvers_unipc import FlowUniPCMultistepScheduler
+
+SAMPLERS = ["unipc", "euler", "heun", "dpm++", "adaptive"]
+
+
+class FlowMatchSolver(SchedulerMixin, ConfigMixin):
+    """
+    Base of the flow-matching samplers. The transformer predicts the velocity `v = noise - x0` of
+    `x = (1 - sigma) * x0 + sigma * noise`, and every solver integrates `dx / dsigma = v` from the first sigma to 0.
+
+    The schedule, the step counter and the clean-latent estimates follow `FlowUniPCMultistepScheduler`: `timesteps`
+    holds one entry per transformer forward, `sigmas` one more ending at 0, `step_index` counts the steps taken and
+    `model_outputs[-1]` is the x0 estimate of the last step, which latent previews and progressive sampling read.
+    Steps are counted rather than looked up by timestep, so schedules may repeat a timestep, and the per-frame
+    schedulers of diffusion forcing step through the same entries in order.
+    """
+
+    order = 1
+
+    def _init_schedule(self, num_train_timesteps: int, shift: float, history: int):
+        alphas = np.linspace(1, 1 / num_train_timesteps, num_train_timesteps)[::-1].copy()
+        sigmas = torch.from_numpy(1.0 - alphas).to(dtype=torch.float32)
+        sigmas = shift * sigmas / (1 + (shift - 1) * sigmas)
+        self.sigmas = sigmas
+        self.timesteps = sigmas * num_train_timesteps
+        self.sigma_min = self.sigmas[-1].item()
+        self.sigma_max = self.sigmas[0].item()
+        self.num_inference_steps = None
+        self._history = history
+        self.model_outputs = [None] * history
+        self._step_index = None
+        self._begin_index = None
+
+    @property
+    def step_index(self):
+        """The index counter for current timestep. It will increase 1 after each scheduler step."""
+        return self._step_index
+
+    @property
+    def begin_index(self):
+        """The index for the first timestep. It should be set from pipeline with `set_begin_index` method."""
+        return self._begin_index
+
+    def set_begin_index(self, begin_index: int = 0):
+        self._begin_index = begin_index
+
+    def reset_multistep_history(self):
+        """
+        Drops the solver history so the next step restarts with a first-order update while keeping the position in
+        the schedule. Used when the sample changes shape mid-trajectory (progressive sampling).
+        """
+        self.model_outputs = [None] * self._history
+
+    def _solver_sigmas(self, sigmas: np.ndarray) -> np.ndarray:
+        """Sigmas of the transformer forwards for the solver steps `sigmas`, by default one forward per step."""
+        return sigmas
+
+    def set_timesteps(
+        self,
+        num_inference_steps: Union[int, None] = None,
+        device: Union[str, torch.device] = None,
+        sigmas: Optional[List[float]] = None,
+        shift: Optional[float] = None,
+    ):
+        """
+        Sets the timesteps of `num_inference_steps` solver steps, with the spacing of `FlowUniPCMultistepScheduler`,
+        or of explicit `sigmas` (before shifting).
+        """
+        if sigmas is None:
+            sigmas = np.linspace(self.sigma_max, self.sigma_min, num_inference_steps + 1).copy()[:-1]
+        sigmas = np.asarray(sigmas, dtype=np.float64)
+        if shift is None:
+            shift = self.config.shift
+        sigmas = shift * sigmas / (1 + (shift - 1) * sigmas)
+        sigmas = self._solver_sigmas(sigmas)
+
+        timesteps = sigmas * self.config.num_train_timesteps
+        self.sigmas = torch.from_numpy(np.concatenate([sigmas, [0.0]]).astype(np.float32))
+        self.timesteps = torch.from_numpy(timesteps).to(device=device, dtype=torch.int64)
+        self.num_inference_steps = len(timesteps)
+        self.reset_multistep_history()
+        self._step_index = None
+        self._begin_index = None
+
+    def _init_step_index(self, timestep):
+        if self.begin_index is not None:
+            self._step_index = self.begin_index
+            return
+        # the first occurrence: a schedule started mid-way begins at its first forward of that timestep
+        if isinstance(timestep, torch.Tensor):
+            timestep = timestep.to(self.timesteps.device)
+        indices = (self.timesteps == timestep).nonzero()
+        self._step_index = indices[0].item() if len(indices) else 0
+
+    def _push(self, x0: torch.Tensor):
+        self.model_outputs = self.model_outputs[1:] + [x0]
+
+    def _update(self, v: torch.Tensor, x: torch.Tensor, sigma: float, sigma_next: float) -> torch.Tensor:
+        raise NotImplementedError
+
+    def step(
+        self,
+        model_output: torch.Tensor,
+        timestep: Union[int, torch.Tensor],
+        sample: torch.Tensor,
+        return_dict: bool = True,
+        generator=None,
+    ) -> Union[SchedulerOutput, Tuple]:
+        """
+        Moves `sample` from the sigma of the current step to the next one with the velocity `model_output`.
+
+        Returns:
+            [`~schedulers.scheduling_utils.SchedulerOutput`] or `tuple`: The sample at the next sigma.
+        """
+        if self.num_inference_steps is None:
+            raise ValueError(
+                "Number of inference steps is 'None', you need to run 'set_timesteps' after creating the scheduler"
+            )
+        if self.step_index is None:
+            self._init_step_index(timestep)
+
+        # sigmas live on the CPU, reading them does not synchronize with the device
+        sigma = self.sigmas[self.step_index].item()
+        sigma_next = self.sigmas[self.step_index + 1].item()
+        v = model_output.float()
+        x = sample.float()
+        self._push(x - sigma * v)
+        prev_sample = self._update(v, x, sigma, sigma_next).to(sample.dtype)
+        self._step_index += 1
+
+        if not return_dict:
+            return (prev_sample,)
+        return SchedulerOutput(prev_sample=prev_sample)
+
+    def scale_model_input(self, sample: torch.Tensor, *args, **kwargs) -> torch.Tensor:
+        return sample
+
+    def add_noise(self, original_samples: torch.Tensor, noise: torch.Tensor, timesteps: torch.IntTensor):
+        sigma = (timesteps.to(original_samples.device).float() / self.config.num_train_timesteps).flatten()
+        while len(sigma.shape) < len(original_samples.shape):
+            sigma = sigma.unsqueeze(-1)
+        return (1 - sigma) * original_samples + sigma * noise
+
+    def __len__(self):
+        return self.config.num_train_timesteps
+
+
+class FlowEulerScheduler(FlowMatchSolver):
+    """
+    First-order Euler sampler for flow matching: `x_next = x + (sigma_next - sigma) * v`. One forward per step.
+
+    Args:
+        num_train_timesteps (`int`, defaults to 1000): The number of diffusion steps to train the model.
+        shift (`float`, defaults to 1.0): Default flow shift of the schedule, usually overridden in `set_timesteps`.
+    """
+
+    @register_to_config
+    def __init__(self, num_train_timesteps: int = 1000, shift: float = 1.0):
+        self._init_schedule(num_train_timesteps, shift, history=1)
+
+    def _update(self, v, x, sigma, sigma_next):
+        return x + (sigma_next - sigma) * v
+
+
+class FlowHeunScheduler(FlowMatchSolver):
+    """
+    Second-order Heun sampler for flow matching. Each step takes an Euler predictor forward and a corrector forward
+    at the predicted sample that averages both velocities; the last step, which ends at sigma 0, is a plain Euler step.
+    `num_inference_steps` steps therefore take `2 * num_inference_steps - 1` forwards, and `timesteps` lists every
+    forward, repeating the timestep of each corrector for the next predictor.
+
+    Args:
+        num_train_timesteps (`int`, defaults to 1000): The number of diffusion steps to train the model.
+        shift (`float`, defaults to 1.0): Default flow shift of the schedule, usually overridden in `set_timesteps`.
+    """
+
+    @register_to_config
+    def __init__(self, num_train_timesteps: int = 1000, shift: float = 1.0):
+        self._init_schedule(num_train_timesteps, shift, history=1)
+        self._predictor = None
+
+    def _solver_sigmas(self, sigmas):
+        return np.concatenate([sigmas[:1], np.repeat(sigmas[1:], 2)])
+
+    def reset_multistep_history(self):
+        super().reset_multistep_history()
+        self._predictor = None
+
+    def _update(self, v, x, sigma, sigma_next):
+        if self._predictor is not None:
+            # corrector: `x` is the Euler prediction at the end of the step
+            x_start, v_start, dt = self._predictor
+            self._predictor = None
+            return x_start + dt * 0.5 * (v_start + v)
+        dt = sigma_next - sigma
+        if dt != 0 and sigma_next > 0:
+            self._predictor = (x, v, dt)
+        # a corrector forward whose predictor was dropped by `reset_multistep_history` has dt 0 and leaves x as is
+        return x + dt * v
+
+
+class FlowDPMSolverMultistepScheduler(FlowMatchSolver):
+    """
+    DPM-Solver++ multistep sampler (2M) for flow matching, in data prediction form with `alpha = 1 - sigma` and
+    `lambda = log(alpha / sigma)`. One forward per step; the second-order update reuses the x0 estimate of the
+    previous step, and the first and last steps are first order.
+
+    Args:
+        num_train_timesteps (`int`, defaults to 1000): The number of diffusion steps to train the model.
+        shift (`float`, defaults to 1.0): Default flow shift of the schedule, usually overridden in `set_timesteps`.
+        solver_order (`int`, defaults to 2): 1 for DPM-Solver++(1S), which is DDIM, or 2 for DPM-Solver++(2M).
+    """
+
+    @register_to_config
+    def __init__(self, num_train_timesteps: int = 1000, shift: float = 1.0, solver_order: int = 2):
+        if solver_order not in (1, 2):
+            raise ValueError(f"`solver_order` must be 1 or 2, got {solver_order}")
+        self._init_schedule(num_train_timesteps, shift, history=2)
+        self._lambdas = [None, None]
+
+    @staticmethod
+    def _lambda(sigma: float) -> float:
+        return math.log(max(1.0 - sigma, 1e-10)) - math.log(sigma)
+
+    def reset_multistep_history(self):
+        super().reset_multistep_history()
+        self._lambdas = [None, None]
+
+    def _update(self, v, x, sigma, sigma_next):
+        x0 = self.model_outputs[-1]
+        lambda_s = self._lambda(sigma)
+        self._lambdas = [self._lambdas[-1], lambda_s]
+        if sigma_next == 0:
+            return x0
+        h = self._lambda(sigma_next) - lambda_s
+        if self.config.solver_order == 2 and self.model_outputs[-2] is not None:
+            r = (lambda_s - self._lambdas[0]) / h
+            x0 = x0 + (x0 - self.model_outputs[-2]) / (2 * r)
+        return (sigma_next / sigma) * x - (1.0 - sigma_next) * math.expm1(-h) * x0
+
+
+class FlowAdaptiveScheduler(FlowMatchSolver):
+    """
+    Adaptive-step sampler for flow matching with error control over a fixed budget of `num_inference_steps` forwards.
+
+    Each step pairs a first-order Euler update with a second-order Adams-Bashforth one, which reuses the velocity of
+    the previous step, and takes the second-order result; their difference estimates the local error of the step at
+    no extra forward. A step-size controller then sizes the next step so its error matches the mean error of the
+    steps so far, equidistributing the error over the trajectory: steps shrink where it bends and grow where it is
+    straight. The sigmas after the next one keep the spacing of the schedule, rescaled to the interval left, and
+    each step stays within `[min_factor, max_factor]` times the step that spacing would take.
+
+    The schedule changes while sampling: `timesteps` and `sigmas` are updated in place, so loops reading them
+    entry by entry see the new values. The per-frame timestep matrix of diffusion forcing is fixed up front and
+    does not support this sampler. `error_history` keeps the relative error estimate of every step.
+
+    Args:
+        num_train_timesteps (`int`, defaults to 1000): The number of diffusion steps to train the model.
+        shift (`float`, defaults to 1.0): Default flow shift of the schedule, usually overridden in `set_timesteps`.
+        min_factor (`float`, defaults to 0.5): Smallest step relative to the step of the schedule's spacing.
+        max_factor (`float`, defaults to 2.0): Largest step relative to the step of the schedule's spacing.
+    """
+
+    @register_to_config
+    def __init__(
+        self, num_train_timesteps: int = 1000, shift: float = 1.0, min_factor: float = 0.5, max_factor: float = 2.0
+    ):
+        self._init_schedule(num_train_timesteps, shift, history=1)
+        self._previous = None
+        self.error_history = []
+
+    def set_timesteps(self, *args, **kwargs):
+        super().set_timesteps(*args, **kwargs)
+        self.error_history = []
+
+    def reset_multistep_history(self):
+        super().reset_multistep_history()
+        self._previous = None
+
+    def _place_next(self, error: float):
+        """Rescales the sigmas after the next one so the next step has the controlled size."""
+        i = self.step_index + 1
+        remaining = len(self.sigmas) - 1 - i
+        if remaining < 2:
+            # the next step is the last and ends at sigma 0
+            return
+        sigmas = self.sigmas[i:].double()
+        start, spaced = sigmas[0].item(), (sigmas[0] - sigmas[1]).item()
+        mean = sum(self.error_history) / len(self.error_history)
+        # the error of the Euler update grows with the square of the step
+        h = spaced * math.sqrt(mean / error) if error > 0 else self.config.max_factor * spaced
+        h = min(max(h, self.config.min_factor * spaced), self.config.max_factor * spaced)
+        # leave at least the mean step of the interval left to each remaining step
+        h = min(h, start * (remaining - 1) / remaining)
+        rest = sigmas[1:] * ((start - h) / sigmas[1].item())
+        self.sigmas[i + 1 :] = rest.float()
+        timesteps = rest[:-1] * self.config.num_train_timesteps
+        self.timesteps[i + 1 :] = timesteps.to(device=self.timesteps.device, dtype=self.timesteps.dtype)
+
+    def _update(self, v, x, sigma, sigma_next):
+        dt = sigma_next - sigma
+        prev_sample = x + dt * v
+        if self._previous is not None and sigma_next > 0:
+            v_prev, dt_prev = self._previous
+            correction = dt * dt / (2 * dt_prev) * (v - v_prev)
+            prev_sample = prev_sample + correction
+            error = (correction.norm() / x.norm().clamp_min(1e-6)).item()
+            self.error_history.append(error)
+            self._place_next(error)
+        self._previous = (v, dt) if dt != 0 else None
+        return prev_sample
+
+
+def build_sampler(name: str = "unipc", **kwargs) -> SchedulerMixin:
+    """A sampler of `SAMPLERS` with its default configuration, or `kwargs`."""
+    if name == "unipc":
+        return FlowUniPCMultistepScheduler(**kwargs)
+    if name == "euler":
+        return FlowEulerScheduler(**kwargs)
+    if name == "heun":
+        return FlowHeunScheduler(**kwargs)
+    if name == "dpm++":
+        return FlowDPMSolverMultistepScheduler(**kwargs)
+    if name == "adaptive":
+        return FlowAdaptiveScheduler(**kwargs)
+    raise ValueError(f"`sampler` must be one of {SAMPLERS}, got {name}")
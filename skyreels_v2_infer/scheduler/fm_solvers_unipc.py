@@ -1,6 +1,7 @@
 # Copied from https://github.com/huggingface/diffusers/blob/v0.31.0/src/diffusers/schedulers/scheduling_unipc_multistep.py
 # Convert unipc for flow matching
 # Copyright 2024-2025 The Alibaba Wan Team Authors. All rights reserved.
+import functools
 import math
 from typing import List
 from typing import Optional
@@ -17,6 +18,158 @@ from diffusers.schedulers.scheduling_utils import SchedulerOutput
 from diffusers.utils import deprecate
 
 
+class UniPCSamplingPlan:
+    """
+    The schedule of `FlowUniPCMultistepScheduler` for one set of sigmas, with the coefficients of every predictor and
+    corrector update precomputed.
+
+    A UniPC update is a linear combination of the sample and the stored model outputs whose weights depend only on
+    the sigmas of the steps involved and on the order of the update. The plan solves the small B(h) systems once, in
+    float64 on the host, for every step and every order that step can run at. Stepping then looks the weights up as
+    Python floats and runs a fixed chain of scaled additions on the device, without building coefficient tensors or
+    reading device values. Plans never change after construction and are shared between schedulers, e.g. the per-frame
+    schedulers of diffusion forcing; `sampling_plan` caches them.
+
+    Args:
+        sigmas (`np.ndarray`): The sigma of every step followed by the final sigma.
+    """
+
+    def __init__(
+        self,
+        sigmas: np.ndarray,
+        num_train_timesteps: int = 1000,
+        solver_order: int = 2,
+        solver_type: str = "bh2",
+        predict_x0: bool = True,
+        lower_order_final: bool = True,
+    ):
+        self.sigmas = torch.from_numpy(np.asarray(sigmas, dtype=np.float32))
+        self.timesteps = torch.from_numpy(sigmas[:-1] * num_train_timesteps).to(torch.int64)
+        self.solver_type = solver_type
+        self.predict_x0 = predict_x0
+        self._device_timesteps = {}
+
+        # the float32 sigmas the scheduler exposes, so the plan follows the same schedule
+        sigma = self.sigmas.double().numpy()
+        self._sigma = sigma.tolist()
+        num_steps = len(self.timesteps)
+        # weights by step index and order; the corrector of a step runs at the order of the previous predictor
+        self.predictor = []
+        self.corrector = [{}]
+        # the step to sigma 0 has an infinite lambda, which the updates handle like the per-step tensor code
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self._lambdas = np.log(1.0 - sigma) - np.log(sigma)
+            for i in range(num_steps):
+                max_order = min(solver_order, i + 1, num_steps - i if lower_order_final else solver_order)
+                orders = range(1, max_order + 1)
+                self.predictor.append({order: self._weights(i + 1, i, order, False) for order in orders})
+                if i > 0:
+                    orders = self.predictor[i - 1]
+                    self.corrector.append({order: self._weights(i, i - 1, order, True) for order in orders})
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _weights(self, t: int, s0: int, order: int, corrector: bool) -> Tuple[float, Tuple[float, ...]]:
+        """
+        Weights of the UniP (or UniC) update of `order` from step `s0` to step `t`: the weight of the sample and those
+        of the model outputs of steps `s0`, `s0 - 1`, ..., followed for UniC by the weight of the model output at `t`.
+        """
+        lambdas = self._lambdas
+        sigma_t, sigma_s0 = self._sigma[t], self._sigma[s0]
+        alpha_t, alpha_s0 = 1.0 - sigma_t, 1.0 - sigma_s0
+        h = lambdas[t] - lambdas[s0]
+        rks = np.array([(lambdas[s0 - k] - lambdas[s0]) / h for k in range(1, order)] + [1.0])
+
+        hh = -h if self.predict_x0 else h
+        h_phi_1 = math.expm1(hh)  # h\phi_1(h) = e^h - 1
+        h_phi_k = h_phi_1 / hh - 1
+        B_h = hh if self.solver_type == "bh1" else math.expm1(hh)
+        R, b = [], []
+        factorial_i = 1
+        for i in range(1, order + 1):
+            R.append(rks ** (i - 1))
+            b.append(h_phi_k * factorial_i / B_h)
+            factorial_i *= i + 1
+            h_phi_k = h_phi_k / hh - 1 / factorial_i
+        R, b = np.stack(R), np.array(b)
+
+        if corrector:
+            rhos = np.array([0.5]) if order == 1 else np.linalg.solve(R, b)
+        elif order == 1:
+            rhos = np.zeros(0)
+        else:
+            rhos = np.array([0.5]) if order == 2 else np.linalg.solve(R[:-1, :-1], b[:-1])
+
+        if self.predict_x0:
+            scale, weight = sigma_t / sigma_s0, alpha_t
+        else:
+            scale, weight = alpha_t / alpha_s0, sigma_t
+        # the differences (m_k - m0) / r_k expanded into weights of the model outputs
+        history = [-weight * B_h * rho / rk for rho, rk in zip(rhos, rks[:-1])]
+        current = [-weight * B_h * rhos[-1]] if corrector else []
+        m0 = -weight * h_phi_1 - sum(history) - sum(current)
+        return float(scale), tuple(float(w) for w in [m0, *history, *current])
+
+    def timesteps_on(self, device: Union[str, torch.device, None]) -> torch.Tensor:
+        """The timesteps on `device`, copied there once per plan."""
+        if device is None:
+            return self.timesteps
+        device = torch.device(device)
+        if device not in self._device_timesteps:
+            self._device_timesteps[device] = self.timesteps.to(device)
+        return self._device_timesteps[device]
+
+    def convert(self, step_index: int, model_output: torch.Tensor, sample: torch.Tensor) -> torch.Tensor:
+        """The x0 (or noise) estimate of `FlowUniPCMultistepScheduler.convert_model_output`."""
+        sigma = self._sigma[step_index]
+        return torch.add(sample, model_output, alpha=-sigma if self.predict_x0 else sigma - 1.0)
+
+    @staticmethod
+    def _combine(scale: float, weights: Tuple[float, ...], sample: torch.Tensor, outputs: List[torch.Tensor]):
+        out = sample * scale
+        for weight, output in zip(weights, outputs):
+            out = torch.add(out, output, alpha=weight)
+        return out.to(sample.dtype)
+
+    def predict(self, step_index: int, order: int, model_outputs: List[torch.Tensor], sample: torch.Tensor):
+        """The UniP update of `multistep_uni_p_bh_update`."""
+        scale, weights = self.predictor[step_index][order]
+        return self._combine(scale, weights, sample, model_outputs[::-1])
+
+    def correct(
+        self,
+        step_index: int,
+        order: int,
+        model_outputs: List[torch.Tensor],
+        last_sample: torch.Tensor,
+        model_output: torch.Tensor,
+    ):
+        """The UniC update of `multistep_uni_c_bh_update`."""
+        scale, weights = self.corrector[step_index][order]
+        outputs = model_outputs[::-1][: len(weights) - 1] + [model_output]
+        return self._combine(scale, weights, last_sample, outputs)
+
+
+@functools.lru_cache(maxsize=64)
+def sampling_plan(
+    num_inference_steps: int,
+    shift: float,
+    sigma_max: float,
+    sigma_min: float,
+    num_train_timesteps: int = 1000,
+    solver_order: int = 2,
+    solver_type: str = "bh2",
+    predict_x0: bool = True,
+    lower_order_final: bool = True,
+) -> UniPCSamplingPlan:
+    """The cached plan of `num_inference_steps` linearly spaced, shifted sigmas ending at 0."""
+    sigmas = np.linspace(sigma_max, sigma_min, num_inference_steps + 1).copy()[:-1]
+    sigmas = shift * sigmas / (1 + (shift - 1) * sigmas)
+    sigmas = np.concatenate([sigmas, [0.0]])
+    return UniPCSamplingPlan(sigmas, num_train_timesteps, solver_order, solver_type, predict_x0, lower_order_final)
+
+
 class FlowUniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
     """
     `UniPCMultistepScheduler` is a training-free framework designed for the fast sampling of diffusion models.
@@ -68,6 +221,9 @@ class FlowUniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
         final_sigmas_type (`str`, defaults to `"zero"`):
             The final `sigma` value for the noise schedule during the sampling process. If `"sigma_min"`, the final
             sigma is the same as the last sigma in the training schedule. If `zero`, the final sigma is set to 0.
+        use_sampling_plan (`bool`, defaults to `True`):
+            Whether to step with the precomputed coefficients of a `UniPCSamplingPlan`. If `False`, the coefficients
+            are computed at every step, as in diffusers.
     """
 
     _compatibles = [e.name for e in KarrasDiffusionSchedulers]
@@ -92,6 +248,7 @@ class FlowUniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
         timestep_spacing: str = "linspace",
         steps_offset: int = 0,
         final_sigmas_type: Optional[str] = "zero",  # "zero", "sigma_min"
+        use_sampling_plan: bool = True,
     ):
 
         if solver_type not in ["bh1", "bh2"]:
@@ -122,6 +279,7 @@ class FlowUniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
         self.last_sample = None
         self._step_index = None
         self._begin_index = None
+        self._plan = None
 
         self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
         self.sigma_min = self.sigmas[-1].item()
@@ -152,6 +310,15 @@ class FlowUniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
         """
         self._begin_index = begin_index
 
+    def reset_multistep_history(self):
+        """
+        Drops the stored model outputs so the next step restarts with a first-order update while keeping the
+        position in the schedule. Used when the sample changes shape mid-trajectory (progressive sampling).
+        """
+        self.model_outputs = [None] * self.config.solver_order
+        self.lower_order_nums = 0
+        self.last_sample = None
+
     # Modified from diffusers.schedulers.scheduling_flow_match_euler_discrete.FlowMatchEulerDiscreteScheduler.set_timesteps
     def set_timesteps(
         self,
@@ -173,32 +340,45 @@ class FlowUniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
         if self.config.use_dynamic_shifting and mu is None:
             raise ValueError(" you have to pass a value for `mu` when `use_dynamic_shifting` is set to be `True`")
 
-        if sigmas is None:
-            sigmas = np.linspace(self.sigma_max, self.sigma_min, num_inference_steps + 1).copy()[:-1]  # pyright: ignore
-
-        if self.config.use_dynamic_shifting:
-            sigmas = self.time_shift(mu, 1.0, sigmas)  # pyright: ignore
+        if shift is None:
+            shift = self.config.shift
+        plan_config = (
+            self.config.num_train_timesteps,
+            self.config.solver_order,
+            self.config.solver_type,
+            self.predict_x0,
+            self.config.lower_order_final,
+        )
+        if sigmas is None and not self.config.use_dynamic_shifting and self.config.final_sigmas_type == "zero":
+            # the common case, shared by every scheduler with the same steps and shift
+            plan = sampling_plan(num_inference_steps, shift, self.sigma_max, self.sigma_min, *plan_config)
         else:
-            if shift is None:
-                shift = self.config.shift
-            sigmas = shift * sigmas / (1 + (shift - 1) * sigmas)  # pyright: ignore
+            if sigmas is None:
+                sigmas = np.linspace(self.sigma_max, self.sigma_min, num_inference_steps + 1).copy()[:-1]
+            sigmas = np.asarray(sigmas, dtype=np.float64)
 
-        if self.config.final_sigmas_type == "sigma_min":
-            sigma_last = ((1 - self.alphas_cumprod[0]) / self.alphas_cumprod[0]) ** 0.5
-        elif self.config.final_sigmas_type == "zero":
-            sigma_last = 0
-        else:
-            raise ValueError(
-                f"`final_sigmas_type` must be one of 'zero', or 'sigma_min', but got {self.config.final_sigmas_type}"
-            )
+            if self.config.use_dynamic_shifting:
+                sigmas = self.time_shift(mu, 1.0, sigmas)  # pyright: ignore
+            else:
+                sigmas = shift * sigmas / (1 + (shift - 1) * sigmas)  # pyright: ignore
 
-        timesteps = sigmas * self.config.num_train_timesteps
-        sigmas = np.concatenate([sigmas, [sigma_last]]).astype(np.float32)  # pyright: ignore
+            if self.config.final_sigmas_type == "sigma_min":
+                sigma_last = ((1 - self.alphas_cumprod[0]) / self.alphas_cumprod[0]) ** 0.5
+            elif self.config.final_sigmas_type == "zero":
+                sigma_last = 0
+            else:
+                raise ValueError(
+                    f"`final_sigmas_type` must be one of 'zero', or 'sigma_min', but got {self.config.final_sigmas_type}"
+                )
+            plan = UniPCSamplingPlan(np.concatenate([sigmas, [sigma_last]]), *plan_config)
 
-        self.sigmas = torch.from_numpy(sigmas)
-        self.timesteps = torch.from_numpy(timesteps).to(device=device, dtype=torch.int64)
+        # the precomputed updates cover the built-in predictor without thresholding
+        use_plan = self.config.use_sampling_plan and self.solver_p is None and not self.config.thresholding
+        self._plan = plan if use_plan else None
+        self.sigmas = plan.sigmas
+        self.timesteps = plan.timesteps_on(device)
 
-        self.num_inference_steps = len(timesteps)
+        self.num_inference_steps = len(self.timesteps)
 
         self.model_outputs = [
             None,
@@ -663,14 +843,23 @@ class FlowUniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
             and self.last_sample is not None  # pyright: ignore
         )
 
-        model_output_convert = self.convert_model_output(model_output, sample=sample)
+        plan = self._plan
+        if plan is not None:
+            model_output_convert = plan.convert(self.step_index, model_output, sample)
+        else:
+            model_output_convert = self.convert_model_output(model_output, sample=sample)
         if use_corrector:
-            sample = self.multistep_uni_c_bh_update(
-                this_model_output=model_output_convert,
-                last_sample=self.last_sample,
-                this_sample=sample,
-                order=self.this_order,
-            )
+            if plan is not None:
+                sample = plan.correct(
+                    self.step_index, self.this_order, self.model_outputs, self.last_sample, model_output_convert
+                )
+            else:
+                sample = self.multistep_uni_c_bh_update(
+                    this_model_output=model_output_convert,
+                    last_sample=self.last_sample,
+                    this_sample=sample,
+                    order=self.this_order,
+                )
 
         for i in range(self.config.solver_order - 1):
             self.model_outputs[i] = self.model_outputs[i + 1]
@@ -688,11 +877,14 @@ class FlowUniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
         assert self.this_order > 0
 
         self.last_sample = sample
-        prev_sample = self.multistep_uni_p_bh_update(
-            model_output=model_output,  # pass the original non-converted model output, in case solver-p is used
-            sample=sample,
-            order=self.this_order,
-        )
+        if plan is not None:
+            prev_sample = plan.predict(self.step_index, self.this_order, self.model_outputs, sample)
+        else:
+            prev_sample = self.multistep_uni_p_bh_update(
+                model_output=model_output,  # pass the original non-converted model output, in case solver-p is used
+                sample=sample,
+                order=self.this_order,
+            )
 
         if self.lower_order_nums < self.config.solver_order:
             self.lower_order_nums += 1
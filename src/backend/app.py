@@ -7,12 +7,15 @@ from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import Optional, List, Dict, Any
 import os
+import random
 import uuid
 import json
 import asyncio
+import threading
 from datetime import datetime, timedelta
 from pathlib import Path
 import shutil
@@ -25,6 +28,7 @@ from .db.models import User
 # Import error handling and logging
 from .utils.logger import initialize_logging, get_logger
 from .utils.errors import *
+from .utils.job_queue import GenerationQueue, PRIORITY_FINAL, PRIORITY_DRAFT
 from .middleware.error_handler import (
     ErrorHandlingMiddleware, RequestLoggingMiddleware, SecurityMiddleware,
     HealthChecker, cinevivid_exception_handler, http_exception_handler,
@@ -102,6 +106,28 @@ app.mount("/temp", StaticFiles(directory=str(TEMP_DIR)), name="temp")
 # Global video generator (lazy load)
 video_generator = None
 
+# GPU generation jobs are admitted by priority tier, drafts after full renders
+generation_queue = GenerationQueue(max_concurrent=int(os.getenv("MAX_CONCURRENT_GENERATIONS", "1")))
+
+# Cancellation flags of queued and running jobs, polled between denoising steps
+cancel_events: Dict[str, threading.Event] = {}
+
+def get_cancel_event(task_id: str) -> threading.Event:
+    """Get the cancellation flag of a generation job"""
+    return cancel_events.setdefault(task_id, threading.Event())
+
+def mark_generation_cancelled(db: Session, task_id: str, refund: bool):
+    """Record a cancelled job, refunding its credits if it never reached the GPU"""
+    video = crud.update_video_status(db, task_id, "cancelled", 0, "Cancelled by user")
+    if video and refund and video.cost_credits:
+        crud.add_credits(
+            db, video.user_id, video.cost_credits,
+            description=f"Refund for cancelled generation {task_id}",
+            reference_type="video",
+            reference_id=task_id
+        )
+    logger.info(f"Generation cancelled: {task_id}")
+
 def get_video_generator():
     """Lazy load video generator"""
     global video_generator
@@ -391,6 +417,16 @@ async def get_available_models(current_user: User = Depends(get_current_user)):
         logger.error(f"Failed to get available models: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve models")
 
+@app.get("/lora-models")
+async def get_lora_models():
+    """Get list of LoRA adapters that can be applied to the resident model"""
+    try:
+        model_manager = get_model_manager()
+        return {"models": model_manager.get_lora_models()}
+    except Exception as e:
+        logger.error(f"Failed to get LoRA models: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve LoRA models")
+
 @app.post("/models/download/{model_id}")
 async def download_model(
     model_id: str,
@@ -468,6 +504,7 @@ async def get_admin_stats(
         return {
             **stats,
             "model_cache": cache_stats,
+            "generation_queue": generation_queue.get_stats(),
             "system_health": HealthChecker.comprehensive_health_check()
         }
         
@@ -521,6 +558,8 @@ async def generate_text_to_video(
             "num_frames": request.num_frames,
             "style": request.style,
             "guidance_scale": request.guidance_scale,
+            "seed": request.seed if request.seed is not None else random.randrange(2**32),
+            "priority": PRIORITY_FINAL,
             "cost_credits": cost
         }
         
@@ -543,6 +582,165 @@ async def generate_text_to_video(
         logger.error(f"T2V generation failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate/draft")
+async def generate_draft(
+    request: schemas.VideoGenerationRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Generate a fast low-quality draft preview of a text-to-video request"""
+    try:
+        # Drafts are billed at a fraction of a full render
+        cost = max(1, request.num_frames // 24 * 2)  # 2 credits per second for drafts
+        
+        if not crud.deduct_credits(
+            db, current_user.id, cost,
+            description=f"T2V draft: {request.prompt[:50]}...",
+            reference_type="video"
+        ):
+            raise HTTPException(status_code=402, detail="Insufficient credits")
+        
+        task_id = str(uuid.uuid4())
+        
+        final_prompt = request.prompt
+        if request.enhance_prompt and prompt_enhancer:
+            try:
+                final_prompt = prompt_enhancer(request.prompt)
+                logger.info(f"Enhanced prompt: {final_prompt[:100]}...")
+            except Exception as e:
+                logger.warning(f"Prompt enhancement failed: {e}")
+        
+        video_data = {
+            "task_id": task_id,
+            "type": "text-to-video",
+            "title": f"Draft: {request.prompt[:50]}...",
+            "prompt": request.prompt,
+            "enhanced_prompt": final_prompt,
+            "status": "pending",
+            "aspect_ratio": request.aspect_ratio,
+            "num_frames": request.num_frames,
+            "style": request.style,
+            "guidance_scale": request.guidance_scale,
+            "seed": request.seed if request.seed is not None else random.randrange(2**32),
+            "is_draft": True,
+            "priority": PRIORITY_DRAFT,
+            "cost_credits": cost
+        }
+        
+        video = crud.create_video(db, current_user.id, video_data)
+        
+        background_tasks.add_task(process_draft_generation, task_id)
+        
+        return {
+            "task_id": task_id,
+            "status": "pending",
+            "message": "Draft generation started",
+            "estimated_time": "10-30 seconds",
+            "seed": video.seed,
+            "cost": cost
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Draft generation failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate/finalize/{task_id}")
+async def finalize_draft(
+    task_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Re-render a completed draft at full quality from its seed and latents"""
+    try:
+        draft = crud.get_video_by_task_id(db, task_id)
+        if not draft or not draft.is_draft:
+            raise HTTPException(status_code=404, detail="Draft not found")
+        
+        if draft.user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        if draft.status != "completed":
+            raise HTTPException(status_code=409, detail="Draft is not completed yet")
+        
+        cost = draft.num_frames // 24 * 10  # 10 credits per second
+        
+        if not crud.deduct_credits(
+            db, current_user.id, cost,
+            description=f"T2V generation: {draft.prompt[:50]}...",
+            reference_type="video"
+        ):
+            raise HTTPException(status_code=402, detail="Insufficient credits")
+        
+        final_task_id = str(uuid.uuid4())
+        video_data = {
+            "task_id": final_task_id,
+            "type": "text-to-video",
+            "title": f"T2V: {draft.prompt[:50]}...",
+            "prompt": draft.prompt,
+            "enhanced_prompt": draft.enhanced_prompt,
+            "status": "pending",
+            "aspect_ratio": draft.aspect_ratio,
+            "num_frames": draft.num_frames,
+            "style": draft.style,
+            "guidance_scale": draft.guidance_scale,
+            "seed": draft.seed,
+            "draft_task_id": task_id,
+            "priority": PRIORITY_FINAL,
+            "cost_credits": cost
+        }
+        
+        crud.create_video(db, current_user.id, video_data)
+        
+        background_tasks.add_task(process_text_to_video_generation, final_task_id)
+        
+        return {
+            "task_id": final_task_id,
+            "draft_task_id": task_id,
+            "status": "pending",
+            "message": "Final render started",
+            "estimated_time": "2-5 minutes",
+            "seed": draft.seed,
+            "cost": cost
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Draft finalization failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate/cancel/{task_id}")
+async def cancel_generation(
+    task_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Cancel a queued or running generation job
+
+    Queued jobs are dropped and refunded, running jobs stop at the next denoising step.
+    """
+    video = crud.get_video_by_task_id(db, task_id)
+    if not video:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    if video.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if video.status not in ("pending", "processing"):
+        raise HTTPException(status_code=409, detail=f"Task is already {video.status}")
+    
+    get_cancel_event(task_id).set()
+    
+    return {
+        "task_id": task_id,
+        "status": "cancelling",
+        "message": "Generation will stop at the next denoising step"
+    }
+
 @app.post("/generate/image-to-video")
 async def generate_image_to_video(
     background_tasks: BackgroundTasks,
@@ -700,6 +898,7 @@ async def get_task_status(
 async def process_text_to_video_generation(task_id: str):
     """Process T2V generation in background"""
     db = next(get_db())
+    cancel_event = get_cancel_event(task_id)
     
     try:
         # Update status to processing
@@ -713,35 +912,60 @@ async def process_text_to_video_generation(task_id: str):
             crud.update_video_status(db, task_id, "failed", 0, "Video generator not available")
             return
         
-        # Generate video
-        crud.update_video_status(db, task_id, "processing", 50)
-        
-        output_path = generator.generate_video(
-            prompt=video.enhanced_prompt,
-            num_frames=video.num_frames,
-            fps=24,
-            aspect_ratio=video.aspect_ratio or "16:9"
-        )
-        
-        # Move to videos directory
-        final_path = VIDEOS_DIR / f"video_{task_id}.mp4"
-        shutil.move(output_path, final_path)
+        # Generate video once a GPU slot is free
+        async with generation_queue.slot(video.priority or PRIORITY_FINAL):
+            if cancel_event.is_set():
+                mark_generation_cancelled(db, task_id, refund=True)
+                return
+            
+            crud.update_video_status(db, task_id, "processing", 50)
+            
+            params = {
+                "prompt": video.enhanced_prompt,
+                "num_frames": video.num_frames,
+                "fps": 24,
+                "aspect_ratio": video.aspect_ratio or "16:9",
+                "guidance_scale": video.guidance_scale or 6.0,
+                "seed": video.seed
+            }
+            if video.draft_task_id:
+                # Finalized drafts start from the draft's latents instead of pure noise
+                draft = crud.get_video_by_task_id(db, video.draft_task_id)
+                params["latents_path"] = draft.latents_path if draft else None
+                output_path = await run_in_threadpool(
+                    generator.finalize_draft,
+                    params,
+                    should_cancel=cancel_event.is_set,
+                    output_path=str(VIDEOS_DIR / f"video_{task_id}.mp4")
+                )
+            else:
+                output_path = await run_in_threadpool(
+                    generator.generate_video,
+                    **params,
+                    should_cancel=cancel_event.is_set,
+                    output_path=str(VIDEOS_DIR / f"video_{task_id}.mp4")
+                )
         
         # Update video record
-        output_url = f"/videos/{final_path.name}"
+        output_url = f"/videos/{Path(output_path).name}"
         crud.update_video_status(db, task_id, "completed", 100, output_url=output_url)
         
         logger.info(f"T2V generation completed: {task_id}")
         
     except Exception as e:
-        logger.error(f"T2V processing failed: {e}")
-        crud.update_video_status(db, task_id, "failed", 0, str(e))
+        if cancel_event.is_set():
+            mark_generation_cancelled(db, task_id, refund=False)
+        else:
+            logger.error(f"T2V processing failed: {e}")
+            crud.update_video_status(db, task_id, "failed", 0, str(e))
     finally:
+        cancel_events.pop(task_id, None)
         db.close()
 
 async def process_image_to_video_generation(task_id: str):
     """Process I2V generation in background"""
     db = next(get_db())
+    cancel_event = get_cancel_event(task_id)
     
     try:
         # Update status to processing
@@ -755,30 +979,90 @@ async def process_image_to_video_generation(task_id: str):
             crud.update_video_status(db, task_id, "failed", 0, "Video generator not available")
             return
         
-        # Generate video
-        crud.update_video_status(db, task_id, "processing", 50)
-        
-        output_path = generator.generate_video_from_image(
-            image_path=video.image_path,
-            prompt=video.enhanced_prompt,
-            num_frames=video.num_frames,
-            fps=24
-        )
-        
-        # Move to videos directory
-        final_path = VIDEOS_DIR / f"i2v_{task_id}.mp4"
-        shutil.move(output_path, final_path)
+        # Generate video once a GPU slot is free
+        async with generation_queue.slot(video.priority or PRIORITY_FINAL):
+            if cancel_event.is_set():
+                mark_generation_cancelled(db, task_id, refund=True)
+                return
+            
+            crud.update_video_status(db, task_id, "processing", 50)
+            
+            output_path = await run_in_threadpool(
+                generator.generate_video_from_image,
+                image_path=video.image_path,
+                prompt=video.enhanced_prompt,
+                num_frames=video.num_frames,
+                fps=24,
+                should_cancel=cancel_event.is_set,
+                output_path=str(VIDEOS_DIR / f"i2v_{task_id}.mp4")
+            )
         
         # Update video record
-        output_url = f"/videos/{final_path.name}"
+        output_url = f"/videos/{Path(output_path).name}"
         crud.update_video_status(db, task_id, "completed", 100, output_url=output_url)
         
         logger.info(f"I2V generation completed: {task_id}")
         
     except Exception as e:
-        logger.error(f"I2V processing failed: {e}")
-        crud.update_video_status(db, task_id, "failed", 0, str(e))
+        if cancel_event.is_set():
+            mark_generation_cancelled(db, task_id, refund=False)
+        else:
+            logger.error(f"I2V processing failed: {e}")
+            crud.update_video_status(db, task_id, "failed", 0, str(e))
+    finally:
+        cancel_events.pop(task_id, None)
+        db.close()
+
+async def process_draft_generation(task_id: str):
+    """Process a draft preview in background at draft priority"""
+    db = next(get_db())
+    cancel_event = get_cancel_event(task_id)
+    
+    try:
+        video = crud.update_video_status(db, task_id, "processing", 10)
+        if not video:
+            return
+        
+        generator = get_video_generator()
+        if not generator:
+            crud.update_video_status(db, task_id, "failed", 0, "Video generator not available")
+            return
+        
+        # Drafts wait behind queued full renders
+        async with generation_queue.slot(PRIORITY_DRAFT):
+            if cancel_event.is_set():
+                mark_generation_cancelled(db, task_id, refund=True)
+                return
+            
+            crud.update_video_status(db, task_id, "processing", 50)
+            
+            draft = await run_in_threadpool(
+                generator.generate_draft,
+                prompt=video.enhanced_prompt,
+                num_frames=video.num_frames,
+                fps=24,
+                aspect_ratio=video.aspect_ratio or "16:9",
+                guidance_scale=video.guidance_scale or 6.0,
+                seed=video.seed,
+                should_cancel=cancel_event.is_set,
+                output_path=str(VIDEOS_DIR / f"draft_{task_id}.mp4")
+            )
+        
+        crud.update_video_fields(db, task_id, latents_path=draft["latents_path"])
+        
+        output_url = f"/videos/{Path(draft['video_path']).name}"
+        crud.update_video_status(db, task_id, "completed", 100, output_url=output_url)
+        
+        logger.info(f"Draft generation completed: {task_id}")
+        
+    except Exception as e:
+        if cancel_event.is_set():
+            mark_generation_cancelled(db, task_id, refund=False)
+        else:
+            logger.error(f"Draft processing failed: {e}")
+            crud.update_video_status(db, task_id, "failed", 0, str(e))
     finally:
+        cancel_events.pop(task_id, None)
         db.close()
 
 if __name__ == "__main__":
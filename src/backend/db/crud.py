@@ -202,6 +202,21 @@ def update_video_status(db: Session, task_id: str, status: str, progress: int =
     
     return video
 
+def update_video_fields(db: Session, task_id: str, **fields) -> Optional[Video]:
+    """Update arbitrary columns of a video record"""
+    video = get_video_by_task_id(db, task_id)
+    if not video:
+        return None
+    
+    for key, value in fields.items():
+        setattr(video, key, value)
+    
+    video.updated_at = datetime.utcnow()
+    db.commit()
+    db.refresh(video)
+    
+    return video
+
 # API Key operations
 def create_api_key(db: Session, user_id: int, api_key_data: APIKeyCreate) -> tuple[APIKey, str]:
     """Create new API key"""
@@ -56,11 +56,39 @@ def get_db() -> Generator[Session, None, None]:
     finally:
         db.close()
 
+def upgrade_tables():
+    """
+    Add the columns models gained since their tables were created
+    `create_all` only creates missing tables, so existing databases need e.g. the draft columns of `videos`
+    """
+    from sqlalchemy import inspect, text
+    
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or column.primary_key:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                # Backfill the Python-side default, which the DDL does not carry
+                if column.default is not None and column.default.is_scalar:
+                    conn.execute(table.update().values({column.name: column.default.arg}))
+                added.append(f"{table.name}.{column.name}")
+    if added:
+        logger.info(f"Added database columns: {', '.join(added)}")
+    return added
+
 def create_tables():
     """Create all database tables"""
     try:
         from .models import User, Video, APIKey, CreditTransaction, ModelCache, SystemConfig, AuditLog
         Base.metadata.create_all(bind=engine)
+        upgrade_tables()
         logger.info("Database tables created successfully")
         return True
     except Exception as e:
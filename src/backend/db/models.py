@@ -66,9 +66,16 @@ class Video(Base):
     aspect_ratio = Column(String(10), default="16:9")
     guidance_scale = Column(Float, default=6.0)
     style = Column(String(50))
+    seed = Column(Integer)
+    
+    # Draft preview
+    is_draft = Column(Boolean, default=False)
+    draft_task_id = Column(String(36))  # draft a final render was finalized from
+    latents_path = Column(String(500))
+    priority = Column(Integer, default=0)  # queue tier, lower runs first
     
     # Processing status
-    status = Column(String(20), default="pending")  # pending, processing, completed, failed
+    status = Column(String(20), default="pending")  # pending, processing, completed, failed, cancelled
     progress = Column(Integer, default=0)
     error_message = Column(Text)
     
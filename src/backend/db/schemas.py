@@ -25,6 +25,7 @@ class VideoStatus(str, Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 class TransactionType(str, Enum):
     PURCHASE = "purchase"
@@ -86,6 +87,7 @@ class VideoGenerationRequest(BaseModel):
     num_frames: Optional[int] = Field(97, ge=25, le=500)
     guidance_scale: Optional[float] = Field(6.0, ge=1.0, le=20.0)
     enhance_prompt: Optional[bool] = True
+    seed: Optional[int] = Field(None, ge=0, lt=2**32)
 
 class ImageToVideoRequest(BaseModel):
     prompt: str = Field(..., min_length=10, max_length=1000)
@@ -109,6 +111,9 @@ class VideoResponse(BaseModel):
     output_url: Optional[str]
     duration: Optional[float]
     cost_credits: Optional[float]
+    seed: Optional[int] = None
+    is_draft: Optional[bool] = False
+    draft_task_id: Optional[str] = None
     created_at: datetime
     completed_at: Optional[datetime]
     
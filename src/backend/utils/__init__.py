@@ -8,6 +8,7 @@ from .errors import (
     VideoGenerationError, ModelNotLoadedError, ValidationError,
     get_error_category, create_error_response, require_authentication, require_credits
 )
+from .job_queue import GenerationQueue, PRIORITY_FINAL, PRIORITY_DRAFT
 
 __all__ = [
     # Logging
@@ -17,5 +18,8 @@ __all__ = [
     'CineVividException', 'AuthenticationError', 'AuthorizationError', 'InvalidTokenError',
     'InsufficientCreditsError', 'UserNotFoundError', 'UserAlreadyExistsError',
     'VideoGenerationError', 'ModelNotLoadedError', 'ValidationError',
-    'get_error_category', 'create_error_response', 'require_authentication', 'require_credits'
+    'get_error_category', 'create_error_response', 'require_authentication', 'require_credits',
+
+    # Job queue
+    'GenerationQueue', 'PRIORITY_FINAL', 'PRIORITY_DRAFT'
 ]
\ No newline at end of file
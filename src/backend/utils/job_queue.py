@@ -0,0 +1,70 @@
+"""
+Priority queue for GPU generation jobs in CineVivid
+Jobs wait for a generation slot and are admitted by priority tier, FIFO within a tier
+"""
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import Dict, Any
+
+# Lower values are admitted first
+PRIORITY_FINAL = 0
+PRIORITY_DRAFT = 10
+
+class GenerationQueue:
+    """Admits at most `max_concurrent` generation jobs at a time, highest priority tier first"""
+
+    def __init__(self, max_concurrent: int = 1):
+        if max_concurrent < 1:
+            raise ValueError(f"max_concurrent must be positive, got {max_concurrent}")
+        self.max_concurrent = max_concurrent
+        self._running = 0
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+
+    async def acquire(self, priority: int = PRIORITY_FINAL):
+        """Wait until a generation slot is free and no higher-priority job is waiting"""
+        if self._running < self.max_concurrent and not self._waiters:
+            self._running += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over right before the cancellation, pass it on
+                self.release()
+            raise
+
+    def release(self):
+        """Free a slot and hand it to the highest-priority waiting job"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._running -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_FINAL):
+        """Hold a generation slot for the duration of the block"""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get running and waiting job counts per priority tier"""
+        waiting = {}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                waiting[priority] = waiting.get(priority, 0) + 1
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self._running,
+            "waiting": waiting,
+        }
@@ -0,0 +1,657 @@
+"""
+Benchmarks for the SkyReels-V2 inference stack.
+
+Each subcommand runs a self-contained harness. `batching` drives the continuous batching scheduler with a CPU stub
+transformer whose forward cost is a fixed launch overhead plus a per-sample cost, which is how a batch-1 forward of
+the 1.3B models underutilizes the GPU. `ffn_chunk` measures the peak activation memory and latency of one block's
+feed-forward at a given window size for several chunk sizes. `qkv` times the separate and the fused q/k/v projection
+of one self-attention layer. `progressive` compares the wall time of the standard denoising loop with
+low-resolution-then-refine schedules on a randomly initialized transformer of the given size. `preview` times the
+latent-space preview decoder on a latent clip of the given size. `stages` runs jobs through CPU stub text encoder,
+transformer, VAE and video encoder stages back to back and with the staged executor, and reports stage utilisation.
+`encode` compares the peak RSS and latency of writing a decoded clip with `imageio.mimwrite` against streaming it
+into a `VideoSink` chunk by chunk, each in a fresh process. `cpu` times a randomly initialized transformer of the
+given size on the CPU in float32, bf16, int8 weight-only and int8 GEMM precision, and reports each one's deviation
+from float32. `lora` writes random LoRA adapters for a randomly initialized transformer, then reports the cold load and
+hot swap latency and the memory of each adapter, and the forward latency of the base model, one adapter and a batch
+mixing one adapter per sample. `samplers` integrates one trajectory of a randomly initialized transformer with every
+sampler at several step counts and reports each one's forwards and deviation from a many-step Heun reference.
+`scheduler` times setting up the per-frame UniPC schedulers of diffusion forcing and one UniPC step, with the cached
+sampling plan and with the coefficients computed at every step.
+"""
+import argparse
+import copy
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from skyreels_v2_infer.modules.device import autocast
+from skyreels_v2_infer.modules.device import configure_cpu
+from skyreels_v2_infer.modules.latent_preview import LatentPreviewer
+from skyreels_v2_infer.modules.lora import LoRAManager
+from skyreels_v2_infer.modules.quantization import pack_int8_for_cpu
+from skyreels_v2_infer.modules.quantization import quantize_model
+from skyreels_v2_infer.modules.transformer import WanAttentionBlock
+from skyreels_v2_infer.modules.transformer import WanModel
+from skyreels_v2_infer.modules.transformer import WanSelfAttention
+from skyreels_v2_infer.pipelines import ContinuousBatchScheduler
+from skyreels_v2_infer.pipelines import DenoiseRequest
+from skyreels_v2_infer.pipelines import GuidanceSchedule
+from skyreels_v2_infer.pipelines import ProgressiveSchedule
+from skyreels_v2_infer.pipelines import Stage
+from skyreels_v2_infer.pipelines import StagedExecutor
+from skyreels_v2_infer.pipelines import VideoSink
+from skyreels_v2_infer.scheduler.fm_solvers import build_sampler
+from skyreels_v2_infer.scheduler.fm_solvers import SAMPLERS
+from skyreels_v2_infer.scheduler.fm_solvers_unipc import FlowUniPCMultistepScheduler
+from skyreels_v2_infer.scheduler.fm_solvers_unipc import sampling_plan
+
+
+class StubTransformer(torch.nn.Module):
+    """Stands in for `WanModel`: same `(x, t, context)` forward, simulated cost, no weights to download."""
+
+    def __init__(self, launch_ms: float, sample_ms: float):
+        super().__init__()
+        self.launch_ms = launch_ms
+        self.sample_ms = sample_ms
+        self.step_cache = None
+        self.batch_sizes = []
+
+    @property
+    def dtype(self):
+        return torch.float32
+
+    def forward(self, x, t, context):
+        self.batch_sizes.append(x.shape[0])
+        time.sleep((self.launch_ms + self.sample_ms * x.shape[0]) / 1000)
+        return x * (1 - t.view(-1, 1, 1, 1, 1) / 1000) + context.mean() * 0
+
+
+def benchmark_batching(args):
+    latent_shape = (16, (args.num_frames - 1) // 4 + 1, args.height // 8, args.width // 8)
+    rng = random.Random(args.seed)
+    arrivals = []
+    now = 0.0
+    for _ in range(args.num_requests):
+        now += rng.expovariate(args.arrival_rate) if args.arrival_rate > 0 else 0.0
+        arrivals.append(now)
+
+    print(f"{'max_batch':>9} {'max_active':>10} {'req/s':>8} {'mean s':>8} {'p50 s':>8} {'p95 s':>8} {'avg bs':>7}")
+    for max_batch_size in args.max_batch_sizes:
+        transformer = StubTransformer(args.launch_ms, args.sample_ms)
+        scheduler = ContinuousBatchScheduler(
+            transformer, max_batch_size=max_batch_size, max_active=args.max_active, device="cpu"
+        )
+        pending = list(enumerate(arrivals))
+        start = time.perf_counter()
+        while pending or scheduler.has_work():
+            elapsed = time.perf_counter() - start
+            while pending and pending[0][1] <= elapsed:
+                i, _ = pending.pop(0)
+                scheduler.submit(
+                    DenoiseRequest(
+                        str(i),
+                        torch.randn(latent_shape),
+                        torch.randn(1, 512, 8),
+                        torch.randn(1, 512, 8),
+                        num_inference_steps=args.inference_steps,
+                        guidance_schedule=GuidanceSchedule(args.guidance_scale),
+                    )
+                )
+            if scheduler.has_work():
+                scheduler.step()
+            elif pending:
+                time.sleep(max(0.0, pending[0][1] - elapsed))
+        total = time.perf_counter() - start
+
+        latencies = np.array([r.finish_time - r.submit_time for r in scheduler.finished.values()])
+        print(
+            f"{max_batch_size:>9} {scheduler.max_active:>10} {args.num_requests / total:>8.2f} "
+            f"{latencies.mean():>8.2f} {np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f} "
+            f"{np.mean(transformer.batch_sizes):>7.2f}"
+        )
+
+
+def benchmark_ffn_chunk(args):
+    device = torch.device(args.device)
+    seq_len = ((args.base_num_frames - 1) // 4 + 1) * (args.height // 16) * (args.width // 16)
+    block = WanAttentionBlock("t2v_cross_attn", args.dim, args.ffn_dim, args.num_heads).to(device, torch.bfloat16)
+    x = torch.randn(1, seq_len, args.dim, device=device)
+    modulation = torch.randn(1, 6, args.dim, device=device)
+    e = (block.modulation.float() + modulation).chunk(6, dim=1)
+    print(f"sequence length: {seq_len}")
+
+    reference = None
+    print(f"{'chunk':>8} {'peak MiB':>9} {'ms':>8} {'max diff':>9}")
+    with torch.no_grad():
+        for chunk_size in [None] + args.chunk_sizes:
+            block.set_ffn_chunk_size(chunk_size)
+            block.ffn_forward(x.clone(), e, torch.bfloat16)  # warm up compiled kernels
+            inp = x.clone()
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+                torch.cuda.reset_peak_memory_stats()
+                baseline = torch.cuda.memory_allocated()
+            start = time.perf_counter()
+            out = block.ffn_forward(inp, e, torch.bfloat16)
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+                peak = f"{(torch.cuda.max_memory_allocated() - baseline) / 2**20:>9.0f}"
+            else:
+                peak = f"{'n/a':>9}"
+            elapsed = (time.perf_counter() - start) * 1000
+            if reference is None:
+                reference = out.clone()
+            diff = (out - reference).abs().max().item()
+            print(f"{str(chunk_size):>8} {peak} {elapsed:>8.1f} {diff:>9.2e}")
+
+
+def benchmark_qkv(args):
+    device = torch.device(args.device)
+    dtype = torch.bfloat16 if args.bf16 else torch.float32
+    attn = WanSelfAttention(args.dim, args.num_heads).to(device, dtype).eval()
+    x = torch.randn(1, args.seq_len, args.dim, device=device, dtype=dtype)
+
+    def timed():
+        for _ in range(args.warmup):
+            attn.qkv_fn(x)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            out = attn.qkv_fn(x)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        return (time.perf_counter() - start) * 1000 / args.repeats, out
+
+    with torch.no_grad():
+        separate_ms, reference = timed()
+        attn.fuse_qkv()
+        fused_ms, fused = timed()
+    diff = max((a.float() - b.float()).abs().max().item() for a, b in zip(reference, fused))
+    print(f"separate: {separate_ms:.2f} ms  fused: {fused_ms:.2f} ms  speedup: {separate_ms / fused_ms:.2f}x")
+    print(f"max diff: {diff:.2e}")
+
+
+def benchmark_progressive(args):
+    device = torch.device(args.device)
+    model = WanModel(
+        dim=args.dim, ffn_dim=args.ffn_dim, num_heads=args.num_heads, num_layers=args.num_layers, text_dim=args.text_dim
+    )
+    model = model.to(device, torch.bfloat16).eval()
+    shape = (16, (args.num_frames - 1) // 4 + 1, args.height // 8, args.width // 8)
+    context = torch.randn(1, 512, args.text_dim, device=device, dtype=torch.bfloat16)
+
+    def denoise(progressive):
+        generator = torch.Generator(device).manual_seed(args.seed)
+        scheduler = FlowUniPCMultistepScheduler()
+        scheduler.set_timesteps(args.inference_steps, device=device, shift=args.shift)
+        if progressive is not None:
+            latents = progressive.sample_noise(shape, device=device, generator=generator)
+        else:
+            latents = torch.randn(shape, device=device, generator=generator)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for i, t in enumerate(scheduler.timesteps):
+            if progressive is not None and progressive.is_switch_step(i):
+                latents = progressive.refine(scheduler, latents, shape[2:], generator)
+            noise_pred = model(latents.unsqueeze(0), t=torch.stack([t]), context=context)[0]
+            latents = scheduler.step(
+                noise_pred.unsqueeze(0), t, latents.unsqueeze(0), return_dict=False, generator=generator
+            )[0].squeeze(0)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        return time.perf_counter() - start
+
+    with torch.autocast(device_type=device.type, dtype=torch.bfloat16), torch.no_grad():
+        denoise(ProgressiveSchedule(args.inference_steps - 1, scale=args.scale))  # warm up both resolutions
+        baseline = denoise(None)
+        print(f"latent shape: {shape}, low-resolution grid: {ProgressiveSchedule(1, args.scale).low_res_size(shape[2:])}")
+        print(f"{'low-res steps':>13} {'s':>8} {'speedup':>8}")
+        print(f"{0:>13} {baseline:>8.2f} {1.0:>8.2f}")
+        for low_res_steps in args.low_res_steps:
+            elapsed = denoise(ProgressiveSchedule(low_res_steps, scale=args.scale))
+            print(f"{low_res_steps:>13} {elapsed:>8.2f} {baseline / elapsed:>8.2f}")
+
+
+def benchmark_preview(args):
+    device = torch.device(args.device)
+    latents = torch.randn(16, (args.num_frames - 1) // 4 + 1, args.height // 8, args.width // 8, device=device)
+    previewer = LatentPreviewer(
+        torch.randn(3 * args.upscale**2, 16) * 0.05, torch.zeros(3 * args.upscale**2), upscale=args.upscale
+    ).to(device)
+    for _ in range(args.warmup):
+        previewer(latents)
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        frames = previewer(latents)
+    elapsed = (time.perf_counter() - start) * 1000 / args.repeats
+    print(f"latent shape: {tuple(latents.shape)}, preview shape: {frames.shape}, {elapsed:.2f} ms per preview")
+
+
+def benchmark_stages(args):
+    durations = {
+        "text_encoder": args.encode_ms,
+        "transformer": args.denoise_ms,
+        "vae": args.decode_ms,
+        "video_encoder": args.export_ms,
+    }
+
+    def stub(ms):
+        def run(payload):
+            time.sleep(ms / 1000)
+            return payload
+
+        return run
+
+    start = time.perf_counter()
+    for i in range(args.num_jobs):
+        for ms in durations.values():
+            stub(ms)(i)
+    sequential = time.perf_counter() - start
+
+    stages = [Stage(name, stub(ms), queue_size=args.queue_size) for name, ms in durations.items()]
+    with StagedExecutor(stages) as executor:
+        executor.map({f"job-{i}": i for i in range(args.num_jobs)})
+    stats = executor.get_stats()
+
+    print(f"{args.num_jobs} jobs, sequential: {sequential:.2f} s, staged: {stats['elapsed_s']:.2f} s, "
+          f"speedup: {sequential / stats['elapsed_s']:.2f}")
+    print(f"{'stage':>14} {'jobs':>5} {'busy s':>8} {'blocked s':>10} {'utilisation':>12}")
+    for name, stage in stats["stages"].items():
+        print(f"{name:>14} {stage['jobs']:>5} {stage['busy_s']:>8.2f} {stage['blocked_s']:>10.2f} "
+              f"{stage['utilisation']:>12.2f}")
+
+
+def _encode_clip(mode, args, path, results):
+    def decoded_chunk(start):
+        # stands in for the VAE output: float frames in [0, 1]
+        length = min(args.chunk_size, args.num_frames - start)
+        rng = np.random.default_rng(start)
+        return rng.random((length, args.height, args.width, 3), dtype=np.float32)
+
+    start_time = time.perf_counter()
+    if mode == "mimwrite":
+        import imageio
+
+        frames = np.concatenate([decoded_chunk(i) for i in range(0, args.num_frames, args.chunk_size)])
+        frames = (frames * 255).round().astype(np.uint8)
+        imageio.mimwrite(path, frames, fps=24, quality=8, output_params=["-loglevel", "error"])
+    else:
+        with VideoSink(path, fps=24, crf=args.crf, preset=args.preset) as sink:
+            for i in range(0, args.num_frames, args.chunk_size):
+                sink.write(decoded_chunk(i))
+    elapsed = time.perf_counter() - start_time
+    # ru_maxrss is in KiB on Linux
+    results.put((mode, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def benchmark_encode(args):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    print(f"{args.num_frames} frames at {args.height}x{args.width}")
+    print(f"{'writer':>9} {'s':>8} {'peak RSS MiB':>13}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for mode in ("mimwrite", "sink"):
+            process = context.Process(
+                target=_encode_clip, args=(mode, args, os.path.join(tmp_dir, f"{mode}.mp4"), results)
+            )
+            process.start()
+            process.join()
+            mode, elapsed, peak = results.get()
+            print(f"{mode:>9} {elapsed:>8.2f} {peak:>13.0f}")
+
+
+def benchmark_cpu(args):
+    num_threads = configure_cpu(args.threads, args.cpu_affinity, args.numa_node)
+    torch.manual_seed(args.seed)
+    model = WanModel(
+        dim=args.dim, ffn_dim=args.ffn_dim, num_heads=args.num_heads, num_layers=args.num_layers, text_dim=args.text_dim
+    ).eval()
+    shape = (16, (args.num_frames - 1) // 4 + 1, args.height // 8, args.width // 8)
+    latents = torch.randn(1, *shape)
+    t = torch.tensor([500.0])
+    context = torch.randn(1, 512, args.text_dim)
+    print(f"{num_threads} threads, latent shape: {shape}, sequence length: {shape[1] * shape[2] * shape[3] // 4}")
+
+    def bf16():
+        return copy.deepcopy(model).to(torch.bfloat16)
+
+    def int8():
+        variant = bf16()
+        quantize_model(variant, "int8")
+        return variant
+
+    def int8_gemm():
+        variant = int8()
+        if pack_int8_for_cpu(variant) == 0:
+            return None
+        return variant
+
+    variants = {"float32": lambda: model, "bf16": bf16, "int8": int8, "int8 gemm": int8_gemm}
+    reference = None
+    print(f"{'precision':>10} {'s/step':>8} {'rel. error':>11}")
+    for name, build in variants.items():
+        variant = build()
+        if variant is None:
+            print(f"{name:>10} {'n/a':>8} {'n/a':>11}")
+            continue
+        dtype = variant.dtype
+        with autocast("cpu", dtype), torch.no_grad():
+            for _ in range(args.warmup):
+                variant(latents, t=t, context=context.to(dtype))
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                out = variant(latents, t=t, context=context.to(dtype))[0].float()
+        elapsed = (time.perf_counter() - start) / args.repeats
+        if reference is None:
+            reference = out
+        error = ((out - reference).norm() / reference.norm()).item()
+        print(f"{name:>10} {elapsed:>8.2f} {error:>11.2e}")
+        del variant
+
+
+def _write_lora(model, path, rank, seed):
+    from safetensors.torch import save_file
+
+    generator = torch.Generator().manual_seed(seed)
+    tensors = {}
+    for name, module in model.named_modules():
+        if name.startswith("blocks.") and isinstance(module, torch.nn.Linear):
+            down = torch.randn(rank, module.in_features, generator=generator) / module.in_features**0.5
+            tensors[f"diffusion_model.{name}.lora_A.weight"] = down
+            tensors[f"diffusion_model.{name}.lora_B.weight"] = torch.randn(module.out_features, rank) * 0.01
+            tensors[f"diffusion_model.{name}.alpha"] = torch.tensor(float(rank))
+    save_file(tensors, path)
+
+
+def benchmark_lora(args):
+    device = torch.device(args.device)
+    dtype = torch.bfloat16 if args.bf16 else torch.float32
+    torch.manual_seed(args.seed)
+    model = WanModel(
+        dim=args.dim, ffn_dim=args.ffn_dim, num_heads=args.num_heads, num_layers=args.num_layers, text_dim=args.text_dim
+    ).eval()
+    shape = (16, (args.num_frames - 1) // 4 + 1, args.height // 8, args.width // 8)
+
+    with tempfile.TemporaryDirectory() as lora_dir:
+        names = [f"adapter_{i}" for i in range(args.num_adapters)]
+        for i, name in enumerate(names):
+            _write_lora(model, os.path.join(lora_dir, f"{name}.safetensors"), args.rank, args.seed + i)
+        model.to(device, dtype)
+        manager = LoRAManager(model, lora_dir, max_adapters=args.max_adapters)
+        for name in names:
+            manager.load(name)
+        cold = manager.stats()
+        for name in names[-args.max_adapters :]:
+            with manager.use(name):
+                pass
+        warm = manager.stats()
+
+        print(f"rank {args.rank}, {args.num_adapters} adapters, {args.max_adapters} resident")
+        print(f"cold load: {cold['mean_load_ms']:.1f} ms  hot swap: {warm['mean_swap_ms']:.3f} ms")
+        print(f"evictions: {warm['evictions']}  resident memory: {warm['memory_mb']:.1f} MB")
+        for adapter in warm["adapters"]:
+            print(f"{adapter['name']:>12} {adapter['layers']:>5} layers {adapter['memory_mb']:>8.1f} MB")
+
+        batch = args.batch_size
+        latents = torch.randn(batch, *shape, device=device)
+        t = torch.full((batch,), 500.0, device=device)
+        context = torch.randn(batch, 512, args.text_dim, device=device, dtype=dtype)
+        resident = list(manager.adapters)
+        selections = {
+            "base": None,
+            "one adapter": resident[0],
+            "mixed": [resident[i % len(resident)] for i in range(batch)],
+        }
+        print(f"{'batch of ' + str(batch):>12} {'s/step':>8}")
+        with autocast(device, dtype), torch.no_grad():
+            for label, selection in selections.items():
+                with manager.use(selection):
+                    for _ in range(args.warmup):
+                        model(latents, t=t, context=context)
+                    if device.type == "cuda":
+                        torch.cuda.synchronize()
+                    start = time.perf_counter()
+                    for _ in range(args.repeats):
+                        model(latents, t=t, context=context)
+                    if device.type == "cuda":
+                        torch.cuda.synchronize()
+                print(f"{label:>12} {(time.perf_counter() - start) / args.repeats:>8.3f}")
+
+
+def benchmark_samplers(args):
+    device = torch.device(args.device)
+    torch.manual_seed(args.seed)
+    model = WanModel(
+        dim=args.dim, ffn_dim=args.ffn_dim, num_heads=args.num_heads, num_layers=args.num_layers, text_dim=args.text_dim
+    )
+    model = model.to(device).eval()
+    shape = (16, (args.num_frames - 1) // 4 + 1, args.height // 8, args.width // 8)
+    generator = torch.Generator(device).manual_seed(args.seed)
+    noise = torch.randn(shape, device=device, generator=generator)
+    context = torch.randn(1, 512, args.text_dim, device=device, generator=generator)
+
+    def sample(name, steps):
+        scheduler = build_sampler(name)
+        scheduler.set_timesteps(steps, device=device, shift=args.shift)
+        latents = noise
+        for t in scheduler.timesteps:
+            noise_pred = model(latents.unsqueeze(0), t=torch.stack([t]), context=context)[0]
+            latents = scheduler.step(noise_pred.unsqueeze(0), t, latents.unsqueeze(0), return_dict=False)[0].squeeze(0)
+        return latents, len(scheduler.timesteps)
+
+    with torch.no_grad():
+        reference, _ = sample("heun", args.reference_steps)
+        print(f"latent shape: {shape}, reference: heun with {args.reference_steps} steps")
+        print(f"{'sampler':>9} {'steps':>6} {'forwards':>9} {'rel. error':>11}")
+        for name in args.samplers:
+            fewest = None
+            for steps in args.steps:
+                latents, forwards = sample(name, steps)
+                error = ((latents - reference).norm() / reference.norm()).item()
+                if error <= args.tolerance and fewest is None:
+                    fewest = forwards
+                print(f"{name:>9} {steps:>6} {forwards:>9} {error:>11.2e}")
+            print(f"{name:>9} fewest forwards within {args.tolerance:.0e}: {fewest if fewest is not None else 'n/a'}")
+
+
+def benchmark_scheduler(args):
+    device = torch.device(args.device)
+    shape = (1, 16, (args.num_frames - 1) // 4 + 1, args.height // 8, args.width // 8)
+    latents = torch.randn(shape, device=device)
+
+    def setup():
+        start = time.perf_counter()
+        schedulers = []
+        for _ in range(args.num_schedulers):
+            scheduler = FlowUniPCMultistepScheduler()
+            scheduler.set_timesteps(args.inference_steps, device=device, shift=args.shift)
+            scheduler.set_begin_index(0)
+            schedulers.append(scheduler)
+        return schedulers, time.perf_counter() - start
+
+    def denoise(scheduler):
+        sample = latents
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for t in scheduler.timesteps:
+            sample = scheduler.step(sample * 0.5, t, sample, return_dict=False)[0]
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        return (time.perf_counter() - start) / len(scheduler.timesteps)
+
+    sampling_plan.cache_clear()
+    schedulers, cold = setup()
+    _, warm = setup()
+    print(f"latent shape: {shape}, {args.num_schedulers} schedulers of {args.inference_steps} steps")
+    print(f"scheduler setup: {1000 * cold:.2f} ms building the plan, {1000 * warm:.2f} ms with the plan cached")
+    denoise(schedulers[0])  # warm up
+    per_step = FlowUniPCMultistepScheduler(use_sampling_plan=False)
+    per_step.set_timesteps(args.inference_steps, device=device, shift=args.shift)
+    per_step.set_begin_index(0)
+    print(f"{'coefficients':>12} {'ms/step':>8}")
+    for label, scheduler in [("per step", per_step), ("plan", schedulers[1])]:
+        print(f"{label:>12} {1000 * denoise(scheduler):>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batching = subparsers.add_parser("batching", help="Continuous batching throughput and latency on a stub model")
+    batching.add_argument("--num_requests", type=int, default=16)
+    batching.add_argument("--arrival_rate", type=float, default=2.0, help="Poisson arrivals per second, 0 for a burst")
+    batching.add_argument("--max_batch_sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    batching.add_argument("--max_active", type=int, default=None)
+    batching.add_argument("--inference_steps", type=int, default=10)
+    batching.add_argument("--guidance_scale", type=float, default=6.0)
+    batching.add_argument("--num_frames", type=int, default=9)
+    batching.add_argument("--height", type=int, default=64)
+    batching.add_argument("--width", type=int, default=64)
+    batching.add_argument("--launch_ms", type=float, default=40.0, help="Simulated fixed cost per forward")
+    batching.add_argument("--sample_ms", type=float, default=10.0, help="Simulated cost per sample in a forward")
+    batching.add_argument("--seed", type=int, default=0)
+    batching.set_defaults(func=benchmark_batching)
+
+    ffn_chunk = subparsers.add_parser("ffn_chunk", help="Peak memory of the chunked feed-forward for one block")
+    ffn_chunk.add_argument("--dim", type=int, default=5120)
+    ffn_chunk.add_argument("--ffn_dim", type=int, default=13824)
+    ffn_chunk.add_argument("--num_heads", type=int, default=40)
+    ffn_chunk.add_argument("--base_num_frames", type=int, default=97)
+    ffn_chunk.add_argument("--height", type=int, default=544)
+    ffn_chunk.add_argument("--width", type=int, default=960)
+    ffn_chunk.add_argument("--chunk_sizes", type=int, nargs="+", default=[16384, 8192, 4096])
+    ffn_chunk.add_argument("--device", type=str, default="cuda")
+    ffn_chunk.set_defaults(func=benchmark_ffn_chunk)
+
+    qkv = subparsers.add_parser("qkv", help="Separate vs fused q/k/v projection of one self-attention layer")
+    qkv.add_argument("--dim", type=int, default=1536)
+    qkv.add_argument("--num_heads", type=int, default=12)
+    qkv.add_argument("--seq_len", type=int, default=4096)
+    qkv.add_argument("--repeats", type=int, default=10)
+    qkv.add_argument("--warmup", type=int, default=2)
+    qkv.add_argument("--bf16", action="store_true")
+    qkv.add_argument("--device", type=str, default="cpu")
+    qkv.set_defaults(func=benchmark_qkv)
+
+    progressive = subparsers.add_parser("progressive", help="Low-resolution-then-refine vs standard sampling")
+    progressive.add_argument("--dim", type=int, default=1536)
+    progressive.add_argument("--ffn_dim", type=int, default=8960)
+    progressive.add_argument("--num_heads", type=int, default=12)
+    progressive.add_argument("--num_layers", type=int, default=30)
+    progressive.add_argument("--text_dim", type=int, default=4096)
+    progressive.add_argument("--num_frames", type=int, default=97)
+    progressive.add_argument("--height", type=int, default=544)
+    progressive.add_argument("--width", type=int, default=960)
+    progressive.add_argument("--inference_steps", type=int, default=30)
+    progressive.add_argument("--shift", type=float, default=8.0)
+    progressive.add_argument("--low_res_steps", type=int, nargs="+", default=[10, 15, 20])
+    progressive.add_argument("--scale", type=float, default=0.5)
+    progressive.add_argument("--seed", type=int, default=0)
+    progressive.add_argument("--device", type=str, default="cuda")
+    progressive.set_defaults(func=benchmark_progressive)
+
+    preview = subparsers.add_parser("preview", help="Latency of the latent-space preview decoder")
+    preview.add_argument("--num_frames", type=int, default=97)
+    preview.add_argument("--height", type=int, default=544)
+    preview.add_argument("--width", type=int, default=960)
+    preview.add_argument("--upscale", type=int, default=1)
+    preview.add_argument("--repeats", type=int, default=20)
+    preview.add_argument("--warmup", type=int, default=2)
+    preview.add_argument("--device", type=str, default="cuda")
+    preview.set_defaults(func=benchmark_preview)
+
+    stages = subparsers.add_parser("stages", help="Cross-job stage pipelining on CPU stub stages")
+    stages.add_argument("--num_jobs", type=int, default=8)
+    stages.add_argument("--encode_ms", type=float, default=50.0)
+    stages.add_argument("--denoise_ms", type=float, default=400.0)
+    stages.add_argument("--decode_ms", type=float, default=150.0)
+    stages.add_argument("--export_ms", type=float, default=100.0)
+    stages.add_argument("--queue_size", type=int, default=1)
+    stages.set_defaults(func=benchmark_stages)
+
+    encode = subparsers.add_parser("encode", help="Peak RSS and latency of whole-clip vs streaming video encoding")
+    encode.add_argument("--num_frames", type=int, default=97)
+    encode.add_argument("--height", type=int, default=544)
+    encode.add_argument("--width", type=int, default=960)
+    encode.add_argument("--chunk_size", type=int, default=8, help="Frames produced per decode chunk")
+    encode.add_argument("--crf", type=int, default=18)
+    encode.add_argument("--preset", type=str, default="medium")
+    encode.set_defaults(func=benchmark_encode)
+
+    cpu = subparsers.add_parser("cpu", help="Transformer forward latency and error on the CPU per precision")
+    cpu.add_argument("--dim", type=int, default=1536)
+    cpu.add_argument("--ffn_dim", type=int, default=8960)
+    cpu.add_argument("--num_heads", type=int, default=12)
+    cpu.add_argument("--num_layers", type=int, default=30)
+    cpu.add_argument("--text_dim", type=int, default=4096)
+    cpu.add_argument("--num_frames", type=int, default=17)
+    cpu.add_argument("--height", type=int, default=272)
+    cpu.add_argument("--width", type=int, default=480)
+    cpu.add_argument("--repeats", type=int, default=3)
+    cpu.add_argument("--warmup", type=int, default=1)
+    cpu.add_argument("--threads", type=int, default=None)
+    cpu.add_argument("--cpu_affinity", type=str, default=None, help="CPUs to pin to, e.g. `0-31`")
+    cpu.add_argument("--numa_node", type=int, default=None, help="NUMA node whose cores to pin to")
+    cpu.add_argument("--seed", type=int, default=0)
+    cpu.set_defaults(func=benchmark_cpu)
+
+    lora = subparsers.add_parser("lora", help="LoRA adapter load, swap and mixed-batch forward latency")
+    lora.add_argument("--dim", type=int, default=1536)
+    lora.add_argument("--ffn_dim", type=int, default=8960)
+    lora.add_argument("--num_heads", type=int, default=12)
+    lora.add_argument("--num_layers", type=int, default=30)
+    lora.add_argument("--text_dim", type=int, default=4096)
+    lora.add_argument("--num_frames", type=int, default=17)
+    lora.add_argument("--height", type=int, default=272)
+    lora.add_argument("--width", type=int, default=480)
+    lora.add_argument("--rank", type=int, default=32)
+    lora.add_argument("--num_adapters", type=int, default=6)
+    lora.add_argument("--max_adapters", type=int, default=4)
+    lora.add_argument("--batch_size", type=int, default=4)
+    lora.add_argument("--repeats", type=int, default=3)
+    lora.add_argument("--warmup", type=int, default=1)
+    lora.add_argument("--bf16", action="store_true")
+    lora.add_argument("--seed", type=int, default=0)
+    lora.add_argument("--device", type=str, default="cuda")
+    lora.set_defaults(func=benchmark_lora)
+
+    samplers = subparsers.add_parser("samplers", help="Deviation from a reference trajectory per sampler and steps")
+    samplers.add_argument("--dim", type=int, default=256)
+    samplers.add_argument("--ffn_dim", type=int, default=1024)
+    samplers.add_argument("--num_heads", type=int, default=4)
+    samplers.add_argument("--num_layers", type=int, default=4)
+    samplers.add_argument("--text_dim", type=int, default=4096)
+    samplers.add_argument("--num_frames", type=int, default=17)
+    samplers.add_argument("--height", type=int, default=128)
+    samplers.add_argument("--width", type=int, default=128)
+    samplers.add_argument("--samplers", type=str, nargs="+", default=SAMPLERS, choices=SAMPLERS)
+    samplers.add_argument("--steps", type=int, nargs="+", default=[5, 10, 15, 20, 30, 50])
+    samplers.add_argument("--reference_steps", type=int, default=200)
+    samplers.add_argument("--tolerance", type=float, default=1e-2)
+    samplers.add_argument("--shift", type=float, default=8.0)
+    samplers.add_argument("--seed", type=int, default=0)
+    samplers.add_argument("--device", type=str, default="cuda")
+    samplers.set_defaults(func=benchmark_samplers)
+
+    scheduler = subparsers.add_parser("scheduler", help="UniPC setup and step latency with and without sampling plans")
+    scheduler.add_argument("--num_frames", type=int, default=97)
+    scheduler.add_argument("--height", type=int, default=544)
+    scheduler.add_argument("--width", type=int, default=960)
+    scheduler.add_argument("--inference_steps", type=int, default=30)
+    scheduler.add_argument("--shift", type=float, default=8.0)
+    scheduler.add_argument("--num_schedulers", type=int, default=25, help="Per-frame schedulers, at least 2")
+    scheduler.add_argument("--device", type=str, default="cuda")
+    scheduler.set_defaults(func=benchmark_scheduler)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,65 @@
+import argparse
+import os
+
+import imageio
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from skyreels_v2_infer.modules import download_model
+from skyreels_v2_infer.modules import get_vae
+from skyreels_v2_infer.modules.latent_preview import fit_latent_previewer
+from skyreels_v2_infer.modules.latent_preview import latent_frame_targets
+from skyreels_v2_infer.modules.latent_preview import LATENT_PREVIEW_CONFIG_NAME
+
+
+def load_video(path, num_frames, height, width):
+    frames = np.stack(imageio.mimread(path, memtest=False)[:num_frames])
+    video = torch.from_numpy(frames).permute(3, 0, 1, 2).float() / 127.5 - 1.0  # [3, T, H, W]
+    video = F.interpolate(video.transpose(0, 1), size=(height, width), mode="bilinear", align_corners=False)
+    num_frames = (video.shape[0] - 1) // 4 * 4 + 1
+    return video[:num_frames].transpose(0, 1).clamp(-1, 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fit the latent preview projection of a checkpoint's VAE and write it beside its weights."
+    )
+    parser.add_argument("--model_id", type=str, default="Skywork/SkyReels-V2-T2V-14B-540P")
+    parser.add_argument("--videos", type=str, nargs="+", required=True, help="Sample clips to encode")
+    parser.add_argument("--resolution", type=str, default="540P", choices=["540P", "720P"])
+    parser.add_argument("--num_frames", type=int, default=33)
+    parser.add_argument("--upscale", type=int, default=1, help="RGB pixels per latent position along each axis")
+    parser.add_argument("--output", type=str, default=None, help=f"Defaults to <model_dir>/{LATENT_PREVIEW_CONFIG_NAME}")
+    args = parser.parse_args()
+
+    args.model_id = download_model(args.model_id)
+    print("model_id:", args.model_id)
+
+    if args.resolution == "540P":
+        height, width = 544, 960
+    else:
+        height, width = 720, 1280
+
+    vae = get_vae(os.path.join(args.model_id, "Wan2.1_VAE.pth"), "cuda", weight_dtype=torch.float32)
+    latents, videos = [], []
+    for path in args.videos:
+        print(f"encoding: {path}")
+        video = load_video(path, args.num_frames, height, width)
+        with torch.no_grad():
+            latents.append(vae.encode(video.unsqueeze(0).cuda())[0])
+        videos.append(video)
+
+    previewer = fit_latent_previewer(latents, videos, upscale=args.upscale)
+    errors = []
+    for z, video in zip(latents, videos):
+        preview = previewer.decode(z).cpu()
+        target = latent_frame_targets(video, z.shape[1]).transpose(0, 1)
+        target = F.interpolate(target, size=preview.shape[-2:], mode="area").transpose(0, 1)
+        errors.append((preview - target).abs().mean())
+    error = torch.stack(errors).mean()
+    print(f"mean absolute preview error: {error.item():.4f}")
+
+    output_path = args.output or os.path.join(args.model_id, LATENT_PREVIEW_CONFIG_NAME)
+    previewer.save(output_path)
+    print(f"saved latent preview config to {output_path}")
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+
+import torch
+from diffusers.utils import load_image
+
+from skyreels_v2_infer import DiffusionForcingPipeline
+from skyreels_v2_infer.modules import download_model
+from skyreels_v2_infer.modules.step_cache import STEP_CACHE_CONFIG_NAME
+from skyreels_v2_infer.modules.step_cache import StepCacheCalibrator
+from skyreels_v2_infer.pipelines import Image2VideoPipeline
+from skyreels_v2_infer.pipelines import resizecrop
+from skyreels_v2_infer.pipelines import Text2VideoPipeline
+
+DEFAULT_PROMPTS = [
+    "A serene lake surrounded by towering mountains, with a few swans gracefully gliding across the water and sunlight dancing on the surface.",
+    "A woman in a leather jacket riding a vintage motorcycle through a desert highway at sunset.",
+    "A close-up of a chef slicing vegetables on a wooden board in a busy restaurant kitchen.",
+    "A drone shot flying over a neon-lit city street at night during light rain.",
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fit teacache coefficients for a checkpoint and write them beside its weights."
+    )
+    parser.add_argument("--model_id", type=str, default="Skywork/SkyReels-V2-DF-1.3B-540P")
+    parser.add_argument("--resolution", type=str, default="540P", choices=["540P", "720P"])
+    parser.add_argument("--num_frames", type=int, default=33)
+    parser.add_argument("--image", type=str, default=None, help="Conditioning image, required for I2V checkpoints")
+    parser.add_argument("--guidance_scale", type=float, default=6.0)
+    parser.add_argument("--shift", type=float, default=8.0)
+    parser.add_argument("--inference_steps", type=int, default=30)
+    parser.add_argument("--prompts_file", type=str, default=None, help="Text file with one prompt per line")
+    parser.add_argument("--num_prompts", type=int, default=4)
+    parser.add_argument("--degree", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--offload", action="store_true")
+    parser.add_argument("--output", type=str, default=None, help=f"Defaults to <model_dir>/{STEP_CACHE_CONFIG_NAME}")
+    args = parser.parse_args()
+
+    args.model_id = download_model(args.model_id)
+    print("model_id:", args.model_id)
+
+    if args.resolution == "540P":
+        height, width = 544, 960
+    else:
+        height, width = 720, 1280
+
+    prompts = DEFAULT_PROMPTS
+    if args.prompts_file:
+        with open(args.prompts_file) as f:
+            prompts = [line.strip() for line in f if line.strip()]
+    prompts = prompts[: args.num_prompts]
+
+    kwargs = {
+        "negative_prompt": "",
+        "num_frames": args.num_frames,
+        "num_inference_steps": args.inference_steps,
+        "guidance_scale": args.guidance_scale,
+        "shift": args.shift,
+        "height": height,
+        "width": width,
+    }
+    if "DF" in args.model_id:
+        pipe = DiffusionForcingPipeline(args.model_id, dit_path=args.model_id, offload=args.offload)
+        kwargs["base_num_frames"] = args.num_frames
+        kwargs["ar_step"] = 0
+    elif "I2V" in args.model_id:
+        assert args.image is not None, "I2V checkpoints need `--image` for calibration"
+        pipe = Image2VideoPipeline(model_path=args.model_id, dit_path=args.model_id, offload=args.offload)
+        kwargs["image"] = resizecrop(load_image(args.image).convert("RGB"), height, width)
+    else:
+        pipe = Text2VideoPipeline(model_path=args.model_id, dit_path=args.model_id, offload=args.offload)
+
+    calibrator = StepCacheCalibrator(num_steps=args.inference_steps * 2)
+    pipe.transformer.step_cache = calibrator
+    for prompt in prompts:
+        print(f"calibrating on: {prompt[:80]}")
+        calibrator.reset()
+        with torch.cuda.amp.autocast(dtype=pipe.transformer.dtype), torch.no_grad():
+            pipe(prompt=prompt, generator=torch.Generator(device="cuda").manual_seed(args.seed), **kwargs)
+
+    coefficients = calibrator.fit(args.degree)
+    print(f"fitted coefficients: {coefficients}")
+
+    output_path = args.output or os.path.join(args.model_id, STEP_CACHE_CONFIG_NAME)
+    config = {}
+    if os.path.exists(output_path):
+        with open(output_path) as f:
+            config = json.load(f)
+    config["teacache"] = {
+        **coefficients,
+        "resolution": args.resolution,
+        "inference_steps": args.inference_steps,
+        "num_prompts": len(prompts),
+    }
+    with open(output_path, "w") as f:
+        json.dump(config, f, indent=2)
+    print(f"saved step cache config to {output_path}")
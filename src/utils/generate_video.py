@@ -1,5 +1,7 @@
 import argparse
+import contextlib
 import gc
+import json
 import os
 import random
 import time
@@ -8,11 +10,26 @@ import imageio
 import torch
 from diffusers.utils import load_image
 
+from skyreels_v2_infer.distributed.shared_loading import report_cold_start
+from skyreels_v2_infer.distributed.shared_loading import set_stage_dir
 from skyreels_v2_infer.modules import download_model
+from skyreels_v2_infer.modules.device import autocast
+from skyreels_v2_infer.modules.device import configure_cpu
+from skyreels_v2_infer.modules.latent_preview import load_latent_previewer
+from skyreels_v2_infer.modules.lora import LoRAManager
+from skyreels_v2_infer.modules.quantization import pack_int8_for_cpu
+from skyreels_v2_infer.modules.quantization import QUANT_FORMATS
+from skyreels_v2_infer.modules.step_cache import STEP_CACHE_METHODS
 from skyreels_v2_infer.pipelines import Image2VideoPipeline
+from skyreels_v2_infer.pipelines import GuidanceSchedule
+from skyreels_v2_infer.pipelines import ProgressiveSchedule
 from skyreels_v2_infer.pipelines import PromptEnhancer
+from skyreels_v2_infer.pipelines.guidance import GUIDANCE_CURVES
 from skyreels_v2_infer.pipelines import resizecrop
 from skyreels_v2_infer.pipelines import Text2VideoPipeline
+from skyreels_v2_infer.pipelines import write_video
+from skyreels_v2_infer.pipelines.video_io import ENCODER_PRESETS
+from skyreels_v2_infer.scheduler.fm_solvers import SAMPLERS
 
 MODEL_ID_CONFIG = {
     "text2video": [
@@ -36,9 +53,56 @@ if __name__ == "__main__":
     parser.add_argument("--num_frames", type=int, default=97)
     parser.add_argument("--image", type=str, default=None)
     parser.add_argument("--guidance_scale", type=float, default=6.0)
+    parser.add_argument(
+        "--guidance_interval",
+        type=float,
+        nargs=2,
+        default=None,
+        metavar=("START", "END"),
+        help="Fraction of the denoising trajectory where guidance is applied; the uncond pass is skipped elsewhere.")
+    parser.add_argument("--guidance_curve", type=str, default="constant", choices=GUIDANCE_CURVES)
     parser.add_argument("--shift", type=float, default=8.0)
     parser.add_argument("--inference_steps", type=int, default=30)
+    parser.add_argument(
+        "--sampler",
+        type=str,
+        default="unipc",
+        choices=SAMPLERS,
+        help="Flow-matching sampler; `heun` takes two forwards per step, `adaptive` sizes its steps by error control.")
     parser.add_argument("--use_usp", action="store_true")
+    parser.add_argument(
+        "--cfg_parallel",
+        action="store_true",
+        help="Runs the conditional and unconditional forwards on two halves of the ranks, composes with --use_usp.")
+    parser.add_argument(
+        "--tensor_parallel",
+        action="store_true",
+        help="Splits the DiT and T5 weights over the ranks of each guidance branch so large models fit on smaller GPUs.")
+    parser.add_argument(
+        "--parallel_vae_decode",
+        action="store_true",
+        help="Splits the VAE decode of a multi-GPU run into temporal chunks, approximate after the first chunk.")
+    parser.add_argument(
+        "--usp_backend",
+        type=str,
+        default="xfuser",
+        choices=["xfuser", "native"],
+        help="Sequence parallel attention: xDiT's, or the portable torch.distributed one that also runs on gloo.")
+    parser.add_argument(
+        "--ulysses_degree",
+        type=int,
+        default=None,
+        help="Ranks that split the attention heads with all-to-alls. Must divide the head count.")
+    parser.add_argument(
+        "--ring_degree",
+        type=int,
+        default=None,
+        help="Ranks that pass key/value blocks around a ring. Degrees left unset are chosen from the world size.")
+    parser.add_argument(
+        "--max_ulysses_degree",
+        type=int,
+        default=None,
+        help="Upper bound of the automatic ulysses degree, the GPUs per node by default. Lower it on PCIe nodes.")
     parser.add_argument("--offload", action="store_true")
     parser.add_argument("--fps", type=int, default=24)
     parser.add_argument("--seed", type=int, default=None)
@@ -58,15 +122,114 @@ if __name__ == "__main__":
         "--use_ret_steps",
         action="store_true",
         help="Using Retention Steps will result in faster generation speed and better generation quality.")
+    parser.add_argument(
+        "--step_cache",
+        type=str,
+        default=None,
+        choices=STEP_CACHE_METHODS,
+        help="Step cache strategy; `--teacache` is a shortcut for `--step_cache teacache`.")
+    parser.add_argument("--fbcache_thresh", type=float, default=0.08)
+    parser.add_argument("--block_cache_interval", type=int, default=2)
+    parser.add_argument(
+        "--ffn_chunk_size",
+        type=int,
+        default=None,
+        help="Run the transformer feed-forward over chunks of this many tokens to lower peak memory.")
+    parser.add_argument(
+        "--disable_fuse_qkv",
+        action="store_true",
+        help="Keep separate q/k/v projections instead of fusing them into one GEMM at load time.")
+    parser.add_argument(
+        "--quantization",
+        type=str,
+        default=None,
+        choices=QUANT_FORMATS,
+        help="Weight-only quantization of the DiT attention and feed-forward linears, applied while loading.")
+    parser.add_argument(
+        "--dit_path",
+        type=str,
+        default=None,
+        help="DiT checkpoint directory, e.g. one saved by src/utils/quantize_model.py. Defaults to --model_id.")
+    parser.add_argument(
+        "--lora",
+        type=str,
+        default=None,
+        help="LoRA adapter safetensors file to apply to the DiT, unmerged, on top of the loaded weights.")
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda",
+        choices=["cuda", "cpu"],
+        help="Runs the whole pipeline on the CPU with `cpu`, for the 1.3B models.")
+    parser.add_argument(
+        "--cpu_threads", type=int, default=None, help="Intra-op threads on CPU, by default one per available core.")
+    parser.add_argument(
+        "--cpu_affinity",
+        type=str,
+        default=None,
+        help="Pins the process to these CPUs on CPU, e.g. `0-31`.")
+    parser.add_argument(
+        "--numa_node",
+        type=int,
+        default=None,
+        help="Pins the process to the cores of this NUMA node on CPU.")
+    parser.add_argument(
+        "--cpu_int8_gemm",
+        action="store_true",
+        help="With `--device cpu --quantization int8`, runs the DiT linears as int8 GEMMs instead of dequantizing.")
+    parser.add_argument(
+        "--weights_stage_dir",
+        type=str,
+        default=None,
+        help="Copy the checkpoints once per node into this directory (e.g. /dev/shm) and map them from every rank; "
+        "useful on network filesystems.")
+    parser.add_argument(
+        "--progressive_steps",
+        type=int,
+        default=0,
+        help="Run the first N denoising steps on a downscaled latent grid before refining at full resolution.")
+    parser.add_argument(
+        "--progressive_scale",
+        type=float,
+        default=0.5,
+        help="Latent height/width scale of the low-resolution stage of `--progressive_steps`.")
+    parser.add_argument(
+        "--preview_interval",
+        type=int,
+        default=0,
+        help="Every N steps write a latent-space preview of the current clean estimate, 0 disables previews.")
+    parser.add_argument(
+        "--crf",
+        type=int,
+        default=18,
+        help="x264 constant rate factor of the output video, lower is higher quality and larger files.")
+    parser.add_argument(
+        "--preset",
+        type=str,
+        default="medium",
+        choices=ENCODER_PRESETS,
+        help="x264 speed preset of the output video encoder.")
     args = parser.parse_args()
 
     args.model_id = download_model(args.model_id)
     print("model_id:", args.model_id)
 
-    assert (args.use_usp and args.seed is not None) or (not args.use_usp), "usp mode need seed"
+    assert args.seed is not None or not (
+        args.use_usp or args.cfg_parallel or args.tensor_parallel
+    ), "usp, cfg and tensor parallel mode need seed"
     if args.seed is None:
         random.seed(time.time())
         args.seed = int(random.randrange(4294967294))
+    if args.device == "cpu":
+        assert not (
+            args.use_usp or args.cfg_parallel or args.tensor_parallel
+        ), "usp, cfg and tensor parallel mode need GPUs"
+        num_threads = configure_cpu(args.cpu_threads, args.cpu_affinity, args.numa_node)
+        print(f"running on CPU with {num_threads} threads")
+    assert not args.cpu_int8_gemm or (
+        args.device == "cpu" and args.quantization == "int8"
+    ), "`--cpu_int8_gemm` needs `--device cpu --quantization int8`"
+    assert not (args.lora and args.tensor_parallel), "`--lora` does not support `--tensor_parallel`"
 
     if args.resolution == "540P":
         height = 544
@@ -80,23 +243,59 @@ if __name__ == "__main__":
     image = load_image(args.image).convert("RGB") if args.image else None
     negative_prompt = "Bright tones, overexposed, static, blurred details, subtitles, style, works, paintings, images, static, overall gray, worst quality, low quality, JPEG compression residue, ugly, incomplete, extra fingers, poorly drawn hands, poorly drawn faces, deformed, disfigured, misshapen limbs, fused fingers, still picture, messy background, three legs, many people in the background, walking backwards"
     local_rank = 0
-    if args.use_usp:
+    if args.use_usp or args.cfg_parallel or args.tensor_parallel:
         assert not args.prompt_enhancer, "`--prompt_enhancer` is not allowed if using `--use_usp`. We recommend running the skyreels_v2_infer/pipelines/prompt_enhancer.py script first to generate enhanced prompt before enabling the `--use_usp` parameter."
-        from xfuser.core.distributed import initialize_model_parallel, init_distributed_environment
         import torch.distributed as dist
+        from skyreels_v2_infer.distributed.cfg_parallel import init_cfg_parallel
+        from skyreels_v2_infer.distributed.sequence_parallel import init_sequence_parallel
+        from skyreels_v2_infer.distributed.sequence_parallel import resolve_parallel_degrees
+        from skyreels_v2_infer.distributed.tensor_parallel import init_tensor_parallel
 
         dist.init_process_group("nccl")
         local_rank = dist.get_rank()
         torch.cuda.set_device(dist.get_rank())
         device = "cuda"
 
-        init_distributed_environment(rank=dist.get_rank(), world_size=dist.get_world_size())
+        # with --cfg_parallel each half of the ranks computes one guidance branch, sequence or tensor parallel within
+        # the half
+        cfg_degree = 2 if args.cfg_parallel else 1
+        sp_world_size = dist.get_world_size() // cfg_degree
+        ulysses_degree, ring_degree = 1, 1
+        if args.use_usp and args.tensor_parallel:
+            raise ValueError("`--use_usp` and `--tensor_parallel` both split the ranks of a branch, use one of them")
+        if args.use_usp:
+            with open(os.path.join(args.model_id, "config.json")) as f:
+                num_heads = json.load(f)["num_heads"]
+            ulysses_degree, ring_degree = resolve_parallel_degrees(
+                sp_world_size,
+                num_heads,
+                ulysses_degree=args.ulysses_degree,
+                ring_degree=args.ring_degree,
+                max_ulysses_degree=args.max_ulysses_degree or int(os.environ.get("LOCAL_WORLD_SIZE", 0)) or None,
+            )
+        elif not args.tensor_parallel and dist.get_world_size() != cfg_degree:
+            raise ValueError("`--cfg_parallel` without `--use_usp` or `--tensor_parallel` runs on exactly 2 GPUs")
+        if local_rank == 0:
+            tp_degree = sp_world_size if args.tensor_parallel else 1
+            print(f"parallel layout: cfg {cfg_degree} x ulysses {ulysses_degree} x ring {ring_degree} x tp {tp_degree}")
 
-        initialize_model_parallel(
-            sequence_parallel_degree=dist.get_world_size(),
-            ring_degree=1,
-            ulysses_degree=dist.get_world_size(),
-        )
+        if args.use_usp and args.usp_backend == "xfuser":
+            from xfuser.core.distributed import initialize_model_parallel, init_distributed_environment
+
+            init_distributed_environment(rank=dist.get_rank(), world_size=dist.get_world_size())
+
+            initialize_model_parallel(
+                classifier_free_guidance_degree=cfg_degree,
+                sequence_parallel_degree=sp_world_size,
+                ring_degree=ring_degree,
+                ulysses_degree=ulysses_degree,
+            )
+        elif args.use_usp:
+            init_sequence_parallel(ulysses_degree, ring_degree)
+        if args.cfg_parallel:
+            init_cfg_parallel()
+        if args.tensor_parallel:
+            init_tensor_parallel(sp_world_size)
 
     prompt_input = args.prompt
     if args.prompt_enhancer and args.image is None:
@@ -108,17 +307,33 @@ if __name__ == "__main__":
         gc.collect()
         torch.cuda.empty_cache()
 
+    set_stage_dir(args.weights_stage_dir)
+    load_start = time.perf_counter()
     if image is None:
         assert "T2V" in args.model_id, f"check model_id:{args.model_id}"
         print("init text2video pipeline")
         pipe = Text2VideoPipeline(
-            model_path=args.model_id, dit_path=args.model_id, use_usp=args.use_usp, offload=args.offload
+            model_path=args.model_id,
+            dit_path=args.dit_path or args.model_id,
+            device=args.device,
+            use_usp=args.use_usp,
+            offload=args.offload,
+            quantization=args.quantization,
+            sampler=args.sampler,
+            parallel_vae_decode=args.parallel_vae_decode,
         )
     else:
         assert "I2V" in args.model_id, f"check model_id:{args.model_id}"
         print("init img2video pipeline")
         pipe = Image2VideoPipeline(
-            model_path=args.model_id, dit_path=args.model_id, use_usp=args.use_usp, offload=args.offload
+            model_path=args.model_id,
+            dit_path=args.dit_path or args.model_id,
+            device=args.device,
+            use_usp=args.use_usp,
+            offload=args.offload,
+            quantization=args.quantization,
+            sampler=args.sampler,
+            parallel_vae_decode=args.parallel_vae_decode,
         )
         args.image = load_image(args.image)
         image_width, image_height = args.image.size
@@ -126,10 +341,36 @@ if __name__ == "__main__":
             height, width = width, height
         args.image = resizecrop(args.image, height, width)
 
-    if args.teacache:
+    if args.ffn_chunk_size is not None:
+        pipe.transformer.set_ffn_chunk_size(args.ffn_chunk_size)
+    # adapters target the separate q/k/v projections
+    if not args.disable_fuse_qkv and not args.lora:
+        pipe.transformer.fuse_qkv()
+    if args.cpu_int8_gemm:
+        pack_int8_for_cpu(pipe.transformer)
+    lora_manager = None
+    if args.lora:
+        lora_manager = LoRAManager(pipe.transformer)
+        adapter = lora_manager.load(args.lora)
+        print(f"LoRA {args.lora}: rank {adapter.rank}, {len(adapter.layers)} layers, {adapter.nbytes / 2**20:.1f} MB")
+    cold_start = report_cold_start(load_start)
+    if local_rank == 0:
+        print(cold_start)
+
+    if args.teacache or args.step_cache == "teacache":
         pipe.transformer.initialize_teacache(enable_teacache=True, num_steps=args.inference_steps, 
                                              teacache_thresh=args.teacache_thresh, use_ret_steps=args.use_ret_steps, 
                                              ckpt_dir=args.model_id)
+    elif args.step_cache == "fbcache":
+        pipe.transformer.initialize_step_cache("fbcache", num_steps=args.inference_steps, thresh=args.fbcache_thresh)
+    elif args.step_cache == "block_cache":
+        num_layers = pipe.transformer.num_layers
+        pipe.transformer.initialize_step_cache(
+            "block_cache",
+            num_steps=args.inference_steps,
+            cache_blocks=range(num_layers // 2, num_layers),
+            interval=args.block_cache_interval,
+        )
         
 
     kwargs = {
@@ -138,19 +379,41 @@ if __name__ == "__main__":
         "num_frames": args.num_frames,
         "num_inference_steps": args.inference_steps,
         "guidance_scale": args.guidance_scale,
+        "guidance_schedule": GuidanceSchedule(
+            args.guidance_scale,
+            interval=tuple(args.guidance_interval) if args.guidance_interval else (0.0, 1.0),
+            curve=args.guidance_curve,
+        ),
         "shift": args.shift,
-        "generator": torch.Generator(device="cuda").manual_seed(args.seed),
+        "generator": torch.Generator(device=args.device).manual_seed(args.seed),
         "height": height,
         "width": width,
+        # uint8 frames stay on the GPU, `write_video` streams them to the encoder in chunks
+        "output_type": "pt",
     }
 
     if image is not None:
         kwargs["image"] = args.image.convert("RGB")
+    if args.progressive_steps > 0:
+        assert image is None, "progressive sampling is only supported for text-to-video"
+        kwargs["progressive"] = ProgressiveSchedule(args.progressive_steps, scale=args.progressive_scale)
 
     save_dir = os.path.join("result", args.outdir)
     os.makedirs(save_dir, exist_ok=True)
 
-    with torch.cuda.amp.autocast(dtype=pipe.transformer.dtype), torch.no_grad():
+    if args.preview_interval > 0:
+        previewer = load_latent_previewer(args.model_id)
+        preview_path = os.path.join(save_dir, f"preview_{args.seed}.mp4")
+
+        def save_preview(step, x0):
+            if local_rank == 0:
+                imageio.mimwrite(preview_path, previewer(x0), fps=max(1, args.fps // 4), macro_block_size=1)
+
+        kwargs["preview_callback"] = save_preview
+        kwargs["preview_interval"] = args.preview_interval
+
+    lora = lora_manager.use(args.lora) if lora_manager is not None else contextlib.nullcontext()
+    with lora, autocast(args.device, pipe.transformer.dtype), torch.no_grad():
         print(f"infer kwargs:{kwargs}")
         video_frames = pipe(**kwargs)[0]
 
@@ -158,4 +421,4 @@ if __name__ == "__main__":
         current_time = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
         video_out_file = f"{args.prompt[:100].replace('/','')}_{args.seed}_{current_time}.mp4"
         output_path = os.path.join(save_dir, video_out_file)
-        imageio.mimwrite(output_path, video_frames, fps=args.fps, quality=8, output_params=["-loglevel", "error"])
+        write_video(output_path, video_frames, fps=args.fps, crf=args.crf, preset=args.preset)
@@ -183,6 +183,46 @@ class ModelManager:
         """Get all available models"""
         return self.AVAILABLE_MODELS.copy()
     
+    @property
+    def lora_dir(self) -> Path:
+        """Directory of the LoRA adapters, `LORA_DIR` or `loras` in the cache directory"""
+        return Path(os.getenv("LORA_DIR", self.cache_dir / "loras"))
+    
+    def get_lora_models(self) -> List[Dict[str, any]]:
+        """
+        Get the LoRA adapters in the LoRA directory, one `<name>.safetensors` file each, described by an optional
+        `<name>.json` sidecar
+        """
+        if not self.lora_dir.is_dir():
+            return []
+        
+        loras = []
+        for path in sorted(self.lora_dir.glob("*.safetensors")):
+            info = {
+                "id": path.stem,
+                "name": path.stem,
+                "description": "",
+                "category": "style",
+                "author": "",
+                "downloads": 0,
+                "rating": 0,
+                "image": "",
+                "tags": [],
+                "baseModel": "SkyReels-V2",
+                "triggerWords": "",
+            }
+            sidecar = path.with_suffix(".json")
+            if sidecar.exists():
+                try:
+                    with open(sidecar, "r") as f:
+                        info.update(json.load(f))
+                except Exception as e:
+                    logger.warning(f"Failed to read LoRA metadata {sidecar}: {e}")
+            info["adapter"] = path.stem
+            info["file_size_mb"] = path.stat().st_size / (1024**2)
+            loras.append(info)
+        return loras
+    
     def get_downloaded_models(self) -> List[ModelInfo]:
         """Get list of downloaded models"""
         return [
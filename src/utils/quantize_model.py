@@ -0,0 +1,42 @@
+import argparse
+
+import torch
+
+from skyreels_v2_infer.modules import download_model
+from skyreels_v2_infer.modules import get_transformer
+from skyreels_v2_infer.modules.quantization import format_quantization_report
+from skyreels_v2_infer.modules.quantization import QUANT_FORMATS
+from skyreels_v2_infer.modules.quantization import quantization_report
+from skyreels_v2_infer.modules.quantization import quantize_model
+from skyreels_v2_infer.modules.quantization import save_quantized
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Quantize the DiT weights of a checkpoint to int8 or FP8 and save them for faster, smaller loads."
+    )
+    parser.add_argument("--model_id", type=str, default="Skywork/SkyReels-V2-DF-1.3B-540P")
+    parser.add_argument("--output_dir", type=str, required=True)
+    parser.add_argument("--format", type=str, default="int8", choices=QUANT_FORMATS)
+    parser.add_argument(
+        "--report", action="store_true", help="Print the weight and output errors of every quantized layer"
+    )
+    args = parser.parse_args()
+
+    args.model_id = download_model(args.model_id)
+    print("model_id:", args.model_id)
+
+    transformer = get_transformer(args.model_id, "cpu", torch.bfloat16)
+    rows = quantization_report(transformer, args.format)
+    print(format_quantization_report(rows, args.format))
+    if args.report:
+        for row in rows:
+            print(
+                f"{row['name']}: weights {row['weight_error']:.2e}, outputs {row['output_error']:.2e} "
+                f"(bf16 {row['bf16_output_error']:.2e})"
+            )
+
+    num_layers = quantize_model(transformer, args.format)
+    save_quantized(transformer, args.output_dir, args.format)
+    print(f"saved {num_layers} {args.format} layers to {args.output_dir}")
+    print(f"generate with `--model_id {args.model_id} --dit_path {args.output_dir}`")
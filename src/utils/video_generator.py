@@ -3,31 +3,57 @@ Video Generator for CineVivid
 Integrates with SkyReels-V2 for AI video generation
 """
 import os
+import random
 import torch
+import torch.nn.functional as F
 import logging
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 import tempfile
 import shutil
 
+from skyreels_v2_infer.pipelines.cancellation import GenerationCancelled
+
 logger = logging.getLogger(__name__)
 
+# Full-quality render settings
+FINAL_INFERENCE_STEPS = 50
+
+# Draft preview settings: few steps, short clip, half resolution
+DRAFT_INFERENCE_STEPS = 8
+DRAFT_MAX_FRAMES = 33
+DRAFT_RESOLUTION_SCALE = 0.5
+
+# Share of the full-quality schedule re-run when finalizing a draft from its latents, 1.0 ignores the draft
+FINALIZE_STRENGTH = 0.7
+
 class VideoGenerator:
     """
     Video generator using SkyReels-V2 models
     """
 
-    def __init__(self, model_id: str = "Skywork/SkyReels-V2-T2V-14B-540P", use_quantization: bool = False):
+    def __init__(
+        self,
+        model_id: str = "Skywork/SkyReels-V2-T2V-14B-540P",
+        use_quantization: bool = False,
+        video_crf: int = 18,
+        video_preset: str = "medium"
+    ):
         """
         Initialize the video generator
 
         Args:
             model_id: HuggingFace model ID for SkyReels-V2
             use_quantization: Whether to use 8-bit quantization for memory efficiency
+            video_crf: x264 constant rate factor of the output videos, lower is higher quality
+            video_preset: x264 speed preset of the output videos
         """
         self.model_id = model_id
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.use_quantization = use_quantization
+        self.video_crf = video_crf
+        self.video_preset = video_preset
         self.pipeline = None
         self.temp_dir = Path("../temp")
         self.temp_dir.mkdir(exist_ok=True)
@@ -68,6 +94,49 @@ class VideoGenerator:
                 logger.error(f"Failed to load pipeline: {e}")
                 raise
 
+    @staticmethod
+    def _get_dimensions(aspect_ratio: str) -> tuple:
+        """Get (height, width) for an aspect ratio"""
+        if aspect_ratio == "16:9":
+            return 544, 960  # 540P
+        elif aspect_ratio == "9:16":
+            return 960, 544  # Portrait
+        elif aspect_ratio == "1:1":
+            return 544, 544  # Square
+        return 544, 960  # Default
+
+    def _get_generator(self, seed: Optional[int]) -> Optional[torch.Generator]:
+        """Get a seeded random generator, or None for an unseeded render"""
+        if seed is None:
+            return None
+        return torch.Generator(device=self.device).manual_seed(seed)
+
+    def _output_path(self, output_path: Optional[str], prefix: str) -> Path:
+        """Get the requested output path, or a fresh one in the temp directory"""
+        if output_path is not None:
+            return Path(output_path)
+        return self.temp_dir / f"{prefix}_{torch.randint(0, 1000000, (1,)).item()}.mp4"
+
+    def _save_video(self, frames, output_path: Path, fps: int):
+        """Stream frames into an MP4 at its final location, a chunk at a time"""
+        from skyreels_v2_infer.pipelines.video_io import write_video
+        write_video(str(output_path), frames, fps=fps, crf=self.video_crf, preset=self.video_preset)
+
+    @staticmethod
+    def _step_end_callback(should_cancel: Optional[Callable[[], bool]], on_step_end: Optional[Callable] = None):
+        """Get a `callback_on_step_end` that stops the denoising loop once `should_cancel` returns True"""
+        if should_cancel is None:
+            return on_step_end
+
+        def callback(pipeline, step, timestep, callback_kwargs):
+            if should_cancel():
+                raise GenerationCancelled(f"Generation cancelled after step {step}")
+            if on_step_end is not None:
+                return on_step_end(pipeline, step, timestep, callback_kwargs)
+            return callback_kwargs
+
+        return callback
+
     def generate_video(
         self,
         prompt: str,
@@ -75,6 +144,10 @@ class VideoGenerator:
         fps: int = 24,
         aspect_ratio: str = "16:9",
         guidance_scale: float = 6.0,
+        num_inference_steps: int = FINAL_INFERENCE_STEPS,
+        seed: Optional[int] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        output_path: Optional[str] = None,
         **kwargs
     ) -> str:
         """
@@ -86,6 +159,10 @@ class VideoGenerator:
             fps: Frames per second
             aspect_ratio: Video aspect ratio
             guidance_scale: Classifier-free guidance scale
+            num_inference_steps: Number of denoising steps
+            seed: Random seed, e.g. the seed of a draft to finalize
+            should_cancel: Polled between denoising steps, the job raises `GenerationCancelled` once it returns True
+            output_path: Where to write the video, a file in the temp directory by default
 
         Returns:
             Path to generated video file
@@ -93,15 +170,7 @@ class VideoGenerator:
         try:
             self._load_pipeline()
 
-            # Set dimensions based on aspect ratio
-            if aspect_ratio == "16:9":
-                height, width = 544, 960  # 540P
-            elif aspect_ratio == "9:16":
-                height, width = 960, 544  # Portrait
-            elif aspect_ratio == "1:1":
-                height, width = 544, 544  # Square
-            else:
-                height, width = 544, 960  # Default
+            height, width = self._get_dimensions(aspect_ratio)
 
             logger.info(f"Generating video: {prompt[:50]}...")
             logger.info(f"Dimensions: {height}x{width}, Frames: {num_frames}")
@@ -110,28 +179,208 @@ class VideoGenerator:
             with torch.no_grad():
                 output = self.pipeline(
                     prompt=prompt,
-                    num_inference_steps=50,  # Adjust based on quality vs speed
+                    num_inference_steps=num_inference_steps,
                     height=height,
                     width=width,
                     num_frames=num_frames,
                     guidance_scale=guidance_scale,
+                    generator=self._get_generator(seed),
+                    callback_on_step_end=self._step_end_callback(should_cancel),
                     **kwargs
                 )
 
             # Save video
-            output_path = self.temp_dir / f"generated_{torch.randint(0, 1000000, (1,)).item()}.mp4"
-
-            # Export to video (using diffusers built-in export)
-            from diffusers.utils import export_to_video
-            export_to_video(output.frames[0], str(output_path), fps=fps)
+            output_path = self._output_path(output_path, "generated")
+            self._save_video(output.frames[0], output_path, fps)
 
             logger.info(f"Video generated successfully: {output_path}")
             return str(output_path)
 
+        except GenerationCancelled:
+            logger.info("Video generation cancelled")
+            raise
         except Exception as e:
             logger.error(f"Video generation failed: {e}")
             raise
 
+    def generate_draft(
+        self,
+        prompt: str,
+        num_frames: int = 97,
+        fps: int = 24,
+        aspect_ratio: str = "16:9",
+        guidance_scale: float = 6.0,
+        seed: Optional[int] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        output_path: Optional[str] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Render a fast draft preview of a text-to-video request
+
+        The draft uses few denoising steps, a short clip and half resolution so it returns in seconds.
+        Its seed and final latents are recorded so `finalize_draft` can re-render the same request at
+        full quality.
+
+        Args:
+            prompt: Text description for video generation
+            num_frames: Number of frames of the final render
+            fps: Frames per second
+            aspect_ratio: Video aspect ratio
+            guidance_scale: Classifier-free guidance scale
+            seed: Random seed, picked at random when omitted
+            should_cancel: Polled between denoising steps, the job raises `GenerationCancelled` once it returns True
+            output_path: Where to write the preview video, a file in the temp directory by default
+
+        Returns:
+            Draft record with the preview path, latents path, seed and the final render settings
+        """
+        try:
+            self._load_pipeline()
+
+            if seed is None:
+                seed = random.randrange(2**32)
+
+            height, width = self._get_dimensions(aspect_ratio)
+            draft_height = int(height * DRAFT_RESOLUTION_SCALE) // 16 * 16
+            draft_width = int(width * DRAFT_RESOLUTION_SCALE) // 16 * 16
+            # Keep 4k + 1 frames for the temporal VAE stride
+            draft_frames = (min(num_frames, DRAFT_MAX_FRAMES) - 1) // 4 * 4 + 1
+
+            logger.info(f"Generating draft: {prompt[:50]}...")
+            logger.info(f"Dimensions: {draft_height}x{draft_width}, Frames: {draft_frames}, Seed: {seed}")
+
+            final_latents = {}
+
+            def record_latents(pipeline, step, timestep, callback_kwargs):
+                final_latents["latents"] = callback_kwargs["latents"]
+                return callback_kwargs
+
+            with torch.no_grad():
+                output = self.pipeline(
+                    prompt=prompt,
+                    num_inference_steps=DRAFT_INFERENCE_STEPS,
+                    height=draft_height,
+                    width=draft_width,
+                    num_frames=draft_frames,
+                    guidance_scale=guidance_scale,
+                    generator=self._get_generator(seed),
+                    callback_on_step_end=self._step_end_callback(should_cancel, record_latents),
+                    callback_on_step_end_tensor_inputs=["latents"],
+                    **kwargs
+                )
+
+            draft_id = torch.randint(0, 1000000, (1,)).item()
+            output_path = self._output_path(output_path, f"draft_{draft_id}")
+            latents_path = self.temp_dir / f"draft_{draft_id}_latents.pt"
+
+            self._save_video(output.frames[0], output_path, fps)
+            torch.save(final_latents["latents"].cpu(), latents_path)
+
+            logger.info(f"Draft generated successfully: {output_path}")
+            return {
+                "video_path": str(output_path),
+                "latents_path": str(latents_path),
+                "seed": seed,
+                "prompt": prompt,
+                "num_frames": num_frames,
+                "fps": fps,
+                "aspect_ratio": aspect_ratio,
+                "guidance_scale": guidance_scale,
+            }
+
+        except GenerationCancelled:
+            logger.info("Draft generation cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Draft generation failed: {e}")
+            raise
+
+    @contextmanager
+    def _skip_first_steps(self, num_steps: int):
+        """Start the denoising loops run inside the block `num_steps` steps into the scheduler's schedule"""
+        scheduler = self.pipeline.scheduler
+        set_timesteps = scheduler.set_timesteps
+
+        def set_truncated_timesteps(*args, **kwargs):
+            set_timesteps(*args, **kwargs)
+            # sigmas has one more entry than timesteps, slicing both keeps them aligned
+            scheduler.timesteps = scheduler.timesteps[num_steps:]
+            scheduler.sigmas = scheduler.sigmas[num_steps:]
+
+        scheduler.set_timesteps = set_truncated_timesteps
+        try:
+            yield
+        finally:
+            del scheduler.set_timesteps
+
+    def _draft_start_latents(
+        self, latents_path: str, aspect_ratio: str, num_frames: int, sigma: float, seed: Optional[int]
+    ) -> torch.Tensor:
+        """
+        Get the starting latents of a final render: the draft's latents resized to the final latent shape and noised
+        to `sigma` along the flow-matching path
+        """
+        draft_latents = torch.load(latents_path, map_location=self.device).float()
+        height, width = self._get_dimensions(aspect_ratio)
+        # 4x temporal and 8x spatial VAE compression
+        shape = ((num_frames - 1) // 4 + 1, height // 8, width // 8)
+        latents = F.interpolate(draft_latents, size=shape, mode="trilinear", align_corners=False)
+        noise = torch.randn(latents.shape, generator=self._get_generator(seed), device=self.device)
+        return sigma * noise + (1.0 - sigma) * latents
+
+    def finalize_draft(
+        self,
+        draft: Dict[str, Any],
+        num_inference_steps: int = FINAL_INFERENCE_STEPS,
+        strength: float = FINALIZE_STRENGTH,
+        **kwargs
+    ) -> str:
+        """
+        Re-render a draft at full quality from its seed and latents
+
+        The draft's latents are upsampled to the final shape, noised to the point of the schedule where the last
+        `strength` of the steps remain, and denoised from there, so the final render keeps the draft's layout and
+        motion. Drafts without stored latents are re-rendered from their seed alone.
+
+        Args:
+            draft: Draft record returned by `generate_draft`
+            num_inference_steps: Number of denoising steps of the full schedule
+            strength: Share of the schedule to re-run, between 0 and 1
+
+        Returns:
+            Path to generated video file
+        """
+        if not 0.0 < strength <= 1.0:
+            raise ValueError(f"strength must be in (0, 1], got {strength}")
+
+        render_kwargs = dict(
+            prompt=draft["prompt"],
+            num_frames=draft["num_frames"],
+            fps=draft["fps"],
+            aspect_ratio=draft["aspect_ratio"],
+            guidance_scale=draft["guidance_scale"],
+            num_inference_steps=num_inference_steps,
+            seed=draft["seed"],
+            **kwargs
+        )
+        latents_path = draft.get("latents_path")
+        start_step = int(num_inference_steps * (1.0 - strength))
+        if not latents_path or not os.path.exists(latents_path) or start_step == 0:
+            if latents_path and start_step > 0:
+                logger.warning(f"Draft latents {latents_path} are missing, re-rendering from the seed")
+            return self.generate_video(**render_kwargs)
+
+        self._load_pipeline()
+        self.pipeline.scheduler.set_timesteps(num_inference_steps, device=self.device)
+        sigma = float(self.pipeline.scheduler.sigmas[start_step])
+        latents = self._draft_start_latents(
+            latents_path, draft["aspect_ratio"], draft["num_frames"], sigma, draft["seed"]
+        )
+        logger.info(f"Finalizing draft from its latents: {num_inference_steps - start_step} steps left")
+        with self._skip_first_steps(start_step):
+            return self.generate_video(latents=latents, **render_kwargs)
+
     def generate_video_from_image(
         self,
         image_path: str,
@@ -139,6 +388,8 @@ class VideoGenerator:
         num_frames: int = 97,
         fps: int = 24,
         guidance_scale: float = 5.0,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        output_path: Optional[str] = None,
         **kwargs
     ) -> str:
         """
@@ -150,6 +401,8 @@ class VideoGenerator:
             num_frames: Number of frames to generate
             fps: Frames per second
             guidance_scale: Classifier-free guidance scale
+            should_cancel: Polled between denoising steps, the job raises `GenerationCancelled` once it returns True
+            output_path: Where to write the video, a file in the temp directory by default
 
         Returns:
             Path to generated video file
@@ -189,18 +442,20 @@ class VideoGenerator:
                     num_inference_steps=50,
                     num_frames=num_frames,
                     guidance_scale=guidance_scale,
+                    callback_on_step_end=self._step_end_callback(should_cancel),
                     **kwargs
                 )
 
             # Save video
-            output_path = self.temp_dir / f"i2v_{torch.randint(0, 1000000, (1,)).item()}.mp4"
-
-            from diffusers.utils import export_to_video
-            export_to_video(output.frames[0], str(output_path), fps=fps)
+            output_path = self._output_path(output_path, "i2v")
+            self._save_video(output.frames[0], output_path, fps)
 
             logger.info(f"I2V video generated successfully: {output_path}")
             return str(output_path)
 
+        except GenerationCancelled:
+            logger.info("I2V generation cancelled")
+            raise
         except Exception as e:
             logger.error(f"I2V generation failed: {e}")
             raise
@@ -265,10 +520,8 @@ class VideoGenerator:
             combined_frames = torch.cat([video_frames, output.frames[0]], dim=0)
 
             # Save extended video
-            output_path = self.temp_dir / f"extended_{torch.randint(0, 1000000, (1,)).item()}.mp4"
-
-            from diffusers.utils import export_to_video
-            export_to_video(combined_frames, str(output_path), fps=24)
+            output_path = self._output_path(None, "extended")
+            self._save_video(combined_frames, output_path, 24)
 
             logger.info(f"Video extended successfully: {output_path}")
             return str(output_path)
@@ -0,0 +1,99 @@
+"""
+Tests for cooperative cancellation and preemption of denoising loops
+"""
+import pytest
+import torch
+
+from skyreels_v2_infer.pipelines.cancellation import CancellationToken
+from skyreels_v2_infer.pipelines.cancellation import DenoiseCheckpoint
+from skyreels_v2_infer.pipelines.cancellation import GenerationCancelled
+from skyreels_v2_infer.pipelines.cancellation import GenerationPreempted
+from skyreels_v2_infer.scheduler.fm_solvers_unipc import FlowUniPCMultistepScheduler
+
+
+def denoise(scheduler, latents, generator, token=None, start_step=0):
+    """Mirrors the text-to-video loop with a stub prediction that consumes the generator"""
+    for i, t in enumerate(scheduler.timesteps[start_step:], start_step):
+        if token is not None:
+            token.check(lambda: DenoiseCheckpoint.capture(i, latents, scheduler, generator))
+        noise_pred = latents * 0.5 + 0.01 * torch.randn(latents.shape, generator=generator)
+        latents = scheduler.step(noise_pred.unsqueeze(0), t, latents.unsqueeze(0), return_dict=False)[0].squeeze(0)
+    return latents
+
+
+class PreemptAt:
+    """Token that requests a preemption before the given step"""
+
+    def __init__(self, token, step):
+        self.token = token
+        self.step = step
+        self.calls = 0
+
+    def check(self, capture):
+        if self.calls == self.step:
+            self.token.preempt()
+        self.calls += 1
+        self.token.check(capture)
+
+
+def make_scheduler():
+    scheduler = FlowUniPCMultistepScheduler()
+    scheduler.set_timesteps(12, shift=5.0)
+    return scheduler
+
+
+class TestCancellationToken:
+    """Test the stop signals checked at step boundaries"""
+
+    def test_check_is_free_without_signal(self):
+        token = CancellationToken()
+        token.check(lambda: pytest.fail("capture must not run"))
+
+    def test_cancel(self):
+        token = CancellationToken()
+        token.cancel()
+        assert token.cancelled
+        with pytest.raises(GenerationCancelled):
+            token.check(lambda: None)
+
+    def test_preempt_is_consumed(self):
+        token = CancellationToken()
+        token.preempt()
+        with pytest.raises(GenerationPreempted):
+            token.check(lambda: DenoiseCheckpoint(3, torch.zeros(1), []))
+        assert not token.preempt_requested
+        token.check(lambda: None)
+
+
+class TestDenoiseCheckpoint:
+    """Test that a preempted loop resumes bit-exactly"""
+
+    def test_resume_matches_uninterrupted_run(self):
+        latents = torch.randn(4, 2, 8, 8, generator=torch.Generator().manual_seed(0))
+        expected = denoise(make_scheduler(), latents, torch.Generator().manual_seed(1))
+
+        generator = torch.Generator().manual_seed(1)
+        with pytest.raises(GenerationPreempted) as preempted:
+            denoise(make_scheduler(), latents, generator, PreemptAt(CancellationToken(), 5))
+        checkpoint = preempted.value.checkpoint
+        assert checkpoint.step_index == 5
+
+        # the generator has moved on since, restoring rewinds it
+        torch.randn(16, generator=generator)
+        scheduler = make_scheduler()
+        (scheduler,) = checkpoint.restore(generator)
+        resumed = denoise(scheduler, checkpoint.latents, generator, start_step=checkpoint.step_index)
+        assert torch.equal(resumed, expected)
+
+    def test_save_and_load(self, tmp_path):
+        scheduler = make_scheduler()
+        latents = denoise(scheduler, torch.randn(4, 1, 4, 4), torch.Generator().manual_seed(0))
+        checkpoint = DenoiseCheckpoint.capture(12, latents, scheduler, sample_schedulers_counter=[12])
+        checkpoint.save(tmp_path / "checkpoint.pt")
+
+        loaded = DenoiseCheckpoint.load(tmp_path / "checkpoint.pt")
+        assert loaded.step_index == 12
+        assert torch.equal(loaded.latents, latents)
+        assert loaded.extra == {"sample_schedulers_counter": [12]}
+        (restored,) = loaded.restore()
+        assert restored.step_index == scheduler.step_index
@@ -0,0 +1,108 @@
+"""
+Tests for CFG-parallel noise prediction on CPU with the gloo backend
+"""
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from skyreels_v2_infer.distributed import cfg_parallel
+from skyreels_v2_infer.distributed import sequence_parallel
+
+
+class StubTransformer:
+    """Transformer stand-in whose prediction depends on the context, with the step cache hooks of `WanModel`"""
+
+    def __init__(self, attention=None):
+        self.attention = attention
+        self.calls = 0
+        self.skips = 0
+
+    def __call__(self, x, t, context):
+        self.calls += 1
+        if self.attention is None:
+            return [x[0] * context + t]
+        return [self.attention(x + context, x, x)[0]]
+
+    def skip_teacache_uncond(self):
+        self.skips += 1
+
+
+def serial_prediction(transformer, x, t, context, context_null, guidance_scale):
+    noise_pred_cond = transformer(x, t=t, context=context)[0]
+    noise_pred_uncond = transformer(x, t=t, context=context_null)[0]
+    return noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
+
+
+def init(rank, world_size, init_file):
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size)
+
+
+def run_cfg(rank, init_file):
+    init(rank, 2, init_file)
+    try:
+        groups = cfg_parallel.init_cfg_parallel()
+        assert groups.rank == rank and groups.ranks == [0, 1]
+        x = torch.randn(1, 4, 3, 8, 8, generator=torch.Generator().manual_seed(0))
+        t = torch.tensor([500.0])
+        context, context_null = torch.tensor(0.5), torch.tensor(-0.25)
+
+        transformer = StubTransformer()
+        guided = cfg_parallel.cfg_parallel_predict(
+            transformer, x, dict(context=context), dict(context=context_null), 5.0, t=t
+        )
+        torch.testing.assert_close(guided, serial_prediction(transformer, x, t, context, context_null, 5.0))
+        # one forward per rank and step, the step cache skips the other branch
+        assert (transformer.calls, transformer.skips) == (3, 1)
+
+        transformer = StubTransformer()
+        unguided = cfg_parallel.cfg_parallel_predict(
+            transformer, x, dict(context=context), dict(context=context_null), 1.0, use_uncond=False, t=t
+        )
+        torch.testing.assert_close(unguided, transformer(x, t=t, context=context)[0])
+        assert transformer.calls == (2 if rank == 0 else 1)
+        assert transformer.skips == (1 if rank == 0 else 2)
+    finally:
+        cfg_parallel.destroy_cfg_parallel()
+        dist.destroy_process_group()
+
+
+def run_cfg_with_sequence_parallel(rank, init_file):
+    init(rank, 4, init_file)
+    try:
+        sequence_parallel.init_sequence_parallel(ulysses_degree=2, ring_degree=1)
+        groups = cfg_parallel.init_cfg_parallel()
+        assert groups.rank == rank // 2 and groups.ranks == [rank % 2, rank % 2 + 2]
+        assert sequence_parallel.get_sequence_parallel_rank() == rank % 2
+        assert sequence_parallel.get_sequence_parallel_world_size() == 2
+
+        x = torch.randn(1, 16, 4, 8, generator=torch.Generator().manual_seed(0))
+        context, context_null = torch.tensor(0.5), torch.tensor(-0.25)
+        local = x.chunk(2, dim=1)[rank % 2]
+
+        def full_attention(q, k, v):
+            return torch.nn.functional.scaled_dot_product_attention(
+                q.transpose(1, 2), k.transpose(1, 2), v.transpose(1, 2)
+            ).transpose(1, 2)
+
+        expected = serial_prediction(StubTransformer(full_attention), x, None, context, context_null, 5.0)
+        transformer = StubTransformer(sequence_parallel.long_context_attention)
+        guided = cfg_parallel.cfg_parallel_predict(
+            transformer, local, dict(context=context), dict(context=context_null), 5.0, t=None
+        )
+        torch.testing.assert_close(guided, expected.chunk(2, dim=0)[rank % 2], atol=1e-5, rtol=1e-5)
+    finally:
+        sequence_parallel.destroy_sequence_parallel()
+        cfg_parallel.destroy_cfg_parallel()
+        dist.destroy_process_group()
+
+
+@pytest.mark.skipif(not dist.is_available(), reason="torch.distributed is not available")
+class TestCFGParallel:
+    """Test that splitting the guidance branches over ranks matches the serial prediction"""
+
+    def test_two_ranks(self, tmp_path):
+        mp.spawn(run_cfg, args=(str(tmp_path / "init"),), nprocs=2, join=True)
+
+    def test_composes_with_sequence_parallel(self, tmp_path):
+        mp.spawn(run_cfg_with_sequence_parallel, args=(str(tmp_path / "init"),), nprocs=4, join=True)
@@ -366,6 +366,14 @@ class TestVideoGenerator:
         assert "pipeline_loaded" in info
         assert "cuda_available" in info
 
+    def test_cancellation_raises_pipeline_exception(self):
+        """Test that cancelling a job raises the pipelines' `GenerationCancelled`"""
+        from skyreels_v2_infer.pipelines import GenerationCancelled
+
+        callback = VideoGenerator._step_end_callback(lambda: True)
+        with pytest.raises(GenerationCancelled):
+            callback(None, 3, 500, {})
+
 class TestAPI:
     """Test API endpoints"""
     
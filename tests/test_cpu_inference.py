@@ -0,0 +1,141 @@
+"""
+Tests for running the attention, the DiT and the quantized linears on the CPU
+"""
+import os
+
+import pytest
+import torch
+import torch.nn as nn
+
+from skyreels_v2_infer.modules.attention import flash_attention
+from skyreels_v2_infer.modules.attention import sdpa_attention
+from skyreels_v2_infer.modules.device import autocast
+from skyreels_v2_infer.modules.device import configure_cpu
+from skyreels_v2_infer.modules.device import parse_cpu_list
+from skyreels_v2_infer.modules.quantization import pack_int8_for_cpu
+from skyreels_v2_infer.modules.quantization import QuantizedLinear
+from skyreels_v2_infer.modules.transformer import WanModel
+
+
+def naive_attention(q, k, v, mask=None):
+    """Reference attention of [B, L, N, C] inputs."""
+    scores = torch.einsum("bqnc,bknc->bnqk", q, k) / q.size(-1) ** 0.5
+    if mask is not None:
+        scores = scores.masked_fill(~mask, float("-inf"))
+    return torch.einsum("bnqk,bknc->bqnc", scores.softmax(dim=-1), v)
+
+
+def make_qkv(lq, lk, n=2, c=8):
+    generator = torch.Generator().manual_seed(0)
+    return (
+        torch.randn(1, lq, n, c, generator=generator),
+        torch.randn(1, lk, n, c, generator=generator),
+        torch.randn(1, lk, n, c, generator=generator),
+    )
+
+
+class TestSdpaAttention:
+    """Test the scaled_dot_product_attention fallback of flash_attention"""
+
+    def test_dispatches_off_cuda(self):
+        q, k, v = make_qkv(6, 5)
+        out = flash_attention(q, k, v)
+        assert out.dtype == torch.float32
+        torch.testing.assert_close(out, naive_attention(q, k, v), atol=1e-5, rtol=1e-5)
+
+    def test_packed_samples_attend_to_their_own(self):
+        q, k, v = make_qkv(7, 9)
+        q_lens, k_lens = torch.tensor([3, 4]), torch.tensor([5, 4])
+        out = sdpa_attention(q, k, v, q_lens=q_lens, k_lens=k_lens)
+        expected = torch.cat(
+            [naive_attention(q[:, :3], k[:, :5], v[:, :5]), naive_attention(q[:, 3:], k[:, 5:], v[:, 5:])], dim=1
+        )
+        torch.testing.assert_close(out, expected, atol=1e-5, rtol=1e-5)
+
+    def test_positions_past_the_samples_are_zero(self):
+        q, k, v = make_qkv(6, 6)
+        out = sdpa_attention(q, k, v, q_lens=torch.tensor([4]), k_lens=torch.tensor([4]))
+        assert out[:, 4:].eq(0).all()
+
+    def test_sliding_window(self):
+        q, k, v = make_qkv(8, 8)
+        i, j = torch.arange(8)[:, None], torch.arange(8)[None, :]
+        mask = (j - i >= -2) & (j - i <= 1)
+        out = sdpa_attention(q, k, v, window_size=(2, 1))
+        torch.testing.assert_close(out, naive_attention(q, k, v, mask), atol=1e-5, rtol=1e-5)
+
+    def test_causal_is_aligned_at_the_end(self):
+        q, k, v = make_qkv(3, 5)
+        i, j = torch.arange(3)[:, None], torch.arange(5)[None, :]
+        out = sdpa_attention(q, k, v, causal=True)
+        torch.testing.assert_close(out, naive_attention(q, k, v, j <= i + 2), atol=1e-5, rtol=1e-5)
+
+
+class TestCpuForward:
+    """Test the DiT forward on the CPU"""
+
+    def test_bf16_autocast_matches_float32(self):
+        torch.manual_seed(0)
+        model = WanModel(dim=32, ffn_dim=64, num_heads=4, num_layers=2, text_dim=16, freq_dim=16).eval()
+        latents = torch.randn(1, 16, 2, 8, 8)
+        t = torch.tensor([500.0])
+        context = torch.randn(1, 8, 16)
+        with torch.no_grad():
+            reference = model(latents, t=t, context=context)[0].float()
+            model.to(torch.bfloat16)
+            with autocast("cpu", torch.bfloat16):
+                out = model(latents, t=t, context=context.bfloat16())[0].float()
+        assert out.shape == reference.shape
+        assert ((out - reference).norm() / reference.norm()).item() < 0.05
+
+    def test_bf16_autocast_keeps_float32_modulation(self):
+        torch.manual_seed(0)
+        model = WanModel(dim=32, ffn_dim=64, num_heads=4, num_layers=2, text_dim=16, freq_dim=16).eval()
+        model.to(torch.bfloat16)
+        modulation = []
+
+        def record(_, args, kwargs):
+            modulation.append(kwargs["e"])
+
+        model.blocks[0].register_forward_pre_hook(record, with_kwargs=True)
+        with torch.no_grad(), autocast("cpu", torch.bfloat16):
+            model(torch.randn(1, 16, 2, 8, 8), t=torch.tensor([500.0]), context=torch.randn(1, 8, 16).bfloat16())
+        assert modulation[0].dtype == torch.float32
+
+
+class TestInt8Gemm:
+    """Test the quantized CPU GEMM of int8 linears"""
+
+    @pytest.mark.skipif(not torch.backends.quantized.supported_engines, reason="no quantized CPU backend")
+    def test_matches_dequantized(self):
+        torch.manual_seed(0)
+        layer = QuantizedLinear.from_linear(nn.Linear(64, 32), "int8")
+        model = nn.Sequential(layer)
+        x = torch.randn(2, 5, 64)
+        with torch.no_grad():
+            expected = layer(x)
+            assert pack_int8_for_cpu(model) == 1
+            out = layer(x)
+        assert out.shape == expected.shape
+        assert ((out - expected).norm() / expected.norm()).item() < 0.05
+
+
+class TestConfigureCpu:
+    """Test CPU thread and affinity settings"""
+
+    def test_parse_cpu_list(self):
+        assert parse_cpu_list("0-3,8,10-11") == [0, 1, 2, 3, 8, 10, 11]
+
+    @pytest.mark.skipif(not hasattr(os, "sched_getaffinity"), reason="needs sched_getaffinity")
+    def test_pins_and_sets_threads(self):
+        threads = torch.get_num_threads()
+        affinity = os.sched_getaffinity(0)
+        try:
+            cpus = ",".join(str(cpu) for cpu in sorted(affinity))
+            assert configure_cpu(num_threads=1, cpus=cpus) == 1
+            assert torch.get_num_threads() == 1
+            assert os.sched_getaffinity(0) == affinity
+            with pytest.raises(ValueError, match="not both"):
+                configure_cpu(cpus=cpus, numa_node=0)
+        finally:
+            torch.set_num_threads(threads)
@@ -0,0 +1,154 @@
+"""
+Tests for the draft preview and finalize endpoints and the upgrade of existing tables
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.backend import app as app_module
+from src.backend.app import app
+from src.backend.db import crud, database, models, schemas
+
+PROMPT = "A lighthouse at dawn with waves rolling in"
+
+
+def make_engine():
+    return create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+
+class FakeGenerator:
+    """Records the calls of the background jobs instead of rendering"""
+
+    def __init__(self, tmp_path):
+        self.tmp_path = tmp_path
+        self.calls = []
+
+    def generate_draft(self, **kwargs):
+        self.calls.append(("draft", kwargs))
+        latents_path = self.tmp_path / "draft_latents.pt"
+        latents_path.write_bytes(b"latents")
+        return {"video_path": kwargs["output_path"], "latents_path": str(latents_path), "seed": kwargs["seed"]}
+
+    def finalize_draft(self, draft, **kwargs):
+        self.calls.append(("finalize", draft))
+        return kwargs["output_path"]
+
+    def generate_video(self, **kwargs):
+        self.calls.append(("video", kwargs))
+        return kwargs["output_path"]
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    monkeypatch.setattr(database, "engine", make_engine())
+    assert database.create_tables()
+    return sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+
+@pytest.fixture
+def api(session_factory, tmp_path, monkeypatch):
+    """Client of a fresh database with a pro user, rendering with a `FakeGenerator`"""
+    def get_test_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def get_test_user():
+        db = session_factory()
+        try:
+            return crud.get_user_by_username(db, "drafter")
+        finally:
+            db.close()
+
+    db = session_factory()
+    user = schemas.UserCreate(username="drafter", email="drafter@example.com", password="draftpass")
+    crud.create_user(db, user, tier="pro")
+    db.close()
+
+    generator = FakeGenerator(tmp_path)
+    # the background jobs open their own sessions and load the generator by module-level name
+    monkeypatch.setattr(app_module, "get_db", get_test_db)
+    monkeypatch.setattr(app_module, "get_video_generator", lambda: generator)
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[database.get_db] = get_test_db
+    app.dependency_overrides[app_module.get_current_user] = get_test_user
+    try:
+        yield TestClient(app), generator, session_factory
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+
+
+class TestDraftEndpoints:
+    """Test rendering a draft and finalizing it from its seed and latents"""
+
+    def test_finalize_reuses_draft_latents(self, api):
+        client, generator, session_factory = api
+        request = {"prompt": PROMPT, "num_frames": 97, "enhance_prompt": False, "seed": 1234}
+        response = client.post("/generate/draft", json=request)
+        assert response.status_code == 200
+        draft_id = response.json()["task_id"]
+        assert response.json()["seed"] == 1234
+        assert generator.calls[0][0] == "draft" and generator.calls[0][1]["seed"] == 1234
+
+        db = session_factory()
+        draft = crud.get_video_by_task_id(db, draft_id)
+        assert draft.is_draft and draft.status == "completed"
+        assert draft.latents_path == str(generator.tmp_path / "draft_latents.pt")
+
+        response = client.post(f"/generate/finalize/{draft_id}")
+        assert response.status_code == 200
+        assert response.json()["draft_task_id"] == draft_id
+        kind, params = generator.calls[-1]
+        assert kind == "finalize"
+        assert params["latents_path"] == draft.latents_path and params["seed"] == 1234
+
+        final = crud.get_video_by_task_id(db, response.json()["task_id"])
+        assert final.draft_task_id == draft_id and not final.is_draft and final.status == "completed"
+        # 8 credits for the draft and 40 for the 4 seconds of the final render
+        assert crud.get_user_credits(db, final.user_id) == 1000 - 8 - 40
+        db.close()
+
+    def test_finalize_pending_draft_conflicts(self, api):
+        client, generator, session_factory = api
+        db = session_factory()
+        user = crud.get_user_by_username(db, "drafter")
+        video = {"task_id": "pending-draft", "type": "text-to-video", "title": "Draft", "prompt": PROMPT}
+        crud.create_video(db, user.id, {**video, "is_draft": True, "seed": 1})
+        crud.create_video(db, user.id, {**video, "task_id": "full-render"})
+        db.close()
+
+        assert client.post("/generate/finalize/pending-draft").status_code == 409
+        assert client.post("/generate/finalize/full-render").status_code == 404
+        assert client.post("/generate/finalize/missing").status_code == 404
+        assert generator.calls == []
+
+
+class TestUpgradeTables:
+    """Test adding the columns of existing tables at startup"""
+
+    def test_adds_draft_columns(self, monkeypatch):
+        engine = make_engine()
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE videos (id INTEGER PRIMARY KEY, task_id VARCHAR(36) NOT NULL, "
+                "user_id INTEGER NOT NULL, title VARCHAR(255) NOT NULL, type VARCHAR(50) NOT NULL)"
+            ))
+            conn.execute(text("INSERT INTO videos (task_id, user_id, title, type) VALUES ('old', 1, 'Old', 't2v')"))
+        monkeypatch.setattr(database, "engine", engine)
+
+        added = database.upgrade_tables()
+        draft_columns = {"seed", "is_draft", "draft_task_id", "latents_path", "priority"}
+        assert {f"videos.{name}" for name in draft_columns} <= set(added)
+        columns = {column["name"] for column in inspect(engine).get_columns("videos")}
+        assert set(models.Video.__table__.columns.keys()) <= columns
+
+        with engine.connect() as conn:
+            row = conn.execute(text("SELECT is_draft, priority, seed FROM videos")).one()
+        # Python-side defaults are backfilled, columns without one stay NULL
+        assert tuple(row) == (0, 0, None)
+        assert database.upgrade_tables() == []
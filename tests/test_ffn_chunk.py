@@ -0,0 +1,56 @@
+"""
+Tests for the sequence-chunked feed-forward of the transformer blocks
+"""
+import torch
+
+from skyreels_v2_infer.modules.transformer import sinusoidal_embedding_1d
+from skyreels_v2_infer.modules.transformer import WanAttentionBlock
+from skyreels_v2_infer.modules.transformer import WanModel
+
+
+def make_block():
+    torch.manual_seed(0)
+    return WanAttentionBlock("t2v_cross_attn", dim=32, ffn_dim=64, num_heads=4).eval()
+
+
+class TestChunkedFFN:
+    """Test that chunking the feed-forward does not change the block output"""
+
+    def test_chunked_matches_full(self):
+        """Per-sample modulation gives the same result for any chunk size"""
+        block = make_block()
+        x = torch.randn(2, 37, 32)
+        e = (block.modulation + torch.randn(2, 6, 32)).chunk(6, dim=1)
+        with torch.no_grad():
+            expected = block.ffn_forward(x.clone(), e, torch.float32)
+            for chunk_size in [1, 8, 16, 36]:
+                block.set_ffn_chunk_size(chunk_size)
+                # the modulation is exact, the FFN GEMMs over fewer rows may round differently
+                torch.testing.assert_close(block.ffn_forward(x.clone(), e, torch.float32), expected, atol=1e-6, rtol=0)
+
+    def test_chunked_per_token_modulation(self):
+        """Diffusion forcing's per-token modulation is sliced along with the tokens"""
+        block = make_block()
+        x = torch.randn(1, 20, 32)
+        e = [ei.squeeze(1) for ei in (block.modulation.unsqueeze(2) + torch.randn(1, 6, 20, 32)).chunk(6, dim=1)]
+        with torch.no_grad():
+            expected = block.ffn_forward(x.clone(), e, torch.float32)
+            block.set_ffn_chunk_size(6)
+            torch.testing.assert_close(block.ffn_forward(x.clone(), e, torch.float32), expected, atol=1e-6, rtol=0)
+
+
+class TestPerTokenModulation:
+    """Test the per-token modulation diffusion forcing builds from per-frame timesteps"""
+
+    def test_matches_repeated_frames(self):
+        torch.manual_seed(0)
+        model = WanModel(dim=32, ffn_dim=64, num_heads=4, num_layers=1, text_dim=16, freq_dim=16).eval()
+        seen = []
+        model.blocks[0].register_forward_pre_hook(lambda _, args, kwargs: seen.append(kwargs["e"]), with_kwargs=True)
+        t = torch.tensor([[900.0, 500.0, 100.0]])
+        with torch.no_grad():
+            model(torch.randn(1, 16, 3, 4, 6), t=t, context=torch.randn(1, 8, 16))
+            e0 = model.time_projection(model.time_embedding(sinusoidal_embedding_1d(16, t.flatten())))
+        # every token of a frame, 2 x 3 patches, carries the modulation of its frame's timestep
+        expected = e0.unflatten(1, (6, 32)).repeat_interleave(6, dim=0).transpose(0, 1).unsqueeze(0)
+        assert torch.equal(seen[0], expected)
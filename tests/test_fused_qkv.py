@@ -0,0 +1,66 @@
+"""
+Tests for fusing the q/k/v projections of the self-attention layers
+"""
+import torch
+
+from skyreels_v2_infer.modules.transformer import WanSelfAttention
+
+
+def make_attention():
+    torch.manual_seed(0)
+    attn = WanSelfAttention(dim=32, num_heads=4).eval()
+    with torch.no_grad():
+        attn.norm_q.weight.uniform_(0.5, 1.5)
+        attn.norm_k.weight.uniform_(0.5, 1.5)
+    return attn
+
+
+class TestFusedQKV:
+    """Test fused projections against the separate ones and checkpoint compatibility"""
+
+    def test_fused_matches_separate(self):
+        attn = make_attention()
+        x = torch.randn(2, 10, 32)
+        with torch.no_grad():
+            expected = attn.qkv_fn(x)
+            assert attn.fuse_qkv()
+            fused = attn.qkv_fn(x)
+        assert not hasattr(attn, "q")
+        for a, b in zip(fused, expected):
+            assert a.shape == b.shape
+            assert torch.allclose(a, b, atol=1e-5)
+
+    def test_state_dict_keeps_checkpoint_layout(self):
+        """Fused layers save and load the original q/k/v keys"""
+        attn = make_attention()
+        reference = attn.state_dict()
+        attn.fuse_qkv()
+        state_dict = attn.state_dict()
+        assert set(state_dict) == set(reference)
+        for key in reference:
+            assert torch.equal(state_dict[key], reference[key])
+
+        other = WanSelfAttention(dim=32, num_heads=4)
+        other.fuse_qkv()
+        other.load_state_dict(reference)
+        x = torch.randn(1, 5, 32)
+        with torch.no_grad():
+            for a, b in zip(other.qkv_fn(x), attn.qkv_fn(x)):
+                assert torch.allclose(a, b)
+
+    def test_partial_load_into_fused(self):
+        """Shards holding only some of q/k/v update just their slices"""
+        attn = make_attention()
+        attn.fuse_qkv()
+        new_k = torch.randn(32, 32)
+        attn.load_state_dict({"k.weight": new_k}, strict=False)
+        assert torch.equal(attn.qkv.weight[32:64], new_k)
+
+    def test_unfuse_restores_layers(self):
+        attn = make_attention()
+        reference = {k: v.clone() for k, v in attn.state_dict().items()}
+        attn.fuse_qkv()
+        attn.unfuse_qkv()
+        assert isinstance(attn.q, torch.nn.Linear)
+        for key, value in attn.state_dict().items():
+            assert torch.equal(value, reference[key])
@@ -0,0 +1,51 @@
+"""
+Tests for the classifier-free guidance schedule used by the SkyReels-V2 pipelines
+"""
+import pytest
+
+from skyreels_v2_infer.pipelines.guidance import GuidanceSchedule
+
+
+class TestGuidanceSchedule:
+    """Test per-step guidance scales and uncond skipping"""
+
+    def test_constant_schedule_matches_plain_cfg(self):
+        """A default schedule applies the same scale on every step"""
+        schedule = GuidanceSchedule(6.0)
+        scales = [schedule.scale_at(i, 30) for i in range(30)]
+        assert scales == [6.0] * 30
+        assert schedule.requires_uncond()
+
+    def test_interval_skips_uncond(self):
+        """Steps outside the interval fall back to the conditional branch only"""
+        schedule = GuidanceSchedule(5.0, interval=(0.0, 0.5))
+        scales = [schedule.scale_at(i, 11) for i in range(11)]
+        assert scales[:6] == [5.0] * 6
+        assert scales[6:] == [1.0] * 5
+        assert not any(schedule.needs_uncond(s) for s in scales[6:])
+
+    def test_unit_scale_never_needs_uncond(self):
+        """A guidance scale of 1 never runs the unconditional pass"""
+        schedule = GuidanceSchedule(1.0)
+        assert not schedule.requires_uncond()
+        assert not schedule.needs_uncond(schedule.scale_at(0, 10))
+
+    def test_decaying_curves(self):
+        """Linear and cosine curves decay from the peak scale to the end scale"""
+        for curve in ["linear", "cosine"]:
+            schedule = GuidanceSchedule(5.0, curve=curve)
+            assert schedule.scale_at(0, 11) == pytest.approx(5.0)
+            assert schedule.scale_at(5, 11) == pytest.approx(3.0)
+            assert schedule.scale_at(10, 11) == pytest.approx(1.0)
+
+    def test_explicit_curve(self):
+        """A per-step sequence is used verbatim"""
+        schedule = GuidanceSchedule(curve=[7.0, 4.0, 1.0])
+        assert [schedule.scale_at(i, 3) for i in range(3)] == [7.0, 4.0, 1.0]
+        with pytest.raises(ValueError):
+            schedule.scale_at(0, 4)
+
+    def test_invalid_interval(self):
+        """Intervals must be ordered fractions"""
+        with pytest.raises(ValueError):
+            GuidanceSchedule(5.0, interval=(0.8, 0.2))
@@ -0,0 +1,56 @@
+"""
+Tests for reusing the zero-padding VAE encode of image-to-video conditioning
+"""
+import torch
+
+from skyreels_v2_infer.modules.vae import WanVAE
+from skyreels_v2_infer.modules.vae import WanVAE_
+
+
+def make_vae(**kwargs):
+    torch.manual_seed(0)
+    vae = WanVAE.__new__(WanVAE)
+    kwargs.setdefault("temperal_downsample", [False, True, True])
+    vae.vae = WanVAE_(dim=8, z_dim=16, **kwargs).eval()
+    vae.mean, vae.std = torch.randn(16), torch.rand(16) + 0.5
+    vae.scale = [vae.mean, 1.0 / vae.std]
+    vae._zero_padding_cache = {}
+    return vae
+
+
+class TestZeroPaddedEncode:
+    """Test that the cached padding gives the same conditioning as a full encode"""
+
+    def test_encoder_reach(self):
+        # the layout of the released VAE, and one level with a single residual block
+        assert make_vae().vae.encoder_reach() == 33
+        assert make_vae(dim_mult=[1, 2], num_res_blocks=1, temperal_downsample=[True]).vae.encoder_reach() == 11
+
+    def test_matches_full_encode(self):
+        vae = make_vae(dim_mult=[1, 2], num_res_blocks=1, temperal_downsample=[True])
+        # 16 chunks, the last 4 are past the reach of the image
+        num_frames = 61
+        with torch.no_grad():
+            for seed in range(3):
+                torch.manual_seed(seed)
+                image = torch.randn(1, 3, 1, 16, 16)
+                padding = torch.zeros(1, 3, num_frames - 1, 16, 16)
+                expected = vae.encode(torch.cat([image, padding], dim=2))
+                assert torch.equal(vae.encode_zero_padded(image, num_frames), expected)
+        assert len(vae._zero_padding_cache) == 1
+
+    def test_short_clip_is_encoded_in_full(self):
+        vae = make_vae()
+        image = torch.randn(1, 3, 1, 32, 32)
+        padding = torch.zeros(1, 3, 40, 32, 32)
+        with torch.no_grad():
+            assert torch.equal(vae.encode_zero_padded(image, 41), vae.encode(torch.cat([image, padding], dim=2)))
+        assert not vae._zero_padding_cache
+
+    def test_chunked_encode_matches_encode(self):
+        vae = make_vae()
+        video = torch.randn(1, 3, 9, 16, 16)
+        with torch.no_grad():
+            chunks = vae.vae.encode_chunks(video)
+            assert len(chunks) == 3
+            assert torch.equal(vae.vae.encode_from_chunks(chunks, vae.scale), vae.vae.encode(video, vae.scale))
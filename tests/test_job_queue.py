@@ -0,0 +1,49 @@
+"""
+Tests for the priority queue of GPU generation jobs
+"""
+import asyncio
+
+from src.backend.utils.job_queue import GenerationQueue, PRIORITY_DRAFT, PRIORITY_FINAL
+
+
+class TestGenerationQueue:
+    """Test admission order across priority tiers"""
+
+    def test_final_renders_run_before_queued_drafts(self):
+        order = []
+
+        async def job(queue, name, priority):
+            async with queue.slot(priority):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        async def main():
+            queue = GenerationQueue(max_concurrent=1)
+            await queue.acquire()
+            order.append("running")
+            tasks = [
+                asyncio.create_task(job(queue, "draft-1", PRIORITY_DRAFT)),
+                asyncio.create_task(job(queue, "draft-2", PRIORITY_DRAFT)),
+                asyncio.create_task(job(queue, "final", PRIORITY_FINAL)),
+            ]
+            await asyncio.sleep(0)
+            assert queue.get_stats()["waiting"] == {PRIORITY_DRAFT: 2, PRIORITY_FINAL: 1}
+            queue.release()
+            await asyncio.gather(*tasks)
+            assert queue.get_stats()["running"] == 0
+
+        asyncio.run(main())
+        assert order == ["running", "final", "draft-1", "draft-2"]
+
+    def test_cancelled_waiter_releases_nothing(self):
+        async def main():
+            queue = GenerationQueue(max_concurrent=1)
+            await queue.acquire()
+            waiter = asyncio.create_task(queue.acquire(PRIORITY_DRAFT))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+            queue.release()
+            assert queue.get_stats() == {"max_concurrent": 1, "running": 0, "waiting": {}}
+
+        asyncio.run(main())
@@ -0,0 +1,48 @@
+"""
+Tests for the latent-space preview decoder
+"""
+import numpy as np
+import pytest
+import torch
+
+from skyreels_v2_infer.modules.latent_preview import fit_latent_previewer
+from skyreels_v2_infer.modules.latent_preview import LatentPreviewer
+from skyreels_v2_infer.modules.latent_preview import load_latent_previewer
+
+
+def expand_to_video(frames):
+    """Repeats preview frames [3, F, H, W] the way causal latent frames cover 1 + 4 * (F - 1) video frames"""
+    return torch.cat([frames[:, :1], frames[:, 1:].repeat_interleave(4, dim=1)], dim=1)
+
+
+class TestLatentPreviewer:
+    """Test decoding and fitting of the latent preview projection"""
+
+    def test_default_preview_shape(self):
+        previewer = LatentPreviewer.default()
+        frames = previewer(torch.randn(16, 3, 8, 12))
+        assert frames.shape == (3, 8, 12, 3)
+        assert frames.dtype == np.uint8
+
+    @pytest.mark.parametrize("upscale", [1, 2])
+    def test_fit_recovers_projection(self, upscale):
+        torch.manual_seed(0)
+        reference = LatentPreviewer(torch.randn(3 * upscale**2, 16) * 0.03, torch.randn(3 * upscale**2) * 0.1, upscale)
+        latents = [torch.randn(16, 3, 6, 8) for _ in range(2)]
+        videos = [expand_to_video(reference.decode(z)) for z in latents]
+
+        fitted = fit_latent_previewer(latents, videos, upscale=upscale, ridge=0.0)
+        assert torch.allclose(fitted.weight, reference.weight, atol=1e-4)
+        assert torch.allclose(fitted.bias, reference.bias, atol=1e-4)
+
+    def test_saved_previewer_is_loaded(self, tmp_path):
+        previewer = LatentPreviewer(torch.randn(12, 16), torch.zeros(12), upscale=2)
+        previewer.save(str(tmp_path / "latent_preview.json"))
+        loaded = load_latent_previewer(str(tmp_path))
+        assert loaded.upscale == 2
+        assert torch.allclose(loaded.weight, previewer.weight)
+        assert load_latent_previewer(None).upscale == 1
+
+    def test_rejects_mismatched_projection(self):
+        with pytest.raises(ValueError):
+            LatentPreviewer(torch.randn(3, 16), torch.zeros(3), upscale=2)
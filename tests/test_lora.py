@@ -0,0 +1,232 @@
+"""
+Tests for serving LoRA adapters on a resident DiT
+"""
+import pytest
+import torch
+import torch.nn as nn
+from safetensors.torch import save_file
+
+from skyreels_v2_infer.modules.device import autocast
+from skyreels_v2_infer.modules.lora import LoRALinear
+from skyreels_v2_infer.modules.lora import LoRAManager
+from skyreels_v2_infer.modules.lora import read_lora
+from skyreels_v2_infer.modules.quantization import quantize_model
+from skyreels_v2_infer.modules.transformer import WanModel
+from skyreels_v2_infer.pipelines import ContinuousBatchScheduler
+from skyreels_v2_infer.pipelines import DenoiseRequest
+from skyreels_v2_infer.pipelines import GuidanceSchedule
+
+
+def make_wan():
+    torch.manual_seed(0)
+    return WanModel(dim=32, ffn_dim=64, num_heads=4, num_layers=2, text_dim=16, freq_dim=16).eval()
+
+
+def write_lora(path, targets, rank=4, seed=0, alpha=None, prefix="diffusion_model."):
+    """Random adapter on `targets`, a dict of module name to (in_features, out_features); returns its weights."""
+    generator = torch.Generator().manual_seed(seed)
+    tensors, weights = {}, {}
+    for name, (in_features, out_features) in targets.items():
+        down = torch.randn(rank, in_features, generator=generator)
+        up = torch.randn(out_features, rank, generator=generator)
+        tensors[f"{prefix}{name}.lora_A.weight"] = down
+        tensors[f"{prefix}{name}.lora_B.weight"] = up
+        if alpha is not None:
+            tensors[f"{prefix}{name}.alpha"] = torch.tensor(float(alpha))
+        weights[name] = (down, up, (alpha if alpha is not None else rank) / rank)
+    save_file(tensors, str(path))
+    return weights
+
+
+def block_targets(model):
+    return {
+        name: (module.in_features, module.out_features)
+        for name, module in model.named_modules()
+        if name.startswith("blocks.") and isinstance(module, nn.Linear)
+    }
+
+
+def forward(model, batch=1):
+    generator = torch.Generator().manual_seed(1)
+    latents = torch.randn(batch, 16, 2, 8, 8, generator=generator)
+    context = torch.randn(batch, 8, 16, generator=generator)
+    with torch.no_grad():
+        return model(latents, t=torch.full((batch,), 500.0), context=context)
+
+
+def merged(weights):
+    """The `make_wan` model with `weights` merged into its linears."""
+    model = make_wan()
+    with torch.no_grad():
+        for name, (down, up, scale) in weights.items():
+            model.get_submodule(name).weight += scale * up @ down
+    return model
+
+
+class TestReadLora:
+    """Test reading LoRA files of different layouts"""
+
+    def test_peft_layout_with_alpha(self, tmp_path):
+        weights = write_lora(tmp_path / "a.safetensors", {"blocks.0.self_attn.q": (32, 32)}, rank=4, alpha=8)
+        layers = read_lora(str(tmp_path / "a.safetensors"))
+        down, up, scale = layers["blocks.0.self_attn.q"]
+        torch.testing.assert_close(down, weights["blocks.0.self_attn.q"][0])
+        assert scale == 2.0
+
+    def test_kohya_layout(self, tmp_path):
+        save_file(
+            {
+                "blocks.0.ffn.0.lora_down.weight": torch.randn(2, 32),
+                "blocks.0.ffn.0.lora_up.weight": torch.randn(64, 2),
+            },
+            str(tmp_path / "k.safetensors"),
+        )
+        layers = read_lora(str(tmp_path / "k.safetensors"))
+        assert list(layers) == ["blocks.0.ffn.0"] and layers["blocks.0.ffn.0"][2] == 1.0
+
+    def test_unsupported_key_raises(self, tmp_path):
+        save_file({"blocks.0.norm3.diff": torch.randn(32)}, str(tmp_path / "d.safetensors"))
+        with pytest.raises(ValueError, match="unsupported LoRA key"):
+            read_lora(str(tmp_path / "d.safetensors"))
+
+
+class TestLoRAManager:
+    """Test loading, swapping and evicting adapters on one `WanModel`"""
+
+    def test_matches_merged_weights(self, tmp_path):
+        model = make_wan()
+        weights = write_lora(tmp_path / "style.safetensors", block_targets(model), alpha=2)
+        manager = LoRAManager(model, str(tmp_path))
+        base = forward(model)
+        with manager.use("style"):
+            out = forward(model)
+        torch.testing.assert_close(out, forward(merged(weights)), atol=1e-4, rtol=1e-4)
+        # outside the block the base model is back
+        torch.testing.assert_close(forward(model), base)
+
+    def test_mixed_batch_matches_single_adapters(self, tmp_path):
+        model = make_wan()
+        targets = block_targets(model)
+        write_lora(tmp_path / "a.safetensors", targets, seed=1, alpha=1)
+        write_lora(tmp_path / "b.safetensors", targets, seed=2, alpha=1)
+        manager = LoRAManager(model, str(tmp_path))
+        with manager.use(["a", None, "b"]):
+            out = forward(model, batch=3)
+        for i, name in enumerate(["a", None, "b"]):
+            with manager.use(name):
+                torch.testing.assert_close(out[i], forward(model, batch=3)[i], atol=1e-4, rtol=1e-4)
+
+    def test_unfuses_qkv(self, tmp_path):
+        model = make_wan()
+        model.fuse_qkv()
+        write_lora(tmp_path / "q.safetensors", {"blocks.1.self_attn.q": (32, 32)})
+        manager = LoRAManager(model, str(tmp_path))
+        manager.load("q")
+        assert isinstance(model.blocks[1].self_attn.q, LoRALinear)
+        assert type(model.blocks[0].self_attn.q) is nn.Linear
+
+    def test_wraps_quantized_layers(self, tmp_path):
+        model = make_wan()
+        quantize_model(model, "int8")
+        write_lora(tmp_path / "s.safetensors", {"blocks.0.ffn.2": (64, 32)}, alpha=1)
+        manager = LoRAManager(model, str(tmp_path))
+        base = forward(model)
+        with manager.use("s"):
+            assert not torch.allclose(forward(model), base)
+
+    def test_adapters_follow_the_model(self, tmp_path):
+        model = make_wan()
+        weights = write_lora(tmp_path / "style.safetensors", block_targets(model), alpha=2)
+        manager = LoRAManager(model, str(tmp_path))
+        manager.load("style")
+        # moved and cast with the base weights, as `--offload` moves the DiT after the adapters were loaded
+        model.to(torch.float64)
+        layers = [module for module in model.modules() if isinstance(module, LoRALinear)]
+        assert all(down.dtype == torch.float64 for layer in layers for down, _, _ in layer.adapters.values())
+        with manager.use("style"):
+            out = forward(model.float())
+        torch.testing.assert_close(out, forward(merged(weights)), atol=1e-4, rtol=1e-4)
+        model.to("meta")
+        assert all(up.is_meta for layer in layers for _, up, _ in layer.adapters.values())
+
+    @pytest.mark.skipif(not torch.cuda.is_available(), reason="needs CUDA")
+    def test_offloaded_model_on_cuda(self, tmp_path):
+        model = make_wan()
+        weights = write_lora(tmp_path / "style.safetensors", block_targets(model), alpha=2)
+        manager = LoRAManager(model, str(tmp_path))
+        manager.load("style")
+        model.to("cuda", torch.bfloat16)
+        generator = torch.Generator().manual_seed(1)
+        latents = torch.randn(1, 16, 2, 8, 8, generator=generator).cuda()
+        context = torch.randn(1, 8, 16, generator=generator).cuda().bfloat16()
+        with manager.use("style"), autocast("cuda", torch.bfloat16), torch.no_grad():
+            out = model(latents, t=torch.full((1,), 500.0, device="cuda"), context=context).cpu()
+        reference = forward(merged(weights))
+        assert ((out - reference).norm() / reference.norm()).item() < 0.05
+
+    def test_lru_eviction_and_stats(self, tmp_path):
+        model = make_wan()
+        for i, name in enumerate("abc"):
+            write_lora(tmp_path / f"{name}.safetensors", {"blocks.0.self_attn.o": (32, 32)}, seed=i)
+        manager = LoRAManager(model, str(tmp_path), max_adapters=2)
+        assert manager.available() == ["a", "b", "c"]
+        manager.load("a")
+        manager.load("b")
+        manager.load("a")
+        manager.load("c")
+        assert list(manager.adapters) == ["a", "c"]
+        assert set(model.blocks[0].self_attn.o.adapters) == {"a", "c"}
+
+        stats = manager.stats()
+        assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 3, 1)
+        # rank 4 down and up projections of a 32 x 32 layer in float32
+        assert stats["adapters"][0]["memory_mb"] == 2 * 4 * 32 * 4 / 2**20
+        assert stats["mean_load_ms"] > 0
+
+    def test_unknown_adapter_and_target_raise(self, tmp_path):
+        model = make_wan()
+        manager = LoRAManager(model, str(tmp_path))
+        with pytest.raises(FileNotFoundError):
+            manager.load("missing")
+        write_lora(tmp_path / "bad.safetensors", {"blocks.0.norm3": (32, 32)})
+        with pytest.raises(ValueError, match="not a linear layer"):
+            manager.load("bad")
+
+
+class TestSchedulerAdapters:
+    """Test requests with different adapters in one continuous batch"""
+
+    def make_request(self, request_id, adapter):
+        generator = torch.Generator().manual_seed(2)
+        return DenoiseRequest(
+            request_id,
+            torch.randn(16, 2, 8, 8, generator=generator),
+            torch.randn(1, 8, 16, generator=generator),
+            num_inference_steps=2,
+            guidance_schedule=GuidanceSchedule(guidance_scale=1.0),
+            adapter=adapter,
+        )
+
+    def test_batched_adapters_match_sequential(self, tmp_path):
+        model = make_wan()
+        targets = block_targets(model)
+        write_lora(tmp_path / "a.safetensors", targets, seed=1, alpha=1)
+        write_lora(tmp_path / "b.safetensors", targets, seed=2, alpha=1)
+        manager = LoRAManager(model, str(tmp_path))
+
+        batched = ContinuousBatchScheduler(model, max_batch_size=3, device="cpu", lora_manager=manager)
+        for request_id, adapter in [("a", "a"), ("base", None), ("b", "b")]:
+            batched.submit(self.make_request(request_id, adapter))
+        results = batched.run_until_complete()
+        assert batched.num_forwards == 2
+
+        for request_id, adapter in [("a", "a"), ("base", None), ("b", "b")]:
+            single = ContinuousBatchScheduler(model, max_batch_size=1, device="cpu", lora_manager=manager)
+            single.submit(self.make_request(request_id, adapter))
+            expected = single.run_until_complete()[request_id].latents
+            torch.testing.assert_close(results[request_id].latents, expected, atol=1e-4, rtol=1e-4)
+
+    def test_adapter_without_manager_raises(self):
+        scheduler = ContinuousBatchScheduler(make_wan(), device="cpu")
+        with pytest.raises(ValueError, match="no `lora_manager`"):
+            scheduler.submit(self.make_request("a", "a"))
@@ -0,0 +1,65 @@
+"""
+Tests for low-resolution-then-refine sampling
+"""
+import pytest
+import torch
+
+from skyreels_v2_infer.modules.step_cache import FirstBlockCache
+from skyreels_v2_infer.pipelines.progressive import ProgressiveSchedule
+from skyreels_v2_infer.scheduler.fm_solvers_unipc import FlowUniPCMultistepScheduler
+
+
+def run_steps(scheduler, latents, start, end):
+    for t in scheduler.timesteps[start:end]:
+        noise_pred = latents * 0.5
+        latents = scheduler.step(noise_pred.unsqueeze(0), t, latents.unsqueeze(0), return_dict=False)[0].squeeze(0)
+    return latents
+
+
+class TestProgressiveSchedule:
+    """Test the resolution switch of a flow-matching trajectory"""
+
+    def test_low_res_size_keeps_whole_patches(self):
+        progressive = ProgressiveSchedule(10, scale=0.5)
+        assert progressive.low_res_size((68, 120)) == (34, 60)
+        assert progressive.low_res_size((90, 160)) == (44, 80)
+        assert progressive.low_res_size((2, 2)) == (2, 2)
+
+    def test_refine_renoises_to_next_sigma(self):
+        """The upsampled clean estimate is noised to the sigma of the next step and the solver restarts"""
+        progressive = ProgressiveSchedule(3, scale=0.5, mode="nearest")
+        scheduler = FlowUniPCMultistepScheduler()
+        scheduler.set_timesteps(10, shift=5.0)
+        latents = run_steps(scheduler, progressive.sample_noise((4, 2, 8, 8)), 0, 3)
+        x0 = scheduler.model_outputs[-1].squeeze(0).clone()
+        sigma = scheduler.sigmas[3].item()
+
+        refined = progressive.refine(scheduler, latents, (8, 8), torch.Generator().manual_seed(0))
+        noise = torch.randn(4, 2, 8, 8, generator=torch.Generator().manual_seed(0))
+        up = x0.repeat_interleave(2, dim=-2).repeat_interleave(2, dim=-1)
+        assert torch.allclose(refined, (1 - sigma) * up + sigma * noise, atol=1e-6)
+        assert scheduler.step_index == 3
+        assert scheduler.lower_order_nums == 0
+        assert all(output is None for output in scheduler.model_outputs)
+
+        latents = run_steps(scheduler, refined, 3, 10)
+        assert latents.shape == (4, 2, 8, 8)
+
+    def test_refine_unstarted_frame_is_noise(self):
+        scheduler = FlowUniPCMultistepScheduler()
+        scheduler.set_timesteps(10, shift=5.0)
+        refined = ProgressiveSchedule(3).refine(scheduler, torch.zeros(4, 4, 4), (8, 8))
+        assert refined.shape == (4, 8, 8)
+        assert refined.std() > 0.5
+
+    def test_invalid_scale(self):
+        with pytest.raises(ValueError):
+            ProgressiveSchedule(3, scale=1.5)
+
+    def test_invalidate_keeps_step_counter(self):
+        cache = FirstBlockCache(thresh=0.1, num_steps=10)
+        cache.cnt = 4
+        cache.state[0]["first_residual"] = torch.zeros(1)
+        cache.invalidate()
+        assert cache.cnt == 4
+        assert cache.state == [cache.init_state(), cache.init_state()]
@@ -0,0 +1,97 @@
+"""
+Tests for int8 and FP8 weight-only quantization of the DiT
+"""
+import pytest
+import torch
+import torch.nn as nn
+
+from skyreels_v2_infer.modules import get_transformer
+from skyreels_v2_infer.modules.quantization import QUANT_DTYPES
+from skyreels_v2_infer.modules.quantization import quantization_report
+from skyreels_v2_infer.modules.quantization import quantize_model
+from skyreels_v2_infer.modules.quantization import quantize_weight
+from skyreels_v2_infer.modules.quantization import QuantizedLinear
+from skyreels_v2_infer.modules.quantization import read_quantization_config
+from skyreels_v2_infer.modules.quantization import save_quantized
+from skyreels_v2_infer.modules.transformer import WanModel
+
+FORMATS = ["int8", pytest.param("fp8", marks=pytest.mark.skipif("fp8" not in QUANT_DTYPES, reason="no float8"))]
+
+
+def make_wan():
+    torch.manual_seed(0)
+    return WanModel(dim=32, ffn_dim=64, num_heads=4, num_layers=2, text_dim=16, freq_dim=16).eval()
+
+
+def relative_error(output, reference):
+    return ((output - reference).norm() / reference.norm()).item()
+
+
+class TestQuantizeWeight:
+    """Test per output channel quantization of linear weights"""
+
+    def test_int8_roundtrip(self):
+        weight = torch.randn(16, 32, generator=torch.Generator().manual_seed(0))
+        q, scale = quantize_weight(weight, "int8")
+        assert q.dtype == torch.int8 and scale.shape == (16, 1)
+        assert q.abs().amax(dim=1).eq(127).all()
+        # rounding is off by at most half a step
+        assert ((q.float() * scale - weight).abs() <= scale / 2 + 1e-6).all()
+
+    @pytest.mark.parametrize("fmt", FORMATS)
+    def test_linear_matches_float(self, fmt):
+        torch.manual_seed(0)
+        linear = nn.Linear(32, 16)
+        layer = QuantizedLinear.from_linear(linear, fmt)
+        assert layer.weight.dtype == QUANT_DTYPES[fmt]
+        x = torch.randn(4, 32)
+        with torch.no_grad():
+            assert relative_error(layer(x), linear(x)) < (0.01 if fmt == "int8" else 0.05)
+            assert layer(x.bfloat16()).dtype == torch.bfloat16
+
+    def test_unknown_format_raises(self):
+        with pytest.raises(ValueError, match="unknown quantization format"):
+            quantize_weight(torch.randn(2, 2), "int4")
+
+
+class TestQuantizeModel:
+    """Test quantizing the attention and feed-forward layers of `WanModel`"""
+
+    def test_replaces_block_linears(self):
+        model = make_wan()
+        # q/k/v/o of both attentions and the two feed-forward layers of each block
+        assert quantize_model(model, "int8") == 2 * (4 + 4 + 2)
+        assert isinstance(model.blocks[0].self_attn.q, QuantizedLinear)
+        assert isinstance(model.blocks[1].ffn[2], QuantizedLinear)
+        assert type(model.head.head) is nn.Linear
+        assert model.fuse_qkv() == 0
+
+    def test_report(self):
+        rows = quantization_report(make_wan(), "int8")
+        assert len(rows) == 20
+        for row in rows:
+            assert row["weight_error"] < 0.01
+            assert row["output_error"] < 0.02
+
+    def test_saved_checkpoint_loads_quantized(self, tmp_path):
+        model = make_wan()
+        quantize_model(model, "int8")
+        save_quantized(model, str(tmp_path), "int8")
+        assert read_quantization_config(str(tmp_path)) == {"format": "int8"}
+
+        loaded = get_transformer(str(tmp_path), "cpu", torch.float32)
+        assert loaded.blocks[0].self_attn.q.weight.dtype == torch.int8
+        assert loaded.blocks[0].self_attn.q.weight_scale.dtype == torch.float32
+        for key, value in model.state_dict().items():
+            torch.testing.assert_close(loaded.state_dict()[key], value)
+        with pytest.raises(ValueError, match="holds int8 weights"):
+            get_transformer(str(tmp_path), "cpu", torch.float32, quantization="fp8")
+
+    def test_quantizes_while_loading(self, tmp_path):
+        model = make_wan()
+        model.save_pretrained(tmp_path)
+        loaded = get_transformer(str(tmp_path), "cpu", torch.float32, quantization="int8")
+        assert isinstance(loaded.blocks[0].cross_attn.k, QuantizedLinear)
+        x = torch.randn(1, 12, 32, generator=torch.Generator().manual_seed(1))
+        with torch.no_grad():
+            assert relative_error(loaded.blocks[0].ffn(x), model.blocks[0].ffn(x)) < 0.02
@@ -0,0 +1,138 @@
+"""
+Tests for the flow-matching Euler, Heun, DPM-Solver++ and adaptive samplers
+"""
+import pytest
+import torch
+
+from skyreels_v2_infer.pipelines.continuous_batching import ContinuousBatchScheduler
+from skyreels_v2_infer.pipelines.continuous_batching import DenoiseRequest
+from skyreels_v2_infer.pipelines.guidance import GuidanceSchedule
+from skyreels_v2_infer.scheduler.fm_solvers import build_sampler
+from skyreels_v2_infer.scheduler.fm_solvers import FlowHeunScheduler
+from skyreels_v2_infer.scheduler.fm_solvers import SAMPLERS
+
+MEAN, STD = 0.5, 0.3
+
+
+class TimestepTransformer(torch.nn.Module):
+    """Deterministic per-sample prediction that depends on the timestep of the sample"""
+
+    step_cache = None
+
+    def forward(self, x, t, context):
+        return x * 0.5 + t.view(-1, 1, 1, 1, 1) / 1000
+
+
+def gaussian_velocity(x, sigma):
+    """Exact flow-matching velocity of data distributed N(MEAN, STD^2) per element."""
+    var = (1 - sigma) ** 2 * STD**2 + sigma**2
+    centered = x - (1 - sigma) * MEAN
+    x0 = MEAN + (1 - sigma) * STD**2 / var * centered
+    noise = sigma / var * centered
+    return noise - x0
+
+
+def gaussian_endpoint(noise, sigma):
+    """Exact ODE solution at sigma 0 starting from `noise` at `sigma`: the standardized sample is constant."""
+    var = (1 - sigma) ** 2 * STD**2 + sigma**2
+    return MEAN + STD * (noise - (1 - sigma) * MEAN) / var**0.5
+
+
+def solve(name, steps, shift=3.0):
+    scheduler = build_sampler(name)
+    scheduler.set_timesteps(steps, device="cpu", shift=shift)
+    noise = torch.randn(64, generator=torch.Generator().manual_seed(0), dtype=torch.float64)
+    x = noise.clone()
+    # iterating the timesteps like the pipelines do, which sees the in-place updates of the adaptive sampler
+    for t in scheduler.timesteps:
+        sigma = scheduler.sigmas[scheduler.step_index or 0].item()
+        x = scheduler.step(gaussian_velocity(x, sigma), t, x, return_dict=False)[0]
+    expected = gaussian_endpoint(noise, scheduler.sigmas[0].item())
+    return (x - expected).norm().item() / expected.norm().item(), len(scheduler.timesteps)
+
+
+class TestSamplers:
+    """Test the samplers on a flow with a known solution"""
+
+    @pytest.mark.parametrize("name", SAMPLERS)
+    def test_converges(self, name):
+        errors = [solve(name, steps)[0] for steps in (5, 10, 20, 40)]
+        assert all(b < a for a, b in zip(errors, errors[1:]))
+        assert errors[-1] < 0.05
+
+    @pytest.mark.parametrize("name", ["heun", "dpm++"])
+    def test_second_order(self, name):
+        # doubling the steps cuts the error about four times
+        assert solve(name, 40)[0] < solve(name, 20)[0] / 2.5
+        assert solve(name, 20)[0] < solve("euler", 20)[0]
+
+    def test_adaptive_keeps_its_budget(self):
+        # error-controlled second-order steps within the forwards of ten Euler steps
+        adaptive, nfe = solve("adaptive", 10)
+        assert nfe == 10
+        assert adaptive < solve("euler", 10)[0]
+
+    def test_adaptive_schedule_stays_valid(self):
+        scheduler = build_sampler("adaptive")
+        scheduler.set_timesteps(8, shift=5.0)
+        timesteps = scheduler.timesteps
+        spaced = scheduler.sigmas.clone()
+        x = torch.randn(16, dtype=torch.float64)
+        for t in timesteps:
+            sigma = scheduler.sigmas[scheduler.step_index or 0].item()
+            x = scheduler.step(gaussian_velocity(x, sigma), t, x, return_dict=False)[0]
+        # the schedule is updated in place, it still decreases to 0 from the same start
+        assert scheduler.timesteps is timesteps and not torch.equal(scheduler.sigmas, spaced)
+        assert scheduler.sigmas[0] == spaced[0] and scheduler.sigmas[-1] == 0
+        assert (scheduler.sigmas[1:] < scheduler.sigmas[:-1]).all()
+        assert len(scheduler.error_history) == 6
+
+    def test_heun_schedule(self):
+        scheduler = FlowHeunScheduler()
+        scheduler.set_timesteps(4, shift=5.0)
+        timesteps = scheduler.timesteps.tolist()
+        assert len(timesteps) == 7 and len(scheduler.sigmas) == 8
+        assert timesteps[1] == timesteps[2] and timesteps[3] == timesteps[4] and timesteps[5] == timesteps[6]
+
+    @pytest.mark.parametrize("name", SAMPLERS)
+    def test_clean_estimate_and_reset(self, name):
+        scheduler = build_sampler(name)
+        scheduler.set_timesteps(6, shift=5.0)
+        x = torch.randn(8, dtype=torch.float64)
+        sigma = scheduler.sigmas[0].item()
+        v = gaussian_velocity(x, sigma)
+        scheduler.step(v, scheduler.timesteps[0], x, return_dict=False)
+        assert scheduler.step_index == 1
+        torch.testing.assert_close(scheduler.model_outputs[-1].double(), x - sigma * v, atol=1e-5, rtol=1e-5)
+        scheduler.reset_multistep_history()
+        assert scheduler.step_index == 1
+
+    def test_unknown_sampler_raises(self):
+        with pytest.raises(ValueError, match="`sampler` must be one of"):
+            build_sampler("ddim")
+
+
+class TestBatchedSamplers:
+    """Test requests with different samplers in one continuous batch"""
+
+    @staticmethod
+    def make_request(request_id, sampler):
+        return DenoiseRequest(
+            request_id,
+            torch.randn(4, 2, 4, 4, generator=torch.Generator().manual_seed(0)),
+            torch.full((1, 6, 8), 1.0),
+            num_inference_steps=4,
+            guidance_schedule=GuidanceSchedule(1.0),
+            sampler=sampler,
+        )
+
+    def test_mixed_samplers_match_serial(self):
+        batched = ContinuousBatchScheduler(TimestepTransformer(), max_batch_size=4, device="cpu")
+        for name in SAMPLERS:
+            batched.submit(self.make_request(name, name))
+        results = batched.run_until_complete()
+        assert len(results["heun"].timesteps) == 7
+        for name in SAMPLERS:
+            single = ContinuousBatchScheduler(TimestepTransformer(), max_batch_size=1, device="cpu")
+            single.submit(self.make_request(name, name))
+            torch.testing.assert_close(results[name].latents, single.run_until_complete()[name].latents)
@@ -0,0 +1,103 @@
+"""
+Tests for hybrid Ulysses x Ring sequence parallel attention on CPU with the gloo backend
+"""
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from skyreels_v2_infer.distributed import sequence_parallel
+from skyreels_v2_infer.distributed.sequence_parallel import resolve_parallel_degrees
+from skyreels_v2_infer.distributed.xdit_context_parallel import usp_attn_forward
+from skyreels_v2_infer.modules.quantization import quantize_model
+from skyreels_v2_infer.modules.transformer import WanModel
+
+WORLD_SIZE = 4
+
+
+def run_attention(rank, init_file, ulysses_degree, ring_degree):
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=WORLD_SIZE)
+    try:
+        sequence_parallel.init_sequence_parallel(ulysses_degree, ring_degree)
+        generator = torch.Generator().manual_seed(0)
+        q, k, v = (torch.randn(2, 32, 8, 16, generator=generator) for _ in range(3))
+        expected = torch.nn.functional.scaled_dot_product_attention(
+            q.transpose(1, 2), k.transpose(1, 2), v.transpose(1, 2)
+        ).transpose(1, 2)
+
+        local = [x.chunk(WORLD_SIZE, dim=1)[rank] for x in (q, k, v)]
+        out = sequence_parallel.long_context_attention(*local)
+        assert out.shape == local[0].shape
+        torch.testing.assert_close(sequence_parallel.all_gather(out, dim=1), expected, atol=1e-5, rtol=1e-5)
+
+        # an all-to-all and its inverse restore the input
+        groups = sequence_parallel.get_groups()
+        heads = sequence_parallel.all_to_all(local[0], 2, 1, groups.ulysses_group, groups.ulysses_ranks)
+        assert heads.shape == (2, 8 * ulysses_degree, 8 // ulysses_degree, 16)
+        back = sequence_parallel.all_to_all(heads, 1, 2, groups.ulysses_group, groups.ulysses_ranks)
+        assert torch.equal(back, local[0])
+    finally:
+        sequence_parallel.destroy_sequence_parallel()
+        dist.destroy_process_group()
+
+
+def run_quantized_attention(rank, init_file):
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=2)
+    try:
+        sequence_parallel.init_sequence_parallel(ulysses_degree=2, ring_degree=1)
+        torch.manual_seed(0)
+        model = WanModel(dim=32, ffn_dim=64, num_heads=4, num_layers=1, text_dim=16, freq_dim=16).eval()
+        quantize_model(model, "int8")
+        attn = model.blocks[0].self_attn
+        grid_sizes = torch.tensor([2, 4, 4])
+        x = torch.randn(1, 32, 32, generator=torch.Generator().manual_seed(1))
+        with torch.no_grad():
+            expected = attn(x, grid_sizes, model.freqs, None)
+            out = usp_attn_forward(attn, x.chunk(2, dim=1)[rank], grid_sizes, model.freqs, None)
+        out = sequence_parallel.all_gather(out, dim=1)
+        # both paths run the attention in bfloat16
+        torch.testing.assert_close(out.float(), expected.float(), atol=2e-2, rtol=2e-2)
+    finally:
+        sequence_parallel.destroy_sequence_parallel()
+        dist.destroy_process_group()
+
+
+@pytest.mark.skipif(not dist.is_available(), reason="torch.distributed is not available")
+class TestGlooAttention:
+    """Test that every layout of four processes matches single-process attention"""
+
+    @pytest.mark.parametrize("ulysses_degree, ring_degree", [(4, 1), (2, 2), (1, 4)])
+    def test_matches_full_attention(self, tmp_path, ulysses_degree, ring_degree):
+        mp.spawn(
+            run_attention, args=(str(tmp_path / "init"), ulysses_degree, ring_degree), nprocs=WORLD_SIZE, join=True
+        )
+
+    def test_usp_attention_on_quantized_block(self, tmp_path):
+        mp.spawn(run_quantized_attention, args=(str(tmp_path / "init"),), nprocs=2, join=True)
+
+
+class TestResolveParallelDegrees:
+    """Test the choice and validation of the Ulysses and ring degrees"""
+
+    def test_auto_prefers_ulysses(self):
+        assert resolve_parallel_degrees(8, 40) == (8, 1)
+
+    def test_auto_is_capped_by_heads(self):
+        assert resolve_parallel_degrees(8, 12) == (4, 2)
+        assert resolve_parallel_degrees(4, 7) == (1, 4)
+
+    def test_auto_is_capped_by_node_size(self):
+        assert resolve_parallel_degrees(16, 40, max_ulysses_degree=8) == (8, 2)
+        assert resolve_parallel_degrees(8, 40, max_ulysses_degree=2) == (2, 4)
+
+    def test_one_degree_derives_the_other(self):
+        assert resolve_parallel_degrees(8, 40, ring_degree=2) == (4, 2)
+        assert resolve_parallel_degrees(8, 40, ulysses_degree=2) == (2, 4)
+
+    def test_invalid_degrees(self):
+        with pytest.raises(ValueError, match="heads"):
+            resolve_parallel_degrees(8, 12, ulysses_degree=8)
+        with pytest.raises(ValueError):
+            resolve_parallel_degrees(8, 40, ulysses_degree=2, ring_degree=2)
+        with pytest.raises(ValueError):
+            resolve_parallel_degrees(8, 40, ring_degree=3)
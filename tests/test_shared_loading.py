@@ -0,0 +1,135 @@
+"""
+Tests for loading checkpoints once per node and mapping them from every rank
+"""
+import json
+import os
+import struct
+import sys
+
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from safetensors.torch import save_file
+
+from skyreels_v2_infer.distributed import shared_loading
+from skyreels_v2_infer.distributed.shared_loading import map_safetensors
+from skyreels_v2_infer.distributed.shared_loading import memory_usage
+from skyreels_v2_infer.distributed.shared_loading import report_cold_start
+from skyreels_v2_infer.distributed.shared_loading import shared_checkpoint
+from skyreels_v2_infer.modules import get_transformer
+from skyreels_v2_infer.modules.transformer import WanModel
+
+
+def make_tensors():
+    generator = torch.Generator().manual_seed(0)
+    return {
+        "weight": torch.randn(4, 6, generator=generator),
+        "half": torch.randn(3, 5, generator=generator).to(torch.bfloat16),
+        "index": torch.arange(7),
+        "scalar": torch.tensor(2.5),
+        "empty": torch.empty(0, 3),
+    }
+
+
+def run_staged(rank, init_file, checkpoint, stage_dir):
+    os.environ["LOCAL_RANK"] = str(rank)
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=2)
+    try:
+        shared_loading.set_stage_dir(stage_dir)
+        with shared_checkpoint(checkpoint) as path:
+            assert os.path.dirname(path) == stage_dir
+            tensors = map_safetensors(path)
+        dist.barrier()
+        assert os.listdir(stage_dir) == []
+        for key, expected in make_tensors().items():
+            torch.testing.assert_close(tensors[key], expected)
+        assert report_cold_start(0.0).startswith("cold start")
+    finally:
+        shared_loading.set_stage_dir(None)
+        dist.destroy_process_group()
+
+
+class TestMapSafetensors:
+    """Test zero-copy loading of safetensors files"""
+
+    def test_matches_saved_tensors(self, tmp_path):
+        save_file(make_tensors(), tmp_path / "model.safetensors")
+        tensors = map_safetensors(str(tmp_path / "model.safetensors"))
+        for key, expected in make_tensors().items():
+            assert tensors[key].dtype == expected.dtype
+            torch.testing.assert_close(tensors[key], expected)
+
+    def test_writes_do_not_reach_the_file(self, tmp_path):
+        save_file(make_tensors(), tmp_path / "model.safetensors")
+        path = str(tmp_path / "model.safetensors")
+        map_safetensors(path)["weight"].zero_()
+        torch.testing.assert_close(map_safetensors(path)["weight"], make_tensors()["weight"])
+
+    def test_unpadded_header_copies_misaligned_tensors(self, tmp_path):
+        expected = {key: tensor for key, tensor in make_tensors().items() if tensor.numel()}
+        header, data = {}, b""
+        for key, tensor in expected.items():
+            raw = tensor.reshape(-1).view(torch.uint8).numpy().tobytes()
+            dtype = {torch.float32: "F32", torch.bfloat16: "BF16", torch.int64: "I64"}[tensor.dtype]
+            offsets = [len(data), len(data) + len(raw)]
+            header[key] = {"dtype": dtype, "shape": list(tensor.shape), "data_offsets": offsets}
+            data += raw
+        header = json.dumps(header).encode()
+        # writers other than `save_file` may leave the header unpadded, here the data starts at an odd offset
+        header += b" " * ((9 - len(header)) % 8)
+        assert (8 + len(header)) % 8 == 1
+        path = tmp_path / "unpadded.safetensors"
+        path.write_bytes(struct.pack("<Q", len(header)) + header + data)
+
+        tensors = map_safetensors(str(path))
+        for key, tensor in expected.items():
+            assert tensors[key].data_ptr() % tensor.element_size() == 0
+            torch.testing.assert_close(tensors[key], tensor)
+
+
+class TestGetTransformer:
+    """Test building the DiT on the meta device from mapped checkpoints"""
+
+    def test_loads_every_parameter(self, tmp_path):
+        torch.manual_seed(0)
+        model = WanModel(dim=32, ffn_dim=64, num_heads=4, num_layers=2, text_dim=16, freq_dim=16)
+        model.save_pretrained(tmp_path)
+        loaded = get_transformer(str(tmp_path), "cpu", torch.float32)
+        assert loaded.state_dict().keys() == model.state_dict().keys()
+        for key, value in model.state_dict().items():
+            torch.testing.assert_close(loaded.state_dict()[key], value)
+        torch.testing.assert_close(loaded.freqs, model.freqs)
+
+    def test_missing_parameters_raise(self, tmp_path):
+        model = WanModel(dim=32, ffn_dim=64, num_heads=4, num_layers=1, text_dim=16, freq_dim=16)
+        model.save_config(tmp_path)
+        state_dict = {key: value for key, value in model.state_dict().items() if not key.startswith("head.")}
+        save_file(state_dict, tmp_path / "diffusion_pytorch_model.safetensors")
+        with pytest.raises(RuntimeError, match="head.head.weight"):
+            get_transformer(str(tmp_path), "cpu", torch.float32)
+
+
+class TestSharedCheckpoint:
+    """Test staging a checkpoint once for the ranks of a node"""
+
+    def test_single_process_maps_in_place(self, tmp_path):
+        with shared_checkpoint(str(tmp_path / "model.safetensors")) as path:
+            assert path == str(tmp_path / "model.safetensors")
+
+    @pytest.mark.skipif(not dist.is_available(), reason="torch.distributed is not available")
+    def test_stages_and_removes_copy(self, tmp_path):
+        save_file(make_tensors(), tmp_path / "model.safetensors")
+        stage_dir = tmp_path / "stage"
+        stage_dir.mkdir()
+        mp.spawn(
+            run_staged,
+            args=(str(tmp_path / "init"), str(tmp_path / "model.safetensors"), str(stage_dir)),
+            nprocs=2,
+            join=True,
+        )
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc")
+    def test_memory_usage(self):
+        usage = memory_usage()
+        assert usage["peak_rss"] > 0 and usage["pss"] > 0
@@ -0,0 +1,99 @@
+"""
+Tests for cross-job pipelining of generation stages
+"""
+import threading
+import time
+
+import pytest
+
+from skyreels_v2_infer.pipelines.staged_executor import Stage
+from skyreels_v2_infer.pipelines.staged_executor import StagedExecutor
+
+
+def sleep_stage(name, seconds, log=None):
+    def run(payload):
+        if log is not None:
+            log.append((name, payload))
+        time.sleep(seconds)
+        return payload + [name]
+
+    return Stage(name, run)
+
+
+class TestStagedExecutor:
+    """Test CPU stub stages passing jobs through bounded queues"""
+
+    def test_jobs_run_every_stage_in_order(self):
+        log = []
+        stages = [sleep_stage(name, 0.0, log) for name in ("encode", "denoise", "decode")]
+        with StagedExecutor(stages) as executor:
+            results = executor.map({f"job-{i}": [i] for i in range(4)})
+        assert results == {f"job-{i}": [i, "encode", "denoise", "decode"] for i in range(4)}
+        for name in ("encode", "denoise", "decode"):
+            assert [payload[0] for stage, payload in log if stage == name] == [0, 1, 2, 3]
+
+    def test_stages_overlap_across_jobs(self):
+        names = ("encode", "denoise", "decode", "export")
+        started = {(name, i): threading.Event() for name in names for i in range(6)}
+        overlapped = []
+
+        def gated_stage(index, name):
+            def run(payload):
+                started[name, payload[0]].set()
+                # hold the job until the stage before has started the next one, which only happens when pipelined
+                if index > 0 and payload[0] + 1 < 6:
+                    overlapped.append(started[names[index - 1], payload[0] + 1].wait(5.0))
+                return payload + [name]
+
+            return Stage(name, run)
+
+        with StagedExecutor([gated_stage(index, name) for index, name in enumerate(names)]) as executor:
+            results = executor.map({f"job-{i}": [i] for i in range(6)})
+        assert results == {f"job-{i}": [i, *names] for i in range(6)}
+        assert overlapped == [True] * 3 * 5
+
+        stats = executor.get_stats()
+        assert set(stats["stages"]) == {"encode", "denoise", "decode", "export"}
+        for stage in stats["stages"].values():
+            assert stage["jobs"] == 6
+            assert 0.0 < stage["utilisation"] <= 1.0
+
+    def test_failed_job_skips_later_stages(self):
+        def fail_on_one(payload):
+            if payload[0] == 1:
+                raise RuntimeError("out of memory")
+            return payload + ["denoise"]
+
+        log = []
+        stages = [sleep_stage("encode", 0.0), Stage("denoise", fail_on_one), sleep_stage("decode", 0.0, log)]
+        with StagedExecutor(stages) as executor:
+            jobs = [executor.submit(f"job-{i}", [i]) for i in range(3)]
+            with pytest.raises(RuntimeError, match="out of memory"):
+                jobs[1].result()
+            assert jobs[1].failed_stage == "denoise"
+            assert jobs[2].result() == [2, "encode", "denoise", "decode"]
+        assert [payload[0] for _, payload in log] == [0, 2]
+
+    def test_bounded_queue_applies_backpressure(self):
+        release = threading.Event()
+
+        def blocked(payload):
+            release.wait()
+            return payload
+
+        executor = StagedExecutor([Stage("denoise", blocked, queue_size=1)])
+        executor.submit("job-0", 0)
+        time.sleep(0.05)
+        executor.submit("job-1", 0)
+        submitted = threading.Event()
+        threading.Thread(target=lambda: (executor.submit("job-2", 0), submitted.set()), daemon=True).start()
+        assert not submitted.wait(0.1)
+        release.set()
+        assert submitted.wait(1.0)
+        executor.shutdown()
+
+    def test_submit_after_shutdown(self):
+        executor = StagedExecutor([sleep_stage("encode", 0.0)])
+        executor.shutdown()
+        with pytest.raises(RuntimeError):
+            executor.submit("job-0", [])
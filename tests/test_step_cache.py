@@ -0,0 +1,110 @@
+"""
+Tests for the step-level transformer caches used by the SkyReels-V2 models
+"""
+import numpy as np
+import pytest
+import torch
+
+from skyreels_v2_infer.modules.step_cache import BlockResidualCache
+from skyreels_v2_infer.modules.step_cache import build_step_cache
+from skyreels_v2_infer.modules.step_cache import FirstBlockCache
+from skyreels_v2_infer.modules.step_cache import load_teacache_coefficients
+from skyreels_v2_infer.modules.step_cache import polyval
+from skyreels_v2_infer.modules.step_cache import StepCacheCalibrator
+from skyreels_v2_infer.modules.step_cache import TeaCache
+from skyreels_v2_infer.modules.step_cache import TEACACHE_COEFFICIENTS
+
+
+class CountingBlock:
+    """Adds a constant and counts how often it runs"""
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self, x, **kwargs):
+        self.calls += 1
+        return x + self.value
+
+
+class TestStepCache:
+    """Test caching decisions and residual reuse"""
+
+    def test_polyval_matches_numpy(self):
+        """Device polynomial evaluation matches np.poly1d"""
+        coefficients = [2.5, -1.0, 0.3, 4.0]
+        x = torch.tensor(0.37, dtype=torch.float64)
+        expected = np.poly1d(coefficients)(0.37)
+        assert polyval(torch.tensor(coefficients, dtype=torch.float64), x).item() == pytest.approx(expected)
+
+    def test_teacache_reuses_residual(self):
+        """Small timestep changes replay the cached residual instead of running the blocks"""
+        blocks = [CountingBlock(1.0), CountingBlock(2.0)]
+        cache = TeaCache([0.0, 0.0, 0.0, 1.0, 0.0], thresh=0.5, num_steps=20)
+        x = torch.zeros(4)
+        e = torch.ones(4)
+        outputs = [cache(blocks, x, {}, e=e * (1 + 0.01 * i), e0=e) for i in range(6)]
+        for out in outputs:
+            assert torch.allclose(out, torch.full((4,), 3.0))
+        # the first call of each branch is forced, the rest stay under the threshold
+        assert blocks[0].calls == 2
+
+    def test_first_block_cache(self):
+        """The first block always runs while identical residuals skip the rest"""
+        blocks = [CountingBlock(1.0), CountingBlock(2.0), CountingBlock(3.0)]
+        cache = FirstBlockCache(thresh=0.1, num_steps=20)
+        x = torch.zeros(4)
+        for _ in range(8):
+            out = cache(blocks, x, {}, e=None, e0=None)
+            assert torch.allclose(out, torch.full((4,), 6.0))
+        assert blocks[0].calls == 8
+        assert blocks[1].calls == 2
+
+    def test_block_residual_cache_interval(self):
+        """Cached blocks are recomputed every `interval` calls of a branch"""
+        blocks = [CountingBlock(1.0), CountingBlock(2.0)]
+        cache = BlockResidualCache(cache_blocks=[1], interval=2, num_steps=40, ret_steps=0)
+        x = torch.zeros(4)
+        for _ in range(8):
+            cache(blocks, x, {}, e=None, e0=None)
+        assert blocks[0].calls == 8
+        assert blocks[1].calls == 4
+
+    def test_skip_branch_keeps_parity(self):
+        """Skipping the uncond pass advances the counter so branches stay aligned"""
+        cache = build_step_cache("fbcache", num_steps=20, thresh=0.1)
+        cache(([CountingBlock(1.0)]), torch.zeros(2), {}, e=None, e0=None)
+        assert cache.branch == 1
+        cache.skip_branch()
+        assert cache.branch == 0
+
+    def test_calibrator_fit(self):
+        """Calibration records per-step changes and fits polynomial coefficients"""
+        calibrator = StepCacheCalibrator(num_steps=40)
+        blocks = [CountingBlock(1.0)]
+        for i in range(20):
+            e = torch.full((4,), 1.0 + i)
+            calibrator(blocks, torch.full((4,), float(i)), {}, e=e, e0=e)
+        coefficients = calibrator.fit(degree=2)
+        assert len(coefficients["coefficients"]) == 3
+        assert len(coefficients["ret_steps_coefficients"]) == 3
+
+    def test_unknown_method(self):
+        with pytest.raises(ValueError):
+            build_step_cache("unknown", num_steps=10)
+
+
+class TestTeaCacheCoefficients:
+    """Test resolving the TeaCache coefficients of the released checkpoints"""
+
+    def test_i2v_1_3b_uses_the_540p_fit(self):
+        coefficients = load_teacache_coefficients("Skywork/SkyReels-V2-I2V-1.3B-540P", "i2v", 1536, False)
+        assert coefficients == TEACACHE_COEFFICIENTS[("i2v", "14B", "540P")]["coefficients"]
+
+    def test_calibrated_config_wins(self, tmp_path):
+        (tmp_path / "step_cache.json").write_text('{"teacache": {"coefficients": [1.0, 0.0]}}')
+        assert load_teacache_coefficients(str(tmp_path), "i2v", 1536, False) == [1.0, 0.0]
+
+    def test_unknown_checkpoint_raises(self):
+        with pytest.raises(ValueError, match="calibrate_step_cache"):
+            load_teacache_coefficients("custom", "i2v", 2048, False)
@@ -0,0 +1,110 @@
+"""
+Tests for tensor parallel sharding of the T5 encoder and the DiT on CPU with the gloo backend
+"""
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from skyreels_v2_infer.distributed import tensor_parallel
+from skyreels_v2_infer.distributed.tensor_parallel import load_sharded_state_dict
+from skyreels_v2_infer.distributed.tensor_parallel import shard_model
+from skyreels_v2_infer.distributed.tensor_parallel import unloaded_parameters
+from skyreels_v2_infer.modules import get_transformer
+from skyreels_v2_infer.modules.t5 import T5Encoder
+from skyreels_v2_infer.modules.transformer import WanModel
+
+WORLD_SIZE = 2
+
+
+def make_t5(shared_pos):
+    torch.manual_seed(0)
+    return T5Encoder(
+        vocab=64, dim=32, dim_attn=32, dim_ffn=48, num_heads=4, num_layers=2, num_buckets=8, shared_pos=shared_pos
+    ).eval()
+
+
+def make_wan():
+    torch.manual_seed(0)
+    model = WanModel(model_type="i2v", dim=32, ffn_dim=64, num_heads=4, num_layers=2, text_dim=16, freq_dim=16)
+    with torch.no_grad():
+        for name, param in model.named_parameters():
+            if "norm" in name:
+                param.uniform_(0.5, 1.5)
+    return model.eval()
+
+
+def init(rank, init_file):
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=WORLD_SIZE)
+    tensor_parallel.init_tensor_parallel()
+
+
+def run_t5(rank, init_file, shared_pos):
+    init(rank, init_file)
+    try:
+        full = make_t5(shared_pos)
+        with torch.device("meta"):
+            model = make_t5(shared_pos)
+        model = shard_model(model)
+        load_sharded_state_dict(model, full.state_dict())
+        assert unloaded_parameters(model) == []
+        assert model.blocks[0].attn.q.weight.shape == (16, 32)
+        assert model.blocks[0].ffn.fc2.weight.shape == (32, 24)
+        with pytest.raises(ValueError, match="evenly"):
+            tensor_parallel.local_shard(5)
+
+        ids = torch.randint(0, 64, (2, 10), generator=torch.Generator().manual_seed(1))
+        mask = torch.ones(2, 10, dtype=torch.long)
+        mask[1, 6:] = 0
+        with torch.no_grad():
+            torch.testing.assert_close(model(ids, mask), full(ids, mask), atol=1e-5, rtol=1e-5)
+    finally:
+        tensor_parallel.destroy_tensor_parallel()
+        dist.destroy_process_group()
+
+
+def run_wan(rank, init_file, model_path):
+    init(rank, init_file)
+    try:
+        full = make_wan()
+        model = get_transformer(model_path, "cpu", torch.float32, shard_fn=shard_model)
+        assert model.fuse_qkv() == 0
+        heads = slice(rank * 2, rank * 2 + 2)
+        x = torch.randn(1, 12, 32, generator=torch.Generator().manual_seed(1))
+        with torch.no_grad():
+            for block, full_block in zip(model.blocks, full.blocks):
+                # each rank computes the q/k/v of its own heads
+                for local, expected in zip(block.self_attn.qkv_fn(x), full_block.self_attn.qkv_fn(x)):
+                    torch.testing.assert_close(local, expected[:, :, heads], atol=1e-5, rtol=1e-5)
+                attn = block.cross_attn
+                k_img = attn.norm_k_img(attn.k_img(x)).view(1, 12, 2, 8)
+                expected = full_block.cross_attn.norm_k_img(full_block.cross_attn.k_img(x)).view(1, 12, 4, 8)
+                torch.testing.assert_close(k_img, expected[:, :, heads], atol=1e-5, rtol=1e-5)
+
+                # and the output projection sums the partial products of all heads
+                values = torch.randn(1, 12, 4, 8, generator=torch.Generator().manual_seed(2))
+                torch.testing.assert_close(
+                    block.self_attn.o(values[:, :, heads].flatten(2)),
+                    full_block.self_attn.o(values.flatten(2)),
+                    atol=1e-5,
+                    rtol=1e-5,
+                )
+                torch.testing.assert_close(block.ffn(x), full_block.ffn(x), atol=1e-5, rtol=1e-5)
+        torch.testing.assert_close(model.head.head.weight, full.head.head.weight)
+    finally:
+        tensor_parallel.destroy_tensor_parallel()
+        dist.destroy_process_group()
+
+
+@pytest.mark.skipif(not dist.is_available(), reason="torch.distributed is not available")
+class TestTensorParallel:
+    """Test that models sharded over two processes match the unsharded ones"""
+
+    @pytest.mark.parametrize("shared_pos", [False, True])
+    def test_t5_encoder(self, tmp_path, shared_pos):
+        mp.spawn(run_t5, args=(str(tmp_path / "init"), shared_pos), nprocs=WORLD_SIZE, join=True)
+
+    def test_wan_model_loads_its_slices(self, tmp_path):
+        make_wan().save_pretrained(tmp_path / "model")
+        mp.spawn(run_wan, args=(str(tmp_path / "init"), str(tmp_path / "model")), nprocs=WORLD_SIZE, join=True)
+
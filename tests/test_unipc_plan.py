@@ -0,0 +1,96 @@
+"""
+Tests for the precomputed sampling plans of the UniPC scheduler
+"""
+import copy
+
+import numpy as np
+import pytest
+import torch
+
+from skyreels_v2_infer.scheduler.fm_solvers_unipc import FlowUniPCMultistepScheduler
+
+
+def trajectory(scheduler, steps=12, reset_at=None):
+    """Denoises with a fixed linear velocity field, returning every intermediate sample."""
+    scheduler.set_timesteps(steps, shift=5.0)
+    latents = torch.randn(1, 4, 2, 4, 4, generator=torch.Generator().manual_seed(0), dtype=torch.float64)
+    samples = []
+    for i, t in enumerate(scheduler.timesteps):
+        if i == reset_at:
+            scheduler.reset_multistep_history()
+        noise_pred = latents * 0.5 - 0.1
+        latents = scheduler.step(noise_pred, t, latents, return_dict=False)[0]
+        samples.append(latents)
+    return torch.stack(samples)
+
+
+def per_step(config=None, **kwargs):
+    """The same trajectory with the coefficients computed at every step."""
+    return trajectory(FlowUniPCMultistepScheduler(**(config or {}), use_sampling_plan=False), **kwargs)
+
+
+class TestSamplingPlan:
+    """Test stepping with a plan against the per-step coefficient computation"""
+
+    @pytest.mark.parametrize(
+        "config",
+        [
+            {},
+            {"solver_order": 1},
+            {"solver_order": 3},
+            {"solver_type": "bh1"},
+            {"solver_order": 3, "solver_type": "bh1"},
+            {"disable_corrector": [0, 1, 2]},
+        ],
+    )
+    def test_matches_per_step_updates(self, config):
+        planned = trajectory(FlowUniPCMultistepScheduler(**config))
+        reference = per_step(config)
+        torch.testing.assert_close(planned, reference, atol=1e-5, rtol=1e-5)
+
+    def test_matches_after_history_reset(self):
+        planned = trajectory(FlowUniPCMultistepScheduler(), reset_at=5)
+        reference = per_step(reset_at=5)
+        torch.testing.assert_close(planned, reference, atol=1e-5, rtol=1e-5)
+
+    def test_cached_schedule_matches_explicit_sigmas(self):
+        cached, explicit = FlowUniPCMultistepScheduler(), FlowUniPCMultistepScheduler()
+        cached.set_timesteps(30, shift=8.0)
+        explicit.set_timesteps(sigmas=np.linspace(cached.sigma_max, cached.sigma_min, 31)[:-1], shift=8.0)
+        assert explicit._plan is not cached._plan
+        assert torch.equal(cached.timesteps, explicit.timesteps) and cached.timesteps.dtype == torch.int64
+        assert torch.equal(cached.sigmas, explicit.sigmas) and cached.sigmas[-1] == 0
+
+    def test_plans_are_cached_and_shared(self):
+        first, second = FlowUniPCMultistepScheduler(), FlowUniPCMultistepScheduler()
+        first.set_timesteps(20, shift=5.0)
+        second.set_timesteps(20, shift=5.0)
+        assert first._plan is second._plan
+        assert first.timesteps is second.timesteps
+        # checkpoint copies keep sharing the plan
+        assert copy.deepcopy(first)._plan is first._plan
+        second.set_timesteps(20, shift=3.0)
+        assert first._plan is not second._plan
+
+    def test_thresholding_keeps_per_step_updates(self):
+        scheduler = FlowUniPCMultistepScheduler(thresholding=True)
+        scheduler.set_timesteps(10, shift=5.0)
+        assert scheduler._plan is None and len(scheduler.timesteps) == 10
+
+    def test_plan_can_be_disabled(self):
+        scheduler = FlowUniPCMultistepScheduler(use_sampling_plan=False)
+        scheduler.set_timesteps(10, shift=5.0)
+        assert scheduler._plan is None and scheduler.config.use_sampling_plan is False
+
+    def test_begin_index_skips_timestep_lookup(self, monkeypatch):
+        scheduler = FlowUniPCMultistepScheduler()
+        scheduler.set_timesteps(10, shift=5.0)
+        scheduler.set_begin_index(0)
+
+        def lookup(*args, **kwargs):
+            raise AssertionError("looked up the timestep")
+
+        monkeypatch.setattr(scheduler, "index_for_timestep", lookup)
+        latents = torch.randn(1, 4, 2, 4, 4)
+        scheduler.step(latents * 0.5, scheduler.timesteps[0], latents, return_dict=False)
+        assert scheduler.step_index == 1
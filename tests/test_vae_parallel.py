@@ -0,0 +1,118 @@
+"""
+Tests for the temporally sharded VAE decode, on CPU with the gloo backend
+"""
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from skyreels_v2_infer.distributed.vae_parallel import num_video_frames
+from skyreels_v2_infer.distributed.vae_parallel import parallel_decode
+from skyreels_v2_infer.distributed.vae_parallel import split_latent_frames
+from skyreels_v2_infer.modules.vae import WanVAE
+from skyreels_v2_infer.modules.vae import WanVAE_
+
+NUM_LATENT_FRAMES = 7
+
+
+def make_vae():
+    torch.manual_seed(0)
+    vae = WanVAE.__new__(WanVAE)
+    vae.vae = WanVAE_(dim=8, z_dim=16, temperal_downsample=[False, True, True]).eval()
+    vae.mean, vae.std = torch.randn(16), torch.rand(16) + 0.5
+    vae.scale = [vae.mean, 1.0 / vae.std]
+    vae.vae_stride = (4, 8, 8)
+    return vae
+
+
+def make_latents():
+    return torch.randn(16, NUM_LATENT_FRAMES, 4, 6, generator=torch.Generator().manual_seed(1))
+
+
+def run_decode(rank, init_file, world_size, overlap, dst):
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size)
+    try:
+        vae, z = make_vae(), make_latents()
+        ranges = split_latent_frames(NUM_LATENT_FRAMES, world_size, overlap)
+        assert all(end > start for start, end in ranges)
+        with torch.no_grad():
+            chunks = [vae.vae.decode_range(z.unsqueeze(0), vae.scale, start, end, overlap) for start, end in ranges]
+            video = parallel_decode(vae, z, overlap=overlap, dst=dst)
+        chunks = [chunk.float().clamp_(-1, 1) for chunk in chunks]
+        if dst is None or rank == dst:
+            torch.testing.assert_close(video, torch.cat(chunks, dim=2))
+            assert video.shape[2] == num_video_frames(0, NUM_LATENT_FRAMES)
+        else:
+            torch.testing.assert_close(video, chunks[rank])
+    finally:
+        dist.destroy_process_group()
+
+
+def run_default_decode(rank, init_file):
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=2)
+    try:
+        vae = make_vae()
+        z = torch.randn(1, 16, 13, 4, 6, generator=torch.Generator().manual_seed(1))
+        with torch.no_grad():
+            expected = vae.decode(z)
+            vae.enable_parallel_decode()
+            video = vae.decode(z)
+        # the second rank starts at latent frame 9 and warms up on 4 frames instead of the full causal history
+        assert split_latent_frames(13, 2, 4) == [(0, 9), (9, 13)]
+        first = num_video_frames(0, 9)
+        torch.testing.assert_close(video[:, :, :first], expected[:, :, :first])
+        error = ((video - expected).norm() / expected.norm()).item()
+        assert error < 0.05, f"relative error {error:.4f} of the default overlap"
+    finally:
+        dist.destroy_process_group()
+
+
+class TestDecodeRange:
+    """Test decoding a temporal chunk with warmed-up causal caches"""
+
+    def test_split_covers_every_frame(self):
+        for num_frames, world_size, overlap in [(25, 4, 4), (31, 8, 2), (3, 4, 4), (7, 2, 0)]:
+            ranges = split_latent_frames(num_frames, world_size, overlap)
+            assert len(ranges) == world_size
+            assert ranges[0][0] == 0 and ranges[-1][1] == num_frames
+            assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+
+    def test_split_evens_out_warmup(self):
+        ranges = split_latent_frames(25, 4, 4)
+        assert [end - max(0, start - 4) for start, end in ranges] == [10, 9, 9, 9]
+
+    def test_video_frame_counts(self):
+        assert num_video_frames(0, 25) == 97
+        assert num_video_frames(0, 1) + num_video_frames(1, 25) == 97
+
+    def test_full_warmup_matches_full_decode(self):
+        vae, z = make_vae(), make_latents().unsqueeze(0)
+        with torch.no_grad():
+            expected = vae.vae.decode(z, vae.scale)
+            for start, end in [(0, 3), (3, 5), (5, NUM_LATENT_FRAMES)]:
+                first = num_video_frames(0, start)
+                chunk = vae.vae.decode_range(z, vae.scale, start, end, overlap=start)
+                torch.testing.assert_close(chunk, expected[:, :, first : first + num_video_frames(start, end)])
+
+    def test_short_warmup_keeps_frame_count(self):
+        vae, z = make_vae(), make_latents().unsqueeze(0)
+        with torch.no_grad():
+            chunk = vae.vae.decode_range(z, vae.scale, 4, 6, overlap=1)
+        assert chunk.shape[2] == num_video_frames(4, 6)
+        assert torch.isfinite(chunk).all()
+
+
+@pytest.mark.skipif(not dist.is_available(), reason="torch.distributed is not available")
+class TestParallelDecode:
+    """Test that the frames decoded by each rank are gathered in order"""
+
+    @pytest.mark.parametrize("dst", [None, 0])
+    def test_gathers_chunks_in_order(self, tmp_path, dst):
+        mp.spawn(run_decode, args=(str(tmp_path / "init"), 3, 1, dst), nprocs=3, join=True)
+
+    def test_default_overlap_matches_single_rank_decode(self, tmp_path):
+        mp.spawn(run_default_decode, args=(str(tmp_path / "init"),), nprocs=2, join=True)
+
+    def test_overlap_must_be_positive(self):
+        with pytest.raises(ValueError, match="overlap"):
+            make_vae().enable_parallel_decode(overlap=0)
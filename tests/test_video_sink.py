@@ -0,0 +1,142 @@
+"""
+Tests for the streaming MP4 encoder sink, the decoded frame transfer and tail reads of input videos
+"""
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from skyreels_v2_infer.pipelines.video_io import AV_AVAILABLE
+from skyreels_v2_infer.pipelines.video_io import DECORD_AVAILABLE
+from skyreels_v2_infer.pipelines.video_io import VideoSink
+from skyreels_v2_infer.pipelines.video_io import VideoSource
+from skyreels_v2_infer.pipelines.video_io import frames_to_numpy
+from skyreels_v2_infer.pipelines.video_io import get_ffmpeg_exe
+from skyreels_v2_infer.pipelines.video_io import iter_host_frames
+from skyreels_v2_infer.pipelines.video_io import video_to_uint8
+from skyreels_v2_infer.pipelines.video_io import write_video
+
+
+def has_ffmpeg():
+    try:
+        get_ffmpeg_exe()
+    except RuntimeError:
+        return False
+    return True
+
+
+requires_ffmpeg = pytest.mark.skipif(not has_ffmpeg(), reason="ffmpeg is not available")
+
+
+class TestVideoSink:
+    """Test incremental encoding into the final path"""
+
+    @requires_ffmpeg
+    def test_streams_chunks_into_final_path(self, tmp_path):
+        path = tmp_path / "video.mp4"
+        with VideoSink(path, fps=8, preset="ultrafast") as sink:
+            for _ in range(3):
+                sink.write(np.random.randint(0, 256, (4, 32, 48, 3), dtype=np.uint8))
+            assert not path.exists()
+        assert sink.frames_written == 12
+        assert path.stat().st_size > 0
+        assert os.listdir(tmp_path) == ["video.mp4"]
+
+    @requires_ffmpeg
+    def test_float_frames_and_odd_sizes(self, tmp_path):
+        frames = np.random.rand(5, 31, 45, 3).astype(np.float32)
+        path = write_video(tmp_path / "video.mp4", frames, fps=8, chunk_size=2, preset="ultrafast")
+        assert os.path.getsize(path) > 0
+
+    @requires_ffmpeg
+    def test_error_discards_partial_video(self, tmp_path):
+        with pytest.raises(KeyboardInterrupt):
+            with VideoSink(tmp_path / "video.mp4", preset="ultrafast") as sink:
+                sink.write(np.zeros((2, 16, 16, 3), dtype=np.uint8))
+                raise KeyboardInterrupt
+        assert os.listdir(tmp_path) == []
+
+    @requires_ffmpeg
+    def test_frame_size_must_not_change(self, tmp_path):
+        with pytest.raises(ValueError):
+            with VideoSink(tmp_path / "video.mp4", preset="ultrafast") as sink:
+                sink.write(np.zeros((1, 16, 16, 3), dtype=np.uint8))
+                sink.write(np.zeros((1, 32, 32, 3), dtype=np.uint8))
+
+    def test_invalid_preset(self, tmp_path):
+        with pytest.raises(ValueError):
+            VideoSink(tmp_path / "video.mp4", preset="fastest")
+
+    def test_rejects_non_rgb_frames(self, tmp_path):
+        with pytest.raises(ValueError):
+            VideoSink(tmp_path / "video.mp4").write(np.zeros((2, 16, 16), dtype=np.uint8))
+
+
+class TestFrameTransfer:
+    """Test the on-device uint8 conversion and the chunked host transfer"""
+
+    def reference(self, videos):
+        videos = (videos / 2 + 0.5).clamp(0, 1)
+        return [(video.permute(1, 2, 3, 0) * 255).cpu().numpy().astype(np.uint8) for video in videos]
+
+    def test_matches_host_conversion(self):
+        videos = torch.rand(2, 3, 9, 16, 24) * 2.2 - 1.1
+        frames = video_to_uint8(videos)
+        assert frames.dtype == torch.uint8
+        assert frames.shape == (2, 9, 16, 24, 3)
+        for video, expected in zip(frames, self.reference(videos)):
+            assert np.array_equal(frames_to_numpy(video, chunk_size=4), expected)
+
+    def test_chunks_cover_every_frame(self):
+        frames = torch.randint(0, 256, (10, 4, 4, 3), dtype=torch.uint8)
+        chunks = [chunk.copy() for chunk in iter_host_frames(frames, chunk_size=4)]
+        assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+        assert np.array_equal(np.concatenate(chunks), frames.numpy())
+
+    @pytest.mark.skipif(not torch.cuda.is_available(), reason="needs a CUDA device")
+    def test_pinned_transfer_from_cuda(self):
+        videos = torch.rand(1, 3, 17, 32, 32, device="cuda") * 2 - 1
+        frames = video_to_uint8(videos)[0]
+        assert np.array_equal(frames_to_numpy(frames, chunk_size=4), self.reference(videos)[0])
+
+
+def frame_video(path, num_frames):
+    """Writes a clip whose frame index can be read back from the mean brightness"""
+    frames = np.repeat((np.arange(num_frames, dtype=np.uint8) * 8)[:, None, None, None], 32 * 48 * 3, axis=1)
+    return write_video(path, frames.reshape(num_frames, 32, 48, 3), fps=8, crf=0, preset="ultrafast")
+
+
+BACKENDS = [
+    "ffmpeg",
+    pytest.param("av", marks=pytest.mark.skipif(not AV_AVAILABLE, reason="PyAV is not installed")),
+    pytest.param("decord", marks=pytest.mark.skipif(not DECORD_AVAILABLE, reason="decord is not installed")),
+]
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize("backend", BACKENDS)
+class TestVideoSource:
+    """Test metadata probing and partial decoding of input videos"""
+
+    def test_metadata(self, tmp_path, backend):
+        source = VideoSource(frame_video(tmp_path / "video.mp4", 30), backend=backend)
+        assert source.num_frames == 30
+        assert source.source_size == (48, 32)
+        assert source.fps == pytest.approx(8.0)
+
+    def test_read_tail_decodes_last_frames(self, tmp_path, backend):
+        source = VideoSource(frame_video(tmp_path / "video.mp4", 30), backend=backend)
+        tail = source.read_tail(5)
+        assert tail.shape == (5, 32, 48, 3)
+        assert np.allclose(tail.reshape(5, -1).mean(axis=1), np.arange(25, 30) * 8, atol=2)
+
+    def test_resize_while_decoding(self, tmp_path, backend):
+        source = VideoSource(frame_video(tmp_path / "video.mp4", 10), width=24, height=16, backend=backend)
+        assert source.read(2, 4).shape == (2, 16, 24, 3)
+
+    def test_chunks_cover_every_frame(self, tmp_path, backend):
+        source = VideoSource(frame_video(tmp_path / "video.mp4", 20), backend=backend)
+        chunks = list(source.iter_chunks(chunk_size=8))
+        assert [len(chunk) for chunk in chunks] == [8, 8, 4]
+        assert np.array_equal(np.concatenate(chunks), source.read())